@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server';
 import axios from 'axios';
 import * as https from 'https';
+import { BridgeClient } from '../../../../services/bridgeClient';
 
 // Create axios instance with HTTPS agent that ignores certificate validation
 const axiosInstance = axios.create({
@@ -10,6 +11,30 @@ const axiosInstance = axios.create({
   timeout: 10000
 });
 
+// The fingerprint bridge's access matrix answers offline access checks; it
+// only re-reads ZKBio periodically, so assignments made here are applied to
+// it directly
+const BRIDGE_PORT = Number(process.env.FINGERPRINT_BRIDGE_PORT || 8765);
+const bridge = new BridgeClient(`ws://localhost:${BRIDGE_PORT}`);
+
+async function updateBridgeAccess(pin: string, levelIds: string[], mode: 'add' | 'remove') {
+  try {
+    const reply = await bridge.updateAccess(pin, levelIds, mode);
+    if (reply.status !== 'updated') {
+      console.warn('Bridge access matrix not updated:', reply.message || reply);
+    }
+  } catch (error) {
+    // ZKBio has the assignment; the bridge picks it up on its next refresh
+    console.warn('Bridge access matrix not updated:', error instanceof Error ? error.message : error);
+  }
+}
+
+function levelIdList(levelIds: string | string[]): string[] {
+  return (Array.isArray(levelIds) ? levelIds : levelIds.toString().split(','))
+    .map(id => id.toString().trim())
+    .filter(Boolean);
+}
+
 // POST /api/access-levels/assign - Assign access level to person
 export async function POST(request: NextRequest) {
   try {
@@ -35,6 +60,10 @@ export async function POST(request: NextRequest) {
 
     console.log('Proxy API response for access level assignment:', response.data);
 
+    if (response.data?.code === 0) {
+      await updateBridgeAccess(pin.toString(), levelIdList(levelIds), 'add');
+    }
+
     return NextResponse.json(response.data);
   } catch (error) {
     console.error('Proxy API error for access level assignment:', error);
@@ -83,6 +112,10 @@ export async function DELETE(request: NextRequest) {
 
     console.log('Proxy API response for access level removal:', response.data);
 
+    if (response.data?.code === 0) {
+      await updateBridgeAccess(pin.toString(), levelIdList(levelIds), 'remove');
+    }
+
     return NextResponse.json(response.data);
   } catch (error) {
     console.error('Proxy API error for access level removal:', error);
@@ -1,20 +1,58 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { spawn, ChildProcess } from 'child_process';
+import { promises as fs } from 'fs';
+import os from 'os';
 import path from 'path';
 
 // Store running processes (in production, use a proper process manager)
 const runningProcesses = new Map<number, ChildProcess>();
 
+// The bridge is a long-lived daemon that announces itself via a ready file
+// (see services/bridge_daemon.py) once it accepts connections
+const BRIDGE_PORT = Number(process.env.FINGERPRINT_BRIDGE_PORT || 8765);
+const BRIDGE_READY_TIMEOUT_MS = 15000;
+const BRIDGE_READY_POLL_MS = 50;
+const BRIDGE_PROBE_TIMEOUT_MS = 500;
+
+interface BridgeReadyInfo {
+  pid: number;
+  port: number;
+  bridge: string;
+  startedAt: number;
+}
+
+// GET /readyz on the bridge port (served from the bridge's in-memory state)
+interface BridgeHealth {
+  status: 'ok' | 'unavailable';
+  ready: boolean;
+  problems: string[];
+  devices: string[];
+  sdk_mode: string | null;
+  mock_mode: boolean;
+  queue_depth?: number;
+  queue_saturation?: number;
+  pid: number;
+  uptime: number;
+}
+
+interface BridgeProbe {
+  running: boolean;
+  health: BridgeHealth | null;
+}
+
 // GET /api/fingerprint - Check service status
 export async function GET() {
   try {
-    // Check if bridge service is running on port 8765
-    const isRunning = await checkBridgeService();
+    // Probe the bridge's readiness endpoint on the bridge port
+    const [probe, readyInfo] = await Promise.all([probeBridge(), readBridgeReadyFile()]);
 
     return NextResponse.json({
       status: 'ok',
       message: 'Fingerprint API is working',
-      bridgeRunning: isRunning,
+      bridgeRunning: probe.running,
+      bridgeReady: probe.health?.ready ?? false,
+      bridgeHealth: probe.health,
+      bridge: readyInfo,
       runningProcesses: Array.from(runningProcesses.keys()),
       timestamp: new Date().toISOString()
     });
@@ -37,13 +75,15 @@ export async function POST(request: NextRequest) {
       const detectedPlatform = platform || detectPlatform();
 
       // Check if service is already running
-      const isRunning = await checkBridgeService();
-      if (isRunning) {
+      const { running } = await probeBridge();
+      if (running) {
+        const readyInfo = await readBridgeReadyFile();
         return NextResponse.json({
           success: true,
           message: 'Bridge service already running',
           platform: detectedPlatform,
-          alreadyRunning: true
+          alreadyRunning: true,
+          pid: readyInfo?.pid
         });
       }
 
@@ -88,31 +128,19 @@ export async function POST(request: NextRequest) {
   }
 }
 
-async function checkBridgeService(): Promise<boolean> {
-  return new Promise((resolve) => {
-    // Simple check - try to connect to the WebSocket port
-    const netstat = spawn('netstat', ['-tln']);
-    let output = '';
-
-    netstat.stdout.on('data', (data) => {
-      output += data.toString();
-    });
-
-    netstat.on('close', () => {
-      const isRunning = output.includes(':8765');
-      resolve(isRunning);
-    });
-
-    netstat.on('error', () => {
-      resolve(false);
+async function probeBridge(): Promise<BridgeProbe> {
+  try {
+    // 503 still means the bridge is up, just not able to capture right now
+    const response = await fetch(`http://localhost:${BRIDGE_PORT}/readyz`, {
+      cache: 'no-store',
+      signal: AbortSignal.timeout(BRIDGE_PROBE_TIMEOUT_MS)
     });
-
-    // Timeout after 2 seconds
-    setTimeout(() => {
-      netstat.kill();
-      resolve(false);
-    }, 2000);
-  });
+    const isJson = response.headers.get('content-type')?.includes('application/json');
+    // Older bridges answer plain HTTP with a WebSocket upgrade error
+    return { running: true, health: isJson ? await response.json() as BridgeHealth : null };
+  } catch {
+    return { running: false, health: null };
+  }
 }
 
 async function startBridgeService(platform: string): Promise<{ success: boolean; pid?: number; error?: string }> {
@@ -122,12 +150,14 @@ async function startBridgeService(platform: string): Promise<{ success: boolean;
       return { success: false, error: `Unsupported platform: ${platform}` };
     }
 
-    // Start the bridge service
+    // Start the bridge service as a detached daemon that outlives this request
     const childProcess = spawn(scriptPath.command, scriptPath.args, {
       cwd: path.join(process.cwd(), scriptPath.cwd || ''),
       detached: true,
-      stdio: 'ignore'
+      stdio: 'ignore',
+      env: { ...process.env, FINGERPRINT_BRIDGE_PORT: String(BRIDGE_PORT) }
     });
+    childProcess.unref();
 
     const pid = childProcess.pid!;
     runningProcesses.set(pid, childProcess);
@@ -143,11 +173,14 @@ async function startBridgeService(platform: string): Promise<{ success: boolean;
       runningProcesses.delete(pid);
     });
 
-    // Wait a bit for service to start
-    await new Promise(resolve => setTimeout(resolve, 2000));
+    // Wait for the bridge's readiness handshake instead of a fixed sleep
+    const ready = await waitForBridgeReady(pid, childProcess, BRIDGE_READY_TIMEOUT_MS);
+    if (!ready) {
+      childProcess.kill('SIGTERM');
+      runningProcesses.delete(pid);
+      return { success: false, error: 'Bridge service did not become ready' };
+    }
 
-    // For testing, assume service started successfully
-    // In production, you would verify it's actually running
     console.log(`Bridge service started with PID: ${pid}`);
     return { success: true, pid };
 
@@ -159,6 +192,42 @@ async function startBridgeService(platform: string): Promise<{ success: boolean;
   }
 }
 
+function bridgeReadyFilePath(): string {
+  const runDir = process.env.FINGERPRINT_BRIDGE_RUN_DIR || os.tmpdir();
+  return path.join(runDir, `ims-fingerprint-bridge-${BRIDGE_PORT}.json`);
+}
+
+async function readBridgeReadyFile(): Promise<BridgeReadyInfo | null> {
+  try {
+    const contents = await fs.readFile(bridgeReadyFilePath(), 'utf8');
+    return JSON.parse(contents) as BridgeReadyInfo;
+  } catch {
+    return null;
+  }
+}
+
+async function waitForBridgeReady(pid: number, childProcess: ChildProcess, timeoutMs: number): Promise<boolean> {
+  let exited = false;
+  const onExit = () => {
+    exited = true;
+  };
+  childProcess.once('exit', onExit);
+
+  try {
+    const deadline = Date.now() + timeoutMs;
+    while (!exited && Date.now() < deadline) {
+      const readyInfo = await readBridgeReadyFile();
+      if (readyInfo?.pid === pid) {
+        return true;
+      }
+      await new Promise(resolve => setTimeout(resolve, BRIDGE_READY_POLL_MS));
+    }
+    return false;
+  } finally {
+    childProcess.removeListener('exit', onExit);
+  }
+}
+
 async function stopBridgeService(pid?: number): Promise<{ success: boolean; message: string }> {
   try {
     if (pid && runningProcesses.has(pid)) {
@@ -1,5 +1,22 @@
 import { NextRequest, NextResponse } from 'next/server'
 
+const BRIDGE_PORT = Number(process.env.FINGERPRINT_BRIDGE_PORT || 8765)
+const BRIDGE_METRICS_TIMEOUT_MS = 1000
+
+// Fingerprint bridge counters and latency summaries (GET /metrics.json on the
+// bridge port); null when the bridge is not running
+async function getBridgeMetrics() {
+  try {
+    const response = await fetch(`http://localhost:${BRIDGE_PORT}/metrics.json`, {
+      cache: 'no-store',
+      signal: AbortSignal.timeout(BRIDGE_METRICS_TIMEOUT_MS)
+    })
+    return response.ok ? await response.json() : null
+  } catch {
+    return null
+  }
+}
+
 export async function GET(request: NextRequest) {
   try {
     const { searchParams } = new URL(request.url)
@@ -13,7 +30,8 @@ export async function GET(request: NextRequest) {
       cpu: process.cpuUsage(),
       version: process.version,
       platform: process.platform,
-      environment: process.env.NODE_ENV || 'development'
+      environment: process.env.NODE_ENV || 'development',
+      bridge: await getBridgeMetrics()
     }
 
     // Specific metric request
@@ -37,6 +55,12 @@ export async function GET(request: NextRequest) {
             data: metrics.cpu,
             timestamp: metrics.timestamp
           })
+        case 'bridge':
+          return NextResponse.json({
+            metric: 'bridge',
+            data: metrics.bridge,
+            timestamp: metrics.timestamp
+          })
         default:
           return NextResponse.json({ error: 'Unknown metric' }, { status: 400 })
       }
@@ -0,0 +1,59 @@
+import { NextRequest, NextResponse } from 'next/server';
+import db from '../../../lib/database';
+
+const DEFAULT_PAGE_SIZE = 50;
+const MAX_PAGE_SIZE = 1000;
+
+// GET /api/transactions - Attendance/door events ingested into ims.db
+// Query: pageNo, pageSize, personPin, deviceSn, startDate, endDate
+// ("YYYY-MM-DD HH:MM:SS"); view=firstInLastOut returns one row per person
+// per day with the first and last event times
+export async function GET(request: NextRequest) {
+  try {
+    const params = request.nextUrl.searchParams;
+    const pageNo = Math.max(1, Number(params.get('pageNo')) || 1);
+    const pageSize = Math.min(MAX_PAGE_SIZE, Math.max(1, Number(params.get('pageSize')) || DEFAULT_PAGE_SIZE));
+
+    const conditions: string[] = [];
+    const values: string[] = [];
+    const filters: Array<[string, string]> = [
+      ['personPin', 'personPin = ?'],
+      ['deviceSn', 'deviceSn = ?'],
+      ['startDate', 'eventTime >= ?'],
+      ['endDate', 'eventTime <= ?']
+    ];
+    for (const [param, condition] of filters) {
+      const value = params.get(param);
+      if (value) {
+        conditions.push(condition);
+        values.push(value);
+      }
+    }
+    const where = conditions.length ? `WHERE ${conditions.join(' AND ')}` : '';
+
+    if (params.get('view') === 'firstInLastOut') {
+      const rows = db.prepare(`
+        SELECT personPin, MAX(personName) AS personName, date(eventTime) AS day,
+               MIN(eventTime) AS firstIn, MAX(eventTime) AS lastOut, COUNT(*) AS events
+        FROM transactions ${where}
+        GROUP BY personPin, day
+        ORDER BY day DESC, personPin
+        LIMIT ? OFFSET ?
+      `).all(...values, pageSize, (pageNo - 1) * pageSize);
+      return NextResponse.json({ data: rows, pageNo, pageSize });
+    }
+
+    const rows = db.prepare(`
+      SELECT sourceId AS id, source, personPin, personName, deviceSn, doorName,
+             eventTime, verifyModeName, eventName
+      FROM transactions ${where}
+      ORDER BY eventTime DESC
+      LIMIT ? OFFSET ?
+    `).all(...values, pageSize, (pageNo - 1) * pageSize);
+    const { total } = db.prepare(`SELECT COUNT(*) AS total FROM transactions ${where}`).get(...values) as { total: number };
+
+    return NextResponse.json({ data: rows, pageNo, pageSize, total });
+  } catch (error) {
+    return NextResponse.json({ error: 'Failed to fetch transactions' }, { status: 500 });
+  }
+}
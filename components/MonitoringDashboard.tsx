@@ -1,7 +1,7 @@
 'use client'
 
 import { useState, useEffect } from 'react'
-import { Activity, AlertTriangle, CheckCircle, Clock, Cpu, HardDrive, Zap } from 'lucide-react'
+import { Activity, AlertTriangle, CheckCircle, Clock, Cpu, Fingerprint, HardDrive, Zap } from 'lucide-react'
 
 interface HealthData {
   status: string
@@ -11,6 +11,31 @@ interface HealthData {
   environment: string
 }
 
+interface LatencySummary {
+  count: number
+  mean_ms: number
+  p50_ms: number
+  p95_ms: number
+  p99_ms: number
+}
+
+interface BridgeMetrics {
+  counters: {
+    bridge_errors_total: Record<string, number>
+    bridge_requests_total: Record<string, number>
+  }
+  gauges: {
+    bridge_connected_clients: number
+    bridge_queue_depth: Record<string, number>
+    bridge_devices_open: number
+    bridge_uptime_seconds: number
+  }
+  histograms: {
+    bridge_stage_seconds: Record<string, LatencySummary>
+    bridge_queue_wait_seconds: LatencySummary
+  }
+}
+
 interface MetricsData {
   timestamp: string
   uptime: number
@@ -27,6 +52,7 @@ interface MetricsData {
   version: string
   platform: string
   environment: string
+  bridge: BridgeMetrics | null
 }
 
 interface AlertData {
@@ -92,6 +118,14 @@ export default function MonitoringDashboard() {
     return `${mb.toFixed(1)} MB`
   }
 
+  const sumValues = (values: Record<string, number> = {}) =>
+    Object.values(values).reduce((total, value) => total + value, 0)
+
+  const formatLatency = (summary?: LatencySummary) =>
+    summary && summary.count > 0 ? `${summary.p50_ms} / ${summary.p95_ms} ms` : 'N/A'
+
+  const bridge = metrics?.bridge
+
   const getSeverityColor = (severity: string) => {
     switch (severity) {
       case 'critical': return 'text-red-600 bg-red-50'
@@ -186,6 +220,51 @@ export default function MonitoringDashboard() {
         </div>
       </div>
 
+      {/* Fingerprint Bridge */}
+      <div className="bg-white rounded-lg shadow p-6">
+        <div className="flex items-center gap-3 mb-4">
+          <Fingerprint className="w-6 h-6 text-indigo-500" />
+          <h2 className="text-xl font-semibold">Fingerprint Bridge</h2>
+          <span className={`ml-auto text-sm font-medium ${bridge ? 'text-green-600' : 'text-gray-500'}`}>
+            {bridge ? 'Running' : 'Not running'}
+          </span>
+        </div>
+        {bridge && (
+          <div className="grid grid-cols-1 md:grid-cols-3 gap-x-8 gap-y-2">
+            <div className="flex justify-between">
+              <span className="text-gray-600">Clients:</span>
+              <span className="font-medium">{bridge.gauges.bridge_connected_clients}</span>
+            </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Scanners:</span>
+              <span className="font-medium">{bridge.gauges.bridge_devices_open}</span>
+            </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Queue Depth:</span>
+              <span className="font-medium">{sumValues(bridge.gauges.bridge_queue_depth)}</span>
+            </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Capture p50 / p95:</span>
+              <span className="font-medium">{formatLatency(bridge.histograms.bridge_stage_seconds.capture)}</span>
+            </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Queue Wait p50 / p95:</span>
+              <span className="font-medium">{formatLatency(bridge.histograms.bridge_queue_wait_seconds)}</span>
+            </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Errors:</span>
+              <span className={`font-medium ${sumValues(bridge.counters.bridge_errors_total) ? 'text-red-600' : ''}`}>
+                {sumValues(bridge.counters.bridge_errors_total)}
+              </span>
+            </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Uptime:</span>
+              <span className="font-medium">{formatUptime(bridge.gauges.bridge_uptime_seconds)}</span>
+            </div>
+          </div>
+        )}
+      </div>
+
       {/* Recent Alerts */}
       <div className="bg-white rounded-lg shadow p-6">
         <div className="flex items-center gap-3 mb-6">
@@ -2,12 +2,29 @@
 Inspect pyzkfp library to understand its API
 """
 
-print("🔍 Inspecting pyzkfp library...")
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services'))
+
+from capability_probe import CapabilityCache, module_versions  # noqa: E402
+
+print("🔍 Installed SDK wrappers:")
+print(json.dumps(module_versions(), indent=2))
+cached = CapabilityCache().load()
+if cached:
+    print(f"Cached capability probe (backend {cached.get('backend')}):")
+    print(json.dumps(cached.get("backends"), indent=2))
+else:
+    print("No cached capability probe (run services/capability_probe.py)")
+
+print("\n🔍 Inspecting pyzkfp library...")
 
 try:
     import pyzkfp
     print("✅ pyzkfp imported successfully")
-    print(f"pyzkfp version: {getattr(pyzkfp, '__version__', 'unknown')}")
+    print(f"pyzkfp version: {module_versions(['pyzkfp'])['pyzkfp']}")
     print(f"pyzkfp attributes: {dir(pyzkfp)}")
 
     # Try to see what's available
@@ -7,7 +7,7 @@ echo Checking Python installation...
 python --version >nul 2>&1
 if errorlevel 1 (
     echo ERROR: Python is not installed or not in PATH
-    echo Please download and install Python 3.7+ from https://python.org
+    echo Please download and install Python 3.9+ from https://python.org
     echo Make sure to check "Add Python to PATH" during installation
     pause
     exit /b 1
@@ -21,11 +21,11 @@ echo Installing required Python packages...
 echo This will install: websockets, pyzkfp
 echo.
 
-pip install websockets pyzkfp
+pip install websockets pyzkfp==0.1.5
 
 if errorlevel 1 (
     echo ERROR: Failed to install Python packages
-    echo Try running: pip install --user websockets pyzkfp
+    echo Try running: pip install --user websockets pyzkfp==0.1.5
     pause
     exit /b 1
 )
@@ -6,7 +6,7 @@ echo ""
 
 # Check if Python 3 is installed
 if ! command -v python3 &> /dev/null; then
-    echo "❌ Python 3 is not installed. Please install Python 3.7 or higher."
+    echo "❌ Python 3 is not installed. Please install Python 3.9 or higher."
     echo "   Ubuntu/Debian: sudo apt install python3 python3-pip"
     echo "   CentOS/RHEL: sudo yum install python3 python3-pip"
     exit 1
@@ -15,12 +15,12 @@ fi
 PYTHON_VERSION=$(python3 --version 2>&1 | awk '{print $2}')
 echo "✓ Python version: $PYTHON_VERSION"
 
-# Check Python version (require 3.7+)
+# Check Python version (require 3.9+)
 PYTHON_MAJOR=$(echo $PYTHON_VERSION | cut -d. -f1)
 PYTHON_MINOR=$(echo $PYTHON_VERSION | cut -d. -f2)
 
-if [ $PYTHON_MAJOR -lt 3 ] || ([ $PYTHON_MAJOR -eq 3 ] && [ $PYTHON_MINOR -lt 7 ]); then
-    echo "❌ Python 3.7 or higher is required. Current version: $PYTHON_VERSION"
+if [ $PYTHON_MAJOR -lt 3 ] || ([ $PYTHON_MAJOR -eq 3 ] && [ $PYTHON_MINOR -lt 9 ]); then
+    echo "❌ Python 3.9 or higher is required. Current version: $PYTHON_VERSION"
     exit 1
 fi
 
@@ -43,6 +43,31 @@ db.exec(`
     Name TEXT,
     cachedAt TEXT
   );
+
+  -- Attendance/door events ingested from panels and ZKBio by
+  -- services/attendance_ingest.py (keep the schemas in step)
+  CREATE TABLE IF NOT EXISTS transactions (
+    source TEXT NOT NULL,
+    sourceId TEXT NOT NULL,
+    personPin TEXT,
+    personName TEXT,
+    deviceSn TEXT,
+    doorName TEXT,
+    eventTime TEXT NOT NULL,
+    verifyModeName TEXT,
+    eventName TEXT,
+    PRIMARY KEY (source, sourceId)
+  );
+  CREATE INDEX IF NOT EXISTS idx_transactions_time ON transactions (eventTime);
+  CREATE INDEX IF NOT EXISTS idx_transactions_pin_time ON transactions (personPin, eventTime);
+  CREATE INDEX IF NOT EXISTS idx_transactions_device_time ON transactions (deviceSn, eventTime);
+
+  CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    cursor TEXT,
+    rows INTEGER DEFAULT 0,
+    updatedAt TEXT
+  );
 `);
 
 export default db;
\ No newline at end of file
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Access Matrix Benchmark
+
+Loads --persons persons, --levels access levels and --doors doors into a
+fake ZKBio (scripts/fake_zkbio.py), fetches a snapshot and compiles it with
+services/access_matrix.py, then answers the same access questions three
+ways:
+
+    - online: walk ZKBio per decision (the person's levels, then the
+              levels' doors), as the web app would without a local copy,
+              over one keep-alive connection at --latency per request
+    - naive:  the same walk over the snapshot in memory, per query
+    - matrix: the compiled bitsets
+
+Reports snapshot fetch and compile times, check and "who can open" latency
+per path, incremental level updates next to a full recompile, and whether
+every matrix answer matched the naive walk, before and after the updates.
+
+Usage:
+    python3 scripts/bench_access_matrix.py [--persons 10000] [--levels 200] [--doors 2000]
+        [--checks 20000] [--latency 0.02]
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Set
+
+from bench_common import summarize
+from access_matrix import (LEVEL_LIST_PATH, PERSON_LIST_PATH, AccessMatrix, bit_count, fetch_snapshot,
+                           principal_of, split_ids, unwrap_list)
+from fake_zkbio import FakeZKBio
+from zkbio_uploader import ZKBioConnections
+
+class NaiveAccess:
+    """Per-query walk of a snapshot: person -> levels -> doors"""
+
+    def __init__(self, snapshot: Dict[str, Any]):
+        self.persons = {str(person["pin"]): person for person in snapshot["persons"]}
+        self.levels = {str(level["id"]): level for level in snapshot["levels"]}
+
+    def levels_of(self, pin: str) -> Set[str]:
+        person = self.persons.get(pin)
+        levels = set(split_ids(person.get("accLevelIds"))) if person else set()
+        principal = self.persons.get(principal_of(pin) or "")
+        if principal:
+            levels |= set(split_ids(principal.get("accLevelIds")))
+        return levels
+
+    def can_open(self, pin: str, door: str) -> bool:
+        return any(door in split_ids(self.levels[level_id].get("doorIds"))
+                   for level_id in self.levels_of(pin) if level_id in self.levels)
+
+    def who_can_open(self, door: str) -> List[str]:
+        return [pin for pin in self.persons if self.can_open(pin, door)]
+
+
+def online_check(connections: ZKBioConnections, pin: str, door: str) -> bool:
+    """One decision against ZKBio itself: look the person (and a spouse's principal) up, then the levels' doors"""
+    levels: Set[str] = set()
+    for lookup in filter(None, (pin, principal_of(pin))):
+        persons = unwrap_list(connections.request("POST", PERSON_LIST_PATH, None,
+                                                  {"pageNo": 1, "pageSize": 1000, "pin": lookup}))
+        levels.update(level_id for person in persons if str(person.get("pin")) == lookup
+                      for level_id in split_ids(person.get("accLevelIds")))
+    if not levels:
+        return False
+    for level in unwrap_list(connections.request("GET", LEVEL_LIST_PATH, None, {"pageNo": 1, "pageSize": 1000})):
+        if str(level["id"]) in levels and door in split_ids(level.get("doorIds")):
+            return True
+    return False
+
+
+def mean_us(samples: list) -> str:
+    return f"{sum(t for t, _ in samples) / len(samples) * 1e6:.2f} us mean"
+
+
+def timed(fn, *args) -> tuple:
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--persons', type=int, default=10000)
+    parser.add_argument('--levels', type=int, default=200)
+    parser.add_argument('--doors', type=int, default=2000)
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--who', type=int, default=200, help='"Who can open" queries')
+    parser.add_argument('--online', type=int, default=50, help='Decisions made against ZKBio')
+    parser.add_argument('--updates', type=int, default=500, help='Incremental level changes')
+    parser.add_argument('--latency', type=float, default=0.02, help='Fake ZKBio seconds per request')
+    parser.add_argument('--port', type=int, default=18100)
+    args = parser.parse_args()
+
+    fake = FakeZKBio(args.port, latency=args.latency)
+    fake.add_access(args.persons, args.levels, args.doors, doors_per_level=max(1, args.doors // 50))
+    fake.serve()
+    try:
+        fetch_time, snapshot = timed(fetch_snapshot, fake.url)
+        print(f"snapshot: {len(snapshot['persons'])} persons, {len(snapshot['levels'])} levels, "
+              f"{len(snapshot['doors'])} doors fetched in {fetch_time * 1000:.0f} ms "
+              f"({fake.requests} requests, {fake.connections} connection(s))")
+
+        compile_time, matrix = timed(AccessMatrix.compile, snapshot)
+        stats = matrix.stats()
+        print(f"compile:  {compile_time * 1000:.0f} ms, {stats['grants']} person-door grants")
+
+        rng = random.Random(3)
+        pins = [str(person["pin"]) for person in snapshot["persons"]]
+        door_ids = [str(door["id"]) for door in snapshot["doors"]]
+        checks = [(rng.choice(pins), rng.choice(door_ids)) for _ in range(args.checks)]
+        naive = NaiveAccess(snapshot)
+
+        connections = ZKBioConnections(fake.url)
+        online = [timed(online_check, connections, pin, door) for pin, door in checks[:args.online]]
+        connections.close()
+        naive_checks = [timed(naive.can_open, pin, door) for pin, door in checks]
+        matrix_checks = [timed(matrix.can_open, pin, door) for pin, door in checks]
+        print(f"can_open over {args.checks} checks ({sum(r for _, r in matrix_checks)} allowed):")
+        print(f"  online {summarize([t for t, _ in online])}  ({args.online} checks)")
+        print(f"  naive  {summarize([t for t, _ in naive_checks])}  ({mean_us(naive_checks)})")
+        print(f"  matrix {summarize([t for t, _ in matrix_checks])}  ({mean_us(matrix_checks)})")
+
+        doors = [rng.choice(door_ids) for _ in range(args.who)]
+        naive_who = [timed(naive.who_can_open, door) for door in doors[:max(1, args.who // 20)]]
+        matrix_who = [timed(lambda door: matrix.pins_of(matrix.who_can_open(door)), door) for door in doors]
+        print(f"who_can_open over {args.who} doors "
+              f"(mean {sum(len(r) for _, r in matrix_who) / len(matrix_who):.0f} pins):")
+        print(f"  naive  {summarize([t for t, _ in naive_who])}  ({len(naive_who)} doors)")
+        print(f"  matrix {summarize([t for t, _ in matrix_who])}")
+
+        def agrees(matrix: AccessMatrix, naive: NaiveAccess, online: list = ()) -> bool:
+            return (all(matrix.can_open(pin, door) == naive.can_open(pin, door) for pin, door in checks)
+                    and all(sorted(matrix.pins_of(matrix.who_can_open(door))) == sorted(naive.who_can_open(door))
+                            for door in doors[:20])
+                    and all(online_result == naive.can_open(pin, door)
+                            for (pin, door), (_, online_result) in zip(checks, online)))
+
+        print(f"matrix matches the naive walk and ZKBio: {'yes' if agrees(matrix, naive, online) else 'NO'}")
+
+        # Level changes: applied to the matrix and to the snapshot the naive walk reads
+        level_ids = [str(level["id"]) for level in snapshot["levels"]]
+        update_times = []
+        for i in range(args.updates):
+            if i % 10 == 0:
+                level = rng.choice(snapshot["levels"])
+                new_doors = rng.sample(door_ids, len(split_ids(level["doorIds"])))
+                level["doorIds"] = ",".join(new_doors)
+                update_times.append(timed(matrix.set_level_doors, str(level["id"]), new_doors)[0])
+            else:
+                person = naive.persons[rng.choice(pins)]
+                new_levels = rng.sample(level_ids, rng.randint(0, 3))
+                person["accLevelIds"] = ",".join(new_levels)
+                update_times.append(timed(matrix.set_person_levels, person["pin"], new_levels)[0])
+        recompile_time, recompiled = timed(AccessMatrix.compile, snapshot)
+        print(f"{args.updates} incremental updates {summarize(update_times)}")
+        print(f"  full recompile {recompile_time * 1000:.0f} ms")
+        same = (matrix.person_doors == recompiled.person_doors and matrix.door_persons == recompiled.door_persons)
+        print(f"after updates: matches a recompile: {'yes' if same else 'NO'}, "
+              f"matches the naive walk: {'yes' if agrees(matrix, naive) else 'NO'}, "
+              f"{bit_count(matrix.who_can_open(door_ids[0]))} can open {door_ids[0]}")
+        return 0 if same and agrees(matrix, naive) else 1
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
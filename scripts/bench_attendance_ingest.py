@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Attendance Ingestion Benchmark
+
+Serves fake ZK panels (scripts/fake_zk_panel.py) and a fake ZKBio
+(scripts/fake_zkbio.py) locally, ingests both into a scratch ims.db with
+services/attendance_ingest.py, and compares report queries:
+
+    - ingest:       first full pull, then an incremental pull after a few
+                    new punches (rows/s and wall time)
+    - zkbio paging: a date-range report fetched from ZKBio 50 rows per
+                    request, as services/transactionService.ts does
+    - local:        the same report, and a per-person first-in/last-out
+                    summary, from the indexed transactions table
+
+Usage:
+    python3 scripts/bench_attendance_ingest.py [--panels 5] [--punches 20000]
+        [--transactions 50000] [--latency 0.05] [--output ingest.json]
+
+Requirements:
+    - pyzk library (pip install pyzk)
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+from urllib.parse import urlencode
+
+from bench_common import summarize
+from fake_zk_panel import FakePanelFleet
+from fake_zkbio import FakeZKBio
+from attendance_ingest import AttendanceIngestor, PanelSource, TransactionStore, ZKBioSource
+from panel_pool import PanelPool, load_panels
+
+ZKBIO_UI_PAGE_SIZE = 50
+FIRST_IN_LAST_OUT = """
+SELECT personPin, date(eventTime) AS day, MIN(eventTime) AS firstIn, MAX(eventTime) AS lastOut
+FROM transactions WHERE eventTime BETWEEN ? AND ?
+GROUP BY personPin, day
+"""
+
+
+def zkbio_report(url: str, start: str, end: str) -> int:
+    """Every transaction in [start, end] fetched 50 rows at a time"""
+    conn = http.client.HTTPConnection(url.split('//')[1], timeout=30)
+    rows, page = 0, 1
+    try:
+        while True:
+            query = urlencode({"pageNo": page, "pageSize": ZKBIO_UI_PAGE_SIZE, "startDate": start, "endDate": end})
+            conn.request("GET", f"/api/v2/transaction/list?{query}")
+            data = json.loads(conn.getresponse().read())["data"]
+            rows += len(data)
+            if len(data) < ZKBIO_UI_PAGE_SIZE:
+                return rows
+            page += 1
+    finally:
+        conn.close()
+
+
+def local_report(path: str, start: str, end: str) -> tuple:
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute("SELECT * FROM transactions WHERE eventTime BETWEEN ? AND ? ORDER BY eventTime DESC",
+                          (start, end)).fetchall()
+        summary = db.execute(FIRST_IN_LAST_OUT, (start, end)).fetchall()
+        return len(rows), len(summary)
+    finally:
+        db.close()
+
+
+async def timed_ingest(ingestor: AttendanceIngestor) -> dict:
+    started = time.perf_counter()
+    results = await ingestor.run_once()
+    seconds = time.perf_counter() - started
+    failed = [r for r in results if r["status"] != "success"]
+    if failed:
+        raise RuntimeError(f"Ingestion failed: {failed}")
+    added = sum(r["added"] for r in results)
+    return {
+        "seconds": round(seconds, 3),
+        "fetched": sum(r["fetched"] for r in results),
+        "added": added,
+        "rows_per_s": round(added / seconds) if seconds else None,
+    }
+
+
+async def run(args) -> dict:
+    fleet = FakePanelFleet(args.panels, args.base_port, args.latency,
+                           users=args.users, punches=args.punches // args.panels).start()
+    zkbio = FakeZKBio(args.zkbio_port, args.latency)
+    zkbio.add_transactions(args.transactions)
+    zkbio.serve()
+
+    workdir = tempfile.mkdtemp(prefix="ims-ingest-")
+    db_path = os.path.join(workdir, "ims.db")
+    store = TransactionStore(db_path)
+    pool = PanelPool(load_panels(fleet.panels_spec()))
+    sources = [PanelSource(pool, name) for name in pool.names] + [ZKBioSource(zkbio.url)]
+    ingestor = AttendanceIngestor(store, sources)
+    try:
+        first = await timed_ingest(ingestor)
+        fleet.punch(args.new_punches)
+        zkbio.add_transactions(args.new_punches, days=1 / 24, until=datetime.now() + timedelta(hours=1))
+        incremental = await timed_ingest(ingestor)
+
+        end = datetime.now()
+        start = (end - timedelta(days=args.report_days)).strftime("%Y-%m-%d %H:%M:%S")
+        end = end.strftime("%Y-%m-%d %H:%M:%S")
+
+        zkbio_times: List[float] = []
+        zkbio_requests = zkbio.requests
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            zkbio_rows = await asyncio.to_thread(zkbio_report, zkbio.url, start, end)
+            zkbio_times.append(time.perf_counter() - started)
+        zkbio_requests = (zkbio.requests - zkbio_requests) // args.rounds
+
+        local_times: List[float] = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            local_rows, summary_rows = local_report(db_path, start, end)
+            local_times.append(time.perf_counter() - started)
+    finally:
+        await pool.close()
+        store.close()
+        zkbio.stop()
+        fleet.stop()
+
+    return {
+        "config": {"panels": args.panels, "punches": args.punches, "transactions": args.transactions,
+                   "latency_s": args.latency, "report_days": args.report_days, "rounds": args.rounds},
+        "ingest_first": first,
+        "ingest_incremental": incremental,
+        "zkbio_paging": dict(summarize(zkbio_times), rows=zkbio_rows, requests=zkbio_requests),
+        "local": dict(summarize(local_times), rows=local_rows, first_in_last_out=summary_rows),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--panels', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200, help='Users per fake panel')
+    parser.add_argument('--punches', type=int, default=20000, help='Punches across all fake panels')
+    parser.add_argument('--transactions', type=int, default=50000, help='Fake ZKBio door events')
+    parser.add_argument('--new-punches', type=int, default=100, help='Events added before the incremental pull')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake panel/ZKBio seconds per request')
+    parser.add_argument('--report-days', type=float, default=7)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--base-port', type=int, default=14370)
+    parser.add_argument('--zkbio-port', type=int, default=18098)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{args.panels} panels / {args.punches} punches, ZKBio {args.transactions} events, "
+          f"{args.latency * 1000:.0f} ms/request")
+    for name in ("ingest_first", "ingest_incremental"):
+        stats = report[name]
+        print(f"  {name:<19} {stats['added']:>7} rows added of {stats['fetched']:>7} fetched "
+              f"in {stats['seconds']:>7} s ({stats['rows_per_s']} rows/s)")
+    zk, local = report["zkbio_paging"], report["local"]
+    print(f"  {args.report_days:g}-day report: ZKBio paging p50 {zk['p50_ms']} ms ({zk['rows']} rows, "
+          f"{zk['requests']} requests); local p50 {local['p50_ms']} ms ({local['rows']} rows, "
+          f"{local['first_in_last_out']} first-in/last-out rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Cold vs Warm Capture Benchmark
+
+Compares the latency of a capture when the bridge has to be started for it
+(the old spawn-per-capture flow: interpreter startup, SDK init, device open,
+readiness wait, connect, capture) with a capture against an already running
+bridge daemon (connect + capture, and capture on an open connection).
+
+Usage:
+    python3 scripts/bench_bridge_cold_warm.py [--runs 10] [--port 18765] [--bridge services/fingerprint_bridge.py]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, summarize, wait_ready
+
+
+async def capture(websocket, finger_index: int = 0) -> dict:
+    await websocket.send(json.dumps({"action": "capture", "fingerIndex": finger_index}))
+    while True:
+        reply = json.loads(await websocket.recv())
+        if reply.get('status') != 'queued':
+            return reply
+
+
+async def run_cold(bridge_path: str, port: int, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = start_bridge(bridge_path, port)
+        try:
+            await wait_ready(process, port)
+            async with websockets.connect(f"ws://localhost:{port}") as websocket:
+                await capture(websocket)
+            samples.append(time.perf_counter() - started)
+        finally:
+            stop_bridge(process)
+    return samples
+
+
+async def run_warm(bridge_path: str, port: int, runs: int) -> tuple:
+    reconnect_samples = []
+    persistent_samples = []
+    process = start_bridge(bridge_path, port)
+    try:
+        await wait_ready(process, port)
+
+        for _ in range(runs):
+            started = time.perf_counter()
+            async with websockets.connect(f"ws://localhost:{port}") as websocket:
+                await capture(websocket)
+            reconnect_samples.append(time.perf_counter() - started)
+
+        async with websockets.connect(f"ws://localhost:{port}") as websocket:
+            for _ in range(runs):
+                started = time.perf_counter()
+                await capture(websocket)
+                persistent_samples.append(time.perf_counter() - started)
+    finally:
+        stop_bridge(process)
+    return reconnect_samples, persistent_samples
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--port', type=int, default=18765)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    cold = await run_cold(args.bridge, args.port, args.runs)
+    warm_reconnect, warm_persistent = await run_warm(args.bridge, args.port, args.runs)
+
+    results = {
+        "bridge": os.path.basename(args.bridge),
+        "cold_start_capture": summarize(cold),
+        "warm_connect_capture": summarize(warm_reconnect),
+        "warm_persistent_capture": summarize(warm_persistent),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Bridge: {results['bridge']}")
+    for name in ("cold_start_capture", "warm_connect_capture", "warm_persistent_capture"):
+        stats = results[name]
+        print(f"  {name:<26} mean {stats['mean_ms']:>9.2f} ms   p50 {stats['p50_ms']:>9.2f} ms   max {stats['max_ms']:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Device Pool Benchmark
+
+Starts a bridge with N simulated scanners and runs M concurrent captures
+from separate clients. With least-busy routing the wall time should be about
+ceil(M / N) * capture latency rather than M * capture latency. Per-device
+utilisation is read back from the `status` action.
+
+Usage:
+    python3 scripts/bench_bridge_device_pool.py [--devices 4] [--captures 8] [--capture-latency 1.0]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, wait_ready
+
+
+async def capture(port: int, finger_index: int) -> dict:
+    async with websockets.connect(f"ws://localhost:{port}") as websocket:
+        await websocket.send(json.dumps({"action": "capture", "fingerIndex": finger_index}))
+        while True:
+            reply = json.loads(await websocket.recv())
+            if reply.get('status') != 'queued':
+                return reply
+
+
+async def status(port: int) -> dict:
+    async with websockets.connect(f"ws://localhost:{port}") as websocket:
+        await websocket.send(json.dumps({"action": "status"}))
+        return json.loads(await websocket.recv())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18767)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--captures', type=int, default=8)
+    parser.add_argument('--capture-latency', type=float, default=1.0)
+    args = parser.parse_args()
+
+    process = start_bridge(args.bridge, args.port, env={
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_DEVICES": str(args.devices),
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": str(args.capture_latency),
+    })
+    try:
+        await wait_ready(process, args.port)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(capture(args.port, i % 10) for i in range(args.captures)))
+        elapsed = time.perf_counter() - started
+        bridge_status = await status(args.port)
+    finally:
+        stop_bridge(process)
+
+    devices = bridge_status.get('queue') or bridge_status.get('device_status', {}).get('queue', {})
+    per_device = {}
+    for result in results:
+        per_device[result.get('deviceId')] = per_device.get(result.get('deviceId'), 0) + 1
+
+    ideal = math.ceil(args.captures / args.devices) * args.capture_latency
+    print(f"{args.captures} captures on {args.devices} device(s): {elapsed:.2f} s "
+          f"(ideal {ideal:.2f} s, serial {args.captures * args.capture_latency:.2f} s)")
+    print(f"  successes: {sum(1 for r in results if r.get('status') == 'success')}")
+    print(f"  captures per device: {per_device}")
+    for device in devices.get('devices', []):
+        print(f"  {device['device']:<8} completed {device['completed']:>3}   utilisation {device['utilisation']:.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
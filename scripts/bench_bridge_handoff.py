@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Bridge Handoff Benchmark
+
+Keeps --clients clients capturing in a loop (simulated backend, each
+capture taking --latency seconds) while a second bridge replaces the first
+on the same port, two ways:
+
+    - restart: the first bridge gets SIGTERM and the second is only started
+               once it has exited, as an upgrade was done before
+    - handoff: the second bridge is started while the first still runs; it
+               binds the port alongside it and tells it to drain (see
+               services/bridge_daemon.py)
+
+Clients behave like services/bridgeClient.ts: a capture handed back with
+"draining" (or cut off by the connection closing) is resent, with the same
+idempotency key, on a new connection. A prober opens a fresh connection
+every 20 ms and pings.
+
+Reports, per mode, the connections refused, captures that failed after
+their resends, captures that were resent, the capture latency and the
+longest time without a connection being accepted. Exits 1 when a capture
+is lost in handoff mode. A connection can still be refused there: one
+caught in the old bridge's accept queue or handshake just as it stops
+listening is reset or answered 503.
+
+Usage:
+    python3 scripts/bench_bridge_handoff.py [--clients 4] [--latency 0.5] [--seconds 6]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, summarize, wait_ready
+
+MAX_RESENDS = 5
+PROBE_INTERVAL = 0.02
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.failed = 0
+        self.resent = 0
+        self.refused = 0
+        self.accepted = []      # times a probe connection was accepted
+
+
+async def capture(port: int, stats: Stats, ids) -> None:
+    """One keyed capture, resent on a new connection until it succeeds"""
+    message = {"action": "capture", "idempotencyKey": f"bench-{next(ids)}"}
+    started = time.perf_counter()
+    for attempt in range(MAX_RESENDS + 1):
+        if attempt:
+            stats.resent += 1
+        try:
+            async with websockets.connect(f"ws://localhost:{port}") as ws:
+                await ws.send(json.dumps({**message, "id": 1}))
+                async for frame in ws:
+                    reply = json.loads(frame)
+                    if reply.get("id") != 1 or reply.get("status") == "queued":
+                        continue
+                    if reply.get("status") == "success":
+                        stats.latencies.append(time.perf_counter() - started)
+                        return
+                    break   # draining, busy or an error: resend
+        except (OSError, websockets.exceptions.WebSocketException):
+            pass
+        await asyncio.sleep(0.1)
+    stats.failed += 1
+
+
+async def client(port: int, stats: Stats, stop: asyncio.Event, ids) -> None:
+    while not stop.is_set():
+        await capture(port, stats, ids)
+
+
+async def prober(port: int, stats: Stats, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            async with websockets.connect(f"ws://localhost:{port}", open_timeout=1) as ws:
+                await ws.send(json.dumps({"action": "ping"}))
+                await ws.recv()
+                stats.accepted.append(time.perf_counter())
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+            stats.refused += 1
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+def reap(process) -> None:
+    """Wait for the process on a thread, so it doesn't linger as a zombie the new bridge waits on"""
+    threading.Thread(target=process.wait, daemon=True).start()
+
+
+async def exited(process, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while process.poll() is None and time.perf_counter() < deadline:
+        await asyncio.sleep(0.02)
+
+
+async def run(mode: str, args, env: dict) -> Stats:
+    stats, stop, ids = Stats(), asyncio.Event(), itertools.count(1)
+    first = start_bridge(args.bridge, args.port, env=env)
+    reap(first)
+    await wait_ready(first, args.port)
+    tasks = [asyncio.create_task(client(args.port, stats, stop, ids)) for _ in range(args.clients)]
+    tasks.append(asyncio.create_task(prober(args.port, stats, stop)))
+    await asyncio.sleep(args.seconds / 3)
+
+    if mode == "restart":
+        first.send_signal(signal.SIGTERM)
+        await exited(first)
+        second = start_bridge(args.bridge, args.port, env=env)
+    else:
+        second = start_bridge(args.bridge, args.port, env=env)
+    await wait_ready(second, args.port)
+    await exited(first)
+    await asyncio.sleep(args.seconds * 2 / 3)
+
+    stop.set()
+    await asyncio.gather(*tasks)
+    stop_bridge(second)
+    return stats
+
+
+def longest_gap(times: list) -> float:
+    return max((later - earlier for earlier, later in zip(times, times[1:])), default=0.0)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated seconds per capture')
+    parser.add_argument('--seconds', type=float, default=6.0, help='Load duration per mode')
+    parser.add_argument('--drain', type=float, default=10.0, help='FINGERPRINT_DRAIN_SECONDS')
+    parser.add_argument('--port', type=int, default=18775)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    args = parser.parse_args()
+
+    env = {
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": str(args.latency),
+        "FINGERPRINT_DEVICE_POLL": "0",
+        "FINGERPRINT_DRAIN_SECONDS": str(args.drain),
+    }
+    # Read by wait_ready here too; also keeps the handoff away from a bridge on the default port
+    os.environ["FINGERPRINT_BRIDGE_RUN_DIR"] = tempfile.mkdtemp(prefix='bench-handoff-')
+    lost = 0
+    for mode in ("restart", "handoff"):
+        stats = await run(mode, args, env)
+        print(f"{mode}: {len(stats.latencies)} captures, {stats.failed} failed, {stats.resent} resent, "
+              f"{stats.refused} connections refused, longest without an accepted connection "
+              f"{longest_gap(stats.accepted) * 1000:.0f} ms")
+        print(f"  capture latency {summarize(stats.latencies)}")
+        if mode == "handoff":
+            lost = stats.failed
+    return 0 if lost == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
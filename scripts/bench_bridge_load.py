@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Load Test
+
+Starts each bridge against the simulated scanner backend (configurable
+capture latency, failure rate and device count) and drives N concurrent
+WebSocket clients, each sending a weighted mix of `capture`, `status` and
+`ping` requests back to back for a fixed duration. Reports throughput and
+p50/p95/p99 latency per action, reply outcomes (success, busy, error) and
+the bridge's own stage timings from GET /metrics.json, and writes it all as
+JSON so runs can be compared.
+
+Usage:
+    python3 scripts/bench_bridge_load.py [--bridges fingerprint,windows] [--clients 16]
+        [--duration 10] [--mix capture=1,status=2,ping=7] [--output load.json]
+    python3 scripts/bench_bridge_load.py --baseline load.json --max-regression 0.25
+
+With --baseline, the script exits non-zero when any action's p95 latency or
+throughput is more than --max-regression worse than in the baseline file.
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from typing import Dict, List
+
+import websockets
+
+from bench_common import SERVICES_DIR, start_bridge, stop_bridge, summarize, wait_ready
+
+BRIDGES = {
+    "fingerprint": os.path.join(SERVICES_DIR, 'fingerprint_bridge.py'),
+    "windows": os.path.join(SERVICES_DIR, 'fingerprint_bridge_windows.py'),
+    "simple": os.path.join(SERVICES_DIR, 'fingerprint_bridge_simple.py'),
+}
+ACTIONS = ("capture", "status", "ping")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        action, _, weight = part.partition('=')
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"Unknown action in mix: {action}")
+        mix[action] = float(weight or 1)
+    return mix
+
+
+async def request(websocket, action: str, finger_index: int) -> str:
+    """Send one request and wait for its final reply; return the outcome"""
+    message = {"action": action}
+    if action == 'capture':
+        message["fingerIndex"] = finger_index
+    await websocket.send(json.dumps(message))
+    while True:
+        reply = json.loads(await websocket.recv())
+        status = reply.get('status')
+        # Captures are acked first; the result follows when the device ran it
+        if status != 'queued':
+            break
+    if status in ('success', 'pong', 'ready', 'info', 'disconnected'):
+        return "ok"
+    return status or "unknown"
+
+
+async def client(port: int, mix: Dict[str, float], deadline: float, seed: int,
+                 samples: Dict[str, List[float]], outcomes: Dict[str, Dict[str, int]]) -> None:
+    rng = random.Random(seed)
+    actions, weights = list(mix), list(mix.values())
+    async with websockets.connect(f"ws://localhost:{port}", max_size=None) as websocket:
+        while time.perf_counter() < deadline:
+            action = rng.choices(actions, weights)[0]
+            started = time.perf_counter()
+            outcome = await request(websocket, action, rng.randrange(10))
+            elapsed = time.perf_counter() - started
+            counts = outcomes.setdefault(action, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+            # Busy replies come straight back; keep them out of the latency figures
+            if outcome == "ok":
+                samples.setdefault(action, []).append(elapsed)
+            elif outcome == "busy":
+                await asyncio.sleep(0.05)
+
+
+def bridge_metrics(port: int) -> dict:
+    try:
+        with urllib.request.urlopen(f"http://localhost:{port}/metrics.json", timeout=2) as response:
+            snapshot = json.load(response)
+    except (OSError, ValueError):
+        return {}
+    return {
+        "stages": snapshot["histograms"].get("bridge_stage_seconds", {}),
+        "queue_wait": snapshot["histograms"].get("bridge_queue_wait_seconds"),
+        "errors": snapshot["counters"].get("bridge_errors_total", {}),
+    }
+
+
+async def run_bridge(name: str, args) -> dict:
+    process = start_bridge(BRIDGES[name], args.port, env={
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": str(args.capture_latency),
+        "FINGERPRINT_SIM_FAILURE_RATE": str(args.failure_rate),
+        "FINGERPRINT_SIM_DEVICES": str(args.devices),
+    })
+    samples: Dict[str, List[float]] = {}
+    outcomes: Dict[str, Dict[str, int]] = {}
+    try:
+        await wait_ready(process, args.port)
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(client(args.port, args.mix, deadline, args.seed + i, samples, outcomes)
+                               for i in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        metrics = await asyncio.to_thread(bridge_metrics, args.port)
+    finally:
+        stop_bridge(process)
+
+    actions = {}
+    for action in args.mix:
+        action_samples = samples.get(action, [])
+        actions[action] = {
+            "throughput_per_s": round(len(action_samples) / elapsed, 2),
+            "outcomes": outcomes.get(action, {}),
+            **summarize(action_samples),
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(sum(sum(counts.values()) for counts in outcomes.values()) / elapsed, 2),
+        "actions": actions,
+        "bridge_metrics": metrics,
+    }
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Actions whose p95 or throughput got worse than the baseline allows"""
+    found = []
+    for bridge, result in report["bridges"].items():
+        for action, stats in result["actions"].items():
+            before = baseline.get("bridges", {}).get(bridge, {}).get("actions", {}).get(action)
+            if not before or not stats.get("runs") or not before.get("runs"):
+                continue
+            if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                found.append(f"{bridge} {action}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+            if stats["throughput_per_s"] < before["throughput_per_s"] * (1 - tolerance):
+                found.append(f"{bridge} {action}: throughput {before['throughput_per_s']} -> "
+                             f"{stats['throughput_per_s']}/s")
+    return found
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18768)
+    parser.add_argument('--bridges', default='fingerprint,windows',
+                        help=f"Comma-separated, from: {', '.join(BRIDGES)}")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per bridge')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('capture=1,status=2,ping=7'))
+    parser.add_argument('--capture-latency', type=float, default=0.2)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--devices', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = {
+        "config": {
+            "clients": args.clients,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "capture_latency_s": args.capture_latency,
+            "failure_rate": args.failure_rate,
+            "devices": args.devices,
+        },
+        "bridges": {},
+    }
+    for name in args.bridges.split(','):
+        report["bridges"][name] = await run_bridge(name, args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    for name, result in report["bridges"].items():
+        print(f"{name}: {args.clients} clients, {result['requests_per_s']} req/s over {result['elapsed_s']} s")
+        for action, stats in result["actions"].items():
+            print(f"  {action:<8} {stats['throughput_per_s']:>8}/s  p50 {stats.get('p50_ms', '-'):>8} ms  "
+                  f"p95 {stats.get('p95_ms', '-'):>8} ms  p99 {stats.get('p99_ms', '-'):>8} ms  {stats['outcomes']}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.max_regression)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        if found:
+            return 1
+        print(f"OK: within {args.max_regression:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
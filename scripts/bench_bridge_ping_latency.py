@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Ping Latency Under Capture
+
+Starts a bridge with the simulated SDK backend configured for a slow
+(default 10 s) blocking capture, then measures `ping` round trips from a
+second client before and during that capture. Because SDK calls run on a
+dedicated device thread, ping latency must stay flat; the script exits
+non-zero if p99 ping latency during the capture exceeds --max-p99-ms.
+
+Usage:
+    python3 scripts/bench_bridge_ping_latency.py [--capture-latency 10] [--max-p99-ms 50]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, summarize, wait_ready
+
+PING_INTERVAL = 0.05
+
+
+async def ping_for(websocket, duration: float) -> list:
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await websocket.send(json.dumps({"action": "ping"}))
+        reply = json.loads(await websocket.recv())
+        if reply.get('status') == 'pong':
+            samples.append(time.perf_counter() - started)
+        await asyncio.sleep(PING_INTERVAL)
+    return samples
+
+
+async def capture(port: int) -> dict:
+    async with websockets.connect(f"ws://localhost:{port}") as websocket:
+        await websocket.send(json.dumps({"action": "capture", "fingerIndex": 0}))
+        while True:
+            reply = json.loads(await websocket.recv())
+            if reply.get('status') != 'queued':
+                return reply
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18766)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    parser.add_argument('--capture-latency', type=float, default=10.0)
+    parser.add_argument('--baseline', type=float, default=2.0, help='Seconds of idle pings')
+    parser.add_argument('--max-p99-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    process = start_bridge(args.bridge, args.port, env={
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": str(args.capture_latency),
+    })
+    try:
+        await wait_ready(process, args.port)
+        async with websockets.connect(f"ws://localhost:{args.port}") as websocket:
+            baseline = await ping_for(websocket, args.baseline)
+
+            capture_task = asyncio.create_task(capture(args.port))
+            # Let the capture reach the device thread before measuring
+            await asyncio.sleep(0.2)
+            during = await ping_for(websocket, max(args.capture_latency - 0.5, 0.5))
+            result = await capture_task
+    finally:
+        stop_bridge(process)
+
+    idle_stats = summarize(baseline)
+    capture_stats = summarize(during)
+    print(f"Capture result: {result.get('status')}")
+    print(f"  idle pings           {idle_stats}")
+    print(f"  pings during capture {capture_stats}")
+
+    if not during:
+        print("FAIL: no ping replies during capture")
+        return 1
+    if result.get('status') != 'success' or capture_stats['p99_ms'] > args.max_p99_ms:
+        print(f"FAIL: ping p99 {capture_stats['p99_ms']} ms exceeds {args.max_p99_ms} ms during capture")
+        return 1
+    print("OK: ping latency stayed flat during capture")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
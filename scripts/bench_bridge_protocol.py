@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Protocol Benchmark
+
+Compares the legacy JSON (base64 template) capture reply with the binary
+frame format: encoded size, and encode + decode throughput for a template
+alone, a template with a raw sensor image, and a ten-finger enrolment.
+
+Usage:
+    python3 scripts/bench_bridge_protocol.py [--iterations 2000] [--json]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services'))
+
+from bridge_protocol import decode_binary_result, encode_binary_result, encode_json_result  # noqa: E402
+
+TEMPLATE_SIZE = 1664            # ZKFinger 10.0 template
+IMAGE_SIZE = 300 * 400          # ZK8500R raw 8-bit image
+
+
+def make_result(finger_index: int, with_image: bool) -> dict:
+    return {
+        "status": "success",
+        "template": os.urandom(TEMPLATE_SIZE),
+        "image": os.urandom(IMAGE_SIZE) if with_image else None,
+        "quality": 90,
+        "fingerIndex": finger_index,
+        "version": "10.0",
+        "bioType": 1
+    }
+
+
+def decode_json_result(frame: str) -> dict:
+    message = json.loads(frame)
+    message["template"] = base64.b64decode(message["template"])
+    if "image" in message:
+        message["image"] = base64.b64decode(message["image"])
+    return message
+
+
+def measure(results: list, iterations: int, encode, decode) -> dict:
+    frames = [encode(result) for result in results]
+    size = sum(len(frame) for frame in frames)
+    payload = sum(len(r["template"]) + len(r["image"] or b"") for r in results)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for result in results:
+            decode(encode(result))
+    elapsed = time.perf_counter() - started
+
+    messages = iterations * len(results)
+    return {
+        "bytes": size,
+        "overhead_pct": round((size - payload) / payload * 100, 1),
+        "round_trips_per_s": round(messages / elapsed),
+        "mb_per_s": round(payload * iterations / elapsed / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    scenarios = {
+        "template": [make_result(0, False)],
+        "template+image": [make_result(0, True)],
+        "ten_fingers": [make_result(i, False) for i in range(10)],
+    }
+
+    report = {}
+    for name, results in scenarios.items():
+        iterations = max(1, args.iterations // (50 if name == "template+image" else 1))
+        report[name] = {
+            "json": measure(results, iterations, encode_json_result, decode_json_result),
+            "binary": measure(results, iterations, encode_binary_result, decode_binary_result),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, formats in report.items():
+        print(name)
+        for fmt, stats in formats.items():
+            print(f"  {fmt:<7} {stats['bytes']:>9} bytes  (+{stats['overhead_pct']:>5}%)  "
+                  f"{stats['round_trips_per_s']:>8} enc+dec/s  {stats['mb_per_s']:>8} MB/s")
+
+
+if __name__ == "__main__":
+    main()
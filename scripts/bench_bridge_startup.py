@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Startup Benchmark
+
+Spawns the bridge --runs times on the simulated backend, with the SDK's
+initialization and device open delayed (--sdk-init, --sdk-open) to model
+the ZKFinger SDK, and measures from the spawn:
+
+    - the first accepted connection (a ping answered);
+    - the ready file (see bridge_daemon.py);
+    - the first capture answered, i.e. the scanner is open.
+
+Each run is measured with a cold capability cache (deleted before the spawn)
+and a warm one (left by the previous run). Exits 1 when the p50 time to the
+first answered ping is over --budget-ms.
+
+Usage:
+    python3 scripts/bench_bridge_startup.py [--runs 10] [--budget-ms 500] [--sdk-init 0.8]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, read_ready_file, start_bridge, stop_bridge, summarize
+
+
+async def first_ping(port: int, started: float, timeout: float = 30.0) -> float:
+    """Seconds from `started` until the bridge answers a ping"""
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with websockets.connect(f"ws://localhost:{port}", open_timeout=1) as websocket:
+                await websocket.send(json.dumps({"action": "ping", "id": 1}))
+                while json.loads(await websocket.recv()).get('id') != 1:
+                    pass
+                return time.perf_counter() - started
+        except (OSError, websockets.exceptions.InvalidHandshake, asyncio.TimeoutError):
+            await asyncio.sleep(0.005)
+    raise TimeoutError("Bridge never accepted a connection")
+
+
+async def ready_file(process, port: int, started: float, timeout: float = 30.0) -> float:
+    """Seconds from `started` until the ready file names this process"""
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        info = read_ready_file(port)
+        if info and info.get('pid') == process.pid:
+            return time.perf_counter() - started
+        await asyncio.sleep(0.005)
+    raise TimeoutError("Bridge did not write its ready file")
+
+
+async def first_capture(port: int, started: float) -> float:
+    """Seconds from `started` until a capture sent on connect is answered"""
+    await first_ping(port, started)
+    async with websockets.connect(f"ws://localhost:{port}") as websocket:
+        await websocket.send(json.dumps({"action": "capture", "fingerIndex": 0, "id": 2}))
+        while True:
+            reply = json.loads(await websocket.recv())
+            if reply.get('id') == 2 and reply.get('status') != 'queued':
+                if reply.get('status') != 'success':
+                    raise RuntimeError(f"Capture failed: {reply.get('message')}")
+                return time.perf_counter() - started
+
+
+async def run(bridge_path: str, port: int, env: dict) -> tuple:
+    started = time.perf_counter()
+    process = start_bridge(bridge_path, port, env=env)
+    try:
+        return await asyncio.gather(
+            first_ping(port, started),
+            ready_file(process, port, started),
+            first_capture(port, started)
+        )
+    finally:
+        stop_bridge(process)
+
+
+def report(name: str, samples: dict) -> None:
+    print(f"{name}:")
+    for stage, values in samples.items():
+        print(f"  {stage:<14} {summarize(values)}")
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--port', type=int, default=18773)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    parser.add_argument('--budget-ms', type=float, default=500.0)
+    parser.add_argument('--sdk-init', type=float, default=0.8, help='Simulated SDK init latency (seconds)')
+    parser.add_argument('--sdk-open', type=float, default=0.2, help='Simulated device open latency (seconds)')
+    args = parser.parse_args()
+
+    cache_path = os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'capabilities.json')
+    env = {
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_INIT_LATENCY": str(args.sdk_init),
+        "FINGERPRINT_SIM_OPEN_LATENCY": str(args.sdk_open),
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": "0.05",
+        "FINGERPRINT_CAPABILITY_CACHE": cache_path,
+        "FINGERPRINT_DEVICE_POLL": "0",
+    }
+    results = {mode: {"first ping": [], "ready file": [], "first capture": []} for mode in ("cold", "warm")}
+    for _ in range(args.runs):
+        for mode in ("cold", "warm"):
+            if mode == "cold" and os.path.exists(cache_path):
+                os.remove(cache_path)
+            ping, ready, captured = await run(args.bridge, args.port, env)
+            results[mode]["first ping"].append(ping)
+            results[mode]["ready file"].append(ready)
+            results[mode]["first capture"].append(captured)
+
+    print(f"{args.runs} spawns of {os.path.basename(args.bridge)}, "
+          f"SDK init {args.sdk_init} s + device open {args.sdk_open} s")
+    for mode, samples in results.items():
+        report(f"{mode} capability cache", samples)
+
+    first_ping_p50 = max(summarize(samples["first ping"])["p50_ms"] for samples in results.values())
+    within = first_ping_p50 <= args.budget_ms
+    print(f"first accepted connection p50 {first_ping_p50:.0f} ms: "
+          f"{'within' if within else 'OVER'} the {args.budget_ms:.0f} ms budget")
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
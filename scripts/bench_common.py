@@ -0,0 +1,75 @@
+"""
+Shared helpers for the fingerprint bridge benchmark scripts.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES_DIR = os.path.join(ROOT, 'services')
+DEFAULT_BRIDGE = os.path.join(SERVICES_DIR, 'fingerprint_bridge.py')
+
+sys.path.insert(0, SERVICES_DIR)
+
+from bridge_daemon import read_ready_file  # noqa: E402
+
+
+def start_bridge(bridge_path: str, port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Spawn a bridge process on the given port"""
+    process_env = dict(os.environ, FINGERPRINT_BRIDGE_PORT=str(port))
+    process_env.update(env or {})
+    return subprocess.Popen(
+        [sys.executable, bridge_path],
+        env=process_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(process: subprocess.Popen, port: int, timeout: float = 30.0) -> None:
+    """Wait for the bridge's ready file handshake"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Bridge exited with code {process.returncode}")
+        info = read_ready_file(port)
+        if info and info.get('pid') == process.pid:
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError("Bridge did not become ready")
+
+
+def stop_bridge(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds for samples in seconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"runs": 0}
+    return {
+        "runs": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
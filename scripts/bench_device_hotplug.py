@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Bridge Hot-Plug Benchmark
+
+Starts a bridge on the simulated backend and unplugs its scanner by writing
+the device id to the FINGERPRINT_SIM_UNPLUGGED file: once in the middle of a
+capture and then for --unplugged seconds while more captures are queued.
+Reports:
+
+    - how long the bridge took to broadcast the removal;
+    - how long it took to reopen the scanner after it was plugged back in;
+    - whether the captures queued while it was gone ran on the recovered
+      device without a bridge restart.
+
+Usage:
+    python3 scripts/bench_device_hotplug.py [--poll 0.25] [--unplugged 2.0] [--queued 4]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, wait_ready
+
+DEVICE = "SIM-0"
+
+
+async def capture(port: int, finger_index: int) -> dict:
+    async with websockets.connect(f"ws://localhost:{port}") as websocket:
+        await websocket.send(json.dumps({"action": "capture", "fingerIndex": finger_index, "id": 1}))
+        while True:
+            reply = json.loads(await websocket.recv())
+            # Device broadcasts carry no id
+            if reply.get('id') == 1 and reply.get('status') != 'queued':
+                return reply
+
+
+async def status(port: int) -> dict:
+    async with websockets.connect(f"ws://localhost:{port}") as websocket:
+        await websocket.send(json.dumps({"action": "status", "id": 1}))
+        while True:
+            reply = json.loads(await websocket.recv())
+            if reply.get('id') == 1:
+                return reply
+
+
+class DeviceEvents:
+    """Records the bridge's device broadcasts with their arrival times"""
+
+    def __init__(self):
+        self.events = []
+        self.changed = asyncio.Event()
+
+    async def listen(self, port: int) -> None:
+        async with websockets.connect(f"ws://localhost:{port}") as websocket:
+            async for message in websocket:
+                reply = json.loads(message)
+                if reply.get('status') == 'device':
+                    self.events.append((time.perf_counter(), reply))
+                    self.changed.set()
+
+    async def wait_for(self, states, since: float, timeout: float = 30.0) -> float:
+        """Seconds from `since` until a broadcast with one of the states"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            for at, event in self.events:
+                if at >= since and event['state'] in states:
+                    return at - since
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"No {'/'.join(states)} broadcast")
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+def set_unplugged(path: str, unplugged: bool) -> None:
+    with open(path, 'w') as f:
+        f.write(DEVICE if unplugged else '')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18772)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    parser.add_argument('--poll', type=float, default=0.25, help='FINGERPRINT_DEVICE_POLL (seconds)')
+    parser.add_argument('--capture-latency', type=float, default=0.5)
+    parser.add_argument('--unplugged', type=float, default=2.0, help='Seconds the scanner stays unplugged')
+    parser.add_argument('--queued', type=int, default=4, help='Captures queued while it is unplugged')
+    args = parser.parse_args()
+
+    unplugged_path = os.path.join(tempfile.mkdtemp(prefix='bench-hotplug-'), 'unplugged')
+    set_unplugged(unplugged_path, False)
+    process = start_bridge(args.bridge, args.port, env={
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": str(args.capture_latency),
+        "FINGERPRINT_SIM_UNPLUGGED": unplugged_path,
+        "FINGERPRINT_DEVICE_POLL": str(args.poll),
+    })
+    try:
+        await wait_ready(process, args.port)
+        events = DeviceEvents()
+        listener = asyncio.create_task(events.listen(args.port))
+        await asyncio.sleep(0.1)
+
+        # 1. Unplugged in the middle of a capture
+        in_flight = asyncio.create_task(capture(args.port, 0))
+        await asyncio.sleep(args.capture_latency / 2)
+        unplugged_at = time.perf_counter()
+        set_unplugged(unplugged_path, True)
+        interrupted = await in_flight
+        detected = await events.wait_for(('lost', 'removed'), unplugged_at)
+
+        # 2. Captures queued while it is gone, then plugged back in
+        queued = [asyncio.create_task(capture(args.port, i % 10)) for i in range(args.queued)]
+        await asyncio.sleep(args.unplugged)
+        replugged_at = time.perf_counter()
+        set_unplugged(unplugged_path, False)
+        reopened = await events.wait_for(('open',), replugged_at)
+        results = await asyncio.gather(*queued)
+        drained = time.perf_counter() - replugged_at
+
+        bridge_status = await status(args.port)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        restarted = process.poll() is not None or bridge_status.get('pid') != process.pid
+    finally:
+        stop_bridge(process)
+
+    successes = sum(1 for result in results if result.get('status') == 'success')
+    print(f"unplugged mid-capture: {interrupted.get('status')} ({interrupted.get('message')})")
+    print(f"  removal broadcast after {detected * 1000:.0f} ms (poll {args.poll} s)")
+    print(f"replugged after {args.unplugged} s: reopened and broadcast after {reopened * 1000:.0f} ms")
+    print(f"  {successes}/{args.queued} captures queued while unplugged succeeded, "
+          f"all done {drained:.2f} s after replug")
+    print(f"  broadcasts: {[event['state'] for _, event in events.events]}")
+    print(f"  bridge restarted: {'yes' if restarted else 'no'}; devices now {bridge_status.get('devices')}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
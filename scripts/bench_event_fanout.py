@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Live Event Fan-out Benchmark
+
+Two parts:
+
+    - hub:     publishes events in-process to an EventHub
+               (services/panel_events.py) with many subscribers, some of
+               which never read, and times publish() per event; stalled
+               subscribers must cost no more than live ones and hold at
+               most their queue size
+    - bridge:  serves fake panels (scripts/fake_zk_panel.py), starts the
+               network bridge on them, and punches at a steady rate while a
+               fast subscriber measures punch-to-delivery latency and a
+               stalled subscriber (never reads) sits on the same bridge
+
+Usage:
+    python3 scripts/bench_event_fanout.py [--panels 4] [--rate 1000] [--seconds 20]
+        [--subscribers 100] [--output events.json]
+
+Requirements:
+    - pyzk library (pip install pyzk)
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import time
+from typing import Dict, List, Tuple
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, summarize, wait_ready
+from fake_zk_panel import FakePanelFleet
+from panel_events import EventHub
+
+STALLED_QUEUE_SIZE = 64
+STALLED_RCVBUF = 4096
+
+
+def stalled_subscriber(port: int, request: dict) -> socket.socket:
+    """Subscribe over a raw WebSocket and then never read again
+
+    A tiny receive buffer makes the bridge's sends to it stall quickly (a
+    WebSocket library would keep reading into its own buffers).
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, STALLED_RCVBUF)
+    sock.connect(("127.0.0.1", port))
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((f"GET / HTTP/1.1\r\nHost: localhost:{port}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    response = b''
+    while b'\r\n\r\n' not in response:
+        response += sock.recv(1024)
+    if b' 101 ' not in response.split(b'\r\n')[0]:
+        raise RuntimeError(f"WebSocket handshake failed: {response[:80]!r}")
+    payload = json.dumps(request).encode()
+    mask = os.urandom(4)
+    # One masked text frame (client frames must be masked)
+    header = struct.pack('!BB', 0x81, 0x80 | 126) + struct.pack('!H', len(payload)) if len(payload) >= 126 \
+        else struct.pack('!BB', 0x81, 0x80 | len(payload))
+    sock.sendall(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+    return sock
+
+
+def bench_hub(subscribers: int, events: int, queue_size: int) -> Dict[str, float]:
+    hub = EventHub()
+    stalled = [hub.subscribe(i, maxsize=queue_size) for i in range(subscribers // 2)]
+    filtered = [hub.subscribe(i, {"pinPrefix": "1"}, maxsize=queue_size)
+                for i in range(subscribers - len(stalled))]
+    event = {"panel": "panel-1", "doorName": "panel-1", "personPin": "1001", "eventTime": "2024-01-01 08:00:00"}
+
+    started = time.perf_counter()
+    for _ in range(events):
+        hub.publish(event)
+    seconds = time.perf_counter() - started
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "publish_us": round(seconds / events * 1e6, 2),
+        "max_queued": max(len(subscription.queue) for subscription in stalled + filtered),
+        "dropped_per_stalled": stalled[0].dropped,
+    }
+
+
+async def bench_bridge(args) -> dict:
+    fleet = FakePanelFleet(args.panels, args.base_port, users=args.users).start()
+    process = start_bridge(DEFAULT_BRIDGE, args.port, {
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_PANELS": fleet.panels_spec(),
+    })
+    url = f"ws://localhost:{args.port}"
+    sent: Dict[Tuple[str, str], float] = {}
+    latencies: List[float] = []
+    try:
+        await wait_ready(process, args.port)
+        stalled = stalled_subscriber(args.port, {"action": "subscribe", "queueSize": STALLED_QUEUE_SIZE, "id": 1})
+        async with websockets.connect(url) as fast:
+            await fast.send(json.dumps({"action": "subscribe", "id": 1}))
+            assert json.loads(await fast.recv())["status"] == "subscribed"
+            # Give every panel's live session time to register for events
+            while True:
+                await fast.send(json.dumps({"action": "status", "id": 2}))
+                status = json.loads(await fast.recv())
+                if status["events"]["streaming"] == args.panels:
+                    break
+                await asyncio.sleep(0.1)
+
+            async def receive() -> None:
+                while True:
+                    reply = json.loads(await fast.recv())
+                    if reply.get("status") != "event":
+                        continue
+                    key = (reply["event"]["panel"], reply["event"]["personPin"])
+                    if key in sent:
+                        latencies.append(time.perf_counter() - sent.pop(key))
+
+            receiver = asyncio.create_task(receive())
+            total = int(args.rate * args.seconds)
+            started = time.perf_counter()
+            for i in range(total):
+                panel, user = i % args.panels, i // args.panels
+                sent[(f"panel-{panel + 1}", str(1000 + user % args.users))] = time.perf_counter()
+                await asyncio.to_thread(fleet.punch_user, panel, user)
+                await asyncio.sleep(max(0.0, started + (i + 1) / args.rate - time.perf_counter()))
+            await asyncio.sleep(1.0)
+            receiver.cancel()
+
+            async with websockets.connect(url) as probe:
+                await probe.send(json.dumps({"action": "status"}))
+                status = json.loads(await probe.recv())
+        stalled.close()
+    finally:
+        stop_bridge(process)
+        fleet.stop()
+
+    subscriptions = {entry["subscription"]: entry for entry in status["events"]["subscriptions"]}
+    return {
+        "punched": total,
+        "delivered_fast": len(latencies),
+        "latency": summarize(latencies),
+        "stalled": subscriptions.get("sub-1"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--panels', type=int, default=4)
+    parser.add_argument('--users', type=int, default=1000, help='Users per fake panel')
+    parser.add_argument('--rate', type=float, default=1000, help='Punches per second across all panels')
+    parser.add_argument('--seconds', type=float, default=20,
+                        help='Long enough to fill the stalled client\'s kernel socket buffers (~4 MB)')
+    parser.add_argument('--subscribers', type=int, default=100, help='In-process hub subscribers')
+    parser.add_argument('--hub-events', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--base-port', type=int, default=14370)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = {
+        "hub": bench_hub(args.subscribers, args.hub_events, STALLED_QUEUE_SIZE),
+        "bridge": asyncio.run(bench_bridge(args)),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    hub, bridge = report["hub"], report["bridge"]
+    print(f"hub: {hub['subscribers']} subscribers (half never read): {hub['publish_us']} us/publish, "
+          f"queues capped at {hub['max_queued']}, {hub['dropped_per_stalled']} dropped per stalled subscriber")
+    latency = bridge["latency"]
+    print(f"bridge: {bridge['punched']} punches on {args.panels} panels at {args.rate:g}/s; fast subscriber got "
+          f"{bridge['delivered_fast']}, p50 {latency.get('p50_ms')} ms, p99 {latency.get('p99_ms')} ms")
+    stalled = bridge["stalled"] or {}
+    print(f"  stalled subscriber: {stalled.get('queued')} queued (cap {stalled.get('queueSize')}), "
+          f"{stalled.get('dropped')} dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Image Quality Gate Benchmark
+
+Scores synthetic 300x400 sensor images (good presses and five kinds of poor
+ones) with the bridge's quality gate and reports per-image latency, batch
+throughput and what the gate does with each kind of press: every poor press
+it rejects is an upload to ZKBio and a re-capture round trip saved.
+
+Usage:
+    python3 scripts/bench_image_quality.py [--images 200] [--batch 8] [--json]
+
+Requirements:
+    - numpy (pip install numpy)
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from bench_common import summarize
+from image_quality import IMAGE_HEIGHT, IMAGE_WIDTH, SYNTHETIC_KINDS, PoorQualityError, QualityGate, \
+    assess_images, synthetic_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=200, help='Images per kind of press')
+    parser.add_argument('--batch', type=int, default=8, help='Batch size for vectorised scoring')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    images = {kind: np.stack([synthetic_image(kind, IMAGE_WIDTH, IMAGE_HEIGHT, rng) for _ in range(args.images)])
+              for kind in SYNTHETIC_KINDS}
+
+    gate = QualityGate()
+    outcomes = {}
+    samples = []
+    for kind, batch in images.items():
+        reasons = {}
+        for image in batch:
+            capture = {"template": b"", "image": image.tobytes(), "quality": 92}
+            started = time.perf_counter()
+            try:
+                gate.check(capture)
+                reason = "accepted"
+            except PoorQualityError as e:
+                reason = e.reason
+            samples.append(time.perf_counter() - started)
+            reasons[reason] = reasons.get(reason, 0) + 1
+        outcomes[kind] = {reason: round(count / len(batch), 3) for reason, count in reasons.items()}
+
+    everything = np.concatenate(list(images.values()))
+    started = time.perf_counter()
+    for start in range(0, len(everything), args.batch):
+        assess_images(everything[start:start + args.batch])
+    batch_seconds = time.perf_counter() - started
+
+    report = {
+        "image": f"{IMAGE_WIDTH}x{IMAGE_HEIGHT}",
+        "single": summarize(samples),
+        "single_images_per_s": round(len(samples) / sum(samples)),
+        "batch_images_per_s": round(len(everything) / batch_seconds),
+        "outcomes": outcomes,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    single = report["single"]
+    print(f"{report['image']} images: one at a time p50 {single['p50_ms']} ms  p99 {single['p99_ms']} ms  "
+          f"({report['single_images_per_s']}/s)  batched {report['batch_images_per_s']}/s")
+    for kind, reasons in outcomes.items():
+        summary = ", ".join(f"{reason} {share:.0%}" for reason, share in sorted(reasons.items()))
+        print(f"  {kind:<13} {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Network Panel Pool Benchmark
+
+Serves N fake ZK panels locally (scripts/fake_zk_panel.py, with a
+per-command latency like real firmware) and times a `panel_info` sweep
+across all of them two ways:
+
+    - one-off:  connect, query and disconnect each panel in turn, as
+                test_sdk_windows.py does for a single device
+    - pooled:   PanelPool (services/panel_pool.py) fan-out over kept-alive
+                sessions, all panels concurrently
+
+Usage:
+    python3 scripts/bench_panel_pool.py [--panels 20] [--latency 0.02] [--rounds 10]
+        [--output panels.json]
+
+Requirements:
+    - pyzk library (pip install pyzk)
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+from bench_common import summarize
+from fake_zk_panel import FakePanelFleet
+from panel_pool import PanelPool, PanelSession, load_panels, panel_info
+
+
+def one_off_sweep(configs) -> None:
+    for config in configs:
+        session = PanelSession(config, timeout=5).open()
+        try:
+            panel_info(session.conn)
+        finally:
+            session.close()
+
+
+async def run(args) -> dict:
+    fleet = FakePanelFleet(args.panels, args.base_port, args.latency, max_sessions=4).start()
+    configs = load_panels(fleet.panels_spec())
+    try:
+        one_off: List[float] = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            await asyncio.to_thread(one_off_sweep, configs)
+            one_off.append(time.perf_counter() - started)
+
+        pool = PanelPool(configs, seed=args.seed)
+        started = time.perf_counter()
+        pool.start()
+        while pool.stats()["connected"] < len(pool):
+            await asyncio.sleep(0.005)
+        connect_s = time.perf_counter() - started
+
+        pooled: List[float] = []
+        try:
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                results = await pool.fan_out(panel_info)
+                pooled.append(time.perf_counter() - started)
+                failed = [name for name, result in results.items() if isinstance(result, BaseException)]
+                if failed:
+                    raise RuntimeError(f"panel_info failed on {failed}")
+        finally:
+            await pool.close()
+    finally:
+        fleet.stop()
+
+    return {
+        "config": {"panels": args.panels, "latency_s": args.latency, "rounds": args.rounds},
+        "one_off": summarize(one_off),
+        "pooled": summarize(pooled),
+        "pool_connect_ms": round(connect_s * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--panels', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='Fake panel seconds per command')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--base-port', type=int, default=14370)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"panel_info across {args.panels} panels ({args.latency * 1000:.0f} ms/command), {args.rounds} rounds")
+    for mode in ("one_off", "pooled"):
+        stats = report[mode]
+        print(f"  {mode:<8} p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms")
+    print(f"  pool connected all panels in {report['pool_connect_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
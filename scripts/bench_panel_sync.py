@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Panel Template Sync Benchmark
+
+Serves N fake ZK panels locally (scripts/fake_zk_panel.py) and pushes a
+generated roster of users with fingerprint templates to them:
+
+    - one-at-a-time:  save_user_template() per user, one panel after the
+                      other, the way changes trickle out through ZKBio
+    - sync:           PanelSyncJob (services/panel_sync.py) - diff, batched
+                      uploads, all panels concurrently
+    - resync:         the same job again once the panels are in sync (diff
+                      only) and after changing a few users
+    - resume:         a sync cancelled after its first batches, then resumed
+                      from its state file
+
+Usage:
+    python3 scripts/bench_panel_sync.py [--panels 4] [--users 200] [--latency 0.005]
+        [--output sync.json]
+
+Requirements:
+    - pyzk library (pip install pyzk)
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services'))
+
+from fake_zk_panel import FakePanelFleet  # noqa: E402
+from panel_pool import PanelPool, PanelSession, load_panels  # noqa: E402
+from panel_sync import PanelSyncJob, load_roster  # noqa: E402
+from zk.finger import Finger  # noqa: E402
+from zk.user import User  # noqa: E402
+
+TEMPLATE_SIZE = 1200
+
+
+def write_roster(path: str, users: int, fingers: int, rng: random.Random) -> list:
+    entries = [{
+        "pin": str(5000 + i),
+        "name": f"Person {i}",
+        "templates": [{"fingerIndex": f, "template": base64.b64encode(rng.randbytes(TEMPLATE_SIZE)).decode()}
+                      for f in range(fingers)],
+    } for i in range(users)]
+    with open(path, 'w') as f:
+        json.dump(entries, f)
+    return entries
+
+
+def one_at_a_time(configs, roster_path: str) -> None:
+    roster = load_roster(roster_path)
+    for config in configs:
+        session = PanelSession(config, timeout=5).open()
+        try:
+            for uid, wanted in enumerate(roster.values(), start=1):
+                user = User(uid, wanted.name, 0, '', '', wanted.pin, 0)
+                session.conn.save_user_template(user, [Finger(uid, fid, 1, template)
+                                                       for fid, template in wanted.templates.items()])
+        finally:
+            session.close()
+
+
+async def timed_sync(pool: PanelPool, roster_path: str, state_path: str) -> dict:
+    started = time.perf_counter()
+    stats = await PanelSyncJob(pool, roster_path, state_path=state_path).run()
+    if stats["failed"]:
+        raise RuntimeError(f"Sync failed: {stats['panels']}")
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "pushed": sum(panel["pushed"] for panel in stats["panels"]),
+        "unchanged": sum(panel["unchanged"] for panel in stats["panels"]),
+    }
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="panel-sync-")
+    roster_path = os.path.join(workdir, "roster.json")
+    state_path = os.path.join(workdir, "sync_state.json")
+    entries = write_roster(roster_path, args.users, args.fingers, rng)
+    report = {"config": {"panels": args.panels, "users": args.users, "fingers": args.fingers,
+                         "latency_s": args.latency, "batch": args.batch}}
+
+    # One at a time, on a fleet of its own
+    fleet = FakePanelFleet(args.panels, args.base_port, args.latency, max_sessions=4).start()
+    try:
+        started = time.perf_counter()
+        await asyncio.to_thread(one_at_a_time, load_panels(fleet.panels_spec()), roster_path)
+        report["one_at_a_time_s"] = round(time.perf_counter() - started, 3)
+    finally:
+        fleet.stop()
+
+    fleet = FakePanelFleet(args.panels, args.base_port + args.panels, args.latency, max_sessions=4).start()
+    pool = PanelPool(load_panels(fleet.panels_spec()))
+    try:
+        report["sync"] = await timed_sync(pool, roster_path, state_path)
+        report["resync_unchanged"] = await timed_sync(pool, roster_path, state_path)
+
+        for entry in rng.sample(entries, args.changes):
+            entry["templates"][0]["template"] = base64.b64encode(rng.randbytes(TEMPLATE_SIZE)).decode()
+        with open(roster_path, 'w') as f:
+            json.dump(entries, f)
+        report["resync_changed"] = await timed_sync(pool, roster_path, state_path)
+
+        # Interrupt a full sync to fresh panels, then resume it from the state file
+        for panel in fleet.panels:
+            for user in list(panel.users):
+                panel.delete_user(user["uid"])
+        job = PanelSyncJob(pool, roster_path, state_path=state_path, batch_size=args.batch)
+        task = asyncio.create_task(job.run())
+        while sum(progress.batches for progress in job.progress.values()) < args.panels:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        resumed = PanelSyncJob.resume(pool, state_path)
+        started = time.perf_counter()
+        stats = await resumed.run()
+        report["resume"] = {
+            "pushed": sum(panel["pushed"] for panel in stats["panels"]),
+            "already_on_panels": sum(panel["unchanged"] for panel in stats["panels"]),
+            "seconds": round(time.perf_counter() - started, 3),
+            "in_sync": all(len(panel.users) == args.users for panel in fleet.panels),
+        }
+    finally:
+        await pool.close()
+        fleet.stop()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--panels', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--fingers', type=int, default=2, help='Templates per user')
+    parser.add_argument('--changes', type=int, default=10, help='Users changed before the second resync')
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005, help='Fake panel seconds per command')
+    parser.add_argument('--base-port', type=int, default=14370)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{args.users} users x {args.fingers} templates to {args.panels} panels "
+          f"({args.latency * 1000:.0f} ms/command)")
+    print(f"  one at a time      {report['one_at_a_time_s']:>8} s")
+    for name in ("sync", "resync_unchanged", "resync_changed"):
+        stats = report[name]
+        print(f"  {name:<18} {stats['seconds']:>8} s  ({stats['pushed']} pushed, {stats['unchanged']} unchanged)")
+    resume = report["resume"]
+    print(f"  resume             {resume['seconds']:>8} s  ({resume['pushed']} pushed, "
+          f"{resume['already_on_panels']} already pushed before the interrupt; in sync: {resume['in_sync']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Template Arena Startup Benchmark
+
+Compares bridge startup with the enrolled templates in a JSON file (parsed
+into a TemplateIndex) against a memory-mapped template arena: time until the
+first identify() answers, and resident and private memory after it. Each
+variant runs in a fresh process, so the numbers match a bridge restart.
+
+Usage:
+    python3 scripts/bench_template_arena.py [--count 1000000] [--json-count 100000] [--dir /tmp]
+
+Building a 1M-template arena needs about 2.7 GB of disk (2 KB slots); the
+JSON variant is capped separately because parsing it takes minutes at 1M.
+Probes are featurized by FINGERPRINT_FEATURE_EXTRACTOR when it is set, else
+by a stand-in that only costs about as much (its scores mean nothing).
+
+Requirements:
+    - numpy (pip install numpy)
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_common import summarize
+from template_arena import COUNT_OFFSET, FLAG_LIVE, TemplateArena, index_dtype
+from template_index import FEATURE_DIM, TemplateIndex, configured_extractor
+
+TEMPLATE_SIZE = 1664
+
+
+def memory_mb() -> dict:
+    """Resident and private (anonymous) memory, from /proc on Linux"""
+    fields = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'RssAnon'):
+                    fields[name] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        fields = {'VmRSS': peak, 'RssAnon': peak}
+    return {"rss": fields.get('VmRSS', 0.0), "private": fields.get('RssAnon', 0.0)}
+
+
+def stand_in_features(template: bytes, dim: int) -> np.ndarray:
+    """A unit vector seeded by the template; for timing only, not matching"""
+    seed = int.from_bytes(hashlib.blake2b(template, digest_size=8).digest(), 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def build_arena(path: str, count: int, rng: np.random.Generator) -> None:
+    """Fill an arena with random rows, writing whole columns at once"""
+    arena = TemplateArena(path)
+    arena._grow(count)
+    chunk = 100_000
+    for start in range(0, count, chunk):
+        end = min(count, start + chunk)
+        features = rng.standard_normal((end - start, FEATURE_DIM), dtype=np.float32)
+        features /= np.linalg.norm(features, axis=1, keepdims=True)
+        arena.features[start:end] = features
+        arena.templates[start:end, :TEMPLATE_SIZE] = rng.integers(
+            0, 256, (end - start, TEMPLATE_SIZE), dtype=np.uint8)
+        rows = np.zeros(end - start, dtype=index_dtype())
+        rows["flags"] = FLAG_LIVE
+        rows["finger_index"] = np.arange(start, end) % 2
+        rows["version"] = 100
+        rows["length"] = TEMPLATE_SIZE
+        rows["pin"] = [str(100000 + i // 2).encode() for i in range(start, end)]
+        arena.index[start:end] = rows
+    struct.pack_into("<Q", arena.idx_map, COUNT_OFFSET, count)
+    arena.close()
+
+
+def build_json(path: str, count: int, rng: np.random.Generator) -> None:
+    with open(path, 'w') as f:
+        json.dump([
+            {"pin": str(100000 + i // 2), "fingerIndex": i % 2,
+             "template": base64.b64encode(rng.integers(0, 256, TEMPLATE_SIZE, dtype=np.uint8).tobytes()).decode()}
+            for i in range(count)
+        ], f)
+
+
+def child(mode: str, path: str, probes: int) -> None:
+    """Open the store the way the bridge does and time the first answers"""
+    baseline = memory_mb()
+    featurizer = configured_extractor() or stand_in_features
+    started = time.perf_counter()
+    if mode == 'arena':
+        store = TemplateArena(path, writable=False, featurizer=featurizer)
+    else:
+        store = TemplateIndex(featurizer=featurizer)
+        store.load_json(path)
+    load_seconds = time.perf_counter() - started
+
+    probe = os.urandom(TEMPLATE_SIZE)
+    samples = []
+    for _ in range(probes):
+        started = time.perf_counter()
+        store.identify(probe)
+        samples.append(time.perf_counter() - started)
+
+    print(json.dumps({
+        "templates": len(store),
+        "load_ms": round(load_seconds * 1000, 2),
+        "first_identify_ms": round(samples[0] * 1000, 2),
+        "identify": summarize(samples[1:] or samples),
+        # Mapped arena pages count towards RSS but are shared page cache;
+        # private memory is what each extra bridge process really costs
+        **{f"{key}_mb": round(value - baseline[key], 1) for key, value in memory_mb().items()},
+    }))
+
+
+def run_child(mode: str, path: str, probes: int) -> dict:
+    output = subprocess.check_output([sys.executable, __file__, '--child', mode, path, '--probes', str(probes)])
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=1_000_000, help='Templates in the arena')
+    parser.add_argument('--json-count', type=int, default=100_000, help='Templates in the JSON file')
+    parser.add_argument('--probes', type=int, default=20)
+    parser.add_argument('--dir', default=None, help='Where to build the test files')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.probes)
+        return
+
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+        arena_path = os.path.join(workdir, 'templates')
+        json_path = os.path.join(workdir, 'templates.json')
+        build_arena(arena_path, args.count, rng)
+        build_json(json_path, args.json_count, rng)
+
+        report = {
+            "json": run_child('json', json_path, args.probes),
+            # Second arena run shows a warm page cache (another bridge already mapped it)
+            "arena": run_child('arena', arena_path, args.probes),
+            "arena_warm": run_child('arena', arena_path, args.probes),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, stats in report.items():
+        print(f"{name:<11} {stats['templates']:>9} templates  load {stats['load_ms']:>10} ms  "
+              f"first identify {stats['first_identify_ms']:>8} ms  "
+              f"identify p50 {stats['identify']['p50_ms']:>7} ms  "
+              f"RSS +{stats['rss_mb']:>7} MB  private +{stats['private_mb']:>7} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Template Index Identification Benchmark
+
+Builds the local 1:N identification index with synthetic feature rows and
+reports build time, memory and identify() latency at several index sizes.
+The rows stand in for a feature extractor's output, so top-1 accuracy only
+checks the search; with FINGERPRINT_FEATURE_EXTRACTOR set, the time to
+featurize one template is reported too.
+
+Usage:
+    python3 scripts/bench_template_index.py [--sizes 10000 100000 1000000] [--probes 50]
+
+Requirements:
+    - numpy (pip install numpy)
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from bench_common import summarize
+from template_index import FEATURE_DIM, TemplateIndex, configured_extractor
+
+TEMPLATE_SIZE = 1664
+
+
+def build_index(size: int, rng: np.random.Generator) -> tuple:
+    """Fill an index with random feature rows (as if loaded from templates)"""
+    index = TemplateIndex(capacity=size)
+    features = rng.standard_normal((size, FEATURE_DIM), dtype=np.float32)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+
+    started = time.perf_counter()
+    index.matrix[:size] = features
+    index.keys = [(f"{100000 + i // 2}" + ("s1" if i % 7 == 0 else ""), i % 2) for i in range(size)]
+    index.positions = {key: row for row, key in enumerate(index.keys)}
+    return index, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--probes', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+
+    # Featurising a real template is part of every identify() call
+    extractor = configured_extractor()
+    featurize_us = None
+    if extractor is not None:
+        template = rng.integers(0, 256, TEMPLATE_SIZE, dtype=np.uint8).tobytes()
+        started = time.perf_counter()
+        for _ in range(100):
+            extractor(template, FEATURE_DIM)
+        featurize_us = round((time.perf_counter() - started) / 100 * 1e6, 1)
+
+    report = {"featurize_us": featurize_us, "sizes": {}}
+    for size in args.sizes:
+        index, build_seconds = build_index(size, rng)
+
+        # Probe with noisy copies of enrolled rows, so the true PIN should rank first
+        samples = []
+        hits = 0
+        for _ in range(args.probes):
+            row = int(rng.integers(size))
+            probe = index.matrix[row] + rng.standard_normal(FEATURE_DIM, dtype=np.float32) * 0.05
+            probe /= np.linalg.norm(probe)
+            started = time.perf_counter()
+            matches = index.identify_features(probe, args.top_k)
+            samples.append(time.perf_counter() - started)
+            hits += matches[0]["pin"] == index.keys[row][0]
+
+        report["sizes"][size] = {
+            "build_ms": round(build_seconds * 1000, 1),
+            "memory_mb": round(index.matrix.nbytes / 1e6, 1),
+            "identify": summarize(samples),
+            "top1_accuracy": round(hits / args.probes, 3),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    if featurize_us is not None:
+        print(f"Featurize one {TEMPLATE_SIZE}-byte template: {featurize_us} us")
+    for size, stats in report["sizes"].items():
+        identify = stats["identify"]
+        print(f"{size:>9} templates  {stats['memory_mb']:>7} MB  identify p50 {identify['p50_ms']:>8} ms  "
+              f"p95 {identify['p95_ms']:>8} ms  top-1 {stats['top1_accuracy']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+SDK Trace Replay Benchmark
+
+Replays a recorded SDK trace (see services/sdk_trace.py) through the bridge
+on the replay backend: every capture in the trace is sent to the bridge at
+its recorded offset, and the bridge's SDK calls take the recorded time
+(both scaled by --scale). No scanner is needed, so this runs on CI.
+
+Without --trace, a trace is recorded first from the simulated backend,
+driven by --captures captures arriving in bursts (seeded, exponential
+gaps), so the run is self-contained.
+
+Reports, per run, the end-to-end capture latency next to the recorded SDK
+durations it contains, and whether every run returned the same templates
+in the same order. --save-baseline writes the latency summary to a JSON
+file; --baseline compares against one and exits 1 when the p95 latency is
+more than --tolerance over it.
+
+Usage:
+    python3 scripts/bench_trace_replay.py [--trace capture.trace.jsonl.gz] [--scale 1.0] [--runs 2]
+        [--baseline baseline.json] [--tolerance 0.2]
+
+Requirements:
+    - websockets library (pip install websockets)
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import websockets
+
+from bench_common import DEFAULT_BRIDGE, start_bridge, stop_bridge, summarize, wait_ready
+from sdk_trace import load_trace
+
+CONNECTIONS = 4
+
+
+class Connection:
+    """A connection with requests pipelined on it, replies matched by id"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.waiting = {}
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self) -> None:
+        async for message in self.websocket:
+            reply = json.loads(message)
+            future = self.waiting.get(reply.get('id'))
+            if future and not future.done() and reply.get('status') != 'queued':
+                future.set_result(reply)
+
+    async def capture(self, request_id: int, finger_index: int) -> tuple:
+        """One capture; returns (latency, status, template digest)"""
+        future = self.waiting[request_id] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self.websocket.send(json.dumps({"action": "capture", "fingerIndex": finger_index,
+                                              "id": request_id}))
+        reply = await future
+        template = reply.get('template') or ''
+        return (time.perf_counter() - started, reply.get('status'),
+                hashlib.sha1(template.encode()).hexdigest()[:12])
+
+    async def close(self) -> None:
+        await self.websocket.close()
+        await asyncio.gather(self.reader, return_exceptions=True)
+
+
+async def drive(port: int, schedule: list, scale: float) -> list:
+    """Send a capture at each (offset, finger) of the schedule; results in schedule order"""
+    connections = [Connection(await websockets.connect(f"ws://localhost:{port}", max_size=None))
+                   for _ in range(CONNECTIONS)]
+    started = time.perf_counter()
+
+    async def one(index: int, offset: float, finger_index: int) -> tuple:
+        await asyncio.sleep(max(0.0, started + offset * scale - time.perf_counter()))
+        return await connections[index % CONNECTIONS].capture(index + 1, finger_index)
+
+    try:
+        return await asyncio.gather(*(one(i, offset, finger) for i, (offset, finger) in enumerate(schedule)))
+    finally:
+        for connection in connections:
+            await connection.close()
+
+
+def count_statuses(results: list) -> dict:
+    statuses = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return statuses
+
+
+async def record(bridge: str, port: int, path: str, captures: int, latency: float) -> list:
+    """Record a trace from the simulated backend under a bursty workload"""
+    rng = random.Random(11)
+    offsets = list(itertools.accumulate(rng.expovariate(1 / (latency * 1.2)) for _ in range(captures)))
+    schedule = [(offset, rng.randrange(10)) for offset in offsets]
+    process = start_bridge(bridge, port, env={
+        "FINGERPRINT_BRIDGE_BACKEND": "simulated",
+        "FINGERPRINT_SIM_CAPTURE_LATENCY": str(latency),
+        "FINGERPRINT_SIM_IMAGES": "1",
+        "FINGERPRINT_SDK_RECORD": path,
+        "FINGERPRINT_DEVICE_POLL": "0",
+    })
+    try:
+        await wait_ready(process, port)
+        return await drive(port, schedule, 1.0)
+    finally:
+        stop_bridge(process)
+
+
+async def replay(bridge: str, port: int, trace: str, scale: float) -> tuple:
+    captures = sorted((r for r in load_trace(trace) if r["call"] == "capture"), key=lambda r: r["at"])
+    first = captures[0]["at"] if captures else 0.0
+    schedule = [(r["at"] - first, r.get("finger", 0)) for r in captures]
+    process = start_bridge(bridge, port, env={
+        "FINGERPRINT_BRIDGE_BACKEND": "replay",
+        "FINGERPRINT_SDK_TRACE": trace,
+        "FINGERPRINT_TRACE_SCALE": str(scale),
+        "FINGERPRINT_DEVICE_POLL": "0",
+    })
+    try:
+        await wait_ready(process, port)
+        results = await drive(port, schedule, scale)
+    finally:
+        stop_bridge(process)
+    return [r["duration"] * scale for r in captures], results
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trace', help='Recorded SDK trace; recorded from the simulator when omitted')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier on recorded durations and offsets')
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--captures', type=int, default=40, help='Captures to record without --trace')
+    parser.add_argument('--latency', type=float, default=0.2, help='Simulated capture latency to record')
+    parser.add_argument('--port', type=int, default=18774)
+    parser.add_argument('--bridge', default=DEFAULT_BRIDGE)
+    parser.add_argument('--baseline', help='Latency summary JSON to compare against')
+    parser.add_argument('--save-baseline', help='Write this run\'s latency summary here')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    # The bridge takes relative trace paths from the project root
+    trace = os.path.abspath(args.trace) if args.trace else None
+    if not trace:
+        trace = os.path.join(tempfile.mkdtemp(prefix='bench-trace-'), 'capture.trace.jsonl.gz')
+        results = await record(args.bridge, args.port, trace, args.captures, args.latency)
+        # Captures answered busy (queue full) never reach the SDK, so are not in the trace
+        print(f"Recorded {args.captures} simulated captures to {trace}: {count_statuses(results)}")
+
+    outcomes, latencies = [], []
+    for run in range(args.runs):
+        recorded, results = await replay(args.bridge, args.port, trace, args.scale)
+        run_latencies = [latency for latency, _, _ in results]
+        latencies.extend(run_latencies)
+        outcomes.append([(status, digest) for _, status, digest in results])
+        print(f"run {run + 1}: {len(results)} captures at scale {args.scale}, {count_statuses(results)}")
+        print(f"  recorded SDK time {summarize(recorded)}")
+        print(f"  end-to-end        {summarize(run_latencies)}")
+    identical = all(outcome == outcomes[0] for outcome in outcomes)
+    print(f"every run returned the same results in the same order: {'yes' if identical else 'NO'}")
+
+    summary = summarize(latencies)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({"trace": os.path.basename(trace), "scale": args.scale, **summary}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline["p95_ms"] * (1 + args.tolerance)
+        within = summary["p95_ms"] <= limit
+        print(f"p95 {summary['p95_ms']:.1f} ms vs baseline {baseline['p95_ms']:.1f} ms: "
+              f"{'ok' if within else 'REGRESSION'} (limit {limit:.1f} ms)")
+        if not within:
+            return 1
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+ZKBio Template Upload Benchmark
+
+Serves a fake ZKBio (scripts/fake_zkbio.py) with --latency seconds per
+request and --handshake seconds per new connection, and uploads
+--enrolments concurrent enrolments of --fingers templates each, two ways:
+
+    - per-request: each enrolment uploads its fingers one after another on a
+                   fresh connection per template, as the browser does through
+                   PUT /api/biometric
+    - uploader:    every template goes to services/zkbio_uploader.py, which
+                   batches them and uploads over at most --concurrency
+                   kept-alive connections, retrying failures
+
+Reports wall time, templates/s, per-template ack latency, the connections
+ZKBio saw opened and the most requests it served at once. --fail-rate makes
+ZKBio answer that share of requests with HTTP 503 (the per-request path does
+not retry, the uploader does).
+
+Usage:
+    python3 scripts/bench_zkbio_upload.py [--enrolments 4] [--fingers 10] [--latency 0.1]
+        [--handshake 0.05] [--concurrency 4] [--fail-rate 0.1]
+"""
+
+import argparse
+import asyncio
+import base64
+import http.client
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_common import summarize
+from fake_zkbio import FakeZKBio
+from zkbio_uploader import UPLOAD_CONCURRENCY, ZKBioUploader
+
+TEMPLATE_BYTES = 1024
+
+
+def template_for(pin: str, finger: int) -> str:
+    return base64.b64encode(os.urandom(TEMPLATE_BYTES)).decode()
+
+
+def upload_fresh_connection(url: str, pin: str, finger: int) -> bool:
+    """One bioTemplate/add on its own connection, like the Next.js proxy"""
+    conn = http.client.HTTPConnection(url.split('//')[1], timeout=30)
+    try:
+        conn.request("POST", "/api/bioTemplate/add", json.dumps({"apiBioTemplate": {
+            "pin": pin, "template": template_for(pin, finger), "templateNo": finger,
+            "validType": "1", "version": "10.0"}}), {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status == 200 and json.loads(response.read()).get("code") == 0
+    finally:
+        conn.close()
+
+
+async def per_request(url: str, enrolments: int, fingers: int) -> tuple:
+    loop = asyncio.get_running_loop()
+    # One thread per enrolment: each browser uploads on its own
+    executor = ThreadPoolExecutor(max_workers=enrolments)
+    latencies, failures = [], 0
+
+    async def enrolment(pin: str) -> None:
+        nonlocal failures
+        for finger in range(fingers):
+            started = time.perf_counter()
+            if not await loop.run_in_executor(executor, upload_fresh_connection, url, pin, finger):
+                failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        await asyncio.gather(*(enrolment(str(1000 + i)) for i in range(enrolments)))
+    finally:
+        executor.shutdown()
+    return latencies, failures
+
+
+async def pooled(url: str, enrolments: int, fingers: int, concurrency: int) -> tuple:
+    uploader = ZKBioUploader(url, concurrency=concurrency, seed=1)
+    latencies, failures = [], 0
+
+    async def finger(pin: str, finger_index: int) -> None:
+        nonlocal failures
+        started = time.perf_counter()
+        ack = await uploader.upload(pin, template_for(pin, finger_index), finger_index)
+        if ack["status"] != "uploaded":
+            failures += 1
+        latencies.append(time.perf_counter() - started)
+
+    async def enrolment(pin: str) -> None:
+        # The bridge starts each finger's upload as soon as it is merged
+        uploads = []
+        for finger_index in range(fingers):
+            uploads.append(asyncio.create_task(finger(pin, finger_index)))
+        await asyncio.gather(*uploads)
+
+    try:
+        await asyncio.gather(*(enrolment(str(1000 + i)) for i in range(enrolments)))
+        return latencies, failures, uploader.stats()
+    finally:
+        await uploader.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18099)
+    parser.add_argument('--enrolments', type=int, default=4)
+    parser.add_argument('--fingers', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.1, help='Fake ZKBio seconds per request')
+    parser.add_argument('--handshake', type=float, default=0.05, help='Fake ZKBio seconds per new connection')
+    parser.add_argument('--concurrency', type=int, default=UPLOAD_CONCURRENCY, help='Uploader connections')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    templates = args.enrolments * args.fingers
+    print(f"{args.enrolments} enrolments x {args.fingers} fingers, ZKBio {args.latency * 1000:.0f} ms/request "
+          f"+ {args.handshake * 1000:.0f} ms/connection, fail rate {args.fail_rate:.0%}")
+    for name in ("per-request", "uploader"):
+        fake = FakeZKBio(args.port, args.latency, fail_rate=args.fail_rate, seed=7,
+                         handshake=args.handshake).serve()
+        try:
+            started = time.perf_counter()
+            if name == "per-request":
+                latencies, failures = await per_request(fake.url, args.enrolments, args.fingers)
+                stats = None
+            else:
+                latencies, failures, stats = await pooled(fake.url, args.enrolments, args.fingers,
+                                                          args.concurrency)
+            wall = time.perf_counter() - started
+        finally:
+            fake.stop()
+        print(f"{name}:")
+        print(f"  {wall:.2f} s, {templates / wall:.1f} templates/s, {failures} failed, "
+              f"{len(fake.templates)}/{templates} stored")
+        print(f"  ack latency {summarize(latencies)}")
+        print(f"  ZKBio saw {fake.requests} requests on {fake.connections} connections, "
+              f"at most {fake.max_in_flight} at once")
+        if stats:
+            print(f"  uploader {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Fake ZKTeco Panels
+
+Serves the ZK TCP protocol (as spoken by pyzk) on consecutive local ports,
+one fake iClock panel per port, so the bridge's panel pool can be tested
+and benchmarked without hardware. Each panel answers the connect/exit
+handshake, time, firmware and option reads and storage sizes, adds a
+configurable per-command latency (firmware commonly takes tens of
+milliseconds per command) and, like real panels, refuses connections past
+its session limit. Panels can be seeded with users and an attendance log,
+which pyzk reads with get_users() and get_attendance(). They also hold
+fingerprint templates (get_templates()), accept buffered user/template
+uploads (CMD_PREPARE_DATA + CMD_DATA + save, as in save_user_template())
+and delete users and templates. A session that registers for events
+(pyzk's live_capture()) is sent each new punch as a CMD_REG_EVENT packet.
+
+Usage:
+    python3 scripts/fake_zk_panel.py [--panels 20] [--base-port 14370]
+        [--latency 0.02] [--max-sessions 4] [--users 200] [--punches 5000]
+        [--event-rate 0]
+
+prints a FINGERPRINT_PANELS value for the bridge and serves until Ctrl+C.
+Benchmarks use FakePanelFleet in-process; it runs the panels on a
+background thread and can take individual panels offline and back.
+
+Requirements:
+    - Python 3.7+ (no pyzk needed; this is the other end of the protocol)
+"""
+
+import argparse
+import asyncio
+import random
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# ZK protocol constants (see pyzk's zk/const.py)
+MACHINE_PREPARE_DATA_1 = 0x5050
+MACHINE_PREPARE_DATA_2 = 0x7D82
+USHRT_MAX = 65535
+
+CMD_DB_RRQ = 7
+CMD_DELETE_USER = 18
+CMD_DELETE_USERTEMP = 19
+CMD_USERTEMP_RRQ = 9
+CMD_OPTIONS_RRQ = 11
+CMD_ATTLOG_RRQ = 13
+CMD_CLEAR_ATTLOG = 15
+CMD_GET_FREE_SIZES = 50
+CMD_STARTVERIFY = 60
+CMD_CANCELCAPTURE = 62
+CMD_SAVE_USERTEMPS = 110
+CMD_GET_TIME = 201
+CMD_REG_EVENT = 500
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_ENABLEDEVICE = 1002
+CMD_DISABLEDEVICE = 1003
+CMD_REFRESHDATA = 1013
+CMD_GET_VERSION = 1100
+CMD_PREPARE_DATA = 1500
+CMD_READ_WITH_BUFFER = 1503
+CMD_FREE_DATA = 1502
+CMD_DATA = 1501
+CMD_ACK_OK = 2000
+CMD_ACK_ERROR = 2001
+CMD_ACK_UNKNOWN = 0xffff
+FCT_FINGERTMP = 2
+FCT_USER = 5
+
+USER_RECORD = struct.Struct('<HB8s24sIx7sx24s')        # ZK8 user, 72 bytes
+UPLOAD_USER_RECORD = struct.Struct('<xHB8s24sIx7sx24s')  # User.repack73(), 73 bytes
+UPLOAD_HEADER = struct.Struct('<III')                  # user, table and template lengths
+UPLOAD_TABLE_ENTRY = struct.Struct('<bHbI')            # 2, uid, 0x10 + fid, template offset
+TEMPLATE_HEADER = struct.Struct('<HHbb')               # size + 6, uid, fid, valid
+EVENT_RECORD = struct.Struct('<24sBB6s20s')            # live attendance event, 52 bytes
+EVENT_ACK_TIMEOUT = 5.0
+ATTENDANCE_RECORD = struct.Struct('<H24sB4sB8s')       # 40 bytes
+
+FIRMWARE_VERSION = "Ver 6.60 Apr 28 2017"
+
+
+def checksum(packet: bytes) -> int:
+    """ZK packet checksum (zkemsdk.c), as pyzk computes it"""
+    if len(packet) % 2:
+        packet += b'\x00'
+    total = sum(struct.unpack(f'<{len(packet) // 2}H', packet))
+    while total > USHRT_MAX:
+        total -= USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += USHRT_MAX
+    return total
+
+
+def encode_time(t: datetime) -> int:
+    """Panel time encoding (zkemsdk.c EncodeTime)"""
+    return (((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) * (24 * 60 * 60)
+            + (t.hour * 60 + t.minute) * 60 + t.second)
+
+
+class FakePanel:
+    """One fake panel's state and protocol handler"""
+
+    def __init__(self, name: str, port: int, latency: float = 0.0, max_sessions: int = 4):
+        self.name = name
+        self.port = port
+        self.latency = latency
+        self.max_sessions = max_sessions
+        self.serial = f"FAKE{port:06d}"
+        self.options = {
+            "~SerialNumber": self.serial,
+            "~Platform": "ZMM220_TFT",
+            "~DeviceName": f"iClock {name}",
+            "~ZKFPVersion": "10",
+        }
+        self.users: List[dict] = []
+        self.templates: Dict[tuple, bytes] = {}        # (uid, fid) -> template
+        self.attendance: List[tuple] = []
+        self.listeners: List[asyncio.Queue] = []       # sessions registered for live events
+        self.sessions = 0
+        self.next_session_id = 1
+        self.commands = 0
+        self.connects = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writers: List[asyncio.StreamWriter] = []
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", self.port)
+
+    async def stop(self) -> None:
+        """Go offline: stop listening and drop every open session"""
+        if self.server:
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def add_user(self, user_id: str, name: str = '') -> dict:
+        uid = max((user["uid"] for user in self.users), default=0) + 1
+        user = {"uid": uid, "user_id": user_id, "name": name or f"User {user_id}",
+                "privilege": 0, "password": "", "card": 0, "group_id": "1"}
+        self.users.append(user)
+        return user
+
+    def save_user(self, user: dict) -> None:
+        """Create or replace the user with this uid"""
+        for i, existing in enumerate(self.users):
+            if existing["uid"] == user["uid"]:
+                self.users[i] = user
+                return
+        self.users.append(user)
+
+    def delete_user(self, uid: int) -> bool:
+        before = len(self.users)
+        self.users = [user for user in self.users if user["uid"] != uid]
+        for key in [key for key in self.templates if key[0] == uid]:
+            del self.templates[key]
+        return len(self.users) < before
+
+    def save_upload(self, upload: bytes) -> None:
+        """Apply a save_user_template() style upload: users, then their templates"""
+        users_len, table_len, templates_len = UPLOAD_HEADER.unpack_from(upload)
+        offset = UPLOAD_HEADER.size
+        users = upload[offset:offset + users_len]
+        table = upload[offset + users_len:offset + users_len + table_len]
+        templates = upload[offset + users_len + table_len:offset + users_len + table_len + templates_len]
+        for start in range(0, len(users), UPLOAD_USER_RECORD.size):
+            uid, privilege, password, name, card, group_id, user_id = UPLOAD_USER_RECORD.unpack_from(users, start)
+            self.save_user({
+                "uid": uid,
+                "user_id": user_id.split(b'\x00')[0].decode(),
+                "name": name.split(b'\x00')[0].decode(),
+                "privilege": privilege,
+                "password": password.split(b'\x00')[0].decode(),
+                "card": card,
+                "group_id": group_id.split(b'\x00')[0].decode(),
+            })
+        for start in range(0, len(table), UPLOAD_TABLE_ENTRY.size):
+            _, uid, fnum, template_offset = UPLOAD_TABLE_ENTRY.unpack_from(table, start)
+            size, = struct.unpack_from('<H', templates, template_offset)
+            self.templates[(uid, fnum - 0x10)] = bytes(templates[template_offset + 2:template_offset + 2 + size])
+
+    def punch(self, user: dict, when: Optional[datetime] = None, status: int = 1, punch: int = 0) -> None:
+        """Append an attendance record (status: verify mode, 1 = fingerprint)"""
+        record = (user["uid"], user["user_id"], status, when or datetime.now(), punch)
+        self.attendance.append(record)
+        for queue in self.listeners:
+            queue.put_nowait(record)
+
+    def populate(self, users: int, punches: int, days: int = 30) -> None:
+        """Seed users and a log of punches spread over the last `days` days"""
+        for i in range(users):
+            self.add_user(str(1000 + i))
+        if not self.users or not punches:
+            return
+        start = datetime.now().replace(microsecond=0) - timedelta(days=days)
+        step = timedelta(days=days) / punches
+        for i in range(punches):
+            self.punch(self.users[(i * 7919) % len(self.users)], start + step * i, punch=i % 2)
+
+    def sizes(self) -> bytes:
+        users, records = len(self.users), len(self.attendance)
+        fields = [0] * 20
+        fingers = len(self.templates)
+        fields[4], fields[6], fields[8] = users, fingers, records
+        fields[14], fields[15], fields[16] = 3000, 3000, 100000
+        fields[17], fields[18], fields[19] = 3000 - fingers, 3000 - users, 100000 - records
+        return struct.pack('<20i', *fields) + struct.pack('<3i', 0, 0, 0)
+
+    def buffered(self, command: int, fct: int) -> Optional[bytes]:
+        """Payload of a read-with-buffer request: total size, then the records"""
+        if command == CMD_ATTLOG_RRQ:
+            records = b''.join(ATTENDANCE_RECORD.pack(uid, user_id.encode(), status,
+                                                      struct.pack('<I', encode_time(when)), punch, b'')
+                               for uid, user_id, status, when, punch in self.attendance)
+        elif command == CMD_USERTEMP_RRQ and fct == FCT_USER:
+            records = b''.join(USER_RECORD.pack(user["uid"], user["privilege"], user["password"].encode(),
+                                                user["name"].encode(), user["card"], user["group_id"].encode(),
+                                                user["user_id"].encode())
+                               for user in self.users)
+        elif command == CMD_DB_RRQ and fct == FCT_FINGERTMP:
+            records = b''.join(TEMPLATE_HEADER.pack(len(template) + 6, uid, fid, 1) + template
+                               for (uid, fid), template in sorted(self.templates.items()))
+        else:
+            return None
+        return struct.pack('<I', len(records)) + records
+
+    def respond(self, command: int, data: bytes, upload: bytearray) -> tuple:
+        """(reply code, payload) for a command; `upload` is the session's data buffer"""
+        if command == CMD_GET_TIME:
+            return CMD_ACK_OK, struct.pack('<I', encode_time(datetime.now()))
+        if command == CMD_GET_VERSION:
+            return CMD_ACK_OK, FIRMWARE_VERSION.encode() + b'\x00'
+        if command == CMD_OPTIONS_RRQ:
+            key = data.split(b'\x00')[0].decode(errors='replace')
+            if key in self.options:
+                return CMD_ACK_OK, f"{key}={self.options[key]}".encode() + b'\x00'
+            return CMD_ACK_ERROR, b''
+        if command == CMD_GET_FREE_SIZES:
+            return CMD_ACK_OK, self.sizes()
+        if command == CMD_READ_WITH_BUFFER:
+            # Small enough to send in one CMD_DATA reply (no chunked reads)
+            _, buffered_command, fct, _ = struct.unpack('<bhii', data[:11])
+            payload = self.buffered(buffered_command, fct)
+            return (CMD_DATA, payload) if payload is not None else (CMD_ACK_ERROR, b'')
+        if command == CMD_CLEAR_ATTLOG:
+            self.attendance.clear()
+            return CMD_ACK_OK, b''
+        if command == CMD_PREPARE_DATA:
+            upload.clear()
+            return CMD_ACK_OK, b''
+        if command == CMD_DATA:
+            upload.extend(data)
+            return CMD_ACK_OK, b''
+        if command == CMD_SAVE_USERTEMPS:
+            try:
+                self.save_upload(bytes(upload))
+            except struct.error:
+                return CMD_ACK_ERROR, b''
+            upload.clear()
+            return CMD_ACK_OK, b''
+        if command == CMD_DELETE_USER:
+            uid, = struct.unpack('<h', data[:2])
+            return (CMD_ACK_OK if self.delete_user(uid) else CMD_ACK_ERROR), b''
+        if command == CMD_DELETE_USERTEMP:
+            uid, fid = struct.unpack('<hb', data[:3])
+            return (CMD_ACK_OK if self.templates.pop((uid, fid), None) is not None else CMD_ACK_ERROR), b''
+        if command in (CMD_ENABLEDEVICE, CMD_DISABLEDEVICE, CMD_REFRESHDATA, CMD_FREE_DATA,
+                       CMD_STARTVERIFY, CMD_CANCELCAPTURE):
+            return CMD_ACK_OK, b''
+        return CMD_ACK_UNKNOWN, b''
+
+    async def push_events(self, writer: asyncio.StreamWriter, session_id: int, queue: asyncio.Queue,
+                          acked: asyncio.Event) -> None:
+        """Send each new punch to a registered session, one at a time, waiting for its ack"""
+        while True:
+            _, user_id, status, when, punch = await queue.get()
+            timehex = bytes([when.year - 2000, when.month, when.day, when.hour, when.minute, when.second])
+            payload = EVENT_RECORD.pack(user_id.encode(), status, punch, timehex, b'')
+            body = struct.pack('<4H', CMD_REG_EVENT, 0, session_id, 0) + payload
+            body = struct.pack('<4H', CMD_REG_EVENT, checksum(body), session_id, 0) + payload
+            acked.clear()
+            writer.write(struct.pack('<HHI', MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2, len(body)) + body)
+            await writer.drain()
+            try:
+                await asyncio.wait_for(acked.wait(), EVENT_ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.writers.append(writer)
+        session_id = 0
+        upload = bytearray()
+        events: Optional[asyncio.Queue] = None
+        pusher: Optional[asyncio.Task] = None
+        acked = asyncio.Event()
+        try:
+            while True:
+                top = await reader.readexactly(8)
+                magic1, magic2, length = struct.unpack('<HHI', top)
+                if (magic1, magic2) != (MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2):
+                    break
+                packet = await reader.readexactly(length)
+                command, _, _, reply_id = struct.unpack('<4H', packet[:8])
+                if command == CMD_ACK_OK:
+                    # The client acknowledging a live event; not a command
+                    acked.set()
+                    continue
+                self.commands += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if command == CMD_CONNECT:
+                    if self.sessions >= self.max_sessions:
+                        code, payload = CMD_ACK_ERROR, b''
+                    else:
+                        self.sessions += 1
+                        self.connects += 1
+                        session_id = self.next_session_id
+                        self.next_session_id = self.next_session_id % USHRT_MAX + 1
+                        code, payload = CMD_ACK_OK, b''
+                elif not session_id:
+                    code, payload = CMD_ACK_ERROR, b''
+                elif command == CMD_EXIT:
+                    code, payload = CMD_ACK_OK, b''
+                elif command == CMD_REG_EVENT:
+                    flags, = struct.unpack('<I', packet[8:12])
+                    if flags and events is None:
+                        events = asyncio.Queue()
+                        self.listeners.append(events)
+                        pusher = asyncio.create_task(self.push_events(writer, session_id, events, acked))
+                    elif not flags and events is not None:
+                        self.listeners.remove(events)
+                        pusher.cancel()
+                        events = pusher = None
+                    code, payload = CMD_ACK_OK, b''
+                else:
+                    code, payload = self.respond(command, packet[8:], upload)
+
+                body = struct.pack('<4H', code, 0, session_id, reply_id) + payload
+                body = struct.pack('<4H', code, checksum(body), session_id, reply_id) + payload
+                writer.write(struct.pack('<HHI', MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2, len(body)) + body)
+                await writer.drain()
+                if command == CMD_EXIT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if events is not None:
+                self.listeners.remove(events)
+                pusher.cancel()
+            if session_id:
+                self.sessions -= 1
+            self.writers.remove(writer)
+            writer.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"sessions": self.sessions, "connects": self.connects, "commands": self.commands}
+
+
+class FakePanelFleet:
+    """Fake panels on consecutive ports, served from a background thread"""
+
+    def __init__(self, count: int, base_port: int = 14370, latency: float = 0.0, max_sessions: int = 4,
+                 users: int = 0, punches: int = 0):
+        self.panels = [FakePanel(f"panel-{i + 1}", base_port + i, latency, max_sessions)
+                       for i in range(count)]
+        for panel in self.panels:
+            panel.populate(users, punches)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fake-zk-panels", daemon=True)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def start(self) -> "FakePanelFleet":
+        self.thread.start()
+        for panel in self.panels:
+            self._call(panel.start())
+        return self
+
+    def stop(self) -> None:
+        for panel in self.panels:
+            self._call(panel.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def set_online(self, index: int, online: bool) -> None:
+        panel = self.panels[index]
+        self._call(panel.start() if online else panel.stop())
+
+    def punch(self, count: int = 1) -> None:
+        """Append `count` new punches, now, to every panel's log"""
+        async def add() -> None:
+            for panel in self.panels:
+                for i in range(count):
+                    panel.punch(panel.users[i % len(panel.users)])
+        self._call(add())
+
+    def punch_user(self, index: int, user_index: int) -> None:
+        """Append one punch, now, by one user on one panel"""
+        panel = self.panels[index]
+
+        async def add() -> None:
+            panel.punch(panel.users[user_index % len(panel.users)])
+        self._call(add())
+
+    def panels_spec(self) -> str:
+        """FINGERPRINT_PANELS value for these panels"""
+        return ",".join(f"{panel.name}=127.0.0.1:{panel.port}" for panel in self.panels)
+
+
+async def serve(args) -> None:
+    panels = [FakePanel(f"panel-{i + 1}", args.base_port + i, args.latency, args.max_sessions)
+              for i in range(args.panels)]
+    for panel in panels:
+        panel.populate(args.users, args.punches)
+        await panel.start()
+    spec = ",".join(f"{panel.name}=127.0.0.1:{panel.port}" for panel in panels)
+    print(f"Serving {len(panels)} fake panels on ports {args.base_port}-{args.base_port + len(panels) - 1}")
+    print(f"FINGERPRINT_PANELS={spec}")
+    started = time.time()
+    last_report = started
+    try:
+        while True:
+            if args.event_rate:
+                # Punch a random user on a random panel (live events for subscribers)
+                await asyncio.sleep(1 / args.event_rate)
+                panel = random.choice(panels)
+                if panel.users:
+                    panel.punch(random.choice(panel.users), punch=random.randint(0, 1))
+            else:
+                await asyncio.sleep(60)
+            if time.time() - last_report >= 60:
+                last_report = time.time()
+                commands = sum(panel.commands for panel in panels)
+                print(f"{commands} commands in {last_report - started:.0f}s")
+    finally:
+        for panel in panels:
+            await panel.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--panels', type=int, default=20)
+    parser.add_argument('--base-port', type=int, default=14370)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per command')
+    parser.add_argument('--max-sessions', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200, help='Users per panel')
+    parser.add_argument('--punches', type=int, default=5000, help='Attendance records per panel (last 30 days)')
+    parser.add_argument('--event-rate', type=float, default=0, help='New punches per second, across all panels')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
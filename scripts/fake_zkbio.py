@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Fake ZKBio Server
+
+A local stand-in for the ZKBio CVSecurity API, for testing and benchmarking
+the bridge's ZKBio clients without the server at 192.168.0.93:8098. Replies
+use ZKBio's {"code": 0, "message": "success", "data": ...} wrapper, the
+access_token query parameter is checked when --token is set, and every
+request waits --latency seconds first (a loaded ZKBio commonly takes
+hundreds of milliseconds per call). Each new connection waits --handshake
+seconds, standing in for the TLS handshake to a remote ZKBio. With --fail-rate, that share of
+requests gets an HTTP 503 instead. It counts the connections opened and the
+most requests it served at once, to check clients reuse and bound them.
+
+Endpoints:
+    GET /api/v2/transaction/list?pageNo&pageSize[&startDate&endDate&personPin]
+        newest first; dates as "YYYY-MM-DD HH:MM:SS"
+    POST /api/bioTemplate/add  {"apiBioTemplate": {"pin", "template", "templateNo", ...}}
+        stores (replaces) the person's template for that templateNo
+    GET /api/v2/bioTemplate/getFgListByPin/<pin>
+    POST /api/v2/person/getPersonList?pageNo&pageSize[&pin]   persons with their accLevelIds
+    GET /api/v2/accLevel/list?pageNo&pageSize           access levels with their doorIds
+    GET /api/door/list?pageNo&pageSize                  doors with their deviceId
+
+Usage:
+    python3 scripts/fake_zkbio.py [--port 18098] [--transactions 50000] [--latency 0.2] [--fail-rate 0.1]
+
+Benchmarks use FakeZKBio in-process (serve() runs it on a background thread).
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_PAGE_SIZE = 1000
+
+
+class FakeZKBio:
+    """In-memory ZKBio state and its HTTP server"""
+
+    def __init__(self, port: int = 18098, latency: float = 0.0, token: Optional[str] = None,
+                 fail_rate: float = 0.0, seed: Optional[int] = None, handshake: float = 0.0):
+        self.port = port
+        self.latency = latency
+        self.handshake = handshake
+        self.token = token
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.transactions: List[Dict[str, Any]] = []   # oldest first
+        self.templates: Dict[tuple, Dict[str, Any]] = {}   # (pin, templateNo) -> template
+        self.template_log: List[Dict[str, Any]] = []   # every template added, in arrival order
+        self.persons: List[Dict[str, Any]] = []
+        self.levels: List[Dict[str, Any]] = []
+        self.doors: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def add_transactions(self, count: int, days: float = 30, pins: int = 500, devices: int = 20,
+                         until: Optional[datetime] = None) -> None:
+        """Append `count` door events spread evenly over the `days` before `until`"""
+        until = (until or datetime.now()).replace(microsecond=0)
+        step = timedelta(days=days) / max(1, count)
+        with self.lock:
+            base = len(self.transactions)
+            for i in range(count):
+                n = base + i
+                pin = str(1000 + (n * 7919) % pins)
+                device = n % devices
+                self.transactions.append({
+                    "id": f"tx-{n + 1}",
+                    "personPin": pin,
+                    "personName": f"Person {pin}",
+                    "deviceSn": f"FAKESN{device:04d}",
+                    "doorName": f"Door {device + 1}",
+                    "eventTime": (until - timedelta(days=days) + step * (i + 1)).strftime(TIME_FORMAT),
+                    "verifyModeName": "Fingerprint",
+                    "eventName": "Normal Verify Open",
+                })
+
+    def add_access(self, persons: int = 1000, levels: int = 50, doors: int = 200, devices: int = 20,
+                   levels_per_person: int = 3, doors_per_level: int = 8, spouse_every: int = 10) -> None:
+        """Persons, access levels and doors with seeded random assignments"""
+        rng = random.Random(7)
+        with self.lock:
+            self.doors = [{"id": str(100 + d), "name": f"Door {d + 1}", "deviceId": f"FAKESN{d % devices:04d}"}
+                          for d in range(doors)]
+            self.levels = [{"id": str(l + 1), "name": f"Level {l + 1}",
+                            "doorIds": ",".join(door["id"] for door in rng.sample(self.doors, doors_per_level))}
+                           for l in range(levels)]
+            self.persons = []
+            for p in range(persons):
+                pin = str(1000 + p)
+                assigned = rng.sample(self.levels, min(levels, rng.randint(1, levels_per_person)))
+                self.persons.append({"pin": pin, "name": f"Person {pin}",
+                                     "accLevelIds": ",".join(level["id"] for level in assigned)})
+                if spouse_every and p % spouse_every == 0:
+                    self.persons.append({"pin": f"{pin}s1", "name": f"Spouse {pin}", "accLevelIds": ""})
+
+    def page(self, rows: List[Dict[str, Any]], query: Dict[str, str]) -> List[Dict[str, Any]]:
+        page_no = max(1, int(query.get('pageNo', 1)))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(query.get('pageSize', 50))))
+        with self.lock:
+            return rows[(page_no - 1) * page_size:page_no * page_size]
+
+    def transaction_list(self, query: Dict[str, str]) -> List[Dict[str, Any]]:
+        page_no = max(1, int(query.get('pageNo', 1)))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(query.get('pageSize', 50))))
+        start, end, pin = query.get('startDate'), query.get('endDate'), query.get('personPin')
+        with self.lock:
+            rows = [row for row in reversed(self.transactions)
+                    if (not start or row["eventTime"] >= start) and (not end or row["eventTime"] <= end)
+                    and (not pin or row["personPin"] == pin)]
+        return rows[(page_no - 1) * page_size:page_no * page_size]
+
+    def add_template(self, body: Any) -> tuple:
+        template = (body or {}).get("apiBioTemplate") if isinstance(body, dict) else None
+        if not isinstance(template, dict) or not template.get("pin") or not template.get("template"):
+            return 200, {"code": -1, "message": "apiBioTemplate with pin and template is required"}
+        with self.lock:
+            self.templates[(str(template["pin"]), int(template.get("templateNo", 0)))] = template
+            self.template_log.append(template)
+        return 200, {"code": 0, "message": "success", "data": None}
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any) -> tuple:
+        """(HTTP status, ZKBio reply) for a request"""
+        if self.token and query.get('access_token') != self.token:
+            return 401, {"code": 401, "message": "Invalid access token"}
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            self.failed += 1
+            return 503, {"code": 503, "message": "Service temporarily unavailable"}
+        if method == 'GET' and path == '/api/v2/transaction/list':
+            return 200, {"code": 0, "message": "success", "data": self.transaction_list(query)}
+        if method == 'POST' and path == '/api/bioTemplate/add':
+            return self.add_template(body)
+        if method == 'POST' and path == '/api/v2/person/getPersonList':
+            persons = [p for p in self.persons if p["pin"] == query['pin']] if query.get('pin') else self.persons
+            return 200, {"code": 0, "message": "success", "data": self.page(persons, query)}
+        if method == 'GET' and path == '/api/v2/accLevel/list':
+            # Listed with a total, unlike the other endpoints
+            return 200, {"code": 0, "message": "success",
+                         "data": {"data": self.page(self.levels, query), "total": len(self.levels)}}
+        if method == 'GET' and path == '/api/door/list':
+            return 200, {"code": 0, "message": "success", "data": self.page(self.doors, query)}
+        if method == 'GET' and path.startswith('/api/v2/bioTemplate/getFgListByPin/'):
+            pin = path.rsplit('/', 1)[-1]
+            with self.lock:
+                data = [template for (template_pin, _), template in sorted(self.templates.items())
+                        if template_pin == pin]
+            return 200, {"code": 0, "message": "success", "data": data}
+        return 404, {"code": 404, "message": f"Not found: {path}"}
+
+    def serve(self) -> "FakeZKBio":
+        """Serve on a background thread"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, like ZKBio's Tomcat
+
+            def setup(self):
+                super().setup()
+                with fake.lock:
+                    fake.connections += 1
+                if fake.handshake:
+                    time.sleep(fake.handshake)
+
+            def _reply(self, method: str) -> None:
+                url = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null') if length else None
+                with fake.lock:
+                    fake.requests += 1
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    status, reply = fake.handle(method, url.path, query, body)
+                finally:
+                    with fake.lock:
+                        fake.in_flight -= 1
+                payload = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._reply('GET')
+
+            def do_POST(self):
+                self._reply('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128   # many clients connecting at once
+
+        self.server = Server(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-zkbio", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18098)
+    parser.add_argument('--transactions', type=int, default=50000, help='Door events over the last 30 days')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds per request')
+    parser.add_argument('--token', help='Require this access_token')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with HTTP 503')
+    parser.add_argument('--handshake', type=float, default=0.0, help='Seconds per new connection')
+    parser.add_argument('--persons', type=int, default=1000, help='Persons with access levels')
+    args = parser.parse_args()
+
+    fake = FakeZKBio(args.port, args.latency, args.token, args.fail_rate, handshake=args.handshake)
+    fake.add_transactions(args.transactions)
+    fake.add_access(args.persons)
+    fake.serve()
+    print(f"Fake ZKBio on {fake.url} ({args.transactions} transactions, {args.latency * 1000:.0f} ms/request)")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
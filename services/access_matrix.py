@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Access Matrix
+
+Answers "can PIN X open door Y" and "who can open door Y" locally, instead
+of walking ZKBio's person, access-level and door endpoints on every
+decision (ims.db's zkteco_access_levels and zkteco_doors tables are only
+name caches, without the level -> door mapping).
+
+A snapshot of ZKBio's persons (with their accLevelIds), access levels
+(with their doorIds) and doors (with their deviceId, which the web app
+treats as the door's area) is compiled into bitsets, held as Python ints:
+
+    person_doors[row]  - bit `col` set if the person can open door `col`
+    door_persons[col]  - bit `row` set if person `row` can open that door
+    area_doors[area]   - the doors of an area
+
+so a check is a shift and a mask, and "who can open" is one int (or an OR
+of a few, for an area) whose set bits are the answer. A spouse, PIN
+"<principal>s1", can open whatever the principal's levels open as well as
+their own.
+
+Level changes are applied incrementally: assigning or removing a person's
+levels recomputes that person (and their spouse) and flips their bit in
+only the door columns that changed; changing a level's doors recomputes
+the level's members. A full recompile is only needed for a new snapshot.
+
+The snapshot is fetched from ZKBio (ZKBIO_API_URL, ZKBIO_API_TOKEN) over
+one keep-alive connection, every FINGERPRINT_ACCESS_REFRESH seconds (default
+300) in the bridge, and kept in FINGERPRINT_ACCESS_SNAPSHOT (default
+access_snapshot.json in the project root), so decisions keep working across restarts while
+ZKBio is down:
+
+    {"persons": [{"pin": "1001", "accLevelIds": "1,2"}, ...],
+     "levels": [{"id": "1", "name": "Lobby", "doorIds": "11,12"}, ...],
+     "doors": [{"id": "11", "name": "Front", "deviceId": "CN1234"}, ...]}
+
+Bridge actions (see fingerprint_bridge.py):
+
+    -> {"action": "access_check", "pin": "1001", "door": "11"}   (door id or name)
+    <- {"status": "access", "pin": "1001", "door": "11", "allowed": true, "levels": ["1"]}
+    -> {"action": "access_who", "door": "11"}   (or "area": "CN1234"; "limit" caps the pins listed)
+    <- {"status": "access", "count": 2, "pins": ["1001", "1001s1"]}
+    -> {"action": "access_doors", "pin": "1001"}
+    <- {"status": "access", "pin": "1001", "doors": [{"id": "11", "name": "Front", "area": "CN1234"}]}
+    -> {"action": "access_update", "pin": "1001", "levelIds": ["2"], "mode": "add"}   (add|remove|set)
+    -> {"action": "access_update", "level": "2", "doorIds": ["11", "13"]}
+    -> {"action": "access_refresh"}   (recompile from ZKBio)
+
+Usage:
+    python3 services/access_matrix.py [--zkbio URL --token TOKEN] [--snapshot access_snapshot.json]
+        [--pin 1001 --door 11] [--who 11]
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from zkbio_uploader import ZKBIO_API_TOKEN, ZKBIO_API_URL, ZKBioConnections, ZKBioError
+
+# Configuration
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACCESS_SNAPSHOT_PATH = os.environ.get('FINGERPRINT_ACCESS_SNAPSHOT', os.path.join(ROOT, 'access_snapshot.json'))
+ACCESS_REFRESH_INTERVAL = float(os.environ.get('FINGERPRINT_ACCESS_REFRESH', 300))
+ZKBIO_PAGE_SIZE = 1000
+SPOUSE_SUFFIX = "s1"
+WHO_LIMIT = 1000
+PERSON_LIST_PATH = "/api/v2/person/getPersonList"
+LEVEL_LIST_PATH = "/api/v2/accLevel/list"
+DOOR_LIST_PATH = "/api/door/list"
+
+
+def principal_of(pin: str) -> Optional[str]:
+    """The principal's PIN for a spouse PIN ("1001s1" -> "1001")"""
+    if pin.endswith(SPOUSE_SUFFIX) and len(pin) > len(SPOUSE_SUFFIX):
+        return pin[:-len(SPOUSE_SUFFIX)]
+    return None
+
+
+def split_ids(value: Any) -> List[str]:
+    """ZKBio sends id lists as "1,2,3" or as JSON arrays"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(',') if part.strip()]
+    return [str(part) for part in value]
+
+
+def bit_count(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    """Positions of the set bits, lowest first"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class AccessMatrix:
+    """Persons x doors access, compiled from a ZKBio snapshot"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.pins: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.doors: List[Dict[str, Any]] = []
+        self.cols: Dict[str, int] = {}          # door id -> column
+        self.door_names: Dict[str, int] = {}    # lower-cased door name -> column
+        self.area_doors: Dict[str, int] = {}
+        self.level_doors: Dict[str, int] = {}
+        self.level_members: Dict[str, int] = {}  # direct assignments only
+        self.person_levels: List[Set[str]] = []
+        self.person_doors: List[int] = []
+        self.door_persons: List[int] = []
+        self.compiled_at: Optional[float] = None
+        self.compile_ms = 0.0
+        self.updates = 0
+
+    @classmethod
+    def compile(cls, snapshot: Dict[str, Any]) -> "AccessMatrix":
+        started = time.perf_counter()
+        matrix = cls()
+        for door in snapshot.get("doors", []):
+            matrix._add_door(door)
+        for level in snapshot.get("levels", []):
+            level_id = str(level.get("id", level.get("LevelID")))
+            matrix.level_doors[level_id] = matrix._door_bits(split_ids(level.get("doorIds", level.get("DoorIds"))))
+            matrix.level_members[level_id] = 0
+        for person in snapshot.get("persons", []):
+            row = matrix._row(str(person["pin"]))
+            levels = set(split_ids(person.get("accLevelIds")))
+            matrix.person_levels[row] = levels
+            for level_id in levels:
+                matrix.level_members[level_id] = matrix.level_members.get(level_id, 0) | (1 << row)
+
+        # Columns built per level: one OR of the level's members into each of its doors
+        effective_members: Dict[str, int] = {}
+        for row, pin in enumerate(matrix.pins):
+            levels = matrix.effective_levels(row)
+            doors = 0
+            for level_id in levels:
+                doors |= matrix.level_doors.get(level_id, 0)
+                effective_members[level_id] = effective_members.get(level_id, 0) | (1 << row)
+            matrix.person_doors[row] = doors
+        for level_id, members in effective_members.items():
+            for col in iter_bits(matrix.level_doors.get(level_id, 0)):
+                matrix.door_persons[col] |= members
+
+        matrix.compiled_at = time.time()
+        matrix.compile_ms = round((time.perf_counter() - started) * 1000, 2)
+        return matrix
+
+    def _add_door(self, door: Dict[str, Any]) -> int:
+        door_id = str(door.get("id", door.get("doorId", door.get("DoorID"))))
+        col = self.cols.get(door_id)
+        if col is not None:
+            return col
+        col = len(self.doors)
+        name = door.get("name", door.get("doorName", door.get("Name"))) or door_id
+        area = door.get("deviceId") or door.get("deviceSn") or door.get("areaName") or ""
+        self.doors.append({"id": door_id, "name": name, "area": str(area)})
+        self.cols[door_id] = col
+        self.door_names.setdefault(str(name).lower(), col)
+        self.area_doors[str(area)] = self.area_doors.get(str(area), 0) | (1 << col)
+        self.door_persons.append(0)
+        return col
+
+    def _door_bits(self, door_ids: Iterable[str]) -> int:
+        bits = 0
+        for door_id in door_ids:
+            col = self.cols.get(door_id)
+            if col is None:
+                # A level can name a door the door list did not return
+                col = self._add_door({"id": door_id})
+            bits |= 1 << col
+        return bits
+
+    def _row(self, pin: str) -> int:
+        row = self.rows.get(pin)
+        if row is None:
+            row = self.rows[pin] = len(self.pins)
+            self.pins.append(pin)
+            self.person_levels.append(set())
+            self.person_doors.append(0)
+        return row
+
+    def door_col(self, door: Any) -> Optional[int]:
+        """A door's column, by id or (case-insensitive) name"""
+        col = self.cols.get(str(door))
+        return col if col is not None else self.door_names.get(str(door).lower())
+
+    def effective_levels(self, row: int) -> Set[str]:
+        """A person's own levels plus, for a spouse, the principal's"""
+        levels = self.person_levels[row]
+        principal = principal_of(self.pins[row])
+        principal_row = self.rows.get(principal) if principal else None
+        if principal_row is None:
+            return levels
+        return levels | self.person_levels[principal_row]
+
+    # Queries
+
+    def can_open(self, pin: str, door: Any) -> bool:
+        row = self.rows.get(str(pin))
+        col = self.door_col(door)
+        if row is None or col is None:
+            return False
+        return bool(self.person_doors[row] >> col & 1)
+
+    def who_can_open(self, door: Any = None, area: Optional[str] = None) -> int:
+        """The persons, as a bitset over rows, who can open a door or any door of an area"""
+        if area is not None:
+            bits = 0
+            for col in iter_bits(self.area_doors.get(str(area), 0)):
+                bits |= self.door_persons[col]
+            return bits
+        col = self.door_col(door)
+        return self.door_persons[col] if col is not None else 0
+
+    def pins_of(self, bits: int, limit: Optional[int] = None) -> List[str]:
+        pins = []
+        for row in iter_bits(bits):
+            if limit is not None and len(pins) >= limit:
+                break
+            pins.append(self.pins[row])
+        return pins
+
+    def doors_of(self, pin: str) -> List[Dict[str, Any]]:
+        row = self.rows.get(str(pin))
+        if row is None:
+            return []
+        return [self.doors[col] for col in iter_bits(self.person_doors[row])]
+
+    def granting_levels(self, pin: str, door: Any) -> List[str]:
+        """Which of the person's levels open the door"""
+        row = self.rows.get(str(pin))
+        col = self.door_col(door)
+        if row is None or col is None:
+            return []
+        return sorted(level_id for level_id in self.effective_levels(row)
+                      if self.level_doors.get(level_id, 0) >> col & 1)
+
+    # Incremental updates
+
+    def _recompute(self, row: int) -> None:
+        doors = 0
+        for level_id in self.effective_levels(row):
+            doors |= self.level_doors.get(level_id, 0)
+        changed = self.person_doors[row] ^ doors
+        if not changed:
+            return
+        self.person_doors[row] = doors
+        bit = 1 << row
+        for col in iter_bits(changed):
+            self.door_persons[col] ^= bit
+
+    def _recompute_person(self, row: int) -> None:
+        """The person and, for a principal, their spouse"""
+        self._recompute(row)
+        spouse_row = self.rows.get(self.pins[row] + SPOUSE_SUFFIX)
+        if spouse_row is not None:
+            self._recompute(spouse_row)
+
+    def set_person_levels(self, pin: str, level_ids: Iterable[str], mode: str = "set") -> Set[str]:
+        """Add, remove or replace a person's levels; returns the levels now held"""
+        row = self._row(str(pin))
+        old = self.person_levels[row]
+        ids = {str(level_id) for level_id in level_ids}
+        if mode == "add":
+            new = old | ids
+        elif mode == "remove":
+            new = old - ids
+        elif mode == "set":
+            new = ids
+        else:
+            raise ValueError(f"Unknown mode: {mode} (add, remove or set)")
+        bit = 1 << row
+        for level_id in old - new:
+            self.level_members[level_id] = self.level_members.get(level_id, 0) & ~bit
+        for level_id in new - old:
+            self.level_members[level_id] = self.level_members.get(level_id, 0) | bit
+        self.person_levels[row] = new
+        self._recompute_person(row)
+        self.updates += 1
+        return new
+
+    def set_level_doors(self, level_id: str, door_ids: Iterable[str]) -> None:
+        """Replace the doors of a level and recompute its members"""
+        level_id = str(level_id)
+        self.level_doors[level_id] = self._door_bits(str(door_id) for door_id in door_ids)
+        for row in iter_bits(self.level_members.get(level_id, 0)):
+            self._recompute_person(row)
+        self.updates += 1
+
+    def stats(self) -> Dict[str, Any]:
+        grants = sum(bit_count(bits) for bits in self.person_doors)
+        return {
+            "persons": len(self.pins),
+            "doors": len(self.doors),
+            "areas": len(self.area_doors),
+            "levels": len(self.level_doors),
+            "grants": grants,
+            "compiledAt": self.compiled_at,
+            "compileMs": self.compile_ms,
+            "updates": self.updates,
+        }
+
+
+def unwrap_list(data: Any) -> List[Dict[str, Any]]:
+    """ZKBio lists come bare or inside {"data": [...], "total": n}"""
+    if isinstance(data, dict):
+        data = data.get("data") or data.get("list") or []
+    return list(data or [])
+
+
+def fetch_snapshot(base_url: str, token: Optional[str] = None,
+                   page_size: int = ZKBIO_PAGE_SIZE) -> Dict[str, Any]:
+    """Persons, levels and doors from ZKBio, over one keep-alive connection (blocking)"""
+    connections = ZKBioConnections(base_url, token)
+
+    def pages(method: str, path: str) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        page = 1
+        while True:
+            data = unwrap_list(connections.request(method, path, None, {"pageNo": page, "pageSize": page_size}))
+            items.extend(data)
+            if len(data) < page_size:
+                return items
+            page += 1
+
+    try:
+        return {
+            "persons": [{"pin": person["pin"], "accLevelIds": person.get("accLevelIds")}
+                        for person in pages("POST", PERSON_LIST_PATH) if person.get("pin")],
+            "levels": pages("GET", LEVEL_LIST_PATH),
+            "doors": pages("GET", DOOR_LIST_PATH),
+            "fetchedAt": time.time(),
+        }
+    finally:
+        connections.close()
+
+
+def load_snapshot(path: str = ACCESS_SNAPSHOT_PATH) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logging.getLogger(__name__).warning(f"Ignoring unreadable access snapshot {path}: {e}")
+        return None
+
+
+def save_snapshot(snapshot: Dict[str, Any], path: str = ACCESS_SNAPSHOT_PATH) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def snapshot_of(matrix: AccessMatrix) -> Dict[str, Any]:
+    """The matrix's current state as a snapshot, including incremental updates"""
+    return {
+        "persons": [{"pin": pin, "accLevelIds": ",".join(sorted(matrix.person_levels[row]))}
+                    for row, pin in enumerate(matrix.pins)],
+        "levels": [{"id": level_id, "doorIds": ",".join(matrix.doors[col]["id"] for col in iter_bits(bits))}
+                   for level_id, bits in matrix.level_doors.items()],
+        "doors": [{"id": door["id"], "name": door["name"], "deviceId": door["area"]} for door in matrix.doors],
+        "fetchedAt": time.time(),
+    }
+
+
+def handle_access_action(matrix: Optional[AccessMatrix], action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Run an access_* bridge action against the matrix"""
+    if matrix is None:
+        return {
+            "status": "error",
+            "message": "Access matrix not loaded (set ZKBIO_API_URL or FINGERPRINT_ACCESS_SNAPSHOT)"
+        }
+    pin = data.get('pin')
+    try:
+        if action == 'access_check':
+            if pin is None or data.get('door') is None:
+                raise ValueError("pin and door are required")
+            door = data['door']
+            if matrix.door_col(door) is None:
+                raise ValueError(f"Unknown door: {door}")
+            return {
+                "status": "access",
+                "pin": str(pin),
+                "door": str(door),
+                "allowed": matrix.can_open(pin, door),
+                "levels": matrix.granting_levels(pin, door)
+            }
+
+        if action == 'access_who':
+            if data.get('door') is None and data.get('area') is None:
+                raise ValueError("door or area is required")
+            bits = matrix.who_can_open(data.get('door'), data.get('area'))
+            return {
+                "status": "access",
+                "count": bit_count(bits),
+                "pins": matrix.pins_of(bits, int(data.get('limit', WHO_LIMIT)))
+            }
+
+        if action == 'access_doors':
+            if pin is None:
+                raise ValueError("pin is required")
+            return {"status": "access", "pin": str(pin), "doors": matrix.doors_of(pin)}
+
+        if action == 'access_update':
+            if data.get('level') is not None:
+                matrix.set_level_doors(data['level'], split_ids(data.get('doorIds')))
+                return {"status": "updated", "level": str(data['level']), **matrix.stats()}
+            if pin is None:
+                raise ValueError("pin or level is required")
+            levels = matrix.set_person_levels(pin, split_ids(data.get('levelIds')), data.get('mode', 'set'))
+            return {"status": "updated", "pin": str(pin), "levelIds": sorted(levels),
+                    "doors": len(matrix.doors_of(pin))}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    return {"status": "error", "message": f"Unknown action: {action}"}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--zkbio', default=ZKBIO_API_URL, help='Fetch a fresh snapshot from this ZKBio')
+    parser.add_argument('--token', default=ZKBIO_API_TOKEN)
+    parser.add_argument('--snapshot', default=ACCESS_SNAPSHOT_PATH)
+    parser.add_argument('--pin')
+    parser.add_argument('--door')
+    parser.add_argument('--who', help='List who can open this door')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    snapshot = None
+    if args.zkbio:
+        try:
+            snapshot = fetch_snapshot(args.zkbio, args.token)
+            save_snapshot(snapshot, args.snapshot)
+        except (ZKBioError, OSError) as e:
+            logging.error(f"Fetching from ZKBio failed, using {args.snapshot}: {e}")
+    snapshot = snapshot or load_snapshot(args.snapshot)
+    if snapshot is None:
+        logging.error(f"No snapshot: pass --zkbio or create {args.snapshot}")
+        return 2
+
+    matrix = AccessMatrix.compile(snapshot)
+    print(json.dumps(matrix.stats()))
+    if args.pin and args.door:
+        print(json.dumps(handle_access_action(matrix, 'access_check', {"pin": args.pin, "door": args.door})))
+    elif args.pin:
+        print(json.dumps(handle_access_action(matrix, 'access_doors', {"pin": args.pin})))
+    if args.who:
+        print(json.dumps(handle_access_action(matrix, 'access_who', {"door": args.who})))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Attendance Ingestion
+
+Copies attendance and door events into ims.db, so reports are answered from
+an indexed local table instead of paging ZKBio's /api/v2/transaction/list
+50 rows at a time:
+
+    PanelSource  - a network panel's attendance log, read over pyzk through
+                   the panel pool (panel_pool.py)
+    ZKBioSource  - ZKBio's transaction list (or scripts/fake_zkbio.py)
+
+Each source ingests incrementally from its own checkpoint
+(ingest_checkpoints table):
+
+    panel  - how many log records were ingested and the time of the last
+             one. The ZK protocol has no "since" query, so the panel still
+             sends its whole log, but only records past the checkpoint
+             become rows. A log shorter than the checkpoint, or with a
+             different record at the checkpoint, was cleared on the panel
+             and is ingested from the start.
+    zkbio  - the latest eventTime ingested; the next pull asks for
+             startDate=<checkpoint> (inclusive) in pages of 1000.
+
+Rows go into `transactions` with INSERT OR IGNORE on (source, sourceId), so
+re-reading an overlap is harmless. They are written in batches of
+INGEST_BATCH_SIZE rows, one transaction per batch, by a single writer
+connection. ims.db runs in WAL mode (lib/database.ts enables it), so the
+Next.js app keeps reading while a batch commits. The checkpoint is updated
+in the same transaction as a source's last batch.
+
+Usage:
+    python3 services/attendance_ingest.py [--db ims.db] [--panels SPEC]
+        [--zkbio http://192.168.0.93:8098 --token TOKEN] [--interval 60]
+
+--panels defaults to FINGERPRINT_PANELS. Without --interval it ingests once
+and exits.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import sqlite3
+import ssl
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlparse
+
+from panel_pool import PanelPool, load_panels
+
+# Configuration
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.environ.get('IMS_DB_PATH', os.path.join(ROOT, 'ims.db'))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 5000))
+ZKBIO_PAGE_SIZE = 1000
+ZKBIO_TIMEOUT = 30.0
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+  source TEXT NOT NULL,
+  sourceId TEXT NOT NULL,
+  personPin TEXT,
+  personName TEXT,
+  deviceSn TEXT,
+  doorName TEXT,
+  eventTime TEXT NOT NULL,
+  verifyModeName TEXT,
+  eventName TEXT,
+  PRIMARY KEY (source, sourceId)
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_time ON transactions (eventTime);
+CREATE INDEX IF NOT EXISTS idx_transactions_pin_time ON transactions (personPin, eventTime);
+CREATE INDEX IF NOT EXISTS idx_transactions_device_time ON transactions (deviceSn, eventTime);
+
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+  source TEXT PRIMARY KEY,
+  cursor TEXT,
+  rows INTEGER DEFAULT 0,
+  updatedAt TEXT
+);
+"""
+
+INSERT_TRANSACTION = """
+INSERT OR IGNORE INTO transactions
+  (source, sourceId, personPin, personName, deviceSn, doorName, eventTime, verifyModeName, eventName)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_CHECKPOINT = """
+INSERT INTO ingest_checkpoints (source, cursor, rows, updatedAt) VALUES (?, ?, ?, ?)
+ON CONFLICT (source) DO UPDATE SET
+  cursor = excluded.cursor, rows = rows + excluded.rows, updatedAt = excluded.updatedAt
+"""
+
+# pyzk Attendance.status is the verify mode and .punch the punch state
+VERIFY_MODES = {0: "Password", 1: "Fingerprint", 2: "Card", 4: "Card", 15: "Face"}
+PUNCH_STATES = {0: "Check-In", 1: "Check-Out", 2: "Break-Out", 3: "Break-In",
+                4: "Overtime-In", 5: "Overtime-Out"}
+
+Row = Tuple[Any, ...]
+
+
+class TransactionStore:
+    """Writer for ims.db's transactions and ingest_checkpoints tables"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, batch_size: int = INGEST_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        # Only ever used from one thread at a time (see AttendanceIngestor.write_lock)
+        self.db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        # Under WAL, NORMAL only risks the last commits on power loss, which
+        # the checkpoints make the next pull re-read
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def checkpoint(self, source: str) -> Dict[str, Any]:
+        row = self.db.execute("SELECT cursor FROM ingest_checkpoints WHERE source = ?", (source,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def write(self, source: str, rows: List[Row], cursor: Dict[str, Any]) -> int:
+        """Insert rows in batched transactions, then move the checkpoint; returns rows added"""
+        added = 0
+        batches = [rows[start:start + self.batch_size] for start in range(0, len(rows), self.batch_size)] or [[]]
+        for i, batch in enumerate(batches):
+            with self.db:
+                before = self.db.total_changes
+                self.db.executemany(INSERT_TRANSACTION, batch)
+                batch_added = self.db.total_changes - before
+                added += batch_added
+                if i == len(batches) - 1:
+                    self.db.execute(UPSERT_CHECKPOINT, (source, json.dumps(cursor), added,
+                                                        datetime.now().isoformat()))
+        return added
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def read_attendance(conn) -> Tuple[str, list]:
+    """A panel's serial number and whole attendance log (runs on a panel thread)"""
+    return conn.get_serialnumber(), conn.get_attendance()
+
+
+class PanelSource:
+    """A network panel's attendance log"""
+
+    def __init__(self, pool: PanelPool, name: str):
+        self.pool = pool
+        self.name = name
+        self.source = f"panel:{name}"
+
+    async def pull(self, cursor: Dict[str, Any]) -> Tuple[List[Row], Dict[str, Any]]:
+        serial, records = await self.pool.run(self.name, read_attendance, op="attendance")
+
+        count = cursor.get("count", 0)
+        if count > len(records) or (count and records[count - 1].timestamp.strftime(TIME_FORMAT) != cursor.get("last")):
+            logging.getLogger(__name__).info(f"Attendance log on {self.name} was cleared; re-reading it")
+            count = 0
+
+        rows = []
+        for record in records[count:]:
+            event_time = record.timestamp.strftime(TIME_FORMAT)
+            rows.append((
+                self.source,
+                f"{record.user_id}|{event_time}|{record.punch}",
+                record.user_id,
+                None,
+                serial,
+                None,
+                event_time,
+                VERIFY_MODES.get(record.status, str(record.status)),
+                PUNCH_STATES.get(record.punch, str(record.punch)),
+            ))
+        last = records[-1].timestamp.strftime(TIME_FORMAT) if records else None
+        return rows, {"count": len(records), "last": last}
+
+
+class ZKBioSource:
+    """ZKBio's transaction list, paged from the last ingested eventTime"""
+
+    source = "zkbio"
+
+    def __init__(self, base_url: str, token: Optional[str] = None, page_size: int = ZKBIO_PAGE_SIZE,
+                 timeout: float = ZKBIO_TIMEOUT):
+        self.url = urlparse(base_url)
+        self.token = token
+        self.page_size = page_size
+        self.timeout = timeout
+
+    def connect(self) -> http.client.HTTPConnection:
+        if self.url.scheme == 'https':
+            # ZKBio commonly runs with a self-signed certificate
+            return http.client.HTTPSConnection(self.url.hostname, self.url.port, timeout=self.timeout,
+                                               context=ssl._create_unverified_context())
+        return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+
+    def fetch(self, since: Optional[str]) -> List[Dict[str, Any]]:
+        """Every transaction at or after `since`, over one keep-alive connection"""
+        conn = self.connect()
+        transactions = []
+        try:
+            page = 1
+            while True:
+                params = {"pageNo": page, "pageSize": self.page_size}
+                if since:
+                    params["startDate"] = since
+                if self.token:
+                    params["access_token"] = self.token
+                conn.request("GET", f"{self.url.path.rstrip('/')}/api/v2/transaction/list?{urlencode(params)}")
+                response = conn.getresponse()
+                body = json.loads(response.read() or b'{}')
+                if response.status != 200 or body.get("code") != 0:
+                    raise RuntimeError(f"ZKBio transaction list failed: {body.get('message') or response.status}")
+                data = body.get("data") or []
+                transactions.extend(data)
+                if len(data) < self.page_size:
+                    return transactions
+                page += 1
+        finally:
+            conn.close()
+
+    async def pull(self, cursor: Dict[str, Any]) -> Tuple[List[Row], Dict[str, Any]]:
+        since = cursor.get("since")
+        transactions = await asyncio.to_thread(self.fetch, since)
+
+        rows = []
+        newest = since
+        for tx in transactions:
+            event_time = tx.get("eventTime")
+            if not event_time:
+                continue
+            pin = tx.get("personPin") or tx.get("pin")
+            device_sn = tx.get("deviceSn") or tx.get("devSn")
+            rows.append((
+                self.source,
+                str(tx.get("id") or f"{pin}|{event_time}|{device_sn}"),
+                pin,
+                tx.get("personName") or tx.get("name"),
+                device_sn,
+                tx.get("doorName") or tx.get("eventPointName"),
+                event_time,
+                tx.get("verifyModeName"),
+                tx.get("eventName"),
+            ))
+            if newest is None or event_time > newest:
+                newest = event_time
+        return rows, {"since": newest}
+
+
+class AttendanceIngestor:
+    """Pulls every source concurrently and writes them through one connection"""
+
+    def __init__(self, store: TransactionStore, sources: List[Any]):
+        self.logger = logging.getLogger(__name__)
+        self.store = store
+        self.sources = sources
+        self.write_lock = asyncio.Lock()
+
+    async def ingest(self, source) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            async with self.write_lock:
+                cursor = await asyncio.to_thread(self.store.checkpoint, source.source)
+            rows, cursor = await source.pull(cursor)
+            async with self.write_lock:
+                added = await asyncio.to_thread(self.store.write, source.source, rows, cursor)
+        except Exception as e:
+            self.logger.error(f"Ingesting {source.source} failed: {e}")
+            return {"source": source.source, "status": "error", "message": str(e)}
+        return {
+            "source": source.source,
+            "status": "success",
+            "fetched": len(rows),
+            "added": added,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    async def run_once(self) -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*(self.ingest(source) for source in self.sources)))
+
+
+async def run(args) -> int:
+    store = TransactionStore(args.db)
+    pool = None
+    sources: List[Any] = []
+    configs = load_panels(args.panels)
+    if configs:
+        pool = PanelPool(configs)
+        sources.extend(PanelSource(pool, config.name) for config in configs)
+    if args.zkbio:
+        sources.append(ZKBioSource(args.zkbio, args.token))
+    if not sources:
+        logging.error("Nothing to ingest: pass --panels (or set FINGERPRINT_PANELS) and/or --zkbio")
+        return 2
+
+    ingestor = AttendanceIngestor(store, sources)
+    failed = False
+    try:
+        while True:
+            for result in await ingestor.run_once():
+                if result["status"] == "success":
+                    logging.info(f"{result['source']}: {result['added']} new of {result['fetched']} "
+                                 f"fetched in {result['seconds']}s")
+                else:
+                    failed = True
+            if not args.interval:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        if pool:
+            await pool.close()
+        store.close()
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--panels', default=os.environ.get('FINGERPRINT_PANELS'),
+                        help='name=host[:port],... or a JSON file (see panel_pool.py)')
+    parser.add_argument('--zkbio', default=os.environ.get('ZKBIO_API_URL'), help='ZKBio base URL')
+    parser.add_argument('--token', default=os.environ.get('ZKBIO_API_TOKEN'))
+    parser.add_argument('--interval', type=float, default=0, help='Seconds between pulls (default: once)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,384 @@
+/**
+ * Fingerprint Bridge Client
+ *
+ * One long-lived WebSocket to the bridge, shared by every request. Each
+ * request carries an "id" that the bridge echoes on all of its replies
+ * (see services/bridge_protocol.py), so status, capture, enroll and other
+ * requests can be pipelined and their replies arrive in any order. Binary
+ * capture frames carry the job number instead, which the client learns from
+ * the request's "queued" ack. Scanner hot-plug broadcasts carry no id and go
+ * to onDeviceChange listeners.
+ *
+ * A bridge that is restarting sends "draining": the client stops using that
+ * socket for new requests (which go to a new connection, served by the
+ * bridge replacing it) while requests already on it finish there. Requests
+ * it hands back with a "draining" reply are resent on the new connection.
+ */
+
+import { decodeBinaryCapture, type BinaryCaptureResult } from './bridgeProtocol';
+
+export type BridgeReply = Record<string, any>;
+
+export interface BridgeRequestOptions {
+  // Called for every reply that does not finish the request (acks,
+  // progress events, per-finger results)
+  onEvent?: (reply: BridgeReply) => void;
+  // Called for binary capture frames that do not finish the request
+  onFrame?: (frame: BinaryCaptureResult) => void;
+  // Whether a JSON reply finishes the request; by default anything but an
+  // ack or a progress event does
+  isFinal?: (reply: BridgeReply) => boolean;
+  // Whether a binary frame finishes the request (default: yes)
+  frameIsFinal?: boolean;
+  // Fails the request when no reply arrives for this long; reset by every reply
+  timeoutMs?: number;
+}
+
+export type BridgeResult =
+  | { kind: 'json'; reply: BridgeReply }
+  | { kind: 'binary'; frame: BinaryCaptureResult };
+
+interface PendingRequest {
+  ws: WebSocket;
+  options: BridgeRequestOptions;
+  resolve: (result: BridgeResult) => void;
+  reject: (error: Error) => void;
+  timer?: ReturnType<typeof setTimeout>;
+}
+
+const CONNECT_TIMEOUT_MS = 5000;
+// Resends of a request handed back by a restarting bridge, and connection
+// attempts while its replacement starts listening
+const MAX_RESENDS = 2;
+const RESTART_CONNECT_ATTEMPTS = 10;
+const RESTART_RETRY_MS = 300;
+
+const defaultIsFinal = (reply: BridgeReply) =>
+  reply.status !== 'queued' && reply.status !== 'progress';
+
+/**
+ * A fresh idempotency key for a capture; resending the capture with the
+ * same key returns the original result instead of capturing again
+ */
+export function newIdempotencyKey(): string {
+  return globalThis.crypto?.randomUUID?.()
+    ?? `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+export class BridgeClient {
+  private socket: WebSocket | null = null;
+  private connecting: Promise<WebSocket> | null = null;
+  private nextId = 1;
+  private pending = new Map<number, PendingRequest>();
+  // Per socket: binary frame tag (job number) -> request id, learned from "queued" acks
+  private jobRequests = new Map<WebSocket, Map<number, number>>();
+  private deviceListeners: ((device: BridgeReply) => void)[] = [];
+  // Set by a "draining" notice until a new connection opens
+  private restarting = false;
+
+  constructor(private url: string = 'ws://localhost:8765') {}
+
+  get connected(): boolean {
+    return this.socket?.readyState === WebSocket.OPEN;
+  }
+
+  /**
+   * Open the shared socket (once) and negotiate binary capture frames
+   */
+  connect(): Promise<WebSocket> {
+    if (this.socket && this.connected) {
+      return Promise.resolve(this.socket);
+    }
+    if (!this.connecting) {
+      this.connecting = this.open().finally(() => {
+        this.connecting = null;
+      });
+    }
+    return this.connecting;
+  }
+
+  private open(): Promise<WebSocket> {
+    return new Promise((resolve, reject) => {
+      const ws = new WebSocket(this.url);
+      ws.binaryType = 'arraybuffer';
+
+      const timeout = setTimeout(() => {
+        ws.close();
+        reject(new Error('Bridge connection timeout'));
+      }, CONNECT_TIMEOUT_MS);
+
+      ws.onopen = () => {
+        clearTimeout(timeout);
+        this.socket = ws;
+        this.restarting = false;
+        // Sent before anything else, so every later request gets binary
+        // frames; the hello reply is matched like any other
+        this.send(ws, { action: 'hello', protocol: 'binary' }).catch(() => undefined);
+        resolve(ws);
+      };
+
+      ws.onerror = () => {
+        clearTimeout(timeout);
+        reject(new Error('Failed to connect to bridge service'));
+      };
+
+      ws.onclose = () => {
+        if (this.socket === ws) {
+          this.socket = null;
+        }
+        this.failSocket(ws, new Error('Bridge connection closed'));
+      };
+
+      ws.onmessage = (event: MessageEvent) => this.dispatch(ws, event.data);
+    });
+  }
+
+  /**
+   * Send a request and resolve with the reply (or binary frame) that
+   * finishes it. Other requests can be sent while this one is in flight.
+   */
+  async request(message: BridgeReply, options: BridgeRequestOptions = {}): Promise<BridgeResult> {
+    let ws = this.restarting ? await this.reconnect() : await this.connect();
+    for (let resends = 0; ; resends++) {
+      const result = await this.send(ws, message, options);
+      if (result.kind === 'json' && result.reply.status === 'draining' && resends < MAX_RESENDS) {
+        // Never run by the restarting bridge: resend it to its replacement
+        ws = await this.reconnect();
+        continue;
+      }
+      return result;
+    }
+  }
+
+  private async reconnect(): Promise<WebSocket> {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await this.connect();
+      } catch (error) {
+        // Without SO_REUSEPORT (Windows) the replacement only listens once the old bridge has gone
+        if (attempt >= RESTART_CONNECT_ATTEMPTS) {
+          throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, RESTART_RETRY_MS));
+      }
+    }
+  }
+
+  private send(ws: WebSocket, message: BridgeReply, options: BridgeRequestOptions = {}): Promise<BridgeResult> {
+    const id = this.nextId++;
+
+    return new Promise((resolve, reject) => {
+      const entry: PendingRequest = { ws, options, resolve, reject };
+      this.pending.set(id, entry);
+      this.armTimeout(id, entry);
+      ws.send(JSON.stringify({ ...message, id }));
+    });
+  }
+
+  /**
+   * Send a JSON request and resolve with its final JSON reply
+   */
+  async call(message: BridgeReply, options: BridgeRequestOptions = {}): Promise<BridgeReply> {
+    const result = await this.request(message, options);
+    if (result.kind !== 'json') {
+      throw new Error('Unexpected binary reply from bridge');
+    }
+    return result.reply;
+  }
+
+  /**
+   * Cancel this connection's captures (or one job) on the bridge
+   */
+  async cancel(jobId?: string): Promise<void> {
+    if (!this.connected) {
+      return;
+    }
+    await this.call(jobId ? { action: 'cancel', jobId } : { action: 'cancel' });
+  }
+
+  /**
+   * Stream live panel events matching the filters to onEvent. Resolves
+   * with the subscription id once the bridge accepts it; `closed` settles
+   * when the subscription ends (unsubscribe or disconnect).
+   */
+  async subscribeEvents(
+    filters: BridgeReply,
+    onEvent: (event: BridgeReply, dropped: number) => void,
+    queueSize?: number,
+  ): Promise<{ subscription: string; closed: Promise<BridgeReply> }> {
+    let accepted!: (subscription: string) => void;
+    const subscribed = new Promise<string>(resolve => { accepted = resolve; });
+    const message: BridgeReply = queueSize ? { action: 'subscribe', filters, queueSize } : { action: 'subscribe', filters };
+    const closed = this.call(message, {
+      isFinal: reply => reply.status === 'unsubscribed' || reply.status === 'error',
+      onEvent: reply => {
+        if (reply.status === 'subscribed') {
+          accepted(reply.subscription);
+        } else if (reply.status === 'event') {
+          onEvent(reply.event, reply.dropped);
+        }
+      },
+    });
+    // A final reply before the "subscribed" ack means the bridge refused it
+    const refused = closed.then(reply => Promise.reject(new Error(reply.message || 'Subscription refused by bridge')));
+    refused.catch(() => undefined);
+    const subscription = await Promise.race([subscribed, refused]);
+    return { subscription, closed };
+  }
+
+  async unsubscribeEvents(subscription: string): Promise<boolean> {
+    if (!this.connected) {
+      return false;
+    }
+    const reply = await this.call({ action: 'unsubscribe', subscription });
+    return Boolean(reply.unsubscribed);
+  }
+
+  /**
+   * Upload a template to ZKBio through the bridge's pooled uploader (instead
+   * of PUT /api/biometric); resolves with the bridge's per-template ack
+   * ({status: 'uploaded' | 'upload_failed', pin, templateNo, attempts, ...})
+   */
+  async uploadTemplate(pin: string, template: string, templateNo = 0): Promise<BridgeReply> {
+    return this.call({ action: 'upload_template', pin, template, templateNo });
+  }
+
+  /** Offline access decision from the bridge's compiled access matrix */
+  async checkAccess(pin: string, door: string): Promise<BridgeReply> {
+    return this.call({ action: 'access_check', pin, door });
+  }
+
+  /** PINs that may open a door (optionally limited to one area) */
+  async whoCanOpen(door: string, area?: string): Promise<BridgeReply> {
+    return this.call({ action: 'access_who', door, ...(area ? { area } : {}) });
+  }
+
+  async accessibleDoors(pin: string): Promise<BridgeReply> {
+    return this.call({ action: 'access_doors', pin });
+  }
+
+  /** Apply a level assignment made in ZKBio to the bridge's access matrix (persisted in its snapshot) */
+  async updateAccess(pin: string, levelIds: string[], mode: 'add' | 'remove' | 'set' = 'set'): Promise<BridgeReply> {
+    return this.call({ action: 'access_update', pin, levelIds, mode });
+  }
+
+  /**
+   * Listen for scanner hot-plug changes ({deviceId, state: 'open' | 'removed'
+   * | 'lost' | 'failed', error?}); returns an unsubscribe function
+   */
+  onDeviceChange(listener: (device: BridgeReply) => void): () => void {
+    this.deviceListeners.push(listener);
+    return () => {
+      this.deviceListeners = this.deviceListeners.filter(other => other !== listener);
+    };
+  }
+
+  close(): void {
+    this.socket?.close();
+  }
+
+  private dispatch(ws: WebSocket, data: ArrayBuffer | string): void {
+    if (data instanceof ArrayBuffer) {
+      let frame: BinaryCaptureResult;
+      try {
+        frame = decodeBinaryCapture(data);
+      } catch {
+        return;
+      }
+      const id = this.jobRequests.get(ws)?.get(frame.tag);
+      const entry = id !== undefined ? this.pending.get(id) : undefined;
+      if (id === undefined || !entry) {
+        return;
+      }
+      if (entry.options.frameIsFinal === false) {
+        this.armTimeout(id, entry);
+        entry.options.onFrame?.(frame);
+      } else {
+        this.settle(id, entry);
+        entry.resolve({ kind: 'binary', frame });
+      }
+      return;
+    }
+
+    let reply: BridgeReply;
+    try {
+      reply = JSON.parse(data);
+    } catch {
+      return;
+    }
+
+    if (reply.status === 'device' && reply.id === undefined) {
+      this.deviceListeners.forEach(listener => listener(reply));
+      return;
+    }
+
+    if (reply.status === 'draining') {
+      // Requests already sent finish here; new ones open a new connection
+      if (this.socket === ws) {
+        this.socket = null;
+        this.restarting = true;
+      }
+      if (reply.id === undefined) {
+        return;
+      }
+    }
+
+    // Replies without an id (e.g. "Invalid JSON message") can't be matched
+    const id = typeof reply.id === 'number' ? reply.id : undefined;
+    const entry = id !== undefined ? this.pending.get(id) : undefined;
+    if (id === undefined || !entry) {
+      return;
+    }
+
+    if (reply.status === 'queued' && typeof reply.jobId === 'string') {
+      const tag = Number(reply.jobId.split('-').pop());
+      if (!Number.isNaN(tag)) {
+        if (!this.jobRequests.has(ws)) {
+          this.jobRequests.set(ws, new Map());
+        }
+        this.jobRequests.get(ws)!.set(tag, id);
+      }
+    }
+
+    const isFinal = entry.options.isFinal ?? defaultIsFinal;
+    if (isFinal(reply)) {
+      this.settle(id, entry);
+      entry.resolve({ kind: 'json', reply });
+    } else {
+      this.armTimeout(id, entry);
+      entry.options.onEvent?.(reply);
+    }
+  }
+
+  private armTimeout(id: number, entry: PendingRequest): void {
+    if (!entry.options.timeoutMs) {
+      return;
+    }
+    clearTimeout(entry.timer);
+    entry.timer = setTimeout(() => {
+      this.settle(id, entry);
+      entry.reject(new Error('Bridge request timeout'));
+    }, entry.options.timeoutMs);
+  }
+
+  private settle(id: number, entry: PendingRequest): void {
+    clearTimeout(entry.timer);
+    this.pending.delete(id);
+    const tags = this.jobRequests.get(entry.ws);
+    tags?.forEach((requestId, tag) => {
+      if (requestId === id) {
+        tags.delete(tag);
+      }
+    });
+  }
+
+  private failSocket(ws: WebSocket, error: Error): void {
+    for (const [id, entry] of Array.from(this.pending)) {
+      if (entry.ws === ws) {
+        this.settle(id, entry);
+        entry.reject(error);
+      }
+    }
+    this.jobRequests.delete(ws);
+  }
+}
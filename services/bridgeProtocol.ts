@@ -0,0 +1,77 @@
+/**
+ * Fingerprint Bridge Binary Protocol
+ *
+ * Decodes the binary capture frames negotiated with the bridge via
+ * {"action": "hello", "protocol": "binary"} (see services/bridge_protocol.py).
+ * A frame is a fixed 24-byte header followed by the raw template bytes and
+ * the raw image bytes, avoiding base64-in-JSON for capture results.
+ */
+
+export const BRIDGE_BINARY_MAGIC = 'ZKFB';
+export const BRIDGE_PROTOCOL_VERSION = 1;
+const HEADER_SIZE = 24;
+const FLAG_IMAGE = 0x01;
+
+export interface BinaryCaptureResult {
+  status: 'success' | 'error';
+  template: Uint8Array;
+  image?: Uint8Array;
+  quality: number;
+  fingerIndex: number;
+  version: string;
+  bioType: number;
+  tag: number;
+}
+
+/**
+ * Decode a binary capture frame. Template and image are views into the
+ * received buffer, so no bytes are copied.
+ */
+export function decodeBinaryCapture(buffer: ArrayBuffer): BinaryCaptureResult {
+  if (buffer.byteLength < HEADER_SIZE) {
+    throw new Error('Bridge frame too short');
+  }
+
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(
+    view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3)
+  );
+  if (magic !== BRIDGE_BINARY_MAGIC) {
+    throw new Error('Not a bridge binary frame');
+  }
+
+  const version = view.getUint8(4);
+  if (version !== BRIDGE_PROTOCOL_VERSION) {
+    throw new Error(`Unsupported bridge protocol version ${version}`);
+  }
+
+  const flags = view.getUint8(11);
+  const templateLength = view.getUint32(16);
+  const imageLength = view.getUint32(20);
+
+  const templateStart = HEADER_SIZE;
+  const imageStart = templateStart + templateLength;
+
+  return {
+    status: view.getUint8(5) === 0 ? 'success' : 'error',
+    fingerIndex: view.getUint8(6),
+    quality: view.getUint8(7),
+    bioType: view.getUint8(8),
+    version: `${view.getUint8(9)}.${view.getUint8(10)}`,
+    tag: view.getUint32(12),
+    template: new Uint8Array(buffer, templateStart, templateLength),
+    image: flags & FLAG_IMAGE ? new Uint8Array(buffer, imageStart, imageLength) : undefined
+  };
+}
+
+/**
+ * Base64-encode raw bytes once, at the point where ZKBio needs it
+ */
+export function bytesToBase64(bytes: Uint8Array): string {
+  let binary = '';
+  const chunkSize = 0x8000;
+  for (let i = 0; i < bytes.length; i += chunkSize) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + chunkSize));
+  }
+  return btoa(binary);
+}
@@ -0,0 +1,563 @@
+"""
+Fingerprint Bridge Core
+
+What the network bridge (fingerprint_bridge.py) and the Windows bridge
+(fingerprint_bridge_windows.py) have in common, so the two can't drift
+apart: the capture queues, idempotent capture and enrolment submission,
+request dispatch, the WebSocket connection loop, the identification index
+and scanner hot-plug handling.
+
+Each bridge subclasses BridgeCore and adds how it opens its scanners, its
+health and status reports and its main(). Actions the core doesn't know go
+to handle_action(), which is where the network bridge adds panels, events,
+ZKBio uploads and access checks.
+
+Requests on a connection are handled concurrently (up to MAX_IN_FLIGHT) and
+replies may arrive out of order; clients match them by "id". Only `hello`
+is handled in line, as it applies to later requests.
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Optional
+
+from bridge_metrics import ERRORS, REGISTRY, STAGE_SECONDS, count_request, register_bridge_gauges
+from bridge_protocol import PROTOCOL_JSON, PROTOCOL_VERSION, correlate, encode_result, job_tag, negotiate
+from capability_probe import CapabilityCache
+from capture_scheduler import DEFAULT_DEVICE, CaptureScheduler, CaptureCancelledError, DrainingError, QueueFullError
+from device_watcher import DEVICE_POLL_INTERVAL, DeviceWatcher
+from enrollment import enroll_fingers, enroll_params
+from image_quality import PoorQualityError, QualityGate
+from result_cache import ResultCache, is_keyed
+from scanner_device import CaptureTimeoutError, DeviceLostError, DevicePool, ScannerBackend
+from sdk_matcher import SdkMatcher
+from template_arena import TemplateArena
+from template_index import NUMPY_AVAILABLE, TemplateIndex, configured_extractor, handle_index_action
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# Configuration
+MAX_QUEUE_DEPTH = 8
+MAX_IN_FLIGHT = 16          # concurrent requests per connection
+TEMPLATE_INDEX_PATH = os.environ.get('FINGERPRINT_TEMPLATE_INDEX')
+TEMPLATE_ARENA_PATH = os.environ.get('FINGERPRINT_TEMPLATE_ARENA')
+# Only one process may write the arena; the bridges only read it unless told to
+TEMPLATE_ARENA_WRITABLE = os.environ.get('FINGERPRINT_TEMPLATE_ARENA_WRITABLE') == '1'
+STARTUP_BUDGET_MS = float(os.environ.get('FINGERPRINT_STARTUP_BUDGET_MS', 500))
+
+
+class BridgeCore(abc.ABC):
+    """Capture queues, request dispatch and connections shared by the bridges"""
+
+    def __init__(self, backend: Optional[ScannerBackend] = None, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.backend = backend
+        self.pool: Optional[DevicePool] = None
+        self.device_watcher: Optional[DeviceWatcher] = None
+        # ZKBio uploads (uploadPin) need an uploader; see FingerprintBridge
+        self.uploader = None
+        self.connected_clients = set()
+        self.replies = set()        # tasks sending capture results
+        self.started_at = time.time()
+        self.ready = False
+        self.starting = True
+        self.draining = False
+        self.startup: Dict[str, Any] = {"budgetMs": STARTUP_BUDGET_MS}
+        self.capabilities = CapabilityCache()
+        self.scheduler = CaptureScheduler(self.run_capture_job, devices=(), max_queue_depth=MAX_QUEUE_DEPTH)
+        self.quality_gate = QualityGate.from_env()
+        self.results = ResultCache()
+        # Created once serving (see open_index and open_matcher), so numpy
+        # loads after the first connection
+        self.index = None
+        register_bridge_gauges(self, lambda: len(self.connected_clients), self.started_at)
+
+    @property
+    def scanner(self) -> bool:
+        """True when at least one scanner is open"""
+        return bool(self.pool)
+
+    def open_template_arena(self, path: str) -> Optional[TemplateArena]:
+        """Serve identification from a memory-mapped arena instead of RAM"""
+        try:
+            arena = TemplateArena(path, writable=TEMPLATE_ARENA_WRITABLE)
+            self.logger.info(f"Mapped template arena {path} ({len(arena)} templates, "
+                             f"{'writable' if arena.writable else 'read-only'})")
+            return arena
+        except Exception as e:
+            self.logger.error(f"Failed to open template arena {path}: {e}")
+            return None
+
+    def load_template_index(self, index: TemplateIndex, path: str) -> None:
+        """Load enrolled templates for local identification"""
+        try:
+            count = index.load_json(path)
+            self.logger.info(f"Loaded {count} templates into the identification index")
+        except Exception as e:
+            self.logger.error(f"Failed to load template index {path}: {e}")
+
+    def open_index(self) -> None:
+        """Create (or map) the feature index; runs on a worker thread
+
+        Only with a feature extractor configured; otherwise the SDK matcher
+        identifies (see open_matcher).
+        """
+        index = TemplateIndex()
+        arena = self.open_template_arena(TEMPLATE_ARENA_PATH) if TEMPLATE_ARENA_PATH else None
+        if arena is not None and (arena.writable or len(arena)):
+            index = arena
+        # With a writable arena, the JSON file is only imported into it once,
+        # when empty; an empty read-only one is replaced by the JSON file
+        if TEMPLATE_INDEX_PATH and not len(index):
+            self.load_template_index(index, TEMPLATE_INDEX_PATH)
+        # Identification requests get "busy" until here
+        self.index = index
+
+    def open_index_task(self) -> Optional[asyncio.Task]:
+        """Start loading the feature index off the event loop (with numpy and an extractor only)"""
+        if not NUMPY_AVAILABLE or configured_extractor() is None:
+            return None
+        return asyncio.create_task(asyncio.to_thread(self.open_index))
+
+    async def open_matcher(self) -> None:
+        """Identify with the SDK's 1:N matcher when there is no feature extractor
+
+        Runs once the SDK is initialized; the enrolled templates come from the
+        arena (kept in sync through it) or else the JSON file.
+        """
+        if self.index is not None or self.pool is None or not self.pool.initialized:
+            return
+        if not self.backend.matcher:
+            self.logger.warning("Identification not available: no feature extractor configured and "
+                                f"the {self.backend.name} backend has no 1:N matcher")
+            return
+
+        def load() -> SdkMatcher:
+            store = self.open_template_arena(TEMPLATE_ARENA_PATH) if TEMPLATE_ARENA_PATH and NUMPY_AVAILABLE else None
+            matcher = SdkMatcher(self.backend, self.pool.sdk_thread, store)
+            try:
+                # The JSON file is only imported into a writable arena once, when empty
+                if store is not None and store.writable and TEMPLATE_INDEX_PATH and not len(store):
+                    store.load_json(TEMPLATE_INDEX_PATH)
+                if store is not None and len(store):
+                    count = matcher.add_many(store.entries())
+                elif TEMPLATE_INDEX_PATH:
+                    count = matcher.load_json(TEMPLATE_INDEX_PATH)
+                else:
+                    count = 0
+                self.logger.info(f"Loaded {count} templates into the {self.backend.name} 1:N matcher")
+            except Exception as e:
+                self.logger.error(f"Failed to load templates into the 1:N matcher: {e}")
+            return matcher
+
+        self.index = await asyncio.to_thread(load)
+
+    def scanners_started(self) -> None:
+        """Swap the queues held from the cached probe for the scanners that opened"""
+        opened = self.pool.device_ids if self.pool else []
+        if not opened:
+            # No scanner: keep one queue so captures get a proper error reply
+            self.scheduler.add_device(DEFAULT_DEVICE)
+        for device_id in opened or [DEFAULT_DEVICE]:
+            self.scheduler.set_online(device_id, True)
+        for device_id in list(self.scheduler.queues):
+            if device_id not in (opened or [DEFAULT_DEVICE]):
+                self.scheduler.remove_device(device_id)
+
+    def watch_devices(self, interval: float = DEVICE_POLL_INTERVAL) -> None:
+        """Reopen scanners that are unplugged and plugged back in"""
+        if self.pool is None or interval <= 0:
+            return
+        self.device_watcher = DeviceWatcher(self.pool, self.device_changed, interval)
+        self.device_watcher.start()
+
+    def device_changed(self, device: Dict[str, Any]) -> None:
+        """Pause or resume the device's queue and tell every client"""
+        device_id = device["deviceId"]
+        if device["state"] == "open":
+            self.scheduler.add_device(device_id)
+            self.scheduler.set_online(device_id, True)
+            # Captures queued while no scanner was open move to this one
+            self.scheduler.remove_device(DEFAULT_DEVICE)
+        else:
+            self.scheduler.set_online(device_id, False)
+        websockets.broadcast(self.connected_clients, json.dumps({"status": "device", **device}))
+
+    async def capture_fingerprint(self, finger_index: int = 0, device_id: Optional[str] = None) -> Dict[str, Any]:
+        """Capture a fingerprint and return raw template (and image) bytes
+
+        Encoding (base64 JSON or binary frame) happens when the reply is sent.
+        """
+        try:
+            device = self.pool.get(device_id) if self.pool else None
+            if not device:
+                ERRORS.inc("no_scanner")
+                return {
+                    "status": "error",
+                    "message": "Scanner not initialized"
+                }
+
+            self.logger.info(f"Capturing fingerprint for finger index {finger_index} on {device_id}")
+
+            # Blocks on the device thread until a finger is placed; the
+            # event loop keeps serving other clients meanwhile
+            capture = await device.capture(finger_index)
+
+            return {
+                "status": "success",
+                "template": capture["template"],
+                "image": capture.get("image"),
+                "quality": capture["quality"],
+                "fingerIndex": finger_index,
+                "deviceId": device_id,
+                "version": "10.0",
+                "bioType": 1
+            }
+
+        except CaptureTimeoutError as e:
+            ERRORS.inc("timeout")
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+        except DeviceLostError as e:
+            ERRORS.inc("device_lost")
+            if self.device_watcher:
+                # Pauses the queue so the next capture waits for the reopen
+                self.device_watcher.lost(device_id, str(e))
+            return {
+                "status": "error",
+                "deviceLost": True,
+                "message": f"Scanner disconnected: {str(e)}"
+            }
+        except PoorQualityError as e:
+            # Rejected at the scanner, before anything is sent to ZKBio
+            self.logger.info(f"Finger {finger_index}: {e}")
+            ERRORS.inc("quality_rejected")
+            return {
+                "status": "error",
+                "rejected": True,
+                "reason": e.reason,
+                "message": str(e),
+                "quality": int(e.metrics["score"]),
+                "metrics": e.metrics,
+                "fingerIndex": finger_index
+            }
+        except Exception as e:
+            self.logger.error(f"Fingerprint capture failed: {e}")
+            ERRORS.inc("capture_failed")
+            return {
+                "status": "error",
+                "message": f"Capture failed: {str(e)}"
+            }
+
+    async def merge_templates(self, device_id: Optional[str], templates: list) -> bytes:
+        """Merge enrolment presses into one registration template"""
+        device = self.pool.get(device_id) if self.pool else None
+        if not device:
+            raise RuntimeError("Scanner not initialized")
+        return await device.merge(templates)
+
+    async def run_capture_job(self, job) -> Dict[str, Any]:
+        """Scheduler callback: run one queued capture (or enrolment) on the device"""
+        if job.params.get("kind") == "enroll":
+            return await enroll_fingers(
+                job,
+                lambda finger_index: self.capture_fingerprint(finger_index, job.device_id),
+                lambda templates: self.merge_templates(job.device_id, templates)
+            )
+        return await self.capture_fingerprint(job.finger_index, job.device_id)
+
+    async def upload_capture(self, pin: Any, result: Dict[str, Any], key: Optional[str] = None) -> Dict[str, Any]:
+        """Upload a captured template to ZKBio; bridges with an uploader override this"""
+        return {
+            "status": "upload_failed",
+            "pin": str(pin),
+            "templateNo": result.get("fingerIndex", 0),
+            "message": "ZKBio upload not configured (set ZKBIO_API_URL)"
+        }
+
+    def submit_capture(self, websocket, client_id, data: Dict[str, Any], pending: set,
+                       protocol: str = PROTOCOL_JSON) -> Dict[str, Any]:
+        """Queue a capture (or enrolment) and reply asynchronously once the device has run it"""
+        try:
+            key = self.results.key(data)
+            if data.get('action') == 'enroll':
+                if key is not None:
+                    raise ValueError("idempotencyKey is only supported for capture")
+                params = enroll_params(data)
+            else:
+                params = {"includeImage": bool(data.get('includeImage'))}
+            finger_index = params.get("fingers", [data.get('fingerIndex', 0)])[0]
+            upload_pin = data.get('uploadPin')
+            if upload_pin and self.uploader is None:
+                raise ValueError("ZKBio upload not configured (set ZKBIO_API_URL)")
+
+            # A retry of a keyed capture joins the original job (or its cached result)
+            job = self.results.find(key, finger_index) if key is not None else None
+            repeat = job is not None
+            if repeat:
+                self.logger.info(f"Repeated capture {key} answered by {job.job_id}")
+                if not job.future.done():
+                    job.client_id = client_id
+            else:
+                if key is not None:
+                    params["idempotencyKey"] = key
+                job = self.scheduler.submit(
+                    client_id,
+                    finger_index=finger_index,
+                    priority=data.get('priority', 0),
+                    device_id=data.get('deviceId'),
+                    params=params
+                )
+                if key is not None:
+                    self.results.track(key, job)
+        except ValueError as e:
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+        except DrainingError as e:
+            return {
+                "status": "draining",
+                "message": str(e)
+            }
+        except QueueFullError as e:
+            self.logger.warning(f"Capture rejected: {e}")
+            return {
+                "status": "busy",
+                "message": str(e),
+                "queueDepth": e.queue_depth,
+                "retryAfter": e.retry_after
+            }
+        except KeyError:
+            return {
+                "status": "error",
+                "message": f"Unknown device: {data.get('deviceId')}"
+            }
+
+        reply_format = negotiate(data.get('format')) if data.get('format') else protocol
+
+        def encode(result: Dict[str, Any]):
+            if not job.params.get("includeImage"):
+                result = {**result, "image": None}
+            with STAGE_SECONDS.time("encode"):
+                return encode_result(correlate({**result, "jobId": job.job_id}, data),
+                                     reply_format, job_tag(job.job_id))
+
+        async def send(result: Dict[str, Any]) -> None:
+            frame = encode(result)
+            with STAGE_SECONDS.time("send"):
+                await websocket.send(frame)
+
+        async def upload(result: Dict[str, Any]) -> Dict[str, Any]:
+            upload_key = f"{key}:{result.get('fingerIndex', 0)}" if key is not None else None
+            ack = await self.upload_capture(upload_pin, result, upload_key)
+            await send({**ack, "status": "progress", "event": ack["status"],
+                        "fingerIndex": result.get("fingerIndex")})
+            return ack
+
+        async def reply():
+            uploads = []
+            try:
+                # Enrolment progress and per-finger results, as they happen;
+                # each finger's upload starts while the next one is pressed
+                async for event in job.stream():
+                    await send(event)
+                    if upload_pin and event.get("status") == "success" and event.get("template"):
+                        uploads.append(asyncio.create_task(upload(event)))
+                result = await job.future
+                if upload_pin and result.get("status") == "success" and result.get("template"):
+                    uploads.append(asyncio.create_task(upload(result)))
+                if uploads:
+                    result = {**result, "uploads": await asyncio.gather(*uploads)}
+                await send(result)
+            except CaptureCancelledError:
+                await websocket.send(json.dumps(correlate({
+                    "status": "cancelled",
+                    "jobId": job.job_id,
+                    "message": "Capture cancelled"
+                }, data)))
+            except DrainingError as e:
+                # Never started here; the client resubmits it to the next bridge
+                await websocket.send(json.dumps(correlate({
+                    "status": "draining",
+                    "jobId": job.job_id,
+                    "message": str(e)
+                }, data)))
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            except Exception as e:
+                ERRORS.inc("job_failed")
+                await websocket.send(json.dumps(correlate({
+                    "status": "error",
+                    "jobId": job.job_id,
+                    "message": f"Capture failed: {str(e)}"
+                }, data)))
+
+        task = asyncio.create_task(reply())
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        self.replies.add(task)
+        task.add_done_callback(self.replies.discard)
+
+        ack = {
+            "status": "queued",
+            "jobId": job.job_id,
+            "deviceId": job.device_id,
+            "position": self.scheduler.position(job)
+        }
+        if "fingers" in job.params:
+            ack["fingers"] = job.params["fingers"]
+        if repeat:
+            ack["idempotent"] = "cached" if job.future.done() else "coalesced"
+        return ack
+
+    @abc.abstractmethod
+    def status(self) -> Dict[str, Any]:
+        """Reply to the `status` action"""
+
+    async def handle_action(self, websocket, client_id, action: Optional[str], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Reply to an action the core doesn't handle; bridges add theirs here"""
+        ERRORS.inc("unknown_action")
+        return {
+            "status": "error",
+            "message": f"Unknown action: {action}"
+        }
+
+    async def handle_request(self, websocket, client_id, data: Dict[str, Any], pending: set,
+                             protocol: str) -> None:
+        """Handle one request and send its reply, tagged with the request's id"""
+        action = data.get('action')
+        try:
+            if action in ('capture', 'enroll'):
+                # Don't wait for the device; the result follows as its own reply
+                reply = self.submit_capture(websocket, client_id, data, pending, protocol)
+
+            elif action == 'cancel':
+                job_id = data.get('jobId')
+                if job_id:
+                    job = self.scheduler.jobs.get(job_id)
+                    cancelled = int(job is not None and job.client_id == client_id
+                                    and self.scheduler.cancel(job_id))
+                else:
+                    cancelled = self.scheduler.cancel_client(client_id)
+                reply = {"status": "ok", "cancelled": cancelled}
+
+            elif action in ('identify', 'index_add', 'index_remove'):
+                if self.index is None and self.starting:
+                    reply = {
+                        "status": "busy",
+                        "message": "Template index still loading",
+                        "retryAfter": 0.5
+                    }
+                else:
+                    reply = await handle_index_action(self.index, action, data)
+
+            elif action == 'ping':
+                reply = {"status": "pong"}
+
+            elif action == 'status':
+                reply = self.status()
+
+            elif action == 'metrics':
+                reply = {"status": "metrics", **REGISTRY.snapshot()}
+
+            else:
+                reply = await self.handle_action(websocket, client_id, action, data)
+
+        except Exception as e:
+            self.logger.error(f"Message handling error: {e}")
+            ERRORS.inc("internal")
+            reply = {
+                "status": "error",
+                "message": "Internal server error"
+            }
+
+        try:
+            await websocket.send(json.dumps(correlate(reply, data)))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def client_closed(self, client_id) -> None:
+        """Drop what a disconnected client left behind, beyond its captures"""
+
+    async def handle_client(self, websocket, path=None):
+        """Handle WebSocket client connections
+
+        Requests are handled concurrently (up to MAX_IN_FLIGHT per connection)
+        and replies may arrive out of order; clients match them by "id".
+        Only `hello` is handled in line, as it applies to later requests.
+        """
+        self.connected_clients.add(websocket)
+        client_address = websocket.remote_address
+        client_id = id(websocket)
+        pending = set()
+        in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        protocol = PROTOCOL_JSON
+        self.logger.info(f"Client connected: {client_address}")
+
+        def request_done(task):
+            pending.discard(task)
+            in_flight.release()
+
+        try:
+            async for message in websocket:
+                try:
+                    data = json.loads(message)
+                    if not isinstance(data, dict):
+                        raise ValueError("not an object")
+                except ValueError:
+                    ERRORS.inc("invalid_json")
+                    await websocket.send(json.dumps({
+                        "status": "error",
+                        "message": "Invalid JSON message"
+                    }))
+                    continue
+
+                action = data.get('action')
+                count_request(action)
+
+                if action == 'hello':
+                    # Negotiate binary capture frames for this connection
+                    protocol = negotiate(data.get('protocol'))
+                    await websocket.send(json.dumps(correlate({
+                        "status": "hello",
+                        "protocol": protocol,
+                        "version": PROTOCOL_VERSION
+                    }, data)))
+                    continue
+
+                # Stop reading (backpressure) while too many requests are running
+                await in_flight.acquire()
+                task = asyncio.create_task(self.handle_request(websocket, client_id, data, pending, protocol))
+                pending.add(task)
+                task.add_done_callback(request_done)
+
+        except websockets.exceptions.ConnectionClosed:
+            self.logger.info(f"Client disconnected: {client_address}")
+        finally:
+            self.connected_clients.discard(websocket)
+            # Keyed captures finish anyway and wait in the cache for a retry
+            cancelled = self.scheduler.cancel_client(client_id, keep=is_keyed)
+            if cancelled:
+                self.logger.info(f"Cancelled {cancelled} capture(s) for {client_address}")
+            for task in list(pending):
+                task.cancel()
+            self.client_closed(client_id)
+
+    async def close(self) -> None:
+        """Stop the capture queues and the device watcher, then close the scanners, once drained"""
+        await self.scheduler.close()
+        self.results.clear()
+        if self.device_watcher:
+            await self.device_watcher.close()
+        if self.pool is not None:
+            await self.pool.close_all()
@@ -0,0 +1,278 @@
+"""
+Fingerprint Bridge Daemon Helpers
+
+The bridge runs as a long-lived local daemon: the scanner is opened once at
+startup and stays open across captures. Once the WebSocket server is bound
+the bridge writes a small ready file, which the Next.js fingerprint route
+waits on instead of sleeping for a fixed amount of time. The file is keyed by
+port so several bridges (or a benchmark instance) can coexist.
+
+Ready file format:
+    {"pid": 1234, "port": 8765, "bridge": "fingerprint_bridge", "startedAt": 1700000000.0}
+
+Plain HTTP GETs on the bridge port (metrics scrapes, health probes) are
+answered by http_routes() before the WebSocket handshake:
+
+    GET /healthz  200 while the process serves, with the bridge's health report
+    GET /readyz   200 when captures can be served, else 503 with the problems
+
+Shutdown is graceful. The first SIGTERM or SIGINT (ShutdownSignals) makes
+the bridge drain: it stops listening, hands queued captures back to their
+clients, gives running ones FINGERPRINT_DRAIN_SECONDS (default 20) to
+finish, then closes every connection with code 1012 (service restart) so
+clients reconnect. A second signal stops it at once.
+
+Upgrades drop no requests (Handoff). A new bridge binds the port with
+SO_REUSEPORT alongside the running one, announces itself and sends the old
+one SIGTERM, once the bridge answering /healthz on the port confirms the
+ready file's pid (a stale file may name an unrelated process). It opens the
+scanners once the old one has exited and closed them. Where
+SO_REUSEPORT is missing (Windows), the new bridge instead retries binding
+until the old one lets go of the port. FINGERPRINT_BRIDGE_HANDOFF=0 turns
+both off: a busy port is then an error.
+"""
+
+import asyncio
+import errno
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
+
+# A route returns (status code, content type, body)
+HttpRoute = Callable[[], Tuple[int, str, str]]
+
+READY_FILE_TEMPLATE = "ims-fingerprint-bridge-{port}.json"
+
+# Configuration
+DRAIN_SECONDS = float(os.environ.get('FINGERPRINT_DRAIN_SECONDS', 20))
+HANDOFF_ENABLED = os.environ.get('FINGERPRINT_BRIDGE_HANDOFF', '1') != '0'
+REUSE_PORT = HANDOFF_ENABLED and hasattr(socket, 'SO_REUSEPORT') and sys.platform != 'win32'
+CLOSE_SERVICE_RESTART = 1012
+BIND_RETRY_INTERVAL = 0.1
+HEALTH_CHECK_TIMEOUT = 1.0
+ADDRESS_IN_USE = (errno.EADDRINUSE, 10048)   # 10048: WSAEADDRINUSE
+
+
+def ready_file_path(port: int) -> str:
+    """Return the ready file path for a bridge listening on the given port"""
+    directory = os.environ.get('FINGERPRINT_BRIDGE_RUN_DIR', tempfile.gettempdir())
+    return os.path.join(directory, READY_FILE_TEMPLATE.format(port=port))
+
+
+def announce_ready(port: int, bridge: str, **extra: Any) -> str:
+    """Write the ready file atomically once the bridge accepts connections"""
+    path = ready_file_path(port)
+    info: Dict[str, Any] = {
+        "pid": os.getpid(),
+        "port": port,
+        "bridge": bridge,
+        "startedAt": time.time(),
+    }
+    info.update(extra)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_ready_file(port: int) -> Optional[Dict[str, Any]]:
+    """Read the ready file for a port, or None if no bridge has announced itself"""
+    try:
+        with open(ready_file_path(port)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_ready(port: int) -> None:
+    """Remove the ready file, but only if it belongs to this process"""
+    info = read_ready_file(port)
+    if info and info.get('pid') == os.getpid():
+        try:
+            os.remove(ready_file_path(port))
+        except OSError:
+            pass
+
+
+def http_routes(routes: Dict[str, HttpRoute]) -> Callable:
+    """A websockets `process_request` hook serving GET routes on the bridge port
+
+    Works with both the legacy `(path, headers)` hook and the current
+    `(connection, request)` one; any other path goes on to the WebSocket
+    handshake.
+    """
+    async def process_request(connection_or_path, request_or_headers):
+        legacy = isinstance(connection_or_path, str)
+        path = connection_or_path if legacy else request_or_headers.path
+        route = routes.get(path.split('?', 1)[0])
+        if route is None:
+            return None
+
+        status, content_type, body = route()
+        if legacy:
+            return HTTPStatus(status), [("Content-Type", content_type)], body.encode()
+        response = connection_or_path.respond(status, body)
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = content_type
+        return response
+
+    return process_request
+
+
+def health_routes(health: Callable[[], Dict[str, Any]]) -> Dict[str, HttpRoute]:
+    """/healthz and /readyz routes for http_routes
+
+    `health()` must only read in-memory bridge state (never call the SDK) and
+    return a dict with a boolean "ready".
+    """
+    def healthz() -> Tuple[int, str, str]:
+        return 200, "application/json", json.dumps(health())
+
+    def readyz() -> Tuple[int, str, str]:
+        report = health()
+        return (200 if report["ready"] else 503), "application/json", json.dumps(report)
+
+    return {"/healthz": healthz, "/readyz": readyz}
+
+
+class ShutdownSignals:
+    """SIGTERM and SIGINT (and Ctrl+Break on Windows) as events on the loop
+
+    The first signal sets `requested` (drain); a second one sets `forced`.
+    """
+
+    def __init__(self):
+        self.requested = asyncio.Event()
+        self.forced = asyncio.Event()
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        for name in ('SIGTERM', 'SIGINT', 'SIGBREAK'):
+            signum = getattr(signal, name, None)
+            if signum is None:
+                continue
+            try:
+                loop.add_signal_handler(signum, self.received)
+            except (NotImplementedError, RuntimeError):
+                # Windows loops have no signal handlers: hop onto the loop instead
+                signal.signal(signum, lambda *_: loop.call_soon_threadsafe(self.received))
+
+    def received(self) -> None:
+        if self.requested.is_set():
+            self.forced.set()
+        else:
+            self.requested.set()
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def serving_pid(port: int) -> Optional[int]:
+    """The pid the bridge listening on a port reports in /healthz, or None if none answers"""
+    # Never through an HTTP proxy from the environment
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    try:
+        with opener.open(f"http://localhost:{port}/healthz", timeout=HEALTH_CHECK_TIMEOUT) as response:
+            pid = json.load(response).get('pid')
+    except (OSError, ValueError, AttributeError):
+        return None
+    return pid if isinstance(pid, int) else None
+
+
+class Handoff:
+    """Taking the port over from the bridge already announced on it"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.previous: Optional[int] = None
+        self.signalled = False
+        # Signals can't ask a Windows process to drain, so only bind there
+        if HANDOFF_ENABLED and sys.platform != 'win32':
+            info = read_ready_file(port)
+            pid = info.get('pid') if info else None
+            # Only a pid that is still serving the port: a stale one may have been reused
+            if (isinstance(pid, int) and pid != os.getpid() and pid_alive(pid)
+                    and serving_pid(port) == pid):
+                self.previous = pid
+
+    async def listen(self, serve: Callable[..., Awaitable], *args, **kwargs):
+        """Bind with `serve` (e.g. websockets.serve), alongside or after the previous bridge"""
+        if REUSE_PORT:
+            kwargs["reuse_port"] = True
+        # Worth waiting for the port only if a bridge is known to be draining off it
+        waits = HANDOFF_ENABLED and (self.previous is not None or sys.platform == 'win32')
+        deadline = time.monotonic() + DRAIN_SECONDS
+        while True:
+            try:
+                return await serve(*args, **kwargs)
+            except OSError as e:
+                if not waits or e.errno not in ADDRESS_IN_USE or time.monotonic() >= deadline:
+                    raise
+            # A previous bridge without SO_REUSEPORT holds the port until it has drained
+            self.stop_previous()
+            await asyncio.sleep(BIND_RETRY_INTERVAL)
+
+    def stop_previous(self) -> None:
+        """Ask the previous bridge to drain (once: a second signal would cut it short)"""
+        if self.previous is None or self.signalled:
+            return
+        self.signalled = True
+        try:
+            os.kill(self.previous, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def wait_previous(self, timeout: float = DRAIN_SECONDS + 5) -> bool:
+        """Stop the previous bridge and wait for it to exit; False if it outlives `timeout`"""
+        if self.previous is None:
+            return True
+        self.stop_previous()
+        deadline = time.monotonic() + timeout
+        while pid_alive(self.previous):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+
+async def drain_bridge(bridge: Any, server: Any, timeout: float = DRAIN_SECONDS) -> Dict[str, Any]:
+    """Drain a bridge for shutdown (see the module docstring)
+
+    `bridge` has a scheduler, connected_clients, the `replies` tasks still
+    sending capture results and a `draining` flag for its health report.
+    """
+    started = time.monotonic()
+    bridge.draining = True
+    # New connections now go to the replacement bridge (or are refused)
+    server.close(close_connections=False)
+    notice = json.dumps({
+        "status": "draining",
+        "deadline": timeout,
+        "message": "Bridge restarting; new requests go to a new connection"
+    })
+    await asyncio.gather(*(websocket.send(notice) for websocket in list(bridge.connected_clients)),
+                         return_exceptions=True)
+    jobs = await bridge.scheduler.drain(timeout)
+    # Results (and uploads) of the captures that just finished
+    replies = [task for task in bridge.replies if not task.done()]
+    if replies:
+        await asyncio.wait(replies, timeout=max(0.1, started + timeout - time.monotonic()))
+    clients = len(bridge.connected_clients)
+    await asyncio.gather(*(websocket.close(CLOSE_SERVICE_RESTART, "Bridge restarting")
+                           for websocket in list(bridge.connected_clients)), return_exceptions=True)
+    return {**jobs, "clients": clients, "seconds": round(time.monotonic() - started, 2)}
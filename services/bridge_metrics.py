@@ -0,0 +1,349 @@
+"""
+Fingerprint Bridge Metrics
+
+In-process counters, histograms and gauges for the bridge, cheap enough to
+update on every capture: a histogram observation is a bisect and two adds
+under a lock (device threads record SDK timings concurrently).
+
+Metrics are read two ways:
+
+    - the `metrics` WebSocket action returns snapshot() as JSON, with
+      bucket-estimated p50/p95/p99 per histogram series
+    - GET /metrics on the bridge port returns the Prometheus text format and
+      GET /metrics.json the same snapshot (see bridge_daemon.http_routes)
+
+Bridge metrics:
+
+    bridge_stage_seconds{stage}     sdk_init, device_open, capture (SDK
+                                    acquire, which includes ZKFinger's own
+                                    template extraction), quality, merge,
+                                    encode, send
+    bridge_queue_wait_seconds       time a job waited for its device
+    bridge_job_seconds{kind}        queued job run time (capture, enroll)
+    bridge_requests_total{action}   WebSocket actions received
+    bridge_errors_total{type}       timeout, quality_rejected, capture_failed,
+                                    no_scanner, queue_full, invalid_json, ...
+    bridge_panel_op_seconds{op}     network panel calls (connect, keepalive,
+                                    panel_info, sync_push, ...), see
+                                    panel_pool.py and panel_sync.py
+    bridge_panel_events_total{panel}
+                                    live events received from each panel
+    bridge_event_drops_total        events dropped from full subscriber
+                                    queues, see panel_events.py
+    bridge_device_changes_total{state}
+                                    scanner hot-plug changes (open, removed,
+                                    lost, failed), see device_watcher.py
+
+plus gauges the bridge registers for its connected clients, queue depth,
+open devices, connected network panels, event subscribers, spooled and
+indexed templates and uptime.
+"""
+
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Configuration
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+KNOWN_ACTIONS = ("capture", "enroll", "cancel", "hello", "identify", "index_add",
+                 "index_remove", "ping", "status", "metrics", "panels", "panel_info",
+                 "panel_sync", "panel_sync_status", "subscribe", "unsubscribe", "upload_template",
+                 "spool", "access_check", "access_who", "access_doors", "access_update",
+                 "access_refresh")
+
+LabelValues = Tuple[str, ...]
+
+
+def _label_text(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of a named metric with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, values: Sequence[Any]) -> LabelValues:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(values)}")
+        return tuple(str(value) for value in values)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def _json_series(self, series: Dict[LabelValues, Any]) -> Any:
+        """A bare value when unlabelled, else keyed by the (joined) label values"""
+        if not self.labels:
+            return series.get((), 0)
+        return {",".join(key): value for key, value in sorted(series.items())}
+
+
+class Counter(Metric):
+    """Monotonic count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self) -> float:
+        with self.lock:
+            return sum(self.values.values())
+
+    def render(self) -> List[str]:
+        with self.lock:
+            series = dict(self.values)
+        return self.header() + [f"{self.name}{_label_text(self.labels, key)} {_number(value)}"
+                                for key, value in sorted(series.items())]
+
+    def snapshot(self) -> Any:
+        with self.lock:
+            return self._json_series(dict(self.values))
+
+
+class Histogram(Metric):
+    """Cumulative-bucket latency histogram per label set, in seconds"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per series: [bucket counts (non-cumulative)..., sum]
+        self.series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, seconds: float, *labels: Any) -> None:
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            counts = self.series.get(key)
+            if counts is None:
+                counts = self.series[key] = [0] * len(self.buckets) + [0.0]
+            counts[slot] += 1
+            counts[-1] += seconds
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        """Observe the duration of the with-block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _copy(self) -> Dict[LabelValues, List[float]]:
+        with self.lock:
+            return {key: list(counts) for key, counts in self.series.items()}
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, counts in sorted(self._copy().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            labels = _label_text(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def quantile(self, counts: List[float], fraction: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        total = sum(counts[:-1])
+        if not total:
+            return 0.0
+        rank = fraction * total
+        seen = 0
+        for index, count in enumerate(counts[:-1]):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                if upper == math.inf:
+                    # Past the last bound: the mean is the best estimate left
+                    return max(lower, counts[-1] / total)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def summary(self, counts: List[float]) -> Dict[str, float]:
+        count = int(sum(counts[:-1]))
+        return {
+            "count": count,
+            "sum_s": round(counts[-1], 4),
+            "mean_ms": round(counts[-1] / count * 1000, 2) if count else 0.0,
+            "p50_ms": round(self.quantile(counts, 0.50) * 1000, 2),
+            "p95_ms": round(self.quantile(counts, 0.95) * 1000, 2),
+            "p99_ms": round(self.quantile(counts, 0.99) * 1000, 2),
+        }
+
+    def snapshot(self) -> Any:
+        series = {key: self.summary(counts) for key, counts in self._copy().items()}
+        if not self.labels:
+            return series.get((), self.summary([0] * len(self.buckets) + [0.0]))
+        return self._json_series(series)
+
+
+class Gauge(Metric):
+    """A value read from the bridge when metrics are collected
+
+    `read()` returns a number, or a {label value(s): number} dict when the
+    gauge has labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Any], labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.read = read
+
+    def _series(self) -> Dict[LabelValues, float]:
+        try:
+            value = self.read()
+        except Exception:
+            return {}
+        if not self.labels:
+            return {(): value}
+        return {key if isinstance(key, tuple) else (str(key),): item for key, item in value.items()}
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_label_text(self.labels, key)} {_number(value)}"
+                                for key, value in sorted(self._series().items())]
+
+    def snapshot(self) -> Any:
+        return self._json_series(self._series())
+
+
+class MetricsRegistry:
+    """Every metric of the process, rendered together"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            # Gauges are re-bound to the current bridge; everything else is shared
+            if existing is not None and not isinstance(metric, Gauge):
+                return existing
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Any], labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, read, labels))
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view: counters and gauges as values, histograms as summaries"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        snapshot: Dict[str, Any] = {"timestamp": time.time()}
+        for kind, group in (("counters", Counter), ("gauges", Gauge), ("histograms", Histogram)):
+            snapshot[kind] = {metric.name: metric.snapshot() for metric in metrics if isinstance(metric, group)}
+        return snapshot
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "bridge_stage_seconds", "Time spent in each capture pipeline stage", ("stage",))
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "bridge_queue_wait_seconds", "Time a capture job waited for its device")
+JOB_SECONDS = REGISTRY.histogram(
+    "bridge_job_seconds", "Run time of capture and enrolment jobs on the device", ("kind",))
+REQUESTS = REGISTRY.counter(
+    "bridge_requests_total", "WebSocket actions received", ("action",))
+ERRORS = REGISTRY.counter(
+    "bridge_errors_total", "Errors by type", ("type",))
+PANEL_SECONDS = REGISTRY.histogram(
+    "bridge_panel_op_seconds", "Network panel operations, by operation", ("op",))
+PANEL_EVENTS = REGISTRY.counter(
+    "bridge_panel_events_total", "Live events received from network panels", ("panel",))
+EVENT_DROPS = REGISTRY.counter(
+    "bridge_event_drops_total", "Events dropped from full subscriber queues")
+DEVICE_CHANGES = REGISTRY.counter(
+    "bridge_device_changes_total", "Scanner hot-plug state changes", ("state",))
+ZKBIO_UPLOADS = REGISTRY.counter(
+    "bridge_zkbio_uploads_total", "Templates uploaded to ZKBio, by outcome", ("outcome",))
+
+
+def register_bridge_gauges(bridge: Any, connected_clients: Callable[[], int],
+                           started_at: Optional[float] = None) -> None:
+    """Bind the per-bridge gauges (clients, queues, devices, index) to a bridge"""
+    started_at = started_at or time.time()
+    REGISTRY.gauge("bridge_connected_clients", "Open WebSocket connections", connected_clients)
+    REGISTRY.gauge("bridge_queue_depth", "Capture jobs waiting per device", lambda: {
+        queue.device_id: queue.depth for queue in bridge.scheduler.queues.values()}, ("device",))
+    REGISTRY.gauge("bridge_devices_open", "Scanners opened by the bridge",
+                   lambda: len(bridge.pool) if bridge.pool else 0)
+    REGISTRY.gauge("bridge_templates_indexed", "Templates available for local identification",
+                   lambda: len(bridge.index) if bridge.index is not None else 0)
+    REGISTRY.gauge("bridge_panels_connected", "Network panels with an open session",
+                   lambda: getattr(bridge, "panels", None) and bridge.panels.stats()["connected"] or 0)
+    REGISTRY.gauge("bridge_event_subscribers", "Live event subscriptions",
+                   lambda: len(bridge.events) if getattr(bridge, "events", None) is not None else 0)
+    REGISTRY.gauge("bridge_spooled_templates", "Templates spooled but not yet uploaded to ZKBio",
+                   lambda: len(bridge.spool) if getattr(bridge, "spool", None) is not None else 0)
+    REGISTRY.gauge("bridge_uptime_seconds", "Seconds since the bridge started",
+                   lambda: round(time.time() - started_at, 1))
+
+
+def count_request(action: Any) -> None:
+    """Count a WebSocket action, folding unknown ones into one label"""
+    REQUESTS.inc(action if action in KNOWN_ACTIONS else "unknown")
+
+
+def metrics_routes() -> Dict[str, Callable[[], Tuple[int, str, str]]]:
+    """HTTP routes for bridge_daemon.http_routes: Prometheus text and JSON"""
+    return {
+        "/metrics": lambda: (200, PROMETHEUS_CONTENT_TYPE, REGISTRY.render_prometheus()),
+        "/metrics.json": lambda: (200, "application/json", json.dumps(REGISTRY.snapshot())),
+    }
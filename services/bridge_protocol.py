@@ -0,0 +1,151 @@
+"""
+Fingerprint Bridge Wire Protocol
+
+Capture results can be sent in two formats:
+
+    json    - legacy text frame, template (and image) base64 encoded
+    binary  - one binary frame: a fixed 24-byte header followed by the raw
+              template bytes and then the raw image bytes (if any)
+
+A client opts into binary frames per connection:
+
+    -> {"action": "hello", "protocol": "binary"}
+    <- {"status": "hello", "protocol": "binary", "version": 1}
+
+or per request with {"action": "capture", "format": "binary"}. Everything
+other than successful capture results (acks, errors, status) stays JSON.
+
+Requests may carry a client-chosen "id" (string or number). Every JSON reply
+to that request (ack, progress events, result, errors) echoes it, so a
+client can pipeline several requests over one socket and match replies that
+arrive out of order. Binary frames have no room for it: their tag is the job
+number, which the client learns from the ack ({"status": "queued",
+"jobId": "job-42", "id": ...}).
+
+Binary header (network byte order):
+
+    offset  size  field
+    0       4     magic b"ZKFB"
+    4       1     protocol version (1)
+    5       1     status (0 = success)
+    6       1     fingerIndex
+    7       1     quality (0-100)
+    8       1     bioType
+    9       1     template version major
+    10      1     template version minor
+    11      1     flags (bit 0: image present)
+    12      4     tag (numeric job/request id, 0 if none)
+    16      4     template length
+    20      4     image length
+"""
+
+import base64
+import json
+import struct
+from typing import Any, Dict, Optional, Union
+
+BINARY_MAGIC = b"ZKFB"
+PROTOCOL_VERSION = 1
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+
+STATUS_SUCCESS = 0
+FLAG_IMAGE = 0x01
+
+HEADER = struct.Struct("!4sBBBBBBBBIII")
+
+
+def parse_version(version: str) -> tuple:
+    """Split a template version like "10.0" into (major, minor) bytes"""
+    major, _, minor = str(version).partition('.')
+    return int(major or 0) & 0xFF, int(minor or 0) & 0xFF
+
+
+def encode_binary_result(result: Dict[str, Any], tag: int = 0) -> bytes:
+    """Encode a successful capture result as a binary frame"""
+    template = result["template"]
+    image = result.get("image") or b""
+    major, minor = parse_version(result.get("version", "10.0"))
+    header = HEADER.pack(
+        BINARY_MAGIC,
+        PROTOCOL_VERSION,
+        STATUS_SUCCESS,
+        result.get("fingerIndex", 0) & 0xFF,
+        max(0, min(100, int(result.get("quality", 0)))),
+        result.get("bioType", 1) & 0xFF,
+        major,
+        minor,
+        FLAG_IMAGE if image else 0,
+        tag & 0xFFFFFFFF,
+        len(template),
+        len(image)
+    )
+    return b"".join((header, template, image))
+
+
+def decode_binary_result(frame: bytes) -> Dict[str, Any]:
+    """Decode a binary frame back into a capture result (templates as bytes)"""
+    (magic, version, status, finger_index, quality, bio_type,
+     major, minor, flags, tag, template_len, image_len) = HEADER.unpack_from(frame)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a bridge binary frame")
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary protocol version {version}")
+
+    view = memoryview(frame)
+    offset = HEADER.size
+    template = bytes(view[offset:offset + template_len])
+    offset += template_len
+    image = bytes(view[offset:offset + image_len]) if flags & FLAG_IMAGE else None
+
+    return {
+        "status": "success" if status == STATUS_SUCCESS else "error",
+        "template": template,
+        "image": image,
+        "quality": quality,
+        "fingerIndex": finger_index,
+        "version": f"{major}.{minor}",
+        "bioType": bio_type,
+        "tag": tag
+    }
+
+
+def encode_json_result(result: Dict[str, Any]) -> str:
+    """Encode a result as a legacy JSON text frame, base64-encoding raw bytes"""
+    message = dict(result)
+    for key in ("template", "image"):
+        value = message.get(key)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            message[key] = base64.b64encode(value).decode('ascii')
+        elif value is None and key == "image":
+            message.pop(key, None)
+    return json.dumps(message)
+
+
+def encode_result(result: Dict[str, Any], protocol: str = PROTOCOL_JSON,
+                  tag: int = 0) -> Union[str, bytes]:
+    """Encode a reply in the negotiated format; only successes go binary"""
+    if (protocol == PROTOCOL_BINARY and result.get("status") == "success"
+            and isinstance(result.get("template"), (bytes, bytearray))):
+        return encode_binary_result(result, tag)
+    return encode_json_result(result)
+
+
+def correlate(reply: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """Echo a request's "id" on a reply (unchanged if the request had none)"""
+    if "id" not in request:
+        return reply
+    return {**reply, "id": request["id"]}
+
+
+def job_tag(job_id: Optional[str]) -> int:
+    """Numeric tag for a job id like "job-42" (0 if it has no number)"""
+    if not job_id:
+        return 0
+    digits = job_id.rsplit('-', 1)[-1]
+    return int(digits) if digits.isdigit() else 0
+
+
+def negotiate(requested: Optional[str]) -> str:
+    """Return the protocol a hello request gets (unknown values fall back to JSON)"""
+    return PROTOCOL_BINARY if requested == PROTOCOL_BINARY else PROTOCOL_JSON
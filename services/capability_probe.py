@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Scanner Capability Probe
+
+Finding out what a machine can do means importing pyzkfp and initializing
+the ZKFinger SDK. The probe records which SDK wrappers are installed, their
+versions, and which scanners are attached. That costs a good part of a
+second (more on Windows). The bridges used to pay it on every start before
+accepting a connection, and inspect_sdk.py and test_sdk_windows.py each
+repeated the discovery by hand.
+
+The result is kept in a small JSON file, FINGERPRINT_CAPABILITY_CACHE
+(default ims-fingerprint-capabilities.json in the bridge run directory):
+
+    {"version": 1, "probedAt": 1700000000.0, "python": "3.11.4", "platform": "Linux",
+     "backend": "pyzkfp",
+     "backends": {"pyzkfp": {"available": true, "devices": ["0"]}},
+     "modules": {"pyzkfp": "0.1.4", "websockets": "12.0", "numpy": "1.26.4", "zk": "0.9"}}
+
+A bridge boots from the cache: it holds early captures for the cached
+devices, only opens the SDK once it is serving, and then writes back what
+it actually found. The Windows bridge also takes its backend from the
+cache when FINGERPRINT_BRIDGE_BACKEND is unset; the network bridge always
+uses FINGERPRINT_BRIDGE_BACKEND (default pyzkfp). The cache is
+ignored when the Python version, platform or FINGERPRINT_BRIDGE_BACKEND has
+changed, or when it is older than FINGERPRINT_CAPABILITY_MAX_AGE seconds
+(default one day).
+
+Run it directly for a full probe (SDK init and device enumeration for
+FINGERPRINT_BRIDGE_BACKEND, default pyzkfp), which also refreshes the cache:
+
+    python3 services/capability_probe.py [--cached] [--backend simulated]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from lazy_imports import is_installed
+
+# Configuration
+CACHE_VERSION = 1
+CACHE_FILE = "ims-fingerprint-capabilities.json"
+CACHE_MAX_AGE = float(os.environ.get('FINGERPRINT_CAPABILITY_MAX_AGE', 24 * 3600))
+SCANNER_BACKENDS = ("pyzkfp", "simulated", "replay")
+# Import name -> distribution name, for versions
+MODULES = {"pyzkfp": "pyzkfp", "websockets": "websockets", "numpy": "numpy", "zk": "pyzk"}
+
+
+def cache_path() -> str:
+    default_dir = os.environ.get('FINGERPRINT_BRIDGE_RUN_DIR', tempfile.gettempdir())
+    return os.environ.get('FINGERPRINT_CAPABILITY_CACHE', os.path.join(default_dir, CACHE_FILE))
+
+
+def module_versions(names: Iterable[str] = MODULES) -> Dict[str, Optional[str]]:
+    """Installed versions from package metadata, without importing anything"""
+    from importlib import metadata
+
+    versions = {}
+    for name in names:
+        if not is_installed(name):
+            versions[name] = None
+            continue
+        try:
+            versions[name] = metadata.version(MODULES.get(name, name))
+        except metadata.PackageNotFoundError:
+            versions[name] = "unknown"
+    return versions
+
+
+def environment() -> Dict[str, Any]:
+    """What a cached probe is only valid for"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.system(),
+        "requestedBackend": os.environ.get('FINGERPRINT_BRIDGE_BACKEND'),
+    }
+
+
+def probe_backend(name: str) -> Dict[str, Any]:
+    """Initialize one backend's SDK and list its devices (blocking)"""
+    from scanner_device import create_backend
+
+    started = time.perf_counter()
+    try:
+        # A probe is not part of the workload being recorded
+        backend = create_backend(name, record=False)
+        backend.initialize()
+        try:
+            devices = [str(device) for device in backend.get_device_list()]
+        finally:
+            backend.terminate()
+    except Exception as e:
+        return {"available": False, "error": str(e)}
+    return {
+        "available": True,
+        "devices": devices,
+        "probeMs": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def probe(backends: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """A full capability probe; slow, call it off the event loop"""
+    requested = os.environ.get('FINGERPRINT_BRIDGE_BACKEND')
+    if backends is None:
+        backends = [requested or "pyzkfp"]
+    results = {name: probe_backend(name) for name in backends}
+    usable = [name for name, result in results.items() if result.get("available")]
+    return {
+        "version": CACHE_VERSION,
+        "probedAt": time.time(),
+        **environment(),
+        "backend": usable[0] if usable else requested,
+        "backends": results,
+        "modules": module_versions(),
+    }
+
+
+class CapabilityCache:
+    """The cached probe in its JSON file"""
+
+    def __init__(self, path: Optional[str] = None, max_age: float = CACHE_MAX_AGE):
+        self.logger = logging.getLogger(__name__)
+        self.path = path or cache_path()
+        self.max_age = max_age
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """The cached probe, or None when missing, stale or from another setup"""
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+            return None
+        if time.time() - cached.get("probedAt", 0) > self.max_age:
+            return None
+        if any(cached.get(key) != value for key, value in environment().items()):
+            return None
+        return cached
+
+    def save(self, capabilities: Dict[str, Any]) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(capabilities, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write capability cache {self.path}: {e}")
+
+    def record(self, backend: Optional[str], devices: List[str], error: Optional[str] = None) -> Dict[str, Any]:
+        """Save what a bridge found when it opened its backend
+
+        Blocking (package metadata and a file write); call it off the event loop.
+        """
+        capabilities = self.load() or {"backends": {}}
+        result: Dict[str, Any] = {"available": error is None, "devices": devices}
+        if error:
+            result["error"] = error
+        capabilities.update({
+            "version": CACHE_VERSION,
+            "probedAt": time.time(),
+            **environment(),
+            "backend": backend,
+            "backends": {**capabilities.get("backends", {}), **({backend: result} if backend else {})},
+            "modules": module_versions(),
+        })
+        self.save(capabilities)
+        return capabilities
+
+
+def cached_devices(capabilities: Optional[Dict[str, Any]]) -> List[str]:
+    """Device ids the cached probe found for its backend"""
+    if not capabilities or not capabilities.get("backend"):
+        return []
+    return list(capabilities.get("backends", {}).get(capabilities["backend"], {}).get("devices") or [])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Probe fingerprint SDK backends and scanners")
+    parser.add_argument('--cached', action='store_true', help='Print the cached probe instead of probing')
+    parser.add_argument('--backend', action='append', choices=SCANNER_BACKENDS,
+                        help='Backend(s) to probe (default: FINGERPRINT_BRIDGE_BACKEND or pyzkfp)')
+    args = parser.parse_args()
+
+    cache = CapabilityCache()
+    if args.cached:
+        capabilities = cache.load()
+        if capabilities is None:
+            print(f"No valid capability cache at {cache.path}", file=sys.stderr)
+            return 1
+    else:
+        capabilities = probe(args.backend)
+        cache.save(capabilities)
+    print(json.dumps(capabilities, indent=2))
+    return 0 if capabilities.get("backend") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+"""
+Capture Scheduler
+
+Serialises fingerprint captures per physical device. Each device has a
+bounded job queue ordered by priority and then arrival (FIFO), and a single
+worker that runs one capture at a time, so two clients can never race on the
+same sensor. With several devices, a job goes to the device a client pinned
+it to, or else to the least-loaded device, so N sensors serve N captures
+concurrently.
+
+Clients get an explicit QueueFullError (with a retry-after hint) instead of
+piling up coroutines, and jobs can be cancelled individually or all at once
+when a client disconnects. Multi-press jobs (enrolment) emit progress
+events that the submitter streams while the job runs. Queue waits, job run
+times and queue-full rejections are recorded in bridge_metrics.py.
+
+A device that is unplugged is marked offline rather than dropped: its
+unpinned jobs move to another online device, and the rest wait up to
+offline_grace seconds for it to come back (then fail with
+DeviceOfflineError).
+
+When the bridge shuts down, drain() refuses new jobs, hands queued ones
+back to their clients (DrainingError, to resubmit to the bridge that
+replaces this one) and gives running ones until a deadline to finish.
+
+Usage:
+    scheduler = CaptureScheduler(run_capture, max_queue_depth=8)
+    scheduler.start()
+    job = scheduler.submit(client_id, finger_index=0)
+    async for event in job.stream():
+        ...
+    result = await job.future
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from bridge_metrics import ERRORS, JOB_SECONDS, QUEUE_WAIT_SECONDS
+
+# Configuration
+DEFAULT_DEVICE = "default"
+MAX_QUEUE_DEPTH = 8
+MAX_JOBS_PER_CLIENT = 2
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+OFFLINE_GRACE = 30.0        # how long queued jobs wait for an unplugged device
+
+# Initial capture duration estimate used for retry-after hints (seconds)
+DEFAULT_SERVICE_TIME = 1.5
+
+
+class QueueFullError(Exception):
+    """Raised when a device queue (or a client's share of it) is full"""
+
+    def __init__(self, message: str, queue_depth: int, retry_after: float):
+        super().__init__(message)
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class CaptureCancelledError(Exception):
+    """Set on a job's future when the job is cancelled"""
+
+
+class DeviceOfflineError(Exception):
+    """Set on a queued job whose device did not come back in time"""
+
+
+class DrainingError(Exception):
+    """Raised on submit, or set on a queued job, while the scheduler drains"""
+
+
+class CaptureJob:
+    """A single capture request waiting for (or running on) a device"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client_id: Any, finger_index: int, priority: int,
+                 device_id: str, params: Optional[Dict[str, Any]] = None, pinned: bool = False):
+        self.job_id = f"job-{next(CaptureJob._ids)}"
+        self.client_id = client_id
+        self.finger_index = finger_index
+        self.priority = priority
+        self.device_id = device_id
+        self.pinned = pinned
+        self.params = params or {}
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        self.events: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def wait_time(self) -> float:
+        """Seconds spent queued before the device picked the job up"""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+    @property
+    def captures(self) -> int:
+        """Sensor presses this job needs (more than one for enrolment)"""
+        return max(1, int(self.params.get("captures", 1)))
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        """Publish a progress event to whoever is streaming this job"""
+        self.events.put_nowait(event)
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield progress events as they are emitted, until the job finishes"""
+        while not (self.future.done() and self.events.empty()):
+            if not self.events.empty():
+                yield self.events.get_nowait()
+                continue
+            getter = asyncio.ensure_future(self.events.get())
+            await asyncio.wait({getter, self.future}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+
+
+class DeviceQueue:
+    """Bounded priority queue and bookkeeping for one device"""
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.heap: List[tuple] = []
+        self.sequence = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.current: Optional[CaptureJob] = None
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.service_time = DEFAULT_SERVICE_TIME
+        self.busy_time = 0.0
+        self.created_at = time.monotonic()
+        self.worker: Optional[asyncio.Task] = None
+        self.online = True
+        self.offline_since: Optional[float] = None
+        self.removed = False
+
+    def push(self, job: CaptureJob) -> None:
+        # Higher priority first, then first come first served
+        heapq.heappush(self.heap, (-job.priority, next(self.sequence), job))
+        self.wakeup.set()
+
+    def pop(self) -> Optional[CaptureJob]:
+        while self.heap:
+            _, _, job = heapq.heappop(self.heap)
+            if not job.cancelled:
+                return job
+        return None
+
+    def pending(self) -> List[CaptureJob]:
+        return [job for _, _, job in sorted(self.heap) if not job.cancelled]
+
+    def take(self, keep: Callable[[CaptureJob], bool]) -> List[CaptureJob]:
+        """Remove and return the waiting jobs for which keep(job) is false"""
+        taken = [job for _, _, job in self.heap if not job.cancelled and not keep(job)]
+        self.heap = [entry for entry in self.heap if not entry[2].cancelled and keep(entry[2])]
+        heapq.heapify(self.heap)
+        return taken
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, job in self.heap if not job.cancelled)
+
+    @property
+    def load(self) -> int:
+        """Jobs waiting for or running on this device"""
+        return self.depth + (1 if self.current else 0)
+
+    def utilisation(self) -> float:
+        """Fraction of time the device has spent capturing since it was added"""
+        busy = self.busy_time
+        if self.current and self.current.started_at is not None:
+            busy += time.monotonic() - self.current.started_at
+        elapsed = time.monotonic() - self.created_at
+        return busy / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.completed + self.failed
+        return {
+            "device": self.device_id,
+            "online": self.online,
+            "queue_depth": self.depth,
+            "busy": self.current is not None,
+            "current_job": self.current.job_id if self.current else None,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / started * 1000, 1) if started else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "oldest_wait_ms": round(max((job.wait_time for job in self.pending()), default=0.0) * 1000, 1),
+            "avg_capture_ms": round(self.service_time * 1000, 1),
+            "busy_seconds": round(self.busy_time, 1),
+            "utilisation": round(self.utilisation(), 3),
+        }
+
+
+class CaptureScheduler:
+    """Runs capture jobs one at a time per device with bounded queues"""
+
+    def __init__(self, run_capture: Callable[[CaptureJob], Awaitable[Dict[str, Any]]],
+                 devices: Iterable[str] = (DEFAULT_DEVICE,),
+                 max_queue_depth: int = MAX_QUEUE_DEPTH,
+                 max_jobs_per_client: int = MAX_JOBS_PER_CLIENT,
+                 offline_grace: float = OFFLINE_GRACE):
+        self.logger = logging.getLogger(__name__)
+        self.run_capture = run_capture
+        self.max_queue_depth = max_queue_depth
+        self.max_jobs_per_client = max_jobs_per_client
+        self.offline_grace = offline_grace
+        self.queues: Dict[str, DeviceQueue] = {}
+        self.jobs: Dict[str, CaptureJob] = {}
+        self.running = False
+        self.draining = False
+        for device_id in devices:
+            self.queues[device_id] = DeviceQueue(device_id)
+
+    def add_device(self, device_id: str) -> None:
+        """Register a device queue; its worker starts now if the scheduler runs"""
+        if device_id in self.queues:
+            return
+        queue = DeviceQueue(device_id)
+        self.queues[device_id] = queue
+        if self.running:
+            queue.worker = asyncio.create_task(self._worker(queue))
+
+    def set_online(self, device_id: str, online: bool) -> int:
+        """Pause a device that was unplugged, or resume it once it is back
+
+        Returns the number of queued jobs moved to other devices.
+        """
+        queue = self.queues.get(device_id)
+        if queue is None or queue.online == online:
+            return 0
+        queue.online = online
+        queue.offline_since = None if online else time.monotonic()
+        queue.wakeup.set()
+        return self.rebalance()
+
+    def remove_device(self, device_id: str) -> int:
+        """Drop a device queue, moving all of its waiting jobs to the others
+
+        The last queue is never removed. Returns the number of jobs moved.
+        """
+        queue = self.queues.get(device_id)
+        if queue is None or len(self.queues) == 1:
+            return 0
+        queue.online = False
+        queue.removed = True
+        queue.wakeup.set()
+        moved = self.rebalance()
+        del self.queues[device_id]
+        return moved
+
+    def rebalance(self) -> int:
+        """Move waiting jobs off offline devices onto the least-loaded online ones
+
+        Jobs pinned to a device stay with it (unless it is being removed) and
+        run there when it comes back.
+        """
+        online = [queue for queue in self.queues.values() if queue.online]
+        if not online:
+            return 0
+        moved = 0
+        for queue in list(self.queues.values()):
+            if queue.online:
+                continue
+            for job in queue.take(lambda job: job.pinned and not queue.removed):
+                target = min(online, key=lambda candidate: (candidate.load, candidate.busy_time))
+                job.device_id = target.device_id
+                target.push(job)
+                moved += 1
+        if moved:
+            self.logger.info(f"Moved {moved} queued capture(s) to online devices")
+        return moved
+
+    def start(self) -> None:
+        """Start one worker per device (must be called from the event loop)"""
+        self.running = True
+        for queue in self.queues.values():
+            if queue.worker is None or queue.worker.done():
+                queue.worker = asyncio.create_task(self._worker(queue))
+
+    async def close(self) -> None:
+        """Cancel every queued and running job and stop the workers"""
+        self.running = False
+        for job in list(self.jobs.values()):
+            self.cancel(job.job_id)
+        workers = [queue.worker for queue in self.queues.values() if queue.worker]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def drain(self, timeout: float) -> Dict[str, int]:
+        """Refuse new jobs, hand queued ones back and let running ones finish
+
+        Queued jobs fail with DrainingError; running jobs get up to `timeout`
+        seconds, and are then cut off with DrainingError too. Returns how
+        many jobs were handed back, finished and cut off.
+        """
+        self.draining = True
+        handed_off = 0
+        for queue in self.queues.values():
+            for job in queue.take(lambda job: False):
+                self._hand_back(job, "Bridge is restarting; reconnect and resubmit")
+                handed_off += 1
+            queue.wakeup.set()
+        running = [queue.current for queue in self.queues.values()
+                   if queue.current and not queue.current.future.done()]
+        done, _ = await asyncio.wait([job.future for job in running], timeout=timeout) if running else (set(), set())
+        unfinished = [job for job in running if job.future not in done]
+        for job in unfinished:
+            if job.task and not job.task.done():
+                job.task.cancel()
+            self._hand_back(job, f"Bridge restarted before the capture finished ({timeout:g}s); resubmit")
+        return {"handedOff": handed_off, "finished": len(done), "cutOff": len(unfinished)}
+
+    def _hand_back(self, job: CaptureJob, message: str) -> None:
+        self.jobs.pop(job.job_id, None)
+        job.cancelled = True
+        if not job.future.done():
+            job.future.set_exception(DrainingError(message))
+            job.future.exception()
+
+    def submit(self, client_id: Any, finger_index: int = 0, priority: int = PRIORITY_NORMAL,
+               device_id: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> CaptureJob:
+        """Queue a capture, raising QueueFullError when the device is saturated
+
+        Without a device_id the job goes to the least-loaded device; an unknown
+        device_id raises KeyError.
+        """
+        if self.draining:
+            raise DrainingError("Bridge is restarting; reconnect and resubmit")
+        queue = self.select_queue(device_id)
+
+        client_jobs = sum(1 for job in self.jobs.values() if job.client_id == client_id)
+        if client_jobs >= self.max_jobs_per_client:
+            queue.rejected += 1
+            ERRORS.inc("queue_full")
+            raise QueueFullError(
+                f"Client already has {client_jobs} capture(s) pending",
+                queue.depth, self._retry_after(queue))
+
+        if queue.depth >= self.max_queue_depth:
+            queue.rejected += 1
+            ERRORS.inc("queue_full")
+            raise QueueFullError(
+                f"Capture queue full for device {queue.device_id}",
+                queue.depth, self._retry_after(queue))
+
+        job = CaptureJob(client_id, finger_index, priority, queue.device_id, params,
+                         pinned=device_id is not None)
+        self.jobs[job.job_id] = job
+        queue.push(job)
+        return job
+
+    def select_queue(self, device_id: Optional[str] = None) -> DeviceQueue:
+        """Pick the pinned device, or the idle/least-loaded one"""
+        if not self.queues:
+            raise KeyError("No devices available")
+        if device_id is not None:
+            if device_id not in self.queues:
+                raise KeyError(f"Unknown device: {device_id}")
+            return self.queues[device_id]
+        # Online devices, fewest waiting + running jobs first; spread ties by busy time
+        return min(self.queues.values(), key=lambda queue: (not queue.online, queue.load, queue.busy_time))
+
+    def position(self, job: CaptureJob) -> Optional[int]:
+        """1-based position of a job in its device queue (0 once running, None once the queue is gone)"""
+        queue = self.queues.get(job.device_id)
+        if queue is None:
+            # Its device was unplugged and removed (see device_watcher.py)
+            return None
+        if queue.current is job:
+            return 0
+        pending = queue.pending()
+        return pending.index(job) + 1 if job in pending else 0
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job"""
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+
+        job.cancelled = True
+        queue = self.queues.get(job.device_id)
+        if queue is not None:
+            queue.cancelled += 1
+        if job.task and not job.task.done():
+            job.task.cancel()
+        if not job.future.done():
+            job.future.set_exception(CaptureCancelledError(f"Capture {job_id} cancelled"))
+            # Nobody may be awaiting a cancelled job; don't warn about it
+            job.future.exception()
+        return True
+
+    def cancel_client(self, client_id: Any, keep: Optional[Callable[[CaptureJob], bool]] = None) -> int:
+        """Cancel all jobs belonging to a client, e.g. when it disconnects
+
+        Jobs for which keep(job) is true are left to finish.
+        """
+        job_ids = [job.job_id for job in self.jobs.values()
+                   if job.client_id == client_id and not (keep and keep(job))]
+        return sum(1 for job_id in job_ids if self.cancel(job_id))
+
+    def stats(self) -> Dict[str, Any]:
+        devices = [queue.stats() for queue in self.queues.values()]
+        return {
+            "queue_depth": sum(device["queue_depth"] for device in devices),
+            "max_queue_depth": self.max_queue_depth,
+            "max_jobs_per_client": self.max_jobs_per_client,
+            "devices": devices,
+        }
+
+    def saturation(self) -> float:
+        """How full the emptiest device queue is (1.0: every capture gets busy)"""
+        if not self.queues:
+            return 1.0
+        return min(queue.depth for queue in self.queues.values()) / self.max_queue_depth
+
+    def _retry_after(self, queue: DeviceQueue) -> float:
+        backlog = sum(job.captures for job in queue.pending())
+        if queue.current:
+            backlog += queue.current.captures
+        return round(max(backlog, 1) * queue.service_time, 1)
+
+    def _expire(self, queue: DeviceQueue, job: CaptureJob) -> None:
+        # A job that waited offline_grace for its unplugged device
+        self.jobs.pop(job.job_id, None)
+        job.cancelled = True
+        queue.failed += 1
+        ERRORS.inc("device_offline")
+        if not job.future.done():
+            job.future.set_exception(DeviceOfflineError(
+                f"Scanner {queue.device_id} disconnected; not back within {self.offline_grace:g}s"))
+            job.future.exception()
+
+    async def _wait_online(self, queue: DeviceQueue) -> None:
+        """Hold an offline device's jobs until it is back or their grace runs out"""
+        queue.wakeup.clear()
+        pending = queue.pending()
+        if not pending:
+            await queue.wakeup.wait()
+            return
+        deadlines = {job.job_id: max(job.enqueued_at, queue.offline_since) + self.offline_grace
+                     for job in pending}
+        remaining = min(deadlines.values()) - time.monotonic()
+        if remaining > 0:
+            try:
+                await asyncio.wait_for(queue.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            return
+        now = time.monotonic()
+        for job in pending:
+            if deadlines[job.job_id] <= now:
+                self._expire(queue, job)
+
+    async def _worker(self, queue: DeviceQueue) -> None:
+        while self.running and not queue.removed:
+            if not queue.online:
+                await self._wait_online(queue)
+                continue
+            job = queue.pop()
+            if job is None:
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+                continue
+
+            job.started_at = time.monotonic()
+            queue.current = job
+            queue.total_wait += job.wait_time
+            queue.max_wait = max(queue.max_wait, job.wait_time)
+            QUEUE_WAIT_SECONDS.observe(job.wait_time)
+
+            job.task = asyncio.create_task(self.run_capture(job))
+            try:
+                result = await job.task
+                # Timeouts and quality rejections come back as error results
+                if result.get("status") in ("success", "enrolled"):
+                    queue.completed += 1
+                else:
+                    queue.failed += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                if not job.cancelled:
+                    # The worker itself is being stopped
+                    raise
+            except Exception as e:
+                queue.failed += 1
+                self.logger.error(f"Capture job {job.job_id} failed: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                job.finished_at = time.monotonic()
+                duration = job.finished_at - job.started_at
+                queue.busy_time += duration
+                if not job.cancelled:
+                    JOB_SECONDS.observe(duration, job.params.get("kind", "capture"))
+                    # Per press, so enrolments don't inflate retry-after hints
+                    queue.service_time = 0.8 * queue.service_time + 0.2 * duration / job.captures
+                queue.current = None
+                self.jobs.pop(job.job_id, None)
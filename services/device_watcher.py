@@ -0,0 +1,175 @@
+"""
+Scanner Hot-Plug Watcher
+
+The bridge opens its ZK8500R scanners once at startup. Without a watcher, a
+scanner that is unplugged (or dropped by the SDK) stays gone, and captures
+fail until the bridge is restarted. DeviceWatcher polls the SDK's device
+list every FINGERPRINT_DEVICE_POLL seconds (default 2, 0 disables it) on the
+SDK thread and reconciles it with the pool's open devices:
+
+    removed   - an open device is no longer listed; it is closed
+    lost      - a capture failed with DeviceLostError; the device is closed
+                and reopened on the next pass if it is still listed
+    open      - a listed device that is not open was (re)opened
+    failed    - opening it failed; retried with jittered exponential
+                backoff (0.5 s doubling, capped at 10 s)
+
+Every change goes to the on_change callback as a state dict. The bridge uses
+it to pause or resume the device's capture queue (see capture_scheduler.py)
+and to broadcast the change to every connected client.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Optional
+
+from bridge_metrics import DEVICE_CHANGES
+from panel_pool import backoff_delay
+from scanner_device import DevicePool
+
+# Configuration
+DEVICE_POLL_INTERVAL = float(os.environ.get('FINGERPRINT_DEVICE_POLL', 2.0))
+DEVICE_BACKOFF_MAX = 10.0
+
+
+class DeviceState:
+    """What the watcher knows about one scanner"""
+
+    def __init__(self, device_id: str, state: str = "open"):
+        self.device_id = device_id
+        self.state = state
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.changed_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "deviceId": self.device_id,
+            "state": self.state,
+            "since": round(self.changed_at, 3),
+        }
+        if self.last_error:
+            stats["error"] = self.last_error
+        if self.state == "failed":
+            stats["failures"] = self.failures
+            stats["retryIn"] = round(max(0.0, self.retry_at - time.monotonic()), 1)
+        return stats
+
+
+class DeviceWatcher:
+    """Notices scanners being unplugged and plugged back in, and reopens them"""
+
+    def __init__(self, pool: DevicePool, on_change: Callable[[Dict[str, Any]], None],
+                 interval: float = DEVICE_POLL_INTERVAL, seed: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.pool = pool
+        self.on_change = on_change
+        self.interval = interval
+        self.rng = random.Random(seed)
+        self.states: Dict[str, DeviceState] = {device_id: DeviceState(device_id)
+                                               for device_id in pool.device_ids}
+        self.lost_devices: Dict[str, str] = {}
+        self.scan_failures = 0
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def lost(self, device_id: str, error: str) -> None:
+        """A call found the device gone: report it now and rescan right away"""
+        state = self.states.get(device_id)
+        if state is None or state.state != "open":
+            return
+        self.lost_devices[device_id] = error
+        self._change(state, "lost", error)
+        self.wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            delay = self.interval
+            try:
+                await self.check()
+                self.scan_failures = 0
+            except Exception as e:
+                # e.g. the SDK itself failed to initialize; back off
+                self.scan_failures += 1
+                delay = max(delay, backoff_delay(self.scan_failures, self.rng, cap=DEVICE_BACKOFF_MAX))
+                self.logger.warning(f"Scanner scan failed ({e}); retrying in {delay:.1f}s")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def check(self) -> None:
+        """One pass: close devices that went away, open the ones that are back"""
+        lost, self.lost_devices = self.lost_devices, {}
+        for device_id in lost:
+            await self.pool.remove(device_id)
+
+        present = await self.pool.scan()
+        for device_id in self.pool.device_ids:
+            if device_id not in present:
+                state = self.states.setdefault(device_id, DeviceState(device_id))
+                await self.pool.remove(device_id)
+                # A capture may have reported it lost while it was closing
+                if state.state == "open":
+                    self._change(state, "removed", "unplugged")
+
+        now = time.monotonic()
+        for device_id, device in present.items():
+            if self.pool.get(device_id):
+                continue
+            state = self.states.setdefault(device_id, DeviceState(device_id, "removed"))
+            if now < state.retry_at:
+                continue
+            await self.reopen(state, device)
+
+    async def reopen(self, state: DeviceState, device: Any) -> None:
+        try:
+            opened = await self.pool.open(device)
+            error = None if opened else "open failed"
+        except Exception as e:
+            opened, error = False, str(e)
+        if opened:
+            state.failures = 0
+            state.retry_at = 0.0
+            self._change(state, "open")
+            return
+        state.failures += 1
+        delay = backoff_delay(state.failures, self.rng, cap=DEVICE_BACKOFF_MAX)
+        state.retry_at = time.monotonic() + delay
+        if state.state != "failed":
+            self._change(state, "failed", error)
+        else:
+            state.last_error = error
+        self.logger.warning(f"Reopening scanner {state.device_id} failed ({error}); "
+                            f"retrying in {delay:.1f}s")
+
+    def _change(self, state: DeviceState, new_state: str, error: Optional[str] = None) -> None:
+        state.state = new_state
+        state.last_error = error
+        state.changed_at = time.time()
+        DEVICE_CHANGES.inc(new_state)
+        if new_state == "open":
+            self.logger.info(f"Scanner {state.device_id} open")
+        else:
+            self.logger.warning(f"Scanner {state.device_id} {new_state}" + (f": {error}" if error else ""))
+        self.on_change(state.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "devices": [state.stats() for state in self.states.values()],
+        }
@@ -0,0 +1,165 @@
+"""
+Multi-Capture Fingerprint Enrolment
+
+ZK enrolment takes three presses of the same finger and merges them into
+one registration template (ZKFinger DBMerge, which takes exactly three).
+With any other number of presses the best press is kept instead of a
+merge. An enrolment is a single
+scheduler job that holds one device for every requested finger, so the
+customer stays at one scanner, and it streams progress over the socket as it
+goes. Each finger's merged template is sent as soon as it is ready, so the UI
+and the ZKBio upload can start on it while the next finger is being pressed.
+
+WebSocket protocol:
+    -> {"action": "enroll", "fingers": [0, 1], "presses": 3}
+    <- {"status": "queued", "jobId": "job-4", "deviceId": "SIM-0", "position": 1, "fingers": [0, 1]}
+    <- {"status": "progress", "event": "place_finger", "fingerIndex": 0, "press": 1, "presses": 3, "jobId": "job-4"}
+    <- {"status": "progress", "event": "press", "fingerIndex": 0, "press": 1, "presses": 3, "quality": 90, ...}
+    <- {"status": "progress", "event": "press_rejected", "reason": "too_dry", "message": "...", ...}
+       (the quality gate turned a press away; it is retried up to PRESS_ATTEMPTS times)
+       ... presses 2/3 and 3/3 ...
+    <- {"status": "success", "fingerIndex": 0, "template": "base64...", "quality": 88,
+        "pressQualities": [90, 88, 91], "merged": true, "enrollment": true, "jobId": "job-4"}   (binary frame if negotiated)
+    <- {"status": "progress", "event": "finger_failed", "fingerIndex": 1, "message": "...", "jobId": "job-4"}
+    <- {"status": "enrolled", "enrolled": [0], "failed": [1], "jobId": "job-4"}
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Configuration
+ENROLL_PRESSES = 3
+MERGE_PRESSES = 3           # DBMerge takes exactly this many templates
+MAX_ENROLL_PRESSES = 5
+PRESS_ATTEMPTS = 3          # tries per press when the quality gate rejects it
+FINGER_COUNT = 10
+
+CaptureFn = Callable[[int], Awaitable[Dict[str, Any]]]
+MergeFn = Callable[[List[bytes]], Awaitable[bytes]]
+
+
+def enroll_params(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate an enroll request into scheduler job params
+
+    Raises ValueError for an empty, duplicated or out-of-range finger list.
+    """
+    fingers = data.get('fingers')
+    if fingers is None:
+        fingers = [data.get('fingerIndex', 0)]
+    try:
+        fingers = [int(finger) for finger in fingers]
+    except (TypeError, ValueError):
+        raise ValueError("fingers must be a list of finger indexes")
+    if not fingers:
+        raise ValueError("fingers must not be empty")
+    if len(set(fingers)) != len(fingers):
+        raise ValueError("fingers must not repeat")
+    if any(finger < 0 or finger >= FINGER_COUNT for finger in fingers):
+        raise ValueError(f"finger indexes must be 0-{FINGER_COUNT - 1}")
+
+    presses = max(1, min(MAX_ENROLL_PRESSES, int(data.get('presses', ENROLL_PRESSES))))
+    return {
+        "kind": "enroll",
+        "fingers": fingers,
+        "presses": presses,
+        "captures": len(fingers) * presses,
+        "includeImage": bool(data.get('includeImage'))
+    }
+
+
+async def enroll_fingers(job, capture: CaptureFn, merge: MergeFn) -> Dict[str, Any]:
+    """Run an enrolment job: capture and merge each finger, emitting progress
+
+    `capture(finger_index)` returns a capture result dict (status success or
+    error); `merge(templates)` returns the registration template and is only
+    called with MERGE_PRESSES templates. A finger
+    whose presses or merge fail is reported and skipped, and the job moves on
+    to the next finger.
+    """
+    fingers = job.params["fingers"]
+    presses = job.params["presses"]
+    enrolled: List[int] = []
+    failed: List[int] = []
+
+    for finger_index in fingers:
+        templates: List[bytes] = []
+        qualities: List[int] = []
+        result: Dict[str, Any] = {}
+        for press in range(1, presses + 1):
+            job.emit({
+                "status": "progress",
+                "event": "place_finger",
+                "fingerIndex": finger_index,
+                "press": press,
+                "presses": presses
+            })
+            for attempt in range(1, PRESS_ATTEMPTS + 1):
+                result = await capture(finger_index)
+                if not result.get("rejected") or attempt == PRESS_ATTEMPTS:
+                    break
+                # A poor press is retried straight away instead of failing the finger
+                job.emit({
+                    "status": "progress",
+                    "event": "press_rejected",
+                    "fingerIndex": finger_index,
+                    "press": press,
+                    "presses": presses,
+                    "reason": result["reason"],
+                    "quality": result["quality"],
+                    "message": result["message"]
+                })
+            if result.get("status") != "success":
+                break
+            templates.append(result["template"])
+            qualities.append(result["quality"])
+            job.emit({
+                "status": "progress",
+                "event": "press",
+                "fingerIndex": finger_index,
+                "press": press,
+                "presses": presses,
+                "quality": result["quality"]
+            })
+
+        message = None
+        # The weakest press bounds a merged template's quality
+        quality = min(qualities) if qualities else 0
+        if len(templates) < presses:
+            message = result.get("message", "Capture failed")
+        elif presses == MERGE_PRESSES:
+            try:
+                merged = await merge(templates)
+            except Exception as e:
+                message = f"Template merge failed: {e}"
+        else:
+            # Nothing to merge with: keep the best press
+            quality = max(qualities)
+            merged = templates[qualities.index(quality)]
+
+        if message:
+            failed.append(finger_index)
+            job.emit({
+                "status": "progress",
+                "event": "finger_failed",
+                "fingerIndex": finger_index,
+                "message": message
+            })
+            continue
+
+        enrolled.append(finger_index)
+        job.emit({
+            **result,
+            "template": merged,
+            "quality": quality,
+            "merged": presses == MERGE_PRESSES,
+            "pressQualities": qualities,
+            "enrollment": True,
+            "enrolledCount": len(enrolled),
+            "fingerCount": len(fingers)
+        })
+
+    return {
+        "status": "enrolled" if enrolled else "error",
+        "enrolled": enrolled,
+        "failed": failed,
+        "message": f"Enrolled {len(enrolled)} of {len(fingers)} finger(s)"
+    }
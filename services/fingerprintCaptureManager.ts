@@ -1,13 +1,20 @@
 /**
  * Smart Fingerprint Capture Manager
  *
- * Automatically detects platform, starts appropriate services,
- * handles capture process, and cleans up afterwards.
+ * Automatically detects platform, starts appropriate services and
+ * handles the capture process. The bridge is a long-lived daemon: it is
+ * started on first use and reused by later captures, so the scanner stays
+ * open between enrolments. All requests share one pipelined connection
+ * (see bridgeClient.ts).
  */
 
+import { BridgeClient, newIdempotencyKey, type BridgeReply, type BridgeResult } from './bridgeClient';
+import { bytesToBase64, type BinaryCaptureResult } from './bridgeProtocol';
+
 // WebSocket-based fingerprint capture only
 export interface FingerprintData {
   template: string;
+  templateBytes?: Uint8Array;
   quality: number;
   capturedAt: string;
   bioType: number;
@@ -15,6 +22,24 @@ export interface FingerprintData {
   templateNo: string;
 }
 
+export interface EnrollmentProgress {
+  event: 'place_finger' | 'press' | 'press_rejected' | 'finger_failed';
+  fingerIndex: number;
+  press?: number;
+  presses?: number;
+  quality?: number;
+  // Quality gate reason for a rejected press, e.g. 'too_dry' or 'low_foreground'
+  reason?: string;
+  message?: string;
+}
+
+export interface EnrollmentCallbacks {
+  // Called as soon as each finger's merged template arrives, so uploads can
+  // start while the next finger is still being pressed
+  onFinger?: (fingerIndex: number, data: FingerprintData) => void;
+  onProgress?: (progress: EnrollmentProgress) => void;
+}
+
 export interface CaptureStatus {
   status: 'idle' | 'detecting' | 'starting_services' | 'connecting' | 'capturing' | 'processing' | 'completed' | 'error';
   message: string;
@@ -33,6 +58,8 @@ export class FingerprintCaptureManager {
 
   private statusCallbacks: ((status: CaptureStatus) => void)[] = [];
   private abortController: AbortController | null = null;
+  private bridgeReady = false;
+  private bridge = new BridgeClient('ws://localhost:8765');
 
   constructor() {
     this.detectPlatform();
@@ -87,52 +114,68 @@ export class FingerprintCaptureManager {
   }
 
   /**
-   * Start the fingerprint capture process
+   * Detect the platform, start (or reuse) the bridge daemon and connect
    */
-  async startCapture(fingerIndex: number = 0): Promise<FingerprintData> {
-    this.abortController = new AbortController();
-
-    try {
-      // Step 1: Platform detection
-      this.updateStatus({
-        status: 'detecting',
-        message: 'Detecting platform and available services...',
-        progress: 10
-      });
+  private async prepareBridge(): Promise<void> {
+    // Step 1: Platform detection
+    this.updateStatus({
+      status: 'detecting',
+      message: 'Detecting platform and available services...',
+      progress: 10
+    });
 
-      const platform = this.detectPlatform();
-      this.updateStatus({
-        platform,
-        message: `Detected ${platform} platform`,
-        progress: 20
-      });
+    const platform = this.detectPlatform();
+    this.updateStatus({
+      platform,
+      message: `Detected ${platform} platform`,
+      progress: 20
+    });
 
-      // Step 2: Start services
-      this.updateStatus({
-        status: 'starting_services',
-        message: 'Starting fingerprint bridge service...',
-        progress: 30
-      });
+    // Step 2: Start services
+    this.updateStatus({
+      status: 'starting_services',
+      message: 'Starting fingerprint bridge service...',
+      progress: 30
+    });
 
+    if (!this.bridgeReady) {
       const serviceStarted = await this.startBridgeService(platform);
       if (!serviceStarted) {
         throw new Error('Failed to start bridge service');
       }
+    }
 
-      this.updateStatus({
-        serviceStarted: true,
-        message: 'Bridge service started successfully',
-        progress: 50
-      });
+    this.updateStatus({
+      serviceStarted: true,
+      message: this.bridgeReady ? 'Reusing running bridge service' : 'Bridge service started successfully',
+      progress: 50
+    });
 
-      // Step 3: Connect to service
-      this.updateStatus({
-        status: 'connecting',
-        message: 'Connecting to fingerprint service...',
-        progress: 60
-      });
+    // Step 3: Connect to service
+    this.updateStatus({
+      status: 'connecting',
+      message: 'Connecting to fingerprint service...',
+      progress: 60
+    });
 
+    try {
       await this.connectToService();
+      this.bridgeReady = true;
+    } catch (error) {
+      // The daemon went away; start it again on the next capture
+      this.bridgeReady = false;
+      throw error;
+    }
+  }
+
+  /**
+   * Start the fingerprint capture process
+   */
+  async startCapture(fingerIndex: number = 0): Promise<FingerprintData> {
+    this.abortController = new AbortController();
+
+    try {
+      await this.prepareBridge();
 
       // Step 4: Capture fingerprint
       this.updateStatus({
@@ -159,9 +202,47 @@ export class FingerprintCaptureManager {
         progress: 0
       });
       throw error;
-    } finally {
-      // Cleanup services
-      await this.cleanupServices();
+    }
+  }
+
+  /**
+   * Enrol several fingers in one bridge session: three presses per finger
+   * are merged on the bridge, and each finger's template is delivered as
+   * soon as it is ready. Resolves with every finger that enrolled.
+   */
+  async startEnrollment(
+    fingerIndexes: number[],
+    callbacks: EnrollmentCallbacks = {},
+    presses: number = 3
+  ): Promise<FingerprintData[]> {
+    this.abortController = new AbortController();
+
+    try {
+      await this.prepareBridge();
+
+      this.updateStatus({
+        status: 'capturing',
+        message: 'Waiting for scanner...',
+        progress: 60
+      });
+
+      const enrolled = await this.performEnrollment(fingerIndexes, presses, callbacks);
+
+      this.updateStatus({
+        status: 'completed',
+        message: `Enrolled ${enrolled.length} of ${fingerIndexes.length} finger(s)`,
+        progress: 100
+      });
+
+      return enrolled;
+
+    } catch (error) {
+      this.updateStatus({
+        status: 'error',
+        message: error instanceof Error ? error.message : 'Enrollment failed',
+        progress: 0
+      });
+      throw error;
     }
   }
 
@@ -198,97 +279,164 @@ export class FingerprintCaptureManager {
   }
 
   /**
-   * Connect to the fingerprint service
+   * Connect to the fingerprint service (the connection is kept open)
    */
   private async connectToService(): Promise<void> {
-    // Connect to WebSocket bridge service
     try {
-      const ws = new WebSocket('ws://localhost:8765');
-
-      return new Promise((resolve, reject) => {
-        ws.onopen = () => {
-          ws.close();
-          resolve();
-        };
-
-        ws.onerror = () => {
-          reject(new Error('Failed to connect to bridge service'));
-        };
-
-        // Timeout after 5 seconds
-        setTimeout(() => {
-          ws.close();
-          reject(new Error('Bridge connection timeout'));
-        }, 5000);
-      });
+      await this.bridge.connect();
     } catch (error) {
       throw new Error(`Bridge connection failed: ${error instanceof Error ? error.message : 'Unknown error'}`);
     }
   }
 
+  /**
+   * Query the bridge's status over the shared connection
+   */
+  async getBridgeStatus(): Promise<BridgeReply> {
+    return this.bridge.call({ action: 'status' }, { timeoutMs: 5000 });
+  }
+
+  private fromFrame(frame: BinaryCaptureResult): FingerprintData {
+    // Binary capture frame: raw template bytes, no JSON/base64 pass
+    return {
+      template: bytesToBase64(frame.template),
+      templateBytes: frame.template,
+      quality: frame.quality,
+      capturedAt: new Date().toISOString(),
+      bioType: frame.bioType || 1,
+      version: frame.version || '10.0',
+      templateNo: frame.fingerIndex.toString()
+    };
+  }
+
+  private fromReply(reply: BridgeReply, fingerIndex: number): FingerprintData {
+    return {
+      template: reply.template,
+      quality: reply.quality,
+      capturedAt: new Date().toISOString(),
+      bioType: reply.bioType || 1,
+      version: reply.version || '10.0',
+      templateNo: reply.fingerIndex?.toString() || fingerIndex.toString()
+    };
+  }
+
+  private replyError(reply: BridgeReply, fallback: string): Error {
+    if (reply.status === 'busy') {
+      // The bridge's capture queue is full; it tells us when to retry
+      return new Error(`Scanner busy, retry in ${reply.retryAfter ?? 1}s`);
+    }
+    return new Error(reply.message || fallback);
+  }
+
   /**
    * Perform the actual fingerprint capture
    */
   private async performCapture(fingerIndex: number): Promise<FingerprintData> {
-    const ws = new WebSocket('ws://localhost:8765');
-
-    return new Promise((resolve, reject) => {
-      ws.onopen = () => {
-        // Set up message handler
-        const messageHandler = (event: MessageEvent) => {
-          try {
-            const response = JSON.parse(event.data);
-
-            if (response.status === 'success') {
-              ws.removeEventListener('message', messageHandler);
-              ws.close();
-
-              resolve({
-                template: response.template,
-                quality: response.quality,
-                capturedAt: new Date().toISOString(),
-                bioType: response.bioType || 1,
-                version: response.version || '10.0',
-                templateNo: response.fingerIndex?.toString() || fingerIndex.toString()
-              });
-            } else if (response.status === 'error') {
-              ws.removeEventListener('message', messageHandler);
-              ws.close();
-              reject(new Error(response.message || 'Bridge capture failed'));
-            }
-          } catch (error) {
-            ws.removeEventListener('message', messageHandler);
-            ws.close();
-            reject(new Error('Invalid response from bridge'));
+    // The same key goes with the retry, so a dropped connection never costs
+    // the customer a second press
+    const message = { action: 'capture', fingerIndex, idempotencyKey: newIdempotencyKey() };
+    let result: BridgeResult;
+    try {
+      try {
+        result = await this.bridge.request(message, { timeoutMs: 30000 });
+      } catch (error) {
+        if (!(error instanceof Error && error.message === 'Bridge connection closed')) {
+          throw error;
+        }
+        // The bridge keeps keyed captures running; collect it on a new connection
+        result = await this.bridge.request(message, { timeoutMs: 30000 });
+      }
+    } catch (error) {
+      if (error instanceof Error && error.message === 'Bridge request timeout') {
+        throw new Error('Fingerprint capture timeout');
+      }
+      throw error;
+    }
+
+    if (result.kind === 'binary') {
+      return this.fromFrame(result.frame);
+    }
+    if (result.reply.status === 'success') {
+      return this.fromReply(result.reply, fingerIndex);
+    }
+    throw this.replyError(result.reply, 'Bridge capture failed');
+  }
+
+  /**
+   * Run an enroll job on the bridge, following its streamed events
+   */
+  private async performEnrollment(
+    fingerIndexes: number[],
+    presses: number,
+    callbacks: EnrollmentCallbacks
+  ): Promise<FingerprintData[]> {
+    const totalPresses = fingerIndexes.length * presses;
+    const enrolled: FingerprintData[] = [];
+    let pressesDone = 0;
+
+    const fingerEnrolled = (data: FingerprintData, fingerIndex: number) => {
+      enrolled.push(data);
+      callbacks.onFinger?.(fingerIndex, data);
+    };
+
+    const onProgress = (response: BridgeReply) => {
+      callbacks.onProgress?.(response as EnrollmentProgress);
+      if (response.event === 'place_finger') {
+        this.updateStatus({
+          message: `Place finger ${response.fingerIndex} on scanner (press ${response.press}/${response.presses})`
+        });
+      } else if (response.event === 'press_rejected') {
+        this.updateStatus({
+          message: `${response.message}. Place finger ${response.fingerIndex} again`
+        });
+      } else if (response.event === 'press' || response.event === 'finger_failed') {
+        pressesDone = response.event === 'press'
+          ? pressesDone + 1
+          : Math.ceil(pressesDone / presses) * presses;
+        this.updateStatus({
+          progress: 60 + Math.round((pressesDone / totalPresses) * 35),
+          message: response.event === 'press'
+            ? `Press ${response.press}/${response.presses} captured (quality ${response.quality})`
+            : `Finger ${response.fingerIndex} failed: ${response.message}`
+        });
+      }
+    };
+
+    let reply: BridgeReply;
+    try {
+      reply = await this.bridge.call({ action: 'enroll', fingers: fingerIndexes, presses }, {
+        // Each press may wait up to 30 seconds for the finger
+        timeoutMs: 30000,
+        // Per-finger results stream in before the final "enrolled"
+        isFinal: (response) => ['enrolled', 'error', 'busy', 'cancelled'].includes(response.status),
+        frameIsFinal: false,
+        onFrame: (frame) => fingerEnrolled(this.fromFrame(frame), frame.fingerIndex),
+        onEvent: (response) => {
+          if (response.status === 'progress') {
+            onProgress(response);
+          } else if (response.status === 'success') {
+            fingerEnrolled(this.fromReply(response, response.fingerIndex), response.fingerIndex);
           }
-        };
-
-        ws.addEventListener('message', messageHandler);
-
-        // Send capture request
-        ws.send(JSON.stringify({
-          action: 'capture',
-          fingerIndex: fingerIndex
-        }));
-
-        // Timeout after 30 seconds
-        setTimeout(() => {
-          ws.removeEventListener('message', messageHandler);
-          ws.close();
-          reject(new Error('Fingerprint capture timeout'));
-        }, 30000);
-      };
-
-      ws.onerror = () => {
-        reject(new Error('Failed to connect to bridge service'));
-      };
-    });
+        }
+      });
+    } catch (error) {
+      if (error instanceof Error && error.message === 'Bridge request timeout') {
+        throw new Error('Fingerprint enrollment timeout');
+      }
+      throw error;
+    }
+
+    if (reply.status !== 'enrolled') {
+      throw this.replyError(reply, 'Bridge enrollment failed');
+    }
+    return enrolled;
   }
 
   /**
-   * Clean up services after capture
+   * Stop the bridge daemon. Captures no longer stop it, so this is only
+   * needed when the scanner should be released explicitly.
    */
-  private async cleanupServices(): Promise<void> {
+  async stopBridgeService(): Promise<void> {
     try {
       if (this.status.servicePid) {
         await fetch('/api/fingerprint', {
@@ -301,6 +449,9 @@ export class FingerprintCaptureManager {
       }
     } catch (error) {
       console.warn('Service cleanup failed:', error);
+    } finally {
+      this.bridge.close();
+      this.bridgeReady = false;
     }
   }
 
@@ -309,6 +460,8 @@ export class FingerprintCaptureManager {
    */
   cancelCapture(): void {
     this.abortController?.abort();
+    // Release our place in the bridge's capture queue
+    this.bridge.cancel().catch(() => undefined);
     this.updateStatus({
       status: 'idle',
       message: 'Capture cancelled',
@@ -10,13 +10,55 @@ NOT for USB fingerprint scanners like ZK8500R - use fingerprint_bridge_windows.p
 Usage:
     python fingerprint_bridge.py
 
+The bridge is a long-lived daemon: the scanner is opened once at startup and
+kept open, and a ready file is written once connections are accepted (see
+bridge_daemon.py) so callers can wait on it instead of sleeping. Scanners
+that are unplugged and plugged back in are reopened without a restart (see
+device_watcher.py). SIGTERM drains the bridge instead of cutting captures
+off, and a new bridge takes the port over from a running one without
+refusing connections (see bridge_daemon.py).
+
+Capture submission, request dispatch and the connection loop are shared
+with the Windows bridge (see bridge_core.py).
+
+Startup accepts connections first. The SDK, numpy and the template index
+load afterwards, in the background. Captures that arrive meanwhile wait for
+the scanners the cached capability probe expects (see capability_probe.py).
+
 WebSocket Protocol:
-    -> {"action": "capture", "fingerIndex": 0}
-    <- {"status": "success", "template": "base64...", "quality": 95}
+    -> {"action": "capture", "fingerIndex": 0, "priority": 0}
+    <- {"status": "queued", "jobId": "job-1", "position": 1}
+    <- {"status": "success", "template": "base64...", "quality": 95, "jobId": "job-1"}
+    <- {"status": "busy", "message": "...", "retryAfter": 3.0}   (queue full)
+    <- {"status": "draining", "message": "..."}   (restarting: resubmit on a new connection)
+    -> {"action": "hello", "protocol": "binary"}   (raw binary capture frames, see bridge_protocol.py)
+    -> {"action": "identify", "template": "base64...", "topK": 5}   (local 1:N, see sdk_matcher.py)
+    -> {"action": "enroll", "fingers": [0, 1], "presses": 3}   (streamed progress, see enrollment.py)
+    -> {"action": "cancel", "jobId": "job-1"}   (omit jobId to cancel all)
+    -> {"action": "status", "id": 7}   (any request may carry an id; its replies echo it)
+    -> {"action": "metrics"}   (timings and counters, see bridge_metrics.py)
+    -> {"action": "panels"}   (pooled network panel sessions, see panel_pool.py)
+    -> {"action": "panel_info", "panels": ["lobby"]}   (fan-out; all panels when omitted)
+    -> {"action": "panel_sync", "roster": "roster.json"}   (differential template push, see panel_sync.py)
+    -> {"action": "panel_sync_status"}   (per-panel progress of the current sync)
+    -> {"action": "subscribe", "filters": {"door": "Lobby", "pinPrefix": "10"}}
+    <- {"status": "subscribed", "subscription": "sub-1", ...}
+    <- {"status": "event", "subscription": "sub-1", "event": {...}, "dropped": 0}   (live, see panel_events.py)
+    -> {"action": "unsubscribe", "subscription": "sub-1"}
+    <- {"status": "device", "deviceId": "0", "state": "removed", ...}   (broadcast on hot-plug changes)
+    -> {"action": "upload_template", "pin": "1001", "template": "base64...", "templateNo": 0}
+    <- {"status": "uploaded", "pin": "1001", "templateNo": 0, "attempts": 1, ...}   (to ZKBio, see zkbio_uploader.py)
+    -> {"action": "enroll", "fingers": [0, 1], "uploadPin": "1001"}   (capture/enroll, each template uploaded too)
+    <- {"status": "progress", "event": "uploaded", "fingerIndex": 0, "pin": "1001", ...}
+    -> {"action": "spool"}   (templates awaiting upload while ZKBio is down, see template_spool.py)
+    -> {"action": "access_check", "pin": "1001", "door": "11"}   (offline access decisions, see access_matrix.py)
+
+Prometheus text metrics are served on the same port: GET /metrics
+(and GET /metrics.json), as are GET /healthz and GET /readyz.
 
 Requirements:
-    - Python 3.7+
-    - pyzk library (pip install pyzk)
+    - Python 3.9+
+    - pyzk library (pip install pyzk==0.9)
     - websockets library (pip install websockets)
     - Network-attached ZKTeco device
 """
@@ -24,153 +66,525 @@ Requirements:
 import asyncio
 import json
 import logging
+import os
 import sys
-import signal
-from typing import Dict, Any, Optional
-
-# Try to import optional dependencies
+import time
+from typing import Dict, Any, List, Optional
+
+# Startup is timed from here: the imports below are the bridge's own
+BOOT_STARTED = time.perf_counter()
+
+from access_matrix import (ACCESS_REFRESH_INTERVAL, ACCESS_SNAPSHOT_PATH, AccessMatrix, fetch_snapshot,
+                           handle_access_action, load_snapshot, save_snapshot, snapshot_of)
+from bridge_core import STARTUP_BUDGET_MS, TEMPLATE_INDEX_PATH, BridgeCore
+from bridge_daemon import (Handoff, ShutdownSignals, announce_ready, clear_ready, drain_bridge, health_routes,
+                           http_routes)
+from bridge_metrics import ERRORS, metrics_routes
+from bridge_protocol import correlate
+from capability_probe import cached_devices
+from capture_scheduler import DEFAULT_DEVICE
+from panel_events import EVENT_QUEUE_SIZE, EventHub, PanelEventStream
+from panel_pool import PanelPool, fan_out_reply, load_panels, panel_info
+from panel_sync import PanelSyncJob
+from scanner_device import PYZKFP_AVAILABLE, DevicePool, ScannerBackend, create_backend
+from template_spool import SPOOL_PATH, SpoolReplayer, TemplateSpool
+from zkbio_uploader import TEMPLATE_VERSION, ZKBIO_API_TOKEN, ZKBIO_API_URL, ZKBioError, ZKBioUploader
+
+# Try to import optional dependencies (reported by main(), not at import)
 try:
     import websockets
     WEBSOCKETS_AVAILABLE = True
 except ImportError:
-    print("websockets not available - install with: pip install websockets")
     WEBSOCKETS_AVAILABLE = False
 
-try:
-    import pyzkfp  # ZKTeco fingerprint SDK wrapper
-    PYZKFP_AVAILABLE = True
-except ImportError:
-    print("pyzkfp not available - install with: pip install pyzkfp")
-    print("Note: ZKFinger SDK must be installed separately from ZKTeco")
-    PYZKFP_AVAILABLE = False
-
 # Configuration
-WEBSOCKET_PORT = 8765
+WEBSOCKET_PORT = int(os.environ.get('FINGERPRINT_BRIDGE_PORT', 8765))
 LOG_LEVEL = logging.INFO
+PANELS_SPEC = os.environ.get('FINGERPRINT_PANELS')
+PANEL_ROSTER_PATH = os.environ.get('FINGERPRINT_PANEL_ROSTER', TEMPLATE_INDEX_PATH)
+PANEL_EVENTS_ENABLED = os.environ.get('FINGERPRINT_PANEL_EVENTS', '1') != '0'
 
 # Global variables
 scanner = None
 server = None
 
-class FingerprintBridge:
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        self.scanner = None
-        self.connected_clients = set()
-
-    async def initialize_scanner(self) -> bool:
-        """Initialize the ZK8500R scanner"""
+class FingerprintBridge(BridgeCore):
+    def __init__(self, backend: Optional[ScannerBackend] = None):
+        super().__init__(backend, logging.getLogger(__name__))
+        self.panels: Optional[PanelPool] = None
+        self.panel_sync: Optional[PanelSyncJob] = None
+        self.panel_sync_task: Optional[asyncio.Task] = None
+        self.events = EventHub()
+        self.event_stream: Optional[PanelEventStream] = None
+        self.event_tasks = set()
+        self.uploader = ZKBioUploader(ZKBIO_API_URL, ZKBIO_API_TOKEN) if ZKBIO_API_URL else None
+        self.spool = TemplateSpool(SPOOL_PATH) if self.uploader and SPOOL_PATH else None
+        self.replayer = SpoolReplayer(self.spool, self.uploader) if self.spool is not None else None
+        self.access: Optional[AccessMatrix] = None
+        self.access_task: Optional[asyncio.Task] = None
+        # access_update requests applied while a refresh is fetching, replayed onto its matrix
+        self.access_updates: Optional[List[Dict[str, Any]]] = None
+        self.access_refreshing = asyncio.Lock()
+        self.access_saving = asyncio.Lock()
+
+    def open_panels(self, spec: str) -> None:
+        """Keep pooled, keep-alived sessions to the configured network panels"""
         try:
-            self.logger.info("Initializing ZK8500R scanner...")
-            self.scanner = pyzkfp.ZKFP()
+            configs = load_panels(spec)
+            self.panels = PanelPool(configs)
+            self.panels.start()
+            self.logger.info(f"Connecting to {len(self.panels)} network panel(s)")
+            if PANEL_EVENTS_ENABLED:
+                self.event_stream = PanelEventStream(configs, self.events)
+                self.event_stream.start()
+        except Exception as e:
+            self.logger.error(f"Failed to configure network panels: {e}")
 
-            # Try to open the device
-            devices = self.scanner.get_device_list()
-            if not devices:
-                self.logger.error("No ZK8500R devices found")
-                return False
+    async def handle_panel_action(self, action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """`panels` (session state) and `panel_info` (fan-out to the panels)"""
+        if self.panels is None:
+            return {
+                "status": "error",
+                "message": "No network panels configured"
+            }
+        if action == 'panels':
+            return {"status": "panels", **self.panels.stats()}
+        try:
+            results = await self.panels.fan_out(panel_info, panels=data.get('panels'))
+        except KeyError as e:
+            return {
+                "status": "error",
+                "message": e.args[0]
+            }
+        return {"status": "panels", "results": fan_out_reply(results)}
 
-            # Open first available device
-            if self.scanner.open_device(devices[0]):
-                self.logger.info("ZK8500R scanner initialized successfully")
-                return True
-            else:
-                self.logger.error("Failed to open ZK8500R device")
-                return False
+    def start_panel_sync(self, job: PanelSyncJob) -> None:
+        self.panel_sync = job
+        self.panel_sync_task = asyncio.create_task(job.run())
 
+    def resume_panel_sync(self) -> None:
+        """Resume a sync job that the last run of the bridge didn't finish"""
+        try:
+            job = PanelSyncJob.resume(self.panels)
         except Exception as e:
-            self.logger.error(f"Scanner initialization failed: {e}")
-            return False
+            self.logger.error(f"Failed to resume panel sync: {e}")
+            return
+        if job is not None:
+            self.logger.info(f"Resuming panel sync {job.job_id}")
+            self.start_panel_sync(job)
+
+    def handle_panel_sync(self, action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """`panel_sync` (start a differential push) and `panel_sync_status`"""
+        if self.panels is None:
+            return {
+                "status": "error",
+                "message": "No network panels configured"
+            }
+        if action == 'panel_sync_status':
+            return {"status": "panel_sync", **(self.panel_sync.stats() if self.panel_sync else {"jobId": None})}
 
-    async def capture_fingerprint(self, finger_index: int = 0) -> Dict[str, Any]:
-        """Capture a fingerprint and return template data"""
+        if self.panel_sync_task is not None and not self.panel_sync_task.done():
+            return {
+                "status": "error",
+                "message": f"Panel sync {self.panel_sync.job_id} is already running"
+            }
+        roster = data.get('roster') or PANEL_ROSTER_PATH
+        if not roster:
+            return {
+                "status": "error",
+                "message": "roster is required"
+            }
         try:
-            if not self.scanner:
-                return {
-                    "status": "error",
-                    "message": "Scanner not initialized"
-                }
-
-            self.logger.info(f"Capturing fingerprint for finger index {finger_index}")
-
-            # Capture fingerprint (this is a simplified implementation)
-            # In real implementation, you would:
-            # 1. Start capture process
-            # 2. Wait for finger placement
-            # 3. Extract template
-            # 4. Calculate quality score
-
-            # For now, return a mock successful response
-            # Replace with actual ZKFinger SDK calls
-            mock_template = "U0tFRVBURU1QTEFURQ=="  # Base64 encoded mock template
-            quality_score = 92
-
+            job = PanelSyncJob(self.panels, roster, data.get('panels'), bool(data.get('prune', False)))
+        except KeyError as e:
             return {
-                "status": "success",
-                "template": mock_template,
-                "quality": quality_score,
-                "fingerIndex": finger_index,
-                "version": "10.0",
-                "bioType": 1
+                "status": "error",
+                "message": e.args[0]
             }
+        self.start_panel_sync(job)
+        return {"status": "panel_sync", **job.stats()}
 
-        except Exception as e:
-            self.logger.error(f"Fingerprint capture failed: {e}")
+    def subscribe(self, websocket, client_id, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Stream live panel events matching the filters until unsubscribed
+
+        Events go out as further replies to the subscribe request; a slow
+        client only ever holds up its own subscription's queue.
+        """
+        if self.event_stream is None:
+            return {
+                "status": "error",
+                "message": "Live panel events not available (no network panels configured)"
+            }
+        try:
+            subscription = self.events.subscribe(client_id, data.get('filters'),
+                                                 int(data.get('queueSize', EVENT_QUEUE_SIZE)))
+        except (ValueError, TypeError, AttributeError) as e:
             return {
                 "status": "error",
-                "message": f"Capture failed: {str(e)}"
+                "message": f"Invalid subscription: {e}"
             }
+        subscription_id = subscription.subscription_id
+
+        async def stream() -> None:
+            try:
+                while True:
+                    event = await subscription.get()
+                    if event is None:
+                        break
+                    await websocket.send(json.dumps(correlate({
+                        "status": "event",
+                        "subscription": subscription_id,
+                        "dropped": subscription.dropped,
+                        "event": event
+                    }, data)))
+                await websocket.send(json.dumps(correlate({
+                    "status": "unsubscribed",
+                    **subscription.stats()
+                }, data)))
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            finally:
+                self.events.unsubscribe(subscription_id)
+
+        task = asyncio.create_task(stream())
+        self.event_tasks.add(task)
+        task.add_done_callback(self.event_tasks.discard)
+        return {"status": "subscribed", **subscription.stats()}
+
+    def boot_from_cache(self) -> None:
+        """Hold early captures for the scanners the cached probe found
+
+        Their queues start offline and come online as the scanners open.
+        """
+        cached = self.capabilities.load()
+        self.startup["capabilities"] = "cache" if cached else "none"
+        for device_id in cached_devices(cached) or [DEFAULT_DEVICE]:
+            self.scheduler.add_device(device_id)
+            self.scheduler.set_online(device_id, False)
+
+    async def finish_startup(self, handoff: Optional[Handoff] = None) -> None:
+        """Everything slow, once connections are already being accepted"""
+        started = time.perf_counter()
+        index = self.open_index_task()
+        if handoff and handoff.previous is not None:
+            # The scanners, spool and state files are the previous bridge's until it exits
+            self.logger.info(f"Taking over from bridge pid {handoff.previous}; waiting for it to drain")
+            if not await handoff.wait_previous():
+                self.logger.warning(f"Bridge pid {handoff.previous} is still running; opening scanners anyway")
+            self.startup["handoffMs"] = round((time.perf_counter() - started) * 1000, 1)
+        spool = asyncio.create_task(self.open_spool()) if self.spool is not None else None
+        access = asyncio.create_task(self.open_access())
+
+        if not await self.initialize_scanner():
+            self.logger.error("Failed to initialize scanner. Captures will fail until one is plugged in.")
+            if self.backend is None and not PYZKFP_AVAILABLE:
+                self.logger.error("pyzkfp not available - install with: pip install pyzkfp==0.1.5 "
+                                  "(the ZKFinger SDK must be installed separately from ZKTeco)")
+        self.scanners_started()
+        self.watch_devices()
+
+        if PANELS_SPEC:
+            self.open_panels(PANELS_SPEC)
+            if self.panels:
+                self.resume_panel_sync()
+
+        if index:
+            await index
+        # Without a feature extractor, the SDK identifies
+        await self.open_matcher()
+        if spool:
+            await spool
+        await access
+        self.starting = False
+        self.startup["scannersMs"] = round((time.perf_counter() - started) * 1000, 1)
+        self.logger.info(f"Startup finished in {self.startup['scannersMs']:.0f} ms after listening")
+        # Re-validate the cached probe with what was actually found
+        await asyncio.to_thread(
+            self.capabilities.record,
+            self.backend.name if self.backend else None,
+            self.pool.device_ids if self.pool else [],
+            None if self.pool and self.pool.initialized else "SDK initialization failed"
+        )
+
+    async def open_access(self) -> None:
+        """Compile the saved access snapshot, then keep it fresh from ZKBio"""
+        snapshot = await asyncio.to_thread(load_snapshot, ACCESS_SNAPSHOT_PATH)
+        if snapshot:
+            self.access = await asyncio.to_thread(AccessMatrix.compile, snapshot)
+            self.logger.info(f"Access matrix: {self.access.stats()['persons']} persons x "
+                             f"{self.access.stats()['doors']} doors from {ACCESS_SNAPSHOT_PATH}")
+        if ZKBIO_API_URL:
+            self.access_task = asyncio.create_task(self.refresh_access_loop())
+
+    async def refresh_access(self) -> Dict[str, Any]:
+        """Recompile the access matrix from a fresh ZKBio snapshot"""
+        async with self.access_refreshing:
+            self.access_updates = []
+            try:
+                snapshot = await asyncio.to_thread(fetch_snapshot, ZKBIO_API_URL, ZKBIO_API_TOKEN)
+                # Compiled off the loop; queries and updates use the previous matrix meanwhile
+                matrix = await asyncio.to_thread(AccessMatrix.compile, snapshot)
+                # The snapshot may predate updates made meanwhile; apply them again
+                for update in self.access_updates:
+                    handle_access_action(matrix, 'access_update', update)
+                if self.access_updates:
+                    snapshot = snapshot_of(matrix)
+                self.access = matrix
+            finally:
+                self.access_updates = None
+            await self.save_access(snapshot)
+            return {"status": "refreshed", **matrix.stats()}
+
+    async def update_access(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply an access_update and persist it, so a restart keeps it"""
+        reply = handle_access_action(self.access, 'access_update', data)
+        if reply.get('status') == 'updated':
+            if self.access_updates is not None:
+                self.access_updates.append(data)
+            try:
+                await self.save_access()
+            except OSError as e:
+                self.logger.warning(f"Access snapshot not saved: {e}")
+        return reply
+
+    async def save_access(self, snapshot: Optional[Dict[str, Any]] = None) -> None:
+        """Write a snapshot (by default the current matrix's) for the next start"""
+        async with self.access_saving:
+            if snapshot is None:
+                snapshot = snapshot_of(self.access)
+            await asyncio.to_thread(save_snapshot, snapshot, ACCESS_SNAPSHOT_PATH)
+
+    async def refresh_access_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh_access()
+            except (ZKBioError, OSError) as e:
+                self.logger.warning(f"Access matrix refresh from ZKBio failed: {e}")
+            await asyncio.sleep(ACCESS_REFRESH_INTERVAL)
 
-    async def handle_client(self, websocket, path):
-        """Handle WebSocket client connections"""
-        self.connected_clients.add(websocket)
-        client_address = websocket.remote_address
-        self.logger.info(f"Client connected: {client_address}")
+    async def initialize_scanner(self) -> bool:
+        """Open every detected ZK8500R scanner on its own SDK thread
 
+        The pool is kept even when no scanner is found, so the device watcher
+        can open one that is plugged in later.
+        """
         try:
-            async for message in websocket:
-                try:
-                    data = json.loads(message)
-                    action = data.get('action')
-
-                    if action == 'capture':
-                        finger_index = data.get('fingerIndex', 0)
-                        result = await self.capture_fingerprint(finger_index)
-                        await websocket.send(json.dumps(result))
-
-                    elif action == 'ping':
-                        await websocket.send(json.dumps({"status": "pong"}))
-
-                    elif action == 'status':
-                        status = {
-                            "status": "ready" if self.scanner else "disconnected",
-                            "scanner": "ZK8500R" if self.scanner else None,
-                            "websocket_port": WEBSOCKET_PORT
-                        }
-                        await websocket.send(json.dumps(status))
-
-                    else:
-                        await websocket.send(json.dumps({
-                            "status": "error",
-                            "message": f"Unknown action: {action}"
-                        }))
-
-                except json.JSONDecodeError:
-                    await websocket.send(json.dumps({
-                        "status": "error",
-                        "message": "Invalid JSON message"
-                    }))
-                except Exception as e:
-                    self.logger.error(f"Message handling error: {e}")
-                    await websocket.send(json.dumps({
-                        "status": "error",
-                        "message": "Internal server error"
-                    }))
-
-        except websockets.exceptions.ConnectionClosed:
-            self.logger.info(f"Client disconnected: {client_address}")
+            self.logger.info("Initializing ZK8500R scanners...")
+            if self.backend is None:
+                self.backend = create_backend()
+
+            # SDK calls run on SDK/device threads, never on the event loop
+            self.pool = DevicePool(self.backend, self.quality_gate)
+            device_ids = await self.pool.open_all()
+            if not device_ids:
+                self.logger.error("No ZK8500R devices found")
+                return False
+
+            for device_id in device_ids:
+                self.scheduler.add_device(device_id)
+            self.logger.info(f"Opened {len(device_ids)} ZK8500R scanner(s) ({self.backend.name}): {device_ids}")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Scanner initialization failed: {e}")
+            return False
         finally:
-            self.connected_clients.remove(websocket)
+            if not self.scheduler.queues:
+                # No scanner: keep one queue so captures get a proper error reply
+                self.scheduler.add_device(DEFAULT_DEVICE)
+
+    def health(self) -> Dict[str, Any]:
+        """Health report for /healthz and /readyz, from in-memory state only"""
+        saturation = self.scheduler.saturation()
+        problems = []
+        if not self.ready:
+            problems.append("starting")
+        if self.draining:
+            problems.append("draining")
+        if not self.scanner:
+            problems.append("opening scanner" if self.starting else "no scanner open")
+        if saturation >= 1:
+            problems.append("capture queues full")
+        return {
+            "status": "ok" if not problems else "unavailable",
+            "ready": not problems,
+            "problems": problems,
+            "devices": self.pool.device_ids if self.pool else [],
+            "sdk_mode": self.backend.name if self.backend else None,
+            "mock_mode": bool(self.backend and self.backend.mock),
+            "queue_depth": sum(queue.depth for queue in self.scheduler.queues.values()),
+            "queue_saturation": round(saturation, 2),
+            "connected_clients": len(self.connected_clients),
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1)
+        }
+
+    async def open_spool(self) -> None:
+        """Read back templates a previous run spooled but never uploaded"""
+        try:
+            pending = await self.spool.open()
+        except OSError as e:
+            self.logger.error(f"Template spool {self.spool.path} unusable, uploading directly: {e}")
+            # Puts already waiting on it fail over to direct uploads
+            self.spool.opened.set()
+            self.spool = self.replayer = None
+            return
+        self.startup["spooled"] = pending
+        self.replayer.start()
+
+    async def spool_template(self, pin: Any, template: Any, template_no: int, key: Optional[str],
+                             version: str) -> Dict[str, Any]:
+        """Spool a template for upload; acknowledged once it is on disk"""
+        started = time.perf_counter()
+        try:
+            entry = await self.spool.put(pin, template_no, template, key, version)
+        except OSError as e:
+            ERRORS.inc("spool_write")
+            self.logger.error(f"Template spool write failed, uploading directly: {e}")
+            return await self.uploader.upload(pin, template, template_no, version=version)
+        return {
+            "status": "spooled",
+            "pin": entry.pin,
+            "templateNo": entry.template_no,
+            "seq": entry.seq,
+            "key": entry.key,
+            "pending": len(self.spool),
+            "spoolMs": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    async def upload_capture(self, pin: Any, result: Dict[str, Any], key: Optional[str] = None) -> Dict[str, Any]:
+        """Upload a capture's (or an enrolled finger's) template to ZKBio, through the spool if enabled"""
+        version = result.get("version", TEMPLATE_VERSION)
+        if self.spool is not None:
+            return await self.spool_template(pin, result["template"], result.get("fingerIndex", 0), key, version)
+        return await self.uploader.upload(pin, result["template"], result.get("fingerIndex", 0), version=version)
+
+    async def upload_template(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Upload a template the client already has, in place of PUT /api/biometric"""
+        if self.uploader is None:
+            return {
+                "status": "error",
+                "message": "ZKBio upload not configured (set ZKBIO_API_URL)"
+            }
+        try:
+            template_no = int(data.get('templateNo', data.get('fingerIndex', 0)))
+            if self.spool is not None:
+                return await self.spool_template(data.get('pin'), data.get('template'), template_no,
+                                                 data.get('idempotencyKey'), data.get('version', TEMPLATE_VERSION))
+            return await self.uploader.upload(
+                data.get('pin'),
+                data.get('template'),
+                template_no,
+                data.get('validType', '1'),
+                data.get('version', TEMPLATE_VERSION)
+            )
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "message": str(e)}
+
+    def spool_status(self) -> Dict[str, Any]:
+        if self.spool is None:
+            return {
+                "status": "error",
+                "message": "Template spool not enabled (set ZKBIO_API_URL and FINGERPRINT_TEMPLATE_SPOOL)"
+            }
+        return {
+            "status": "spool",
+            **self.spool.stats(),
+            **self.replayer.stats(),
+            "entries": [entry.stats() for entry in self.spool.pending()[:100]],
+            "rejectedEntries": list(self.spool.rejected)
+        }
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.scanner else "disconnected",
+            "scanner": "ZK8500R" if self.scanner else None,
+            "devices": self.pool.device_ids if self.pool else [],
+            "hotplug": self.device_watcher.stats() if self.device_watcher else None,
+            "sdk_mode": self.backend.name if self.backend else None,
+            "mock_mode": bool(self.backend and self.backend.mock),
+            "websocket_port": WEBSOCKET_PORT,
+            "ready": self.ready,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "connected_clients": len(self.connected_clients),
+            "queue": self.scheduler.stats(),
+            "results": self.results.stats(),
+            "panels": self.panels.stats() if self.panels else None,
+            "panel_sync": self.panel_sync.stats() if self.panel_sync else None,
+            "events": {**self.events.stats(), **self.event_stream.stats()} if self.event_stream else None,
+            "index": self.index.stats() if self.index is not None else None,
+            "quality_gate": self.quality_gate.stats() if self.quality_gate else None,
+            "zkbio": self.uploader.stats() if self.uploader else None,
+            "spool": {**self.spool.stats(), **self.replayer.stats()} if self.spool is not None else None,
+            "access": self.access.stats() if self.access else None,
+            "startup": self.startup,
+            "errors": ERRORS.snapshot()
+        }
+
+    async def handle_action(self, websocket, client_id, action: Optional[str], data: Dict[str, Any]) -> Dict[str, Any]:
+        """ZKBio uploads, access checks, network panels and live panel events"""
+        if action == 'upload_template':
+            return await self.upload_template(data)
+
+        if action == 'spool':
+            return self.spool_status()
+
+        if action in ('access_check', 'access_who', 'access_doors'):
+            return handle_access_action(self.access, action, data)
+
+        if action == 'access_update':
+            return await self.update_access(data)
+
+        if action == 'access_refresh':
+            if not ZKBIO_API_URL:
+                return {"status": "error", "message": "ZKBio not configured (set ZKBIO_API_URL)"}
+            try:
+                return await self.refresh_access()
+            except (ZKBioError, OSError) as e:
+                return {"status": "error", "message": f"Access matrix refresh failed: {e}"}
+
+        if action in ('panels', 'panel_info'):
+            return await self.handle_panel_action(action, data)
+
+        if action in ('panel_sync', 'panel_sync_status'):
+            return self.handle_panel_sync(action, data)
+
+        if action == 'subscribe':
+            return self.subscribe(websocket, client_id, data)
+
+        if action == 'unsubscribe':
+            return {
+                "status": "ok",
+                "unsubscribed": self.events.unsubscribe(data.get('subscription'), client_id)
+            }
+
+        return await super().handle_action(websocket, client_id, action, data)
+
+    def client_closed(self, client_id) -> None:
+        self.events.unsubscribe_client(client_id)
+
+    async def close(self) -> None:
+        """Stop everything the bridge runs, once drained"""
+        await super().close()
+        if self.panel_sync_task:
+            # Left unfinished in the state file; the next start resumes it
+            self.panel_sync_task.cancel()
+            await asyncio.gather(self.panel_sync_task, return_exceptions=True)
+        if self.event_stream:
+            await self.event_stream.close()
+        if self.panels:
+            await self.panels.close()
+        if self.access_task:
+            self.access_task.cancel()
+            await asyncio.gather(self.access_task, return_exceptions=True)
+        if self.replayer is not None:
+            await self.replayer.close()
+        if self.spool is not None:
+            # Whatever is still pending is uploaded by the next start
+            await self.spool.close()
+        if self.uploader:
+            await self.uploader.close()
 
 async def main():
     """Main application entry point"""
@@ -181,37 +595,64 @@ async def main():
     )
     logger = logging.getLogger(__name__)
 
-    # Create bridge instance
-    bridge = FingerprintBridge()
+    if not WEBSOCKETS_AVAILABLE:
+        logger.error("websockets not available - install with: pip install websockets")
+        return
 
-    # Initialize scanner
-    if not await bridge.initialize_scanner():
-        logger.error("Failed to initialize scanner. Service will start without scanner support.")
-        logger.info("Clients can still connect, but fingerprint capture will return mock data.")
+    # Create bridge instance; the scanners are opened once it is serving
+    bridge = FingerprintBridge()
+    bridge.boot_from_cache()
 
-    # Setup signal handlers for graceful shutdown
-    def signal_handler(signum, frame):
-        logger.info("Shutdown signal received, stopping server...")
-        if server:
-            server.close()
-        sys.exit(0)
+    # The first SIGTERM/SIGINT drains in-flight captures, a second one stops at once
+    signals = ShutdownSignals()
+    signals.install(asyncio.get_running_loop())
+    handoff = Handoff(WEBSOCKET_PORT)
 
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    bridge.scheduler.start()
 
-    # Start WebSocket server
+    # Start WebSocket server, alongside the bridge it replaces if there is one
     global server
-    server = await websockets.serve(
+    server = await handoff.listen(
+        websockets.serve,
         bridge.handle_client,
         "localhost",
-        WEBSOCKET_PORT
+        WEBSOCKET_PORT,
+        process_request=http_routes({**metrics_routes(), **health_routes(bridge.health)})
     )
 
-    logger.info(f"ZK8500R Fingerprint Bridge started on ws://localhost:{WEBSOCKET_PORT}")
+    bridge.ready = True
+    announce_ready(WEBSOCKET_PORT, "fingerprint_bridge")
+    bridge.startup["listenMs"] = round((time.perf_counter() - BOOT_STARTED) * 1000, 1)
+    if bridge.startup["listenMs"] > STARTUP_BUDGET_MS:
+        logger.warning(f"Accepting connections took {bridge.startup['listenMs']:.0f} ms "
+                       f"(budget {STARTUP_BUDGET_MS:.0f} ms)")
+
+    logger.info(f"ZK8500R Fingerprint Bridge started on ws://localhost:{WEBSOCKET_PORT} "
+                f"in {bridge.startup['listenMs']:.0f} ms")
     logger.info("Press Ctrl+C to stop the service")
+    startup = asyncio.create_task(bridge.finish_startup(handoff))
 
     # Keep the server running
-    await server.wait_closed()
+    try:
+        await signals.requested.wait()
+        logger.info("Shutdown signal received, draining captures...")
+        drain = asyncio.create_task(drain_bridge(bridge, server))
+        forced = asyncio.create_task(signals.forced.wait())
+        await asyncio.wait({drain, forced}, return_when=asyncio.FIRST_COMPLETED)
+        forced.cancel()
+        if drain.done():
+            logger.info(f"Drained: {drain.result()}")
+        else:
+            logger.warning("Second shutdown signal, stopping without waiting for captures")
+            drain.cancel()
+            await asyncio.gather(drain, return_exceptions=True)
+    finally:
+        if not startup.done():
+            startup.cancel()
+            await asyncio.gather(startup, return_exceptions=True)
+        server.close()
+        await bridge.close()
+        clear_ready(WEBSOCKET_PORT)
 
 if __name__ == "__main__":
     print("ZK8500R Fingerprint Scanner WebSocket Bridge")
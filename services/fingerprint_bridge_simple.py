@@ -2,31 +2,53 @@
 """
 Simple Test Fingerprint Bridge Service
 
-This is a minimal version for testing the API integration without external dependencies.
+This is a minimal version for testing the API integration without a scanner
+or SDK. With the websockets library installed it serves mock captures,
+`status` and `ping` on the bridge port (one capture per connection at a
+time; other connections are still served while it "waits for a finger"),
+plus GET /healthz and /readyz. Without websockets it just idles.
+
+Configuration:
+    FINGERPRINT_BRIDGE_PORT       default 8765
+    FINGERPRINT_SIM_CAPTURE_LATENCY  mock capture delay in seconds, default 1
 """
 
+import asyncio
 import json
-import sys
+import os
 import time
 from typing import Dict, Any
 
+from bridge_daemon import announce_ready, clear_ready, health_routes, http_routes
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+# Configuration
+WEBSOCKET_PORT = int(os.environ.get('FINGERPRINT_BRIDGE_PORT', 8765))
+CAPTURE_DELAY = float(os.environ.get('FINGERPRINT_SIM_CAPTURE_LATENCY', 1.0))
+
 print("Simple Fingerprint Bridge Service")
 print("=" * 40)
-print("This is a test version without external dependencies")
+print("This is a test version without a scanner or SDK")
 print("Use for testing API integration only")
 print()
 
 class SimpleBridge:
     def __init__(self):
         self.running = True
+        self.started_at = time.time()
         print("Bridge initialized (mock mode)")
 
-    def capture_fingerprint(self, finger_index: int = 0) -> Dict[str, Any]:
+    async def capture_fingerprint(self, finger_index: int = 0) -> Dict[str, Any]:
         """Mock fingerprint capture"""
         print(f"Capturing fingerprint for finger {finger_index}...")
 
-        # Simulate capture delay
-        time.sleep(1)
+        # Simulate capture delay without blocking other connections
+        await asyncio.sleep(CAPTURE_DELAY)
 
         # Mock successful capture
         mock_template = "U0tFRVBURU1QTEFURQ=="  # Base64 encoded mock template
@@ -43,6 +65,60 @@ class SimpleBridge:
             "message": f"Mock fingerprint captured for finger {finger_index}"
         }
 
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "ready": True,
+            "problems": [],
+            "devices": [],
+            "sdk_mode": None,
+            "mock_mode": True,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1)
+        }
+
+    async def handle_connection(self, websocket, path=None):
+        """Serve capture, status and ping requests"""
+        try:
+            async for message in websocket:
+                try:
+                    data = json.loads(message)
+                except json.JSONDecodeError:
+                    await websocket.send(json.dumps({"status": "error", "message": "Invalid JSON message"}))
+                    continue
+
+                action = data.get('action')
+                if action == 'capture':
+                    result = await self.capture_fingerprint(int(data.get('fingerIndex', 0)))
+                elif action == 'status':
+                    result = {
+                        "status": "ready",
+                        "scanner": None,
+                        "mock_mode": True,
+                        "websocket_port": WEBSOCKET_PORT,
+                        "uptime": round(time.time() - self.started_at, 1)
+                    }
+                elif action == 'ping':
+                    result = {"status": "pong"}
+                else:
+                    result = {"status": "error", "message": f"Unknown action: {action}"}
+                await websocket.send(json.dumps(result))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def serve(bridge: SimpleBridge) -> None:
+    async with websockets.serve(bridge.handle_connection, "localhost", WEBSOCKET_PORT,
+                                process_request=http_routes(health_routes(bridge.health))):
+        announce_ready(WEBSOCKET_PORT, "fingerprint_bridge_simple")
+        print(f"Serving mock captures on ws://localhost:{WEBSOCKET_PORT}")
+        try:
+            while bridge.running:
+                await asyncio.sleep(1)
+        finally:
+            clear_ready(WEBSOCKET_PORT)
+
+
 def main():
     """Simple test mode"""
     print("Starting in test mode...")
@@ -53,14 +129,16 @@ def main():
     bridge = SimpleBridge()
 
     try:
-        while bridge.running:
-            # In a real implementation, this would handle WebSocket connections
-            # For now, just keep the service running
-            time.sleep(1)
+        if WEBSOCKETS_AVAILABLE:
+            asyncio.run(serve(bridge))
+        else:
+            print("websockets not available - install with: pip install websockets")
+            while bridge.running:
+                time.sleep(1)
 
     except KeyboardInterrupt:
         print("\nService stopped by user")
         bridge.running = False
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,218 +7,290 @@ bridging the web application with fingerprint scanners.
 Usage:
     python fingerprint_bridge_windows.py
 
+The bridge is a long-lived daemon; a ready file is written once connections
+are accepted (see bridge_daemon.py) so callers can wait on it. The scanner
+backend is FINGERPRINT_BRIDGE_BACKEND, else the one the cached capability
+probe found (see capability_probe.py), else pyzkfp when it is installed;
+it is opened after the server is listening. Scanners that are unplugged
+and plugged back in are reopened without a restart (see
+device_watcher.py). Stopping the bridge lets
+running captures finish and sends clients to its replacement, which may
+already be binding the port (see bridge_daemon.py). Capture submission,
+request dispatch and the connection loop are shared with the network
+bridge (see bridge_core.py).
+
 WebSocket Protocol:
-    -> {"action": "capture", "fingerIndex": 0}
-    <- {"status": "success", "template": "base64...", "quality": 95}
+    -> {"action": "capture", "fingerIndex": 0, "priority": 0}
+    <- {"status": "queued", "jobId": "job-1", "position": 1}
+    <- {"status": "success", "template": "base64...", "quality": 95, "jobId": "job-1"}
+    <- {"status": "busy", "message": "...", "retryAfter": 3.0}   (queue full)
+    <- {"status": "draining", "message": "..."}   (restarting: resubmit on a new connection)
+    -> {"action": "hello", "protocol": "binary"}   (raw binary capture frames, see bridge_protocol.py)
+    -> {"action": "identify", "template": "base64...", "topK": 5}   (local 1:N, see sdk_matcher.py)
+    -> {"action": "enroll", "fingers": [0, 1], "presses": 3}   (streamed progress, see enrollment.py)
+    -> {"action": "cancel", "jobId": "job-1"}   (omit jobId to cancel all)
+    -> {"action": "status", "id": 7}   (any request may carry an id; its replies echo it)
+    -> {"action": "metrics"}   (timings and counters, see bridge_metrics.py)
+    <- {"status": "device", "deviceId": "0", "state": "removed", ...}   (broadcast on hot-plug changes)
+
+Prometheus text metrics are served on the same port: GET /metrics
+(and GET /metrics.json), as are GET /healthz and GET /readyz.
 
 Requirements:
-    - Python 3.7+
+    - Python 3.9+
     - websockets library (pip install websockets)
 """
 
 import asyncio
-import json
 import logging
-import sys
-import signal
+import os
 import platform
 import time
 from typing import Dict, Any, Optional
 
-# Try to import websockets
+# Startup is timed from here: the imports below are the bridge's own
+BOOT_STARTED = time.perf_counter()
+
+from bridge_core import STARTUP_BUDGET_MS, BridgeCore
+from bridge_daemon import (Handoff, ShutdownSignals, announce_ready, clear_ready, drain_bridge, health_routes,
+                           http_routes)
+from bridge_metrics import ERRORS, metrics_routes
+from capability_probe import cached_devices
+from capture_scheduler import DEFAULT_DEVICE
+from scanner_device import PYZKFP_AVAILABLE, DevicePool, create_backend
+
+# Try to import websockets (reported by main(), not at import)
 try:
     import websockets
     WEBSOCKETS_AVAILABLE = True
 except ImportError:
-    print("websockets not available - install with: pip install websockets")
     WEBSOCKETS_AVAILABLE = False
 
-# For now, we'll use mock mode since SDK integration needs more work
-# TODO: Implement real ZKFinger SDK integration
-print("⚠ Running in mock mode - real SDK integration needed")
-print("   Install ZKFinger SDK from ZKTeco and update this code")
-
-PYZK_AVAILABLE = False
-PYZKFP_AVAILABLE = False
-
 # Configuration
-WEBSOCKET_PORT = 8765
+WEBSOCKET_PORT = int(os.environ.get('FINGERPRINT_BRIDGE_PORT', 8765))
 LOG_LEVEL = logging.INFO
 
 # Global variables
 server = None
-scanner = None
-scanner = None
 
-class WindowsFingerprintBridge:
-    def __init__(self):
-        self.running = True
-        self.scanner_connected = False
-        print("✓ Windows Fingerprint Bridge initialized")
-        print(f"✓ Platform: {platform.system()}")
-        print(f"✓ WebSocket port: {WEBSOCKET_PORT}")
-
-        # Initialize scanner if SDK is available
-        if PYZKFP_AVAILABLE:
-            self.initialize_scanner()
-        else:
-            print("⚠ Running in mock mode (ZKFinger SDK not available)")
+logger = logging.getLogger(__name__)
 
-    def initialize_scanner(self):
-        """Initialize the scanner (mock mode for now)"""
-        print("🔧 Initializing scanner in mock mode...")
-        print("   TODO: Implement real ZKFinger SDK integration")
-        print("   1. Install ZKFinger SDK from ZKTeco")
-        print("   2. Find correct Python wrapper library")
-        print("   3. Update this code to use real device")
 
-        # For now, simulate device detection
-        self.scanner_connected = False  # Set to False since we can't detect real device yet
+class WindowsFingerprintBridge(BridgeCore):
+    def __init__(self):
+        super().__init__(logger=logger)
+        self.backend_name: Optional[str] = None
+        # True when the simulated backend stands in for a missing SDK
+        self.mock_fallback = False
+        self.logger.info("Windows Fingerprint Bridge initialized")
+        self.logger.info(f"Platform: {platform.system()}")
+        self.logger.info(f"WebSocket port: {WEBSOCKET_PORT}")
+
+    def boot_from_cache(self) -> None:
+        """Pick the backend and hold early captures for the scanners the cached probe found
+
+        Without the SDK the simulated backend stands in, in mock mode.
+        """
+        cached = self.capabilities.load()
+        self.startup["capabilities"] = "cache" if cached else "none"
+        self.backend_name = (os.environ.get('FINGERPRINT_BRIDGE_BACKEND')
+                             or (cached or {}).get("backend")
+                             or ("pyzkfp" if PYZKFP_AVAILABLE else None))
+        if not self.backend_name:
+            self.logger.warning("Running in mock mode (pyzkfp / ZKFinger SDK not available)")
+            self.backend_name = "simulated"
+            self.mock_fallback = True
+        devices = cached_devices(cached) if cached and cached.get("backend") == self.backend_name else []
+        for device_id in devices or [DEFAULT_DEVICE]:
+            self.scheduler.add_device(device_id)
+            self.scheduler.set_online(device_id, False)
+
+    async def finish_startup(self, handoff: Optional[Handoff] = None) -> None:
+        """Open the scanners and the index once connections are already being accepted"""
+        started = time.perf_counter()
+        index = self.open_index_task()
+        if handoff and handoff.previous is not None:
+            # The scanners are the previous bridge's until it exits
+            self.logger.info(f"Taking over from bridge pid {handoff.previous}; waiting for it to drain")
+            if not await handoff.wait_previous():
+                self.logger.warning(f"Bridge pid {handoff.previous} is still running; opening scanners anyway")
+
+        opened = await self.open_devices(self.backend_name)
+        # Captures sent before a scanner is plugged in wait on the default queue
+        self.scanners_started()
+        self.watch_devices()
+
+        if index:
+            await index
+        # Without a feature extractor, the SDK identifies
+        await self.open_matcher()
+        self.starting = False
+        self.startup["scannersMs"] = round((time.perf_counter() - started) * 1000, 1)
+        self.logger.info(f"Startup finished in {self.startup['scannersMs']:.0f} ms after listening")
+        if not self.mock_fallback:
+            # Re-validate the cached probe with what was actually found
+            await asyncio.to_thread(self.capabilities.record, self.backend_name,
+                                    self.pool.device_ids if opened else [],
+                                    None if opened else "no scanner opened")
+
+    async def open_devices(self, backend_name: str) -> bool:
+        """Open every scanner of a backend, each on its own SDK thread
+
+        The pool is kept when the SDK works but no scanner is found, so the
+        device watcher can open one that is plugged in later.
+        """
+        self.logger.info(f"Opening scanners via {backend_name} backend...")
+        try:
+            self.backend = create_backend(backend_name)
+            pool = DevicePool(self.backend, self.quality_gate)
+            device_ids = await pool.open_all()
+            self.pool = pool
+            if not device_ids:
+                self.logger.warning("No scanner devices found")
+                return False
+
+            for device_id in device_ids:
+                if device_id not in self.scheduler.queues:
+                    self.scheduler.add_device(device_id)
+            self.logger.info(f"Opened {len(device_ids)} scanner(s): {', '.join(device_ids)}")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Scanner initialization failed: {e}")
+            return False
+
+    async def capture_fingerprint(self, finger_index: int = 0, device_id: Optional[str] = None) -> Dict[str, Any]:
+        """Capture on an open scanner (the simulated one in mock mode), tagged with where it came from"""
+        result = await super().capture_fingerprint(finger_index, device_id)
+        if result["status"] == "success":
+            result.update(source=self.backend.name, platform=platform.system())
+        return result
 
     def get_device_status(self) -> Dict[str, Any]:
         """Get current device status"""
         return {
             "sdk_available": PYZKFP_AVAILABLE,
-            "device_connected": self.scanner_connected,
+            "device_connected": self.scanner,
             "platform": platform.system(),
-            "mock_mode": not (PYZKFP_AVAILABLE and self.scanner_connected)
+            "mock_mode": bool(self.backend and self.backend.mock),
+            "devices": self.pool.device_ids if self.pool else [],
+            "hotplug": self.device_watcher.stats() if self.device_watcher else None,
+            "sdk_mode": self.backend.name if self.backend else None,
+            "connected_clients": len(self.connected_clients),
+            "queue": self.scheduler.stats(),
+            "results": self.results.stats(),
+            "index": self.index.stats() if self.index is not None else None,
+            "quality_gate": self.quality_gate.stats() if self.quality_gate else None,
+            "startup": self.startup,
+            "errors": ERRORS.snapshot()
         }
 
-    async def handle_connection(self, websocket, path):
-        """Handle WebSocket connection"""
-        print(f"✓ Client connected from {websocket.remote_address}")
-
-        try:
-            async for message in websocket:
-                try:
-                    data = json.loads(message)
-                    action = data.get('action')
-
-                    if action == 'capture':
-                        finger_index = data.get('fingerIndex', 0)
-                        print(f"📸 Capturing fingerprint for finger {finger_index}...")
-
-                        result = await self.capture_fingerprint(finger_index)
-
-                        await websocket.send(json.dumps(result))
-                        print(f"✓ Sent capture result: {result['status']}")
-
-                    elif action == 'status':
-                        # Return device status
-                        status_info = self.get_device_status()
-                        await websocket.send(json.dumps({
-                            "status": "info",
-                            "device_status": status_info
-                        }))
-                        print(f"✓ Sent device status: {status_info}")
-
-                    else:
-                        await websocket.send(json.dumps({
-                            "status": "error",
-                            "message": f"Unknown action: {action}"
-                        }))
-
-                except json.JSONDecodeError:
-                    await websocket.send(json.dumps({
-                        "status": "error",
-                        "message": "Invalid JSON message"
-                    }))
-                except Exception as e:
-                    print(f"✗ Error handling message: {e}")
-                    await websocket.send(json.dumps({
-                        "status": "error",
-                        "message": str(e)
-                    }))
-
-        except websockets.exceptions.ConnectionClosed:
-            print("✓ Client disconnected")
-        except Exception as e:
-            print(f"✗ Connection error: {e}")
-
-    async def capture_fingerprint(self, finger_index: int = 0) -> Dict[str, Any]:
-        """Capture fingerprint using real device or mock data"""
-        print(f"Capturing fingerprint for finger {finger_index}...")
-
-        # TODO: Implement real device capture
-        # For now, always use mock capture since SDK integration is not complete
-
-        # Fallback to mock capture
-        print("Using mock fingerprint capture...")
-        await asyncio.sleep(1.5)
-
-        # Mock successful capture
-        import base64
-        mock_template_data = b"WindowsFingerprintTemplateData"
-        mock_template = base64.b64encode(mock_template_data).decode('utf-8')
-        quality_score = 88 + (finger_index * 2)
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": "info",
+            "device_status": self.get_device_status()
+        }
 
+    def health(self) -> Dict[str, Any]:
+        """Health report for /healthz and /readyz, from in-memory state only"""
+        saturation = self.scheduler.saturation()
+        problems = []
+        if not self.ready:
+            problems.append("starting")
+        if self.draining:
+            problems.append("draining")
+        if not self.pool:
+            problems.append("opening scanner" if self.starting else "no scanner open")
+        if saturation >= 1:
+            problems.append("capture queues full")
         return {
-            "status": "success",
-            "template": mock_template,
-            "quality": min(100, quality_score),
-            "fingerIndex": finger_index,
-            "version": "10.0",
-            "bioType": 1,
-            "source": "mock_fallback",
-            "platform": platform.system(),
-            "message": f"Mock fingerprint captured for finger {finger_index} (device not available)"
+            "status": "ok" if not problems else "unavailable",
+            "ready": not problems,
+            "problems": problems,
+            "device_connected": self.scanner,
+            "devices": self.pool.device_ids if self.pool else [],
+            "sdk_mode": self.backend.name if self.backend else None,
+            "mock_mode": bool(self.backend and self.backend.mock),
+            "queue_depth": sum(queue.depth for queue in self.scheduler.queues.values()),
+            "queue_saturation": round(saturation, 2),
+            "connected_clients": len(self.connected_clients),
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1)
         }
 
 async def main():
     """Main WebSocket server"""
     if not WEBSOCKETS_AVAILABLE:
-        print("✗ websockets library not available")
-        print("Install with: pip install websockets")
+        logger.error("websockets library not available - install with: pip install websockets")
         return
 
-    print("🚀 Starting Windows Fingerprint Bridge Service")
-    print("=" * 50)
-    print(f"WebSocket Port: {WEBSOCKET_PORT}")
-    print("Ready for connections...")
-    print("Press Ctrl+C to stop")
-    print()
+    logger.info("Starting Windows Fingerprint Bridge Service")
+    logger.info(f"WebSocket Port: {WEBSOCKET_PORT}")
 
+    # The scanners are opened once the bridge is serving
     bridge = WindowsFingerprintBridge()
+    bridge.boot_from_cache()
     server = None
+    startup = None
 
-    # Setup signal handlers for graceful shutdown
-    def signal_handler(signum, frame):
-        print("\n🛑 Shutdown signal received...")
-        bridge.running = False
-        if server:
-            server.close()
-
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    # The first Ctrl+C/SIGTERM drains in-flight captures, a second one stops at once
+    signals = ShutdownSignals()
+    signals.install(asyncio.get_running_loop())
+    handoff = Handoff(WEBSOCKET_PORT)
 
     try:
-        server = await websockets.serve(
-            bridge.handle_connection,
+        bridge.scheduler.start()
+        # Retries while a previous bridge drains off the port (see bridge_daemon.py)
+        server = await handoff.listen(
+            websockets.serve,
+            bridge.handle_client,
             "localhost",
-            WEBSOCKET_PORT
+            WEBSOCKET_PORT,
+            process_request=http_routes({**metrics_routes(), **health_routes(bridge.health)})
         )
+        bridge.ready = True
 
-        print(f"✓ WebSocket server started on ws://localhost:{WEBSOCKET_PORT}")
+        announce_ready(WEBSOCKET_PORT, "fingerprint_bridge_windows")
+        bridge.startup["listenMs"] = round((time.perf_counter() - BOOT_STARTED) * 1000, 1)
+        logger.info(f"WebSocket server started on ws://localhost:{WEBSOCKET_PORT} "
+                    f"in {bridge.startup['listenMs']:.0f} ms")
+        if bridge.startup["listenMs"] > STARTUP_BUDGET_MS:
+            logger.warning(f"Accepting connections took longer than the {STARTUP_BUDGET_MS:.0f} ms budget")
+        logger.info("Press Ctrl+C to stop")
+        startup = asyncio.create_task(bridge.finish_startup(handoff))
 
         # Keep the server running
-        while bridge.running:
-            await asyncio.sleep(1)
+        await signals.requested.wait()
+        logger.info("Shutdown signal received, draining captures...")
+        drain = asyncio.create_task(drain_bridge(bridge, server))
+        forced = asyncio.create_task(signals.forced.wait())
+        await asyncio.wait({drain, forced}, return_when=asyncio.FIRST_COMPLETED)
+        forced.cancel()
+        if drain.done():
+            logger.info(f"Drained: {drain.result()}")
+        else:
+            logger.warning("Second shutdown signal, stopping without waiting for captures")
+            drain.cancel()
+            await asyncio.gather(drain, return_exceptions=True)
 
     except Exception as e:
-        print(f"✗ Failed to start server: {e}")
+        logger.error(f"Failed to start server: {e}")
         if "10048" in str(e):
-            print("💡 Port 8765 is already in use. Try:")
-            print("   1. Close other bridge services")
-            print("   2. Kill process: netstat -ano | findstr :8765")
-            print("   3. Or change WEBSOCKET_PORT in the script")
+            logger.error(f"Port {WEBSOCKET_PORT} is already in use. Close other bridge services, "
+                         f"find the process with: netstat -ano | findstr :{WEBSOCKET_PORT}, "
+                         "or set FINGERPRINT_BRIDGE_PORT")
     finally:
+        if startup and not startup.done():
+            startup.cancel()
+            await asyncio.gather(startup, return_exceptions=True)
+        await bridge.close()
+        clear_ready(WEBSOCKET_PORT)
         if server:
             server.close()
-            print("✓ Server closed")
+            logger.info("Server closed")
 
 if __name__ == "__main__":
     # Configure logging
     logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 
     # Run the server
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,250 @@
+"""
+Fingerprint Image Quality Gate
+
+Scores the raw 8-bit sensor image of every press with NumPy before the
+template is used, so a poor press is rejected at the scanner with a reason
+("finger not covering the sensor", "too dry", ...) instead of being found
+out after the round trip to ZKBio `bioTemplate/add`.
+
+The image is split into 16x16 pixel blocks and scored on:
+
+    foreground  - fraction of blocks covered by the finger
+    contrast    - ridge/valley contrast in the foreground (0-1)
+    coherence   - ridge-orientation coherence of the gradient field (0-1);
+                  low for smudged, blurred or noisy presses
+    dryness     - fraction of light pixels in the foreground; about 0.5 for
+                  a good press, towards 1 when dry, towards 0 when wet
+
+and a combined 0-100 score that replaces the SDK's constant quality.
+Everything works on (..., height, width) arrays, so a batch of images is
+scored in one pass.
+
+Thresholds are configured per deployment through environment variables:
+
+    FINGERPRINT_QUALITY_GATE            1/0 (default 1 when numpy is installed)
+    FINGERPRINT_QUALITY_MIN_SCORE       default 40
+    FINGERPRINT_QUALITY_MIN_FOREGROUND  default 0.25
+    FINGERPRINT_QUALITY_MIN_CONTRAST    default 0.25
+    FINGERPRINT_QUALITY_MIN_COHERENCE   default 0.35
+    FINGERPRINT_QUALITY_MAX_DRYNESS     default 0.80
+    FINGERPRINT_QUALITY_MIN_DRYNESS     default 0.20
+    FINGERPRINT_IMAGE_SIZE              WIDTHxHEIGHT of raw images, default 300x400
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from lazy_imports import lazy_module
+
+# Loaded on first use, so importing the bridge doesn't wait for numpy
+np = lazy_module('numpy')
+NUMPY_AVAILABLE = np is not None
+
+# Configuration
+BLOCK_SIZE = 16
+IMAGE_WIDTH = 300
+IMAGE_HEIGHT = 400
+FOREGROUND_STD = 12.0       # block std (grey levels) that counts as ridge texture
+BACKGROUND_LEVEL = 220.0    # blocks darker than this are covered by the finger
+FULL_CONTRAST_STD = 60.0    # block std treated as full contrast
+RIDGE_LEVEL = 128           # pixels darker than this are ridge
+
+SYNTHETIC_KINDS = ("good", "low_contrast", "dry", "wet", "partial", "smudged")
+
+
+class PoorQualityError(Exception):
+    """A press failed the quality gate; carries the reason and its metrics"""
+
+    def __init__(self, reason: str, message: str, metrics: Dict[str, float]):
+        super().__init__(message)
+        self.reason = reason
+        self.metrics = metrics
+
+
+def assess_images(images: "np.ndarray") -> Dict[str, "np.ndarray"]:
+    """Score a (..., height, width) uint8 array; every metric has shape (...)"""
+    images = np.asarray(images, dtype=np.float32)
+    height = images.shape[-2] // BLOCK_SIZE * BLOCK_SIZE
+    width = images.shape[-1] // BLOCK_SIZE * BLOCK_SIZE
+    images = images[..., :height, :width]
+    lead = images.shape[:-2]
+    block_shape = lead + (height // BLOCK_SIZE, BLOCK_SIZE, width // BLOCK_SIZE, BLOCK_SIZE)
+    block_axes = (-3, -1)
+
+    def block_mean(values):
+        return values.reshape(block_shape).mean(axis=block_axes)
+
+    # Variance from running sums: one pass fewer than ndarray.std
+    mean = block_mean(images)
+    block_std = np.sqrt(np.maximum(block_mean(images * images) - mean * mean, 0.0))
+    foreground_blocks = (block_std > FOREGROUND_STD) | (mean < BACKGROUND_LEVEL)
+    block_count = np.maximum(foreground_blocks.sum(axis=(-2, -1)), 1)
+
+    def foreground_mean(values):
+        return (values * foreground_blocks).sum(axis=(-2, -1)) / block_count
+
+    foreground = foreground_blocks.mean(axis=(-2, -1))
+    contrast = np.minimum(foreground_mean(block_std) / FULL_CONTRAST_STD, 1.0)
+    dryness = 1.0 - foreground_mean(block_mean(images < RIDGE_LEVEL))
+
+    # Orientation coherence from the structure tensor of each block
+    gy, gx = np.gradient(images, axis=(-2, -1))
+    gxx = block_mean(gx * gx)
+    gyy = block_mean(gy * gy)
+    gxy = block_mean(gx * gy)
+    block_coherence = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / np.maximum(gxx + gyy, 1e-6)
+    coherence = foreground_mean(block_coherence)
+
+    no_finger = foreground == 0
+    coherence = np.where(no_finger, 0.0, coherence)
+    dryness = np.where(no_finger, 1.0, dryness)
+
+    score = 100 * (0.3 * contrast + 0.4 * coherence + 0.2 * np.minimum(foreground / 0.6, 1.0)
+                   + 0.1 * (1 - 2 * np.abs(dryness - 0.5)))
+    return {
+        "score": np.clip(np.rint(score), 0, 100),
+        "foreground": foreground,
+        "contrast": contrast,
+        "coherence": coherence,
+        "dryness": dryness,
+    }
+
+
+def assess_image(image: bytes, width: int = IMAGE_WIDTH, height: int = IMAGE_HEIGHT) -> Dict[str, float]:
+    """Score one raw 8-bit image"""
+    pixels = np.frombuffer(image, dtype=np.uint8)
+    if pixels.size != width * height:
+        raise ValueError(f"Image of {pixels.size} bytes is not {width}x{height}")
+    metrics = assess_images(pixels.reshape(height, width))
+    return {name: round(float(value), 3) for name, value in metrics.items()}
+
+
+class QualityGate:
+    """Deployment thresholds applied to each capture's raw image"""
+
+    def __init__(self, min_score: float = 40, min_foreground: float = 0.25,
+                 min_contrast: float = 0.25, min_coherence: float = 0.35,
+                 max_dryness: float = 0.80, min_dryness: float = 0.20,
+                 width: int = IMAGE_WIDTH, height: int = IMAGE_HEIGHT):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy not available - install with: pip install numpy")
+        self.min_score = min_score
+        self.min_foreground = min_foreground
+        self.min_contrast = min_contrast
+        self.min_coherence = min_coherence
+        self.max_dryness = max_dryness
+        self.min_dryness = min_dryness
+        self.width = width
+        self.height = height
+        # Captures run on several device threads
+        self.lock = threading.Lock()
+        self.assessed = 0
+        self.rejected: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional["QualityGate"]:
+        """The configured gate, or None when disabled or numpy is missing"""
+        if not NUMPY_AVAILABLE or os.environ.get('FINGERPRINT_QUALITY_GATE', '1') == '0':
+            return None
+        width, _, height = os.environ.get('FINGERPRINT_IMAGE_SIZE', f"{IMAGE_WIDTH}x{IMAGE_HEIGHT}").partition('x')
+
+        def threshold(name: str, default: float) -> float:
+            return float(os.environ.get(f'FINGERPRINT_QUALITY_{name}', default))
+
+        return cls(
+            min_score=threshold('MIN_SCORE', 40),
+            min_foreground=threshold('MIN_FOREGROUND', 0.25),
+            min_contrast=threshold('MIN_CONTRAST', 0.25),
+            min_coherence=threshold('MIN_COHERENCE', 0.35),
+            max_dryness=threshold('MAX_DRYNESS', 0.80),
+            min_dryness=threshold('MIN_DRYNESS', 0.20),
+            width=int(width),
+            height=int(height)
+        )
+
+    def rejection(self, metrics: Dict[str, float]) -> Optional[tuple]:
+        """(reason, message) for the first failed threshold, or None"""
+        checks = (
+            ("low_foreground", metrics["foreground"] < self.min_foreground,
+             f"finger not covering the sensor (foreground {metrics['foreground']} < {self.min_foreground})"),
+            ("low_contrast", metrics["contrast"] < self.min_contrast,
+             f"ridges too faint (contrast {metrics['contrast']} < {self.min_contrast})"),
+            ("too_dry", metrics["dryness"] > self.max_dryness,
+             f"finger too dry (dryness {metrics['dryness']} > {self.max_dryness})"),
+            ("too_wet", metrics["dryness"] < self.min_dryness,
+             f"finger too wet or pressed too hard (dryness {metrics['dryness']} < {self.min_dryness})"),
+            ("low_coherence", metrics["coherence"] < self.min_coherence,
+             f"ridges smudged or moving (coherence {metrics['coherence']} < {self.min_coherence})"),
+            ("low_quality", metrics["score"] < self.min_score,
+             f"quality {metrics['score']:.0f} below {self.min_score:.0f}"),
+        )
+        for reason, failed, message in checks:
+            if failed:
+                return reason, f"Press rejected: {message}"
+        return None
+
+    def check(self, capture: Dict[str, Any]) -> Dict[str, Any]:
+        """Score a capture's image; raise PoorQualityError for a poor press
+
+        Captures without a (correctly sized) image pass through unchanged.
+        """
+        image = capture.get("image")
+        width = capture.get("width", self.width)
+        height = capture.get("height", self.height)
+        if not image or len(image) != width * height:
+            return capture
+
+        metrics = assess_image(image, width, height)
+        rejection = self.rejection(metrics)
+        with self.lock:
+            self.assessed += 1
+            if rejection:
+                self.rejected[rejection[0]] = self.rejected.get(rejection[0], 0) + 1
+        if rejection:
+            raise PoorQualityError(rejection[0], rejection[1], metrics)
+        return {**capture, "quality": int(metrics["score"]), "metrics": metrics}
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "assessed": self.assessed,
+                "rejected": sum(self.rejected.values()),
+                "rejected_by_reason": dict(self.rejected),
+            }
+
+
+def synthetic_image(kind: str = "good", width: int = IMAGE_WIDTH, height: int = IMAGE_HEIGHT,
+                    rng: Optional["np.random.Generator"] = None) -> "np.ndarray":
+    """A synthetic ridge pattern for the simulated backend and benchmarks
+
+    kind is one of SYNTHETIC_KINDS.
+    """
+    rng = rng or np.random.default_rng()
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx, cy = width * rng.uniform(0.45, 0.55), height * rng.uniform(0.4, 0.5)
+    rx, ry = width * 0.42, height * 0.45
+    if kind == "partial":
+        cx, cy, rx, ry = width * 0.05, height * 0.05, width * 0.3, height * 0.25
+
+    # Loop-shaped ridges with a period of ~9 pixels
+    radius = np.hypot((x - cx) / 1.0, (y - cy) / 1.3)
+    ridges = np.sin(2 * np.pi * radius / rng.uniform(8.5, 9.5) + rng.uniform(0, 2 * np.pi))
+
+    amplitude, level, noise = 100.0, 128.0, 8.0
+    if kind == "low_contrast":
+        amplitude, noise = 6.0, 3.0
+    elif kind == "dry":
+        # Broken, thin ridges on a light finger
+        ridges = np.where(ridges > 0.7, -1.0, 1.0) * np.where(rng.random(ridges.shape) < 0.5, 1.0, 0.3)
+        level = 190.0
+        amplitude = 60.0
+    elif kind == "wet":
+        level, amplitude = 55.0, 45.0
+    elif kind == "smudged":
+        amplitude, noise = 20.0, 45.0
+
+    finger = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1.0
+    pixels = level + amplitude * ridges + rng.normal(0, noise, ridges.shape)
+    image = np.where(finger, pixels, 255.0 - np.abs(rng.normal(0, 2, ridges.shape)))
+    return np.clip(image, 0, 255).astype(np.uint8)
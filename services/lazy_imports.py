@@ -0,0 +1,63 @@
+"""
+Lazy Imports
+
+Importing the bridge used to import numpy (about 75 ms) and the ZKFinger SDK
+wrapper (hundreds of milliseconds, more on Windows where pyzkfp loads the
+SDK's .NET assembly) before the WebSocket server could accept a connection.
+lazy_module() finds an optional dependency without executing it; the module
+is imported on first attribute access, i.e. when the feature is first used:
+
+    np = lazy_module('numpy')        # None when numpy is not installed
+    NUMPY_AVAILABLE = np is not None
+
+The first access can come from two threads at once (the index loader and a
+device thread scoring an image), so it goes through the regular import
+system under a lock. importlib.util.LazyLoader is not thread-safe before
+Python 3.12.
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+def is_installed(name: str) -> bool:
+    """Whether a module can be imported, without importing it"""
+    if name in sys.modules:
+        return sys.modules[name] is not None
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def lazy_module(name: str) -> Optional[ModuleType]:
+    """The named module, loaded on first use, or None when it is not installed"""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.loader is None:
+        return None
+    return _LazyModule(name)
+
+
+class _LazyModule(ModuleType):
+    """Stands in for a module until an attribute is first read"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only reached for attributes not copied in yet
+        with self.__dict__["_lazy_lock"]:
+            module = importlib.import_module(self.__name__)
+            # Later reads are plain attribute lookups
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
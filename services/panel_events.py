@@ -0,0 +1,248 @@
+"""
+Live Panel Events
+
+Pushes door and attendance events from the network panels to WebSocket
+subscribers as they happen, instead of the UI polling ZKBio transactions:
+
+    PanelEventStream  - one dedicated pyzk session per panel in live-capture
+                        mode (CMD_REG_EVENT), read on its own thread
+    EventHub          - hands each event to every subscription whose filters
+                        match it
+    Subscription      - one subscriber's bounded event queue
+
+Publishing never waits on a subscriber. Each subscription holds at most
+FINGERPRINT_EVENT_QUEUE events (per subscription, "queueSize" in the
+request); when it is full the oldest event is dropped and counted, so a slow
+dashboard misses old events instead of backing up the panel streams or the
+other subscribers. Events carry a hub-wide "seq", so a subscriber can tell
+where it lost some.
+
+Filters (each optional, a value or a list; every given filter must match):
+
+    door       - door name (the panel's "door" setting, else its name)
+    device     - panel name or serial number
+    pinPrefix  - start of the person's PIN
+
+The live session is opened in addition to the pool's sessions (it is
+occupied for as long as the stream runs) and is reconnected with the pool's
+jittered backoff when it drops.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from attendance_ingest import PUNCH_STATES, TIME_FORMAT, VERIFY_MODES
+from bridge_metrics import EVENT_DROPS, PANEL_EVENTS
+from panel_pool import PANEL_TIMEOUT, PanelConfig, PanelSession, backoff_delay
+
+# Configuration
+EVENT_QUEUE_SIZE = int(os.environ.get('FINGERPRINT_EVENT_QUEUE', 256))
+MAX_EVENT_QUEUE_SIZE = 10000
+LIVE_POLL_INTERVAL = 1.0     # live-capture read timeout; bounds how long stop() waits
+FILTER_KEYS = ('door', 'device', 'pinPrefix')
+
+
+def _values(value: Any) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return tuple(str(v) for v in value)
+    return (str(value),)
+
+
+class Subscription:
+    """A subscriber's filters and bounded, drop-oldest event queue"""
+
+    def __init__(self, subscription_id: str, client_id: Any, filters: Optional[Dict[str, Any]] = None,
+                 maxsize: int = EVENT_QUEUE_SIZE):
+        filters = filters or {}
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown event filter: {', '.join(sorted(unknown))}")
+        self.subscription_id = subscription_id
+        self.client_id = client_id
+        self.doors = _values(filters.get('door'))
+        self.devices = _values(filters.get('device'))
+        self.pin_prefixes = _values(filters.get('pinPrefix'))
+        self.filters = {key: filters[key] for key in FILTER_KEYS if filters.get(key) is not None}
+        self.queue: deque = deque(maxlen=max(1, min(MAX_EVENT_QUEUE_SIZE, maxsize)))
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.doors is not None and event.get("doorName") not in self.doors:
+            return False
+        if self.devices is not None and event.get("panel") not in self.devices \
+                and event.get("deviceSn") not in self.devices:
+            return False
+        if self.pin_prefixes is not None and not str(event.get("personPin") or '').startswith(self.pin_prefixes):
+            return False
+        return True
+
+    def put(self, event: Dict[str, Any]) -> None:
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            EVENT_DROPS.inc()
+        self.queue.append(event)
+        self.ready.set()
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """The next event, or None once the subscription is closed"""
+        while not self.queue:
+            if self.closed:
+                return None
+            self.ready.clear()
+            await self.ready.wait()
+        self.delivered += 1
+        return self.queue.popleft()
+
+    def close(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        self.ready.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscription": self.subscription_id,
+            "filters": self.filters,
+            "queued": len(self.queue),
+            "queueSize": self.queue.maxlen,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class EventHub:
+    """Fans events out to subscriptions; publish() never blocks"""
+
+    def __init__(self):
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.next_id = 1
+        self.seq = 0
+        self.published = 0
+
+    def subscribe(self, client_id: Any, filters: Optional[Dict[str, Any]] = None,
+                  maxsize: int = EVENT_QUEUE_SIZE) -> Subscription:
+        """A new subscription; raises ValueError for an unknown filter"""
+        subscription = Subscription(f"sub-{self.next_id}", client_id, filters, maxsize)
+        self.next_id += 1
+        self.subscriptions[subscription.subscription_id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription_id: str, client_id: Any = None) -> bool:
+        subscription = self.subscriptions.get(subscription_id)
+        if subscription is None or (client_id is not None and subscription.client_id != client_id):
+            return False
+        del self.subscriptions[subscription_id]
+        subscription.close()
+        return True
+
+    def unsubscribe_client(self, client_id: Any) -> int:
+        ids = [sid for sid, subscription in self.subscriptions.items() if subscription.client_id == client_id]
+        for subscription_id in ids:
+            self.unsubscribe(subscription_id)
+        return len(ids)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self.seq += 1
+        self.published += 1
+        event = {**event, "seq": self.seq}
+        for subscription in self.subscriptions.values():
+            if subscription.matches(event):
+                subscription.put(event)
+
+    def __len__(self) -> int:
+        return len(self.subscriptions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscriptions),
+            "published": self.published,
+            "subscriptions": [subscription.stats() for subscription in self.subscriptions.values()],
+        }
+
+
+def live_event(config: PanelConfig, serial: Optional[str], record) -> Dict[str, Any]:
+    """A pyzk live-capture Attendance as an event (the same fields as a transaction)"""
+    return {
+        "panel": config.name,
+        "deviceSn": serial,
+        "doorName": config.door or config.name,
+        "personPin": record.user_id,
+        "eventTime": record.timestamp.strftime(TIME_FORMAT),
+        "verifyModeName": VERIFY_MODES.get(record.status, str(record.status)),
+        "eventName": PUNCH_STATES.get(record.punch, str(record.punch)),
+    }
+
+
+class PanelEventStream:
+    """Live capture from every panel, each on its own session and thread"""
+
+    def __init__(self, configs: Iterable[PanelConfig], hub: EventHub, timeout: float = PANEL_TIMEOUT,
+                 seed: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.configs = list(configs)
+        self.hub = hub
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.stopping = threading.Event()
+        self.threads: List[threading.Thread] = []
+        self.connected: Dict[str, bool] = {config.name: False for config in self.configs}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        for config in self.configs:
+            thread = threading.Thread(target=self._stream, args=(config, random.Random(self.rng.random())),
+                                      name=f"zk-live-{config.name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _stream(self, config: PanelConfig, rng: random.Random) -> None:
+        # Runs on the panel's live thread
+        failures = 0
+        while not self.stopping.is_set():
+            session = PanelSession(config, self.timeout)
+            try:
+                session.open()
+                serial = session.conn.get_serialnumber()
+                self.connected[config.name] = True
+                if failures:
+                    self.logger.info(f"Live events from panel {config.name} resumed")
+                failures = 0
+                for record in session.conn.live_capture(new_timeout=LIVE_POLL_INTERVAL):
+                    if self.stopping.is_set():
+                        # Lets pyzk unregister the events before the session closes
+                        session.conn.end_live_capture = True
+                    if record is None:
+                        continue
+                    PANEL_EVENTS.inc(config.name)
+                    self.loop.call_soon_threadsafe(self.hub.publish, live_event(config, serial, record))
+            except Exception as e:
+                failures += 1
+                delay = backoff_delay(failures, rng)
+                self.logger.warning(f"Live events from panel {config.name} lost ({e}); "
+                                    f"reconnecting in {delay:.1f}s")
+                self.stopping.wait(delay)
+            finally:
+                self.connected[config.name] = False
+                session.close()
+
+    async def close(self) -> None:
+        self.stopping.set()
+        for thread in self.threads:
+            await asyncio.to_thread(thread.join, LIVE_POLL_INTERVAL + self.timeout)
+        self.threads.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "panels": len(self.configs),
+            "streaming": sum(1 for connected in self.connected.values() if connected),
+        }
@@ -0,0 +1,399 @@
+"""
+Network Panel Pool
+
+Pooled pyzk connections to the branch's network-attached ZKTeco panels
+(iClock terminals, access controllers). Connecting to a panel costs a TCP
+handshake plus the ZK CMD_CONNECT exchange; instead of a connect/disconnect
+per operation, sessions are opened once and reused:
+
+    PanelConfig  - one configured panel (name, host, port, comm key)
+    Panel        - a panel's open sessions, at most `sessions` at once, and
+                   its reconnect backoff
+    PanelPool    - every configured panel, kept alive, with concurrent fan-out
+
+pyzk calls block, so they run on a shared thread pool and the asyncio loop
+only awaits them. A pyzk session is a single command stream, so each
+session serves one caller at a time and a panel runs at most `sessions`
+operations concurrently (most firmware only accepts a few connections).
+
+Idle sessions are pinged (CMD_GET_TIME) every FINGERPRINT_PANEL_KEEPALIVE
+seconds so NAT and the panel's own idle timeout don't drop them. A session
+that fails with a network error is discarded; the panel is then reconnected
+in the background with exponential backoff and full jitter, so dozens of
+panels coming back after a switch reboot don't all reconnect in the same
+instant. Until the backoff elapses, operations on the panel fail fast with
+PanelUnavailableError.
+
+Panels are configured with FINGERPRINT_PANELS, either the path of a JSON
+file (a list of {"name", "host", "port", "password", "sessions", "door"}) or a
+comma-separated list of name=host[:port] entries:
+
+    FINGERPRINT_PANELS="lobby=192.168.1.201,store=192.168.1.202:4370"
+
+scripts/fake_zk_panel.py serves the ZK protocol locally for testing.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from bridge_metrics import PANEL_SECONDS
+
+try:
+    from zk import ZK
+    from zk.exception import ZKNetworkError
+    PYZK_AVAILABLE = True
+except ImportError:
+    PYZK_AVAILABLE = False
+
+    class ZKNetworkError(Exception):
+        pass
+
+# Configuration
+DEFAULT_PANEL_PORT = 4370
+PANEL_TIMEOUT = float(os.environ.get('FINGERPRINT_PANEL_TIMEOUT', 5))
+PANEL_SESSIONS = int(os.environ.get('FINGERPRINT_PANEL_SESSIONS', 1))
+KEEPALIVE_INTERVAL = float(os.environ.get('FINGERPRINT_PANEL_KEEPALIVE', 30))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+MAX_PANEL_THREADS = 64
+
+
+class PanelUnavailableError(Exception):
+    """The panel is unreachable and its reconnect backoff has not elapsed"""
+
+
+class PanelConfig:
+    """Connection settings for one network panel"""
+
+    def __init__(self, name: str, host: str, port: int = DEFAULT_PANEL_PORT,
+                 password: int = 0, sessions: int = PANEL_SESSIONS, door: Optional[str] = None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.password = password
+        self.sessions = max(1, sessions)
+        self.door = door
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PanelConfig":
+        return cls(
+            name=str(data.get('name') or data['host']),
+            host=data['host'],
+            port=int(data.get('port', DEFAULT_PANEL_PORT)),
+            password=int(data.get('password', 0)),
+            sessions=int(data.get('sessions', PANEL_SESSIONS)),
+            door=data.get('door')
+        )
+
+
+def load_panels(spec: Optional[str]) -> List[PanelConfig]:
+    """Parse FINGERPRINT_PANELS: a JSON file path or name=host[:port],..."""
+    if not spec:
+        return []
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            return [PanelConfig.from_dict(entry) for entry in json.load(f)]
+
+    panels = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, address = entry.rpartition('=')
+        host, _, port = address.partition(':')
+        panels.append(PanelConfig(name or address, host, int(port or DEFAULT_PANEL_PORT)))
+    return panels
+
+
+def backoff_delay(failures: int, rng: random.Random,
+                  base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter, after `failures` consecutive failures"""
+    return rng.uniform(0, min(cap, base * 2 ** max(0, failures - 1)))
+
+
+def ping(conn) -> Any:
+    """Cheapest round trip a panel answers; used as the keep-alive"""
+    return conn.get_time()
+
+
+def panel_info(conn) -> Dict[str, Any]:
+    """Firmware, identity and storage usage of a panel"""
+    conn.read_sizes()
+    return {
+        "firmware": conn.get_firmware_version(),
+        "serial": conn.get_serialnumber(),
+        "platform": conn.get_platform(),
+        "device_name": conn.get_device_name(),
+        "time": conn.get_time().isoformat(),
+        "users": conn.users,
+        "fingers": conn.fingers,
+        "records": conn.records,
+        "users_cap": conn.users_cap,
+        "fingers_cap": conn.fingers_cap,
+        "records_cap": conn.rec_cap,
+    }
+
+
+class PanelSession:
+    """One connected pyzk session; blocking, used by one caller at a time"""
+
+    def __init__(self, config: PanelConfig, timeout: float):
+        self.zk = ZK(config.host, port=config.port, timeout=timeout,
+                     password=config.password, ommit_ping=True)
+        self.conn = None
+        self.last_used = time.monotonic()
+
+    def open(self) -> "PanelSession":
+        self.conn = self.zk.connect()
+        return self
+
+    def close(self) -> None:
+        try:
+            if self.conn is not None:
+                self.conn.disconnect()
+        except Exception:
+            pass
+        self.conn = None
+
+
+class Panel:
+    """A panel's sessions, concurrency cap and reconnect state"""
+
+    def __init__(self, config: PanelConfig, executor: ThreadPoolExecutor,
+                 timeout: float = PANEL_TIMEOUT, rng: Optional[random.Random] = None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.executor = executor
+        self.timeout = timeout
+        self.rng = rng or random.Random()
+        self.slots = asyncio.Semaphore(config.sessions)
+        self.idle: List[PanelSession] = []
+        self.in_use = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.connected_at: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.idle or self.in_use) and not self.failures
+
+    async def run(self, fn: Callable, *args, op: Optional[str] = None) -> Any:
+        """Run fn(conn, *args) on one of the panel's sessions"""
+        await self.slots.acquire()
+        try:
+            session = await self._acquire()
+        except BaseException:
+            self.slots.release()
+            raise
+
+        loop = asyncio.get_running_loop()
+        self.in_use += 1
+        future = loop.run_in_executor(self.executor, self._call, session, fn, args,
+                                      op or getattr(fn, '__name__', 'call'))
+        try:
+            # Shielded: a cancelled caller can't interrupt the pyzk call
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The session is mid-command; retire it (and keep its slot) until it returns
+            future.add_done_callback(lambda _: self._retire(session))
+            raise
+        except (ZKNetworkError, OSError) as e:
+            self._retire(session)
+            self._failed(e)
+            raise PanelUnavailableError(f"Panel {self.name} connection lost: {e}") from e
+        except BaseException:
+            self._release(session)
+            raise
+        self._release(session)
+        return result
+
+    def _call(self, session: PanelSession, fn: Callable, args: tuple, op: str) -> Any:
+        # Runs on a panel thread
+        with PANEL_SECONDS.time(op):
+            return fn(session.conn, *args)
+
+    async def _acquire(self) -> PanelSession:
+        if self.idle:
+            return self.idle.pop()
+
+        wait = self.retry_at - time.monotonic()
+        if wait > 0:
+            raise PanelUnavailableError(
+                f"Panel {self.name} unreachable ({self.last_error}), retrying in {wait:.1f}s")
+
+        session = PanelSession(self.config, self.timeout)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, session.open)
+        try:
+            with PANEL_SECONDS.time("connect"):
+                await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda _: self.executor.submit(session.close))
+            raise
+        except Exception as e:
+            self._failed(e)
+            raise PanelUnavailableError(f"Panel {self.name} unreachable: {e}") from e
+
+        if self.failures or self.connected_at is None:
+            self.logger.info(f"Connected to panel {self.name} ({self.config.host}:{self.config.port})")
+        self.failures = 0
+        self.last_error = None
+        self.connected_at = time.time()
+        return session
+
+    def _release(self, session: PanelSession) -> None:
+        self.in_use -= 1
+        session.last_used = time.monotonic()
+        self.idle.append(session)
+        self.slots.release()
+
+    def _retire(self, session: PanelSession) -> None:
+        self.in_use -= 1
+        self.executor.submit(session.close)
+        self.slots.release()
+
+    def _failed(self, error: Exception) -> None:
+        self.failures += 1
+        delay = backoff_delay(self.failures, self.rng)
+        self.retry_at = time.monotonic() + delay
+        self.last_error = str(error) or type(error).__name__
+        self.logger.warning(f"Panel {self.name} failed ({self.last_error}); "
+                            f"reconnecting in {delay:.1f}s")
+
+    async def keepalive(self, interval: float) -> None:
+        """Ping a stale idle session, or reconnect once the backoff has elapsed"""
+        now = time.monotonic()
+        if self.in_use:
+            return
+        if self.idle and now - min(session.last_used for session in self.idle) < interval:
+            return
+        if not self.idle and now < self.retry_at:
+            return
+        try:
+            await self.run(ping, op="keepalive")
+        except PanelUnavailableError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"Panel {self.name} keep-alive failed: {e}")
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        sessions, self.idle = self.idle, []
+        await asyncio.gather(*(loop.run_in_executor(self.executor, session.close)
+                               for session in sessions), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = self.retry_at - time.monotonic()
+        return {
+            "name": self.name,
+            "host": self.config.host,
+            "port": self.config.port,
+            "connected": self.connected,
+            "sessions": len(self.idle) + self.in_use,
+            "in_use": self.in_use,
+            "max_sessions": self.config.sessions,
+            "failures": self.failures,
+            "retry_in": round(retry_in, 1) if self.failures and retry_in > 0 else 0,
+            "last_error": self.last_error,
+        }
+
+
+class PanelPool:
+    """Every configured panel, kept connected, with concurrent fan-out"""
+
+    def __init__(self, configs: Iterable[PanelConfig], timeout: float = PANEL_TIMEOUT,
+                 keepalive_interval: float = KEEPALIVE_INTERVAL, seed: Optional[int] = None):
+        if not PYZK_AVAILABLE:
+            raise RuntimeError("pyzk not available - install with: pip install pyzk==0.9")
+        self.logger = logging.getLogger(__name__)
+        configs = list(configs)
+        self.keepalive_interval = keepalive_interval
+        threads = min(MAX_PANEL_THREADS, max(1, sum(config.sessions for config in configs)))
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="zk-panel")
+        rng = random.Random(seed)
+        self.panels: Dict[str, Panel] = {
+            config.name: Panel(config, self.executor, timeout, random.Random(rng.random()))
+            for config in configs
+        }
+        self.keepalive_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Connect every panel in the background and keep the sessions alive"""
+        if self.keepalive_task is None:
+            self.keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self) -> None:
+        # Tick often enough to honour short reconnect backoffs
+        tick = min(1.0, self.keepalive_interval)
+        while True:
+            await asyncio.gather(*(panel.keepalive(self.keepalive_interval)
+                                   for panel in self.panels.values()))
+            await asyncio.sleep(tick)
+
+    async def close(self) -> None:
+        if self.keepalive_task:
+            self.keepalive_task.cancel()
+            await asyncio.gather(self.keepalive_task, return_exceptions=True)
+            self.keepalive_task = None
+        await asyncio.gather(*(panel.close() for panel in self.panels.values()))
+        self.executor.shutdown(wait=False)
+
+    def get(self, name: str) -> Panel:
+        """The named panel; raises KeyError for an unknown name"""
+        if name not in self.panels:
+            raise KeyError(f"Unknown panel: {name}")
+        return self.panels[name]
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.panels)
+
+    def __len__(self) -> int:
+        return len(self.panels)
+
+    async def run(self, name: str, fn: Callable, *args, op: Optional[str] = None) -> Any:
+        return await self.get(name).run(fn, *args, op=op)
+
+    async def fan_out(self, fn: Callable, *args, panels: Optional[Iterable[str]] = None,
+                      timeout: Optional[float] = None, op: Optional[str] = None) -> Dict[str, Any]:
+        """Run fn(conn, *args) on every (or the named) panel concurrently
+
+        Returns {panel name: result}, with a failed panel's exception as its
+        result, so one unreachable panel doesn't fail the whole operation.
+        """
+        targets = [self.get(name) for name in panels] if panels is not None else list(self.panels.values())
+
+        async def run_one(panel: Panel) -> Any:
+            return await asyncio.wait_for(panel.run(fn, *args, op=op), timeout)
+
+        results = await asyncio.gather(*(run_one(panel) for panel in targets), return_exceptions=True)
+        return {panel.name: result for panel, result in zip(targets, results)}
+
+    def stats(self) -> Dict[str, Any]:
+        panels = [panel.stats() for panel in self.panels.values()]
+        return {
+            "configured": len(panels),
+            "connected": sum(1 for panel in panels if panel["connected"]),
+            "panels": panels,
+        }
+
+
+def fan_out_reply(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-panel results for a WebSocket reply, with errors as messages"""
+    reply = {}
+    for name, result in results.items():
+        if isinstance(result, asyncio.TimeoutError):
+            reply[name] = {"status": "error", "message": "Panel timed out"}
+        elif isinstance(result, BaseException):
+            reply[name] = {"status": "error", "message": str(result)}
+        else:
+            reply[name] = {"status": "success", **(result if isinstance(result, dict) else {"result": result})}
+    return reply
@@ -0,0 +1,380 @@
+"""
+Differential Template Push
+
+Pushes a roster of users and fingerprint templates to the network panels,
+sending each panel only what it doesn't already hold:
+
+    1. read   - download the panel's users and templates (two buffered reads)
+    2. diff   - hash each user's fields and templates on both sides; users
+                whose hash differs are pushed, fingers the roster no longer
+                has are deleted, and with `prune` so are panel users missing
+                from the roster
+    3. push   - changed users go up FINGERPRINT_PANEL_SYNC_BATCH at a time,
+                one buffered upload (CMD_PREPARE_DATA, CMD_DATA chunks, then
+                CMD_SAVE_USERTEMPS) per batch instead of one per user, with
+                the panel disabled while it writes
+
+Every panel syncs concurrently through the panel pool (panel_pool.py), and
+progress is kept per panel (state, users to push, pushed, deleted, batches).
+
+The roster is a JSON list of users:
+
+    [{"pin": "1001", "name": "Jane", "privilege": 0, "password": "",
+      "card": 0, "groupId": "", "templates": [{"fingerIndex": 0, "template": "base64..."}]}]
+
+Flat template-index entries ({"pin", "fingerIndex", "template"}, as loaded
+by template_index.py) are accepted too and grouped by pin.
+
+A job's roster path, panels and progress are saved to
+FINGERPRINT_PANEL_SYNC_STATE (default panel_sync_state.json in the project
+root, wherever the bridge was started from) after every batch. A bridge restarted
+mid-sync resumes the job for the panels that hadn't finished; since every
+run diffs against what the panel holds, batches that landed before the
+interruption are not pushed again.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from panel_pool import PYZK_AVAILABLE, PanelPool
+
+if PYZK_AVAILABLE:
+    from zk.exception import ZKErrorResponse
+    from zk.finger import Finger
+    from zk.user import User
+
+# Configuration
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYNC_BATCH_SIZE = int(os.environ.get('FINGERPRINT_PANEL_SYNC_BATCH', 50))
+SYNC_STATE_PATH = os.environ.get('FINGERPRINT_PANEL_SYNC_STATE', os.path.join(ROOT, 'panel_sync_state.json'))
+CMD_SAVE_USERTEMPS = 110
+MAX_UID = 65535
+
+# ZK8 user record field sizes; the panel truncates longer values
+NAME_SIZE = 24
+PASSWORD_SIZE = 8
+GROUP_SIZE = 7
+USER_ID_SIZE = 24
+
+
+def _fit(value: Any, size: int) -> str:
+    return str(value or '').encode()[:size].decode(errors='ignore')
+
+
+class RosterUser:
+    """A user as the panels should hold them"""
+
+    def __init__(self, pin: str):
+        self.pin = _fit(pin, USER_ID_SIZE)
+        self.name = ''
+        self.privilege = 0
+        self.password = ''
+        self.card = 0
+        self.group_id = ''
+        self.templates: Dict[int, bytes] = {}
+
+    def update(self, entry: Dict[str, Any]) -> None:
+        if 'name' in entry:
+            self.name = _fit(entry['name'], NAME_SIZE)
+        if 'privilege' in entry:
+            self.privilege = int(entry['privilege'])
+        if 'password' in entry:
+            self.password = _fit(entry['password'], PASSWORD_SIZE)
+        if 'card' in entry:
+            self.card = int(entry['card'] or 0)
+        if 'groupId' in entry:
+            self.group_id = _fit(entry['groupId'], GROUP_SIZE)
+        templates = entry.get('templates', [entry] if 'template' in entry else [])
+        for template in templates:
+            self.templates[int(template.get('fingerIndex', 0))] = base64.b64decode(template['template'])
+
+    @property
+    def digest(self) -> str:
+        # pyzk reads a nameless user back as "NN-<pin>"
+        return user_digest(self.pin, self.name or f"NN-{self.pin}", self.privilege, self.password,
+                           self.card, self.group_id, self.templates)
+
+
+def user_digest(pin: str, name: str, privilege: int, password: str, card: int, group_id: str,
+                templates: Dict[int, bytes]) -> str:
+    """Content hash of everything a panel stores for a user"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([pin, name, privilege, password, card, group_id]).encode())
+    for fid in sorted(templates):
+        h.update(struct.pack('<BI', fid, len(templates[fid])))
+        h.update(templates[fid])
+    return h.hexdigest()
+
+
+def load_roster(path: str) -> Dict[str, RosterUser]:
+    """{pin: RosterUser} from a roster or template-index JSON file"""
+    with open(path) as f:
+        entries = json.load(f)
+    roster: Dict[str, RosterUser] = {}
+    for entry in entries:
+        pin = str(entry['pin'])
+        if pin not in roster:
+            roster[pin] = RosterUser(pin)
+        roster[pin].update(entry)
+    return roster
+
+
+def read_panel(conn) -> Tuple[list, list]:
+    """The panel's users and templates (runs on a panel thread)"""
+    return conn.get_users(), conn.get_templates()
+
+
+def diff_panel(roster: Dict[str, RosterUser], users: list, templates: list,
+               prune: bool = False) -> Dict[str, Any]:
+    """What to push to and delete from a panel holding `users` and `templates`"""
+    fingers: Dict[int, Dict[int, bytes]] = {}
+    for finger in templates:
+        fingers.setdefault(finger.uid, {})[finger.fid] = finger.template
+    held = {user.user_id: user for user in users}
+    used_uids = {user.uid for user in users}
+    next_uid = 1
+
+    push, delete_fingers, unchanged = [], [], 0
+    for pin, wanted in roster.items():
+        user = held.get(pin)
+        if user is not None:
+            have = fingers.get(user.uid, {})
+            if user_digest(user.user_id, user.name, user.privilege, user.password, int(user.card or 0),
+                           user.group_id, have) == wanted.digest:
+                unchanged += 1
+                continue
+            uid = user.uid
+            delete_fingers.extend((uid, fid) for fid in have if fid not in wanted.templates)
+        else:
+            while next_uid in used_uids:
+                next_uid += 1
+            if next_uid > MAX_UID:
+                raise ValueError("Panel has no free user slots")
+            uid = next_uid
+            used_uids.add(uid)
+        push.append((uid, wanted))
+
+    delete_users = [user.uid for pin, user in held.items() if pin not in roster] if prune else []
+    return {"push": push, "delete_fingers": delete_fingers, "delete_users": delete_users,
+            "unchanged": unchanged}
+
+
+def upload_batch(conn, batch: List[Tuple[int, RosterUser]]) -> int:
+    """Save a batch of users and their templates in one buffered upload
+
+    The same packet as pyzk's save_user_template(), with every user of the
+    batch in it: user records, then a table of (uid, finger, offset)
+    entries, then the templates. pyzk has no public batched save, so this
+    uses the internals save_user_template() itself uses (checked against
+    pyzk 0.9); a pyzk without them gets one save_user_template() per user.
+    """
+    if not (hasattr(conn, '_send_with_buffer') and hasattr(conn, '_ZK__send_command')):
+        return upload_each(conn, batch)
+    users, table, fingers = b'', b'', b''
+    for uid, wanted in batch:
+        user = roster_user(uid, wanted)
+        users += user.repack29() if conn.user_packet_size == 28 else user.repack73()
+        for fid, template in sorted(wanted.templates.items()):
+            packed = Finger(uid, fid, 1, template).repack_only()
+            table += struct.pack('<bHbI', 2, uid, 0x10 + fid, len(fingers))
+            fingers += packed
+    conn.disable_device()
+    try:
+        conn._send_with_buffer(struct.pack('<III', len(users), len(table), len(fingers)) + users + table + fingers)
+        response = conn._ZK__send_command(CMD_SAVE_USERTEMPS, struct.pack('<IHH', 12, 0, 8))
+        if not response.get('status'):
+            raise ZKErrorResponse("Can't save user templates")
+        conn.refresh_data()
+    finally:
+        conn.enable_device()
+    return len(batch)
+
+
+def upload_each(conn, batch: List[Tuple[int, RosterUser]]) -> int:
+    """Save a batch one user at a time through pyzk's public save_user_template()"""
+    conn.disable_device()
+    try:
+        for uid, wanted in batch:
+            fingers = [Finger(uid, fid, 1, template) for fid, template in sorted(wanted.templates.items())]
+            conn.save_user_template(roster_user(uid, wanted), fingers)
+    finally:
+        conn.enable_device()
+    return len(batch)
+
+
+def roster_user(uid: int, wanted: RosterUser) -> "User":
+    return User(uid, wanted.name, wanted.privilege, wanted.password, wanted.group_id, wanted.pin, wanted.card)
+
+
+def delete_entries(conn, users: List[int], fingers: List[Tuple[int, int]]) -> int:
+    """Delete stale templates and users (runs on a panel thread)"""
+    for uid, fid in fingers:
+        conn.delete_user_template(uid, fid)
+    for uid in users:
+        conn.delete_user(uid)
+    return len(users) + len(fingers)
+
+
+class PanelSyncProgress:
+    """One panel's progress through a sync job"""
+
+    def __init__(self, name: str, saved: Optional[Dict[str, Any]] = None):
+        saved = saved or {}
+        self.name = name
+        self.state = saved.get('state', 'pending')   # pending, reading, pushing, done, error
+        self.unchanged = 0
+        self.to_push = 0
+        self.pushed = 0
+        self.to_delete = 0
+        self.deleted = 0
+        self.batches = 0
+        self.error: Optional[str] = None
+        self.runs = saved.get('runs', 0)
+        self.seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "unchanged": self.unchanged,
+            "toPush": self.to_push,
+            "pushed": self.pushed,
+            "toDelete": self.to_delete,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "runs": self.runs,
+            "seconds": round(self.seconds, 3),
+            "error": self.error,
+        }
+
+
+class PanelSyncJob:
+    """A roster pushed to a set of panels, saved after every batch"""
+
+    def __init__(self, pool: PanelPool, roster_path: str, panels: Optional[Iterable[str]] = None,
+                 prune: bool = False, batch_size: int = SYNC_BATCH_SIZE,
+                 state_path: Optional[str] = SYNC_STATE_PATH, saved: Optional[Dict[str, Any]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.pool = pool
+        self.roster_path = roster_path
+        names = list(panels) if panels is not None else pool.names
+        for name in names:
+            pool.get(name)   # KeyError for an unknown panel
+        self.prune = prune
+        self.batch_size = max(1, batch_size)
+        self.state_path = state_path
+        saved = saved or {}
+        self.job_id = saved.get('jobId') or f"sync-{int(time.time() * 1000)}"
+        self.started_at = saved.get('startedAt') or time.time()
+        self.finished_at: Optional[float] = None
+        saved_progress = saved.get('progress', {})
+        self.progress = {name: PanelSyncProgress(name, saved_progress.get(name)) for name in names}
+        self.roster_users = 0
+        self.error: Optional[str] = None
+
+    @classmethod
+    def resume(cls, pool: PanelPool, state_path: str = SYNC_STATE_PATH) -> Optional["PanelSyncJob"]:
+        """The unfinished job saved at state_path, if there is one"""
+        try:
+            with open(state_path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return None
+        if saved.get('finishedAt'):
+            return None
+        panels = [name for name in saved['panels'] if name in pool.panels]
+        return cls(pool, saved['roster'], panels, saved.get('prune', False),
+                   saved.get('batchSize', SYNC_BATCH_SIZE), state_path, saved)
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self) -> Dict[str, Any]:
+        """Sync every panel that isn't done yet, concurrently"""
+        try:
+            roster = await asyncio.to_thread(load_roster, self.roster_path)
+        except (OSError, ValueError, KeyError) as e:
+            self.error = f"Failed to load roster {self.roster_path}: {e}"
+            self.logger.error(self.error)
+            self.finished_at = time.time()
+            return self.stats()
+        self.roster_users = len(roster)
+        pending = [progress for progress in self.progress.values() if progress.state != 'done']
+        self.logger.info(f"Syncing {len(roster)} users to {len(pending)} panel(s) ({self.job_id})")
+        self.save()
+        await asyncio.gather(*(self.sync_panel(progress, roster) for progress in pending))
+        self.finished_at = time.time()
+        self.save()
+        return self.stats()
+
+    async def sync_panel(self, progress: PanelSyncProgress, roster: Dict[str, RosterUser]) -> None:
+        started = time.perf_counter()
+        progress.runs += 1
+        progress.error = None
+        try:
+            progress.state = 'reading'
+            users, templates = await self.pool.run(progress.name, read_panel, op="sync_read")
+            plan = await asyncio.to_thread(diff_panel, roster, users, templates, self.prune)
+            push = plan["push"]
+            progress.unchanged = plan["unchanged"]
+            progress.to_push = len(push)
+            progress.to_delete = len(plan["delete_users"]) + len(plan["delete_fingers"])
+
+            progress.state = 'pushing'
+            if progress.to_delete:
+                progress.deleted = await self.pool.run(progress.name, delete_entries, plan["delete_users"],
+                                                       plan["delete_fingers"], op="sync_delete")
+            for start in range(0, len(push), self.batch_size):
+                progress.pushed += await self.pool.run(progress.name, upload_batch,
+                                                       push[start:start + self.batch_size], op="sync_push")
+                progress.batches += 1
+                self.save()
+            progress.state = 'done'
+            self.logger.info(f"Panel {progress.name} in sync: {progress.pushed} pushed, "
+                             f"{progress.deleted} deleted, {progress.unchanged} unchanged")
+        except Exception as e:
+            progress.state = 'error'
+            progress.error = str(e) or type(e).__name__
+            self.logger.error(f"Sync to panel {progress.name} failed: {progress.error}")
+        finally:
+            progress.seconds += time.perf_counter() - started
+
+    def save(self) -> None:
+        if not self.state_path:
+            return
+        state = {
+            "jobId": self.job_id,
+            "roster": self.roster_path,
+            "panels": list(self.progress),
+            "prune": self.prune,
+            "batchSize": self.batch_size,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "progress": {name: progress.stats() for name, progress in self.progress.items()},
+        }
+        # Write-then-rename, so an interruption never leaves a torn state file
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def stats(self) -> Dict[str, Any]:
+        panels = [progress.stats() for progress in self.progress.values()]
+        return {
+            "jobId": self.job_id,
+            "roster": self.roster_path,
+            "users": self.roster_users,
+            "finished": self.finished,
+            "done": sum(1 for panel in panels if panel["state"] == 'done'),
+            "failed": sum(1 for panel in panels if panel["state"] == 'error'),
+            "error": self.error,
+            "panels": panels,
+        }
@@ -0,0 +1,152 @@
+"""
+Idempotent Capture Results
+
+A capture request can carry a client-chosen idempotency key:
+
+    -> {"action": "capture", "fingerIndex": 0, "idempotencyKey": "3f1c..."}
+
+A retry with the same key (after a timeout, a dropped connection or an HTTP
+retry further up) never makes the customer press again:
+
+    - while the original capture is still queued or running, the retry is
+      coalesced onto that same job and gets its result
+    - once it has succeeded, the result is replayed from a small cache for
+      FINGERPRINT_RESULT_CACHE_TTL seconds (default 60)
+
+The cache is bounded (FINGERPRINT_RESULT_CACHE_SIZE entries, default 256,
+least recently used evicted first). The cached template and image are kept
+in bytearrays and overwritten with zeros when their entry is evicted or
+expires, so biometric data does not linger in the bridge's memory. Only
+successful captures are cached; a failed or cancelled capture can be
+retried with the same key.
+
+Keyed jobs are not cancelled when their client disconnects: they finish and
+wait in the cache for the client's retry.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configuration
+DEFAULT_TTL = float(os.environ.get('FINGERPRINT_RESULT_CACHE_TTL', 60))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('FINGERPRINT_RESULT_CACHE_SIZE', 256))
+MAX_KEY_LENGTH = 128
+SENSITIVE_FIELDS = ("template", "image")
+
+
+def wipe(result: Dict[str, Any]) -> None:
+    """Overwrite a result's template and image buffers with zeros"""
+    for field in SENSITIVE_FIELDS:
+        buffer = result.get(field)
+        if isinstance(buffer, bytearray):
+            buffer[:] = bytes(len(buffer))
+
+
+def is_keyed(job) -> bool:
+    """Whether a capture job was submitted with an idempotency key"""
+    return "idempotencyKey" in job.params
+
+
+class ResultCache:
+    """Finished capture jobs by idempotency key, plus the ones still running"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.running: Dict[str, Any] = {}
+        # key -> (job, expires_at), oldest first
+        self.finished: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.coalesced = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(data: Dict[str, Any]) -> Optional[str]:
+        """The request's idempotency key, or None; raises ValueError if malformed"""
+        key = data.get('idempotencyKey')
+        if key is None:
+            return None
+        if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(f"idempotencyKey must be a string of 1-{MAX_KEY_LENGTH} characters")
+        return key
+
+    def find(self, key: str, finger_index: int):
+        """The running or cached job for a key, or None
+
+        Raises ValueError when the key was used for a different finger.
+        """
+        self.expire()
+        job = self.running.get(key)
+        if job is None and key in self.finished:
+            job = self.finished[key][0]
+        if job is None:
+            return None
+        if job.finger_index != finger_index:
+            raise ValueError(f"idempotencyKey was already used for finger {job.finger_index}")
+
+        if job.future.done():
+            self.finished.move_to_end(key)
+            self.hits += 1
+        else:
+            self.coalesced += 1
+        return job
+
+    def track(self, key: str, job) -> None:
+        """Follow a new keyed job; cache its result if it succeeds"""
+        self.running[key] = job
+        job.future.add_done_callback(lambda future: self._finished(key, job, future))
+
+    def _finished(self, key: str, job, future) -> None:
+        if self.running.get(key) is job:
+            del self.running[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if result.get("status") != "success":
+            return
+
+        # Own the bytes in mutable buffers so eviction can zero them
+        for field in SENSITIVE_FIELDS:
+            if isinstance(result.get(field), bytes):
+                result[field] = bytearray(result[field])
+        self._evict(key)
+        self.finished[key] = (job, time.monotonic() + self.ttl)
+        # Wipe on time even if no further request comes along to expire it
+        asyncio.get_running_loop().call_later(self.ttl, self.expire)
+        while len(self.finished) > self.max_entries:
+            self._evict(next(iter(self.finished)))
+
+    def _evict(self, key: str) -> None:
+        entry = self.finished.pop(key, None)
+        if entry is None:
+            return
+        self.evicted += 1
+        job = entry[0]
+        if job.future.done() and not job.future.cancelled() and job.future.exception() is None:
+            wipe(job.future.result())
+
+    def expire(self) -> None:
+        """Evict (and wipe) every entry past its TTL"""
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self.finished.items() if expires_at <= now]
+        for key in expired:
+            self._evict(key)
+
+    def clear(self) -> None:
+        for key in list(self.finished):
+            self._evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        self.expire()
+        return {
+            "cached": len(self.finished),
+            "running": len(self.running),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+        }
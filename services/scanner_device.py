@@ -0,0 +1,505 @@
+"""
+Scanner Device Threads and SDK Backends
+
+Every ZKFinger SDK call blocks: opening a device takes hundreds of
+milliseconds and acquiring a fingerprint blocks until a finger is placed.
+To keep the bridge's asyncio loop responsive (ping, status and other
+clients), all SDK interaction is confined to dedicated threads:
+
+    SdkThread      - a single thread that owns SDK-wide calls (init, enumerate)
+    DeviceWorker   - one thread per opened device, with an async facade
+    DevicePool     - every detected device opened, keyed by device id; devices
+                     can be rescanned, opened and removed one at a time as
+                     they are plugged in and out (see device_watcher.py)
+
+Backends implement the blocking calls and are only ever invoked from those
+threads:
+
+    PyzkfpBackend    - real ZK8500R via pyzkfp 0.1.5 / ZKFinger SDK
+    SimulatedBackend - configurable slow fake for tests and benchmarks
+    ReplayBackend    - a recorded SDK trace served back (see sdk_trace.py)
+
+Select a backend with FINGERPRINT_BRIDGE_BACKEND=pyzkfp|simulated|replay,
+and record any of them with FINGERPRINT_SDK_RECORD=<trace path>. The
+simulated backend reads FINGERPRINT_SIM_CAPTURE_LATENCY,
+FINGERPRINT_SIM_INIT_LATENCY and FINGERPRINT_SIM_OPEN_LATENCY (seconds),
+FINGERPRINT_SIM_DEVICES and FINGERPRINT_SIM_FAILURE_RATE, and with
+FINGERPRINT_SIM_IMAGES=1 returns synthetic sensor images, a
+FINGERPRINT_SIM_POOR_RATE fraction of them poor presses. Devices whose ids
+are listed in the FINGERPRINT_SIM_UNPLUGGED file (one per line) are treated
+as unplugged, so hot-plug can be exercised by editing that file.
+
+Backends with `matcher` set also expose the SDK's in-memory 1:N database
+(ZKFinger DBAdd/DBDel/DBIdentify/DBClear); it is SDK-wide, so it is only
+used from the pool's SdkThread (see sdk_matcher.py).
+
+A device can have a QualityGate (image_quality.py); each capture's image is
+scored on the device thread right after the SDK returns it. SDK init, device
+open, capture, quality and merge times go to bridge_stage_seconds
+(bridge_metrics.py).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bridge_metrics import STAGE_SECONDS
+from image_quality import IMAGE_HEIGHT, IMAGE_WIDTH, SYNTHETIC_KINDS, QualityGate, synthetic_image
+from lazy_imports import lazy_module
+
+# ZKTeco fingerprint SDK wrapper; loaded when the backend initializes, on the SDK thread
+pyzkfp = lazy_module('pyzkfp')
+PYZKFP_AVAILABLE = pyzkfp is not None
+
+# Configuration
+CAPTURE_TIMEOUT = 30.0
+CAPTURE_POLL_INTERVAL = 0.1
+DEVICE_CLOSE_TIMEOUT = 2.0
+MERGE_TEMPLATES = 3         # ZKFinger DBMerge takes exactly three
+
+
+class CaptureTimeoutError(Exception):
+    """No finger was placed on the sensor before the capture timeout"""
+
+
+class CaptureAbortedError(Exception):
+    """The capture was cancelled while waiting for a finger"""
+
+
+class DeviceLostError(Exception):
+    """The scanner was unplugged, or the SDK dropped it, during a call"""
+
+
+def check_merge(templates: List[bytes]) -> None:
+    if len(templates) != MERGE_TEMPLATES:
+        raise ValueError(f"DBMerge takes {MERGE_TEMPLATES} templates, got {len(templates)}")
+
+
+class ScannerBackend:
+    """Blocking SDK interface; only called from an SdkThread/DeviceWorker"""
+
+    name = "base"
+    mock = False
+    matcher = False     # implements the db_* 1:N calls
+
+    def initialize(self) -> None:
+        pass
+
+    def get_device_list(self) -> List[Any]:
+        raise NotImplementedError
+
+    def open_device(self, device: Any) -> Any:
+        """Open a device and return a handle, or None on failure"""
+        raise NotImplementedError
+
+    def capture(self, handle: Any, finger_index: int, timeout: float,
+                cancel_event: threading.Event) -> Dict[str, Any]:
+        """Block until a fingerprint is captured; return template bytes and quality"""
+        raise NotImplementedError
+
+    def merge_templates(self, handle: Any, templates: List[bytes]) -> bytes:
+        """Merge three presses of one finger into a registration template"""
+        raise NotImplementedError
+
+    def close_device(self, handle: Any) -> None:
+        pass
+
+    def terminate(self) -> None:
+        pass
+
+    def db_add(self, fid: int, template: bytes) -> None:
+        """Add a registration template to the SDK's 1:N database"""
+        raise NotImplementedError
+
+    def db_remove(self, fid: int) -> None:
+        raise NotImplementedError
+
+    def db_identify(self, template: bytes) -> Optional[Tuple[int, int]]:
+        """Best matching fid and its score for a probe, or None below the SDK threshold"""
+        raise NotImplementedError
+
+    def db_clear(self) -> None:
+        raise NotImplementedError
+
+
+class PyzkfpBackend(ScannerBackend):
+    """ZK8500R scanners through the pyzkfp wrapper of the ZKFinger SDK
+
+    Written against pyzkfp 0.1.5, whose ZKFP2 object holds a single open
+    device. One ZKFP2 initializes the SDK and owns the 1:N database; each
+    opened device gets its own, and the device index is the handle.
+    """
+
+    name = "pyzkfp"
+    matcher = True
+
+    def __init__(self):
+        self.zkfp = None
+        self.devices: Dict[Any, Any] = {}
+
+    def initialize(self) -> None:
+        zkfp = pyzkfp.ZKFP2()
+        # Raises a ZKFP2Error subclass for a non-zero SDK result
+        zkfp.Init()
+        zkfp.DBInit()
+        self.zkfp = zkfp
+
+    def terminate(self) -> None:
+        # Releases the SDK, so another process (a replacement bridge) can open the scanners
+        if self.zkfp:
+            self.zkfp.Terminate()
+            self.zkfp = None
+        self.devices.clear()
+
+    def get_device_list(self) -> List[Any]:
+        return list(range(self.zkfp.GetDeviceCount()))
+
+    def open_device(self, device: Any) -> Any:
+        zkfp = pyzkfp.ZKFP2()
+        if not zkfp.OpenDevice(int(device)):
+            return None
+        self.devices[device] = zkfp
+        return device
+
+    def capture(self, handle: Any, finger_index: int, timeout: float,
+                cancel_event: threading.Event) -> Dict[str, Any]:
+        zkfp = self.devices[handle]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if cancel_event.is_set():
+                raise CaptureAbortedError("Capture cancelled")
+            try:
+                # None until a finger is on the sensor
+                capture = zkfp.AcquireFingerprint()
+            except Exception as e:
+                # The SDK fails acquisition on a device that has gone away
+                raise DeviceLostError(f"Scanner {handle} lost: {e}") from e
+            if capture:
+                template, image = capture
+                # The SDK reports no quality; the quality gate scores the image
+                return {"template": bytes(template), "image": bytes(image) if image else None, "quality": 92}
+            cancel_event.wait(CAPTURE_POLL_INTERVAL)
+        raise CaptureTimeoutError("No finger detected before timeout")
+
+    def merge_templates(self, handle: Any, templates: List[bytes]) -> bytes:
+        # ZKFinger DBMerge: three pre-registration templates -> one
+        check_merge(templates)
+        template, length = self.devices[handle].DBMerge(*templates)
+        return bytes(template)[:length]
+
+    def close_device(self, handle: Any) -> None:
+        zkfp = self.devices.pop(handle, None)
+        if zkfp is not None:
+            zkfp.CloseDevice()
+
+    def db_add(self, fid: int, template: bytes) -> None:
+        self.zkfp.DBAdd(fid, template)
+
+    def db_remove(self, fid: int) -> None:
+        self.zkfp.DBDel(fid)
+
+    def db_identify(self, template: bytes) -> Optional[Tuple[int, int]]:
+        # ZKFinger DBIdentify: the single best fid above the SDK's threshold (fid 0 if none)
+        fid, score = self.zkfp.DBIdentify(template)
+        return (int(fid), int(score)) if fid > 0 else None
+
+    def db_clear(self) -> None:
+        self.zkfp.DBClear()
+
+
+class SimulatedBackend(ScannerBackend):
+    """Fake scanner whose blocking calls take configurable time"""
+
+    name = "simulated"
+    mock = True
+    matcher = True
+
+    def __init__(self, capture_latency: float = 1.5, device_count: int = 1,
+                 failure_rate: float = 0.0, open_latency: float = 0.0, init_latency: float = 0.0,
+                 template: bytes = b"SKEEPTEMPLATE", images: bool = False,
+                 poor_rate: float = 0.0, unplugged_path: Optional[str] = None):
+        self.capture_latency = capture_latency
+        self.device_count = device_count
+        self.failure_rate = failure_rate
+        self.open_latency = open_latency
+        self.init_latency = init_latency
+        self.template = template
+        self.images = images
+        self.poor_rate = poor_rate
+        self.unplugged_path = unplugged_path
+        self.unplugged: set = set()
+        self.random = random.Random()
+        self.db: Dict[int, bytes] = {}
+
+    def set_present(self, device: Any, present: bool) -> None:
+        """Plug a simulated device in or out"""
+        if present:
+            self.unplugged.discard(str(device))
+        else:
+            self.unplugged.add(str(device))
+
+    def is_present(self, device: Any) -> bool:
+        if str(device) in self.unplugged:
+            return False
+        if not self.unplugged_path:
+            return True
+        try:
+            with open(self.unplugged_path) as f:
+                return str(device) not in f.read().split()
+        except FileNotFoundError:
+            return True
+
+    def _image(self) -> Optional[bytes]:
+        if not self.images:
+            return None
+        kind = "good"
+        if self.random.random() < self.poor_rate:
+            kind = self.random.choice(SYNTHETIC_KINDS[1:])
+        return synthetic_image(kind, IMAGE_WIDTH, IMAGE_HEIGHT).tobytes()
+
+    def initialize(self) -> None:
+        # Stands in for ZKFinger SDK init
+        time.sleep(self.init_latency)
+
+    def get_device_list(self) -> List[Any]:
+        return [device for device in (f"SIM-{i}" for i in range(self.device_count)) if self.is_present(device)]
+
+    def open_device(self, device: Any) -> Any:
+        time.sleep(self.open_latency)
+        return device if self.is_present(device) else None
+
+    def capture(self, handle: Any, finger_index: int, timeout: float,
+                cancel_event: threading.Event) -> Dict[str, Any]:
+        # Deliberately blocks the calling thread, like the real SDK
+        if cancel_event.wait(min(self.capture_latency, timeout)):
+            raise CaptureAbortedError("Capture cancelled")
+        if not self.is_present(handle):
+            raise DeviceLostError(f"Scanner {handle} unplugged")
+        if self.capture_latency > timeout:
+            raise CaptureTimeoutError("No finger detected before timeout")
+        if self.random.random() < self.failure_rate:
+            raise RuntimeError("Simulated capture failure")
+        return {
+            "template": self.template + bytes([finger_index & 0xFF]),
+            "image": self._image(),
+            "quality": min(100, 88 + finger_index * 2)
+        }
+
+    def merge_templates(self, handle: Any, templates: List[bytes]) -> bytes:
+        # Simulated presses of one finger are identical
+        check_merge(templates)
+        return templates[-1]
+
+    def db_add(self, fid: int, template: bytes) -> None:
+        self.db[fid] = bytes(template)
+
+    def db_remove(self, fid: int) -> None:
+        self.db.pop(fid, None)
+
+    def db_identify(self, template: bytes) -> Optional[Tuple[int, int]]:
+        # Simulated captures of one finger are identical, so match exact bytes
+        for fid, enrolled in self.db.items():
+            if enrolled == template:
+                return fid, 100
+        return None
+
+    def db_clear(self) -> None:
+        self.db.clear()
+
+
+def create_backend(name: Optional[str] = None, record: bool = True) -> ScannerBackend:
+    """Create the configured scanner backend, recording its calls if FINGERPRINT_SDK_RECORD is set"""
+    backend = _create_backend(name or os.environ.get('FINGERPRINT_BRIDGE_BACKEND', 'pyzkfp'))
+    record_path = os.environ.get('FINGERPRINT_SDK_RECORD')
+    if record and record_path:
+        from sdk_trace import RecordingBackend
+        return RecordingBackend(backend, record_path)
+    return backend
+
+
+def _create_backend(name: str) -> ScannerBackend:
+    if name == 'simulated':
+        return SimulatedBackend(
+            capture_latency=float(os.environ.get('FINGERPRINT_SIM_CAPTURE_LATENCY', 1.5)),
+            device_count=int(os.environ.get('FINGERPRINT_SIM_DEVICES', 1)),
+            failure_rate=float(os.environ.get('FINGERPRINT_SIM_FAILURE_RATE', 0.0)),
+            open_latency=float(os.environ.get('FINGERPRINT_SIM_OPEN_LATENCY', 0.0)),
+            init_latency=float(os.environ.get('FINGERPRINT_SIM_INIT_LATENCY', 0.0)),
+            images=os.environ.get('FINGERPRINT_SIM_IMAGES') == '1',
+            poor_rate=float(os.environ.get('FINGERPRINT_SIM_POOR_RATE', 0.0)),
+            unplugged_path=os.environ.get('FINGERPRINT_SIM_UNPLUGGED')
+        )
+    if name == 'pyzkfp':
+        if not PYZKFP_AVAILABLE:
+            raise RuntimeError("pyzkfp not available - install with: pip install pyzkfp==0.1.5")
+        return PyzkfpBackend()
+    if name == 'replay':
+        from sdk_trace import replay_from_env
+        return replay_from_env()
+    raise ValueError(f"Unknown scanner backend: {name}")
+
+
+class SdkThread:
+    """A dedicated thread that runs blocking SDK calls for the event loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) on this thread without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class DeviceWorker(SdkThread):
+    """Async facade over one opened device, backed by its own thread"""
+
+    def __init__(self, backend: ScannerBackend, device: Any, quality_gate: Optional[QualityGate] = None):
+        super().__init__(f"zkfp-device-{device}")
+        self.logger = logging.getLogger(__name__)
+        self.backend = backend
+        self.device = device
+        self.quality_gate = quality_gate
+        self.handle = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.handle is not None
+
+    async def open(self) -> bool:
+        with STAGE_SECONDS.time("device_open"):
+            self.handle = await self.call(self.backend.open_device, self.device)
+        return self.is_open
+
+    async def capture(self, finger_index: int = 0, timeout: float = CAPTURE_TIMEOUT) -> Dict[str, Any]:
+        """Capture on the device thread; cancelling the caller aborts the capture"""
+        cancel_event = threading.Event()
+        try:
+            return await self.call(self._capture, finger_index, timeout, cancel_event)
+        except asyncio.CancelledError:
+            # Let the device thread notice and return to its idle state
+            cancel_event.set()
+            raise
+
+    def _capture(self, finger_index: int, timeout: float, cancel_event: threading.Event) -> Dict[str, Any]:
+        # Runs on the device thread; a poor press raises PoorQualityError here
+        with STAGE_SECONDS.time("capture"):
+            capture = self.backend.capture(self.handle, finger_index, timeout, cancel_event)
+        if not self.quality_gate:
+            return capture
+        with STAGE_SECONDS.time("quality"):
+            return self.quality_gate.check(capture)
+
+    async def merge(self, templates: List[bytes]) -> bytes:
+        """Merge enrolment presses on the device thread"""
+        with STAGE_SECONDS.time("merge"):
+            return await self.call(self.backend.merge_templates, self.handle, templates)
+
+    async def close(self) -> None:
+        if self.handle is not None:
+            await self.call(self.backend.close_device, self.handle)
+            self.handle = None
+        self.shutdown()
+
+
+class DevicePool:
+    """All detected devices of a backend, each opened on its own worker thread"""
+
+    def __init__(self, backend: ScannerBackend, quality_gate: Optional[QualityGate] = None):
+        self.logger = logging.getLogger(__name__)
+        self.backend = backend
+        self.quality_gate = quality_gate
+        self.sdk_thread = SdkThread("zkfp-sdk")
+        self.workers: Dict[str, DeviceWorker] = {}
+        self.initialized = False
+
+    async def initialize(self) -> None:
+        """Initialize the SDK (once)"""
+        if self.initialized:
+            return
+        with STAGE_SECONDS.time("sdk_init"):
+            await self.sdk_thread.call(self.backend.initialize)
+        self.initialized = True
+
+    async def scan(self) -> Dict[str, Any]:
+        """Devices currently attached, by device id"""
+        await self.initialize()
+        devices = await self.sdk_thread.call(self.backend.get_device_list)
+        return {str(device): device for device in devices}
+
+    async def open_all(self) -> List[str]:
+        """Initialize the SDK and open every detected device concurrently"""
+        devices = await self.scan()
+        results = await asyncio.gather(*(self.open(device) for device in devices.values()),
+                                       return_exceptions=True)
+        for device, opened in zip(devices, results):
+            if opened is not True:
+                self.logger.error(f"Failed to open device {device}: {opened}")
+        return list(self.workers)
+
+    async def open(self, device: Any) -> bool:
+        """Open one device on a new worker thread; raises if the SDK does"""
+        worker = DeviceWorker(self.backend, device, self.quality_gate)
+        try:
+            opened = await worker.open()
+        except BaseException:
+            worker.shutdown()
+            raise
+        if not opened:
+            worker.shutdown()
+            return False
+        self.workers[str(device)] = worker
+        return True
+
+    async def remove(self, device_id: str) -> bool:
+        """Forget a device that has gone away and stop its thread"""
+        worker = self.workers.pop(device_id, None)
+        if worker is None:
+            return False
+        try:
+            # Queued behind any capture still running on the device thread
+            await asyncio.wait_for(worker.close(), DEVICE_CLOSE_TIMEOUT)
+        except Exception as e:
+            # Closing an unplugged device usually fails; the handle is gone anyway
+            self.logger.debug(f"Closing removed device {device_id}: {e}")
+            worker.shutdown()
+        return True
+
+    def get(self, device_id: str) -> Optional[DeviceWorker]:
+        return self.workers.get(device_id)
+
+    @property
+    def device_ids(self) -> List[str]:
+        return list(self.workers)
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    async def close_all(self) -> None:
+        """Close every device and terminate the SDK, so the next bridge can open them"""
+        workers = list(self.workers.items())
+        self.workers.clear()
+        results = await asyncio.gather(
+            *(asyncio.wait_for(worker.close(), DEVICE_CLOSE_TIMEOUT) for _, worker in workers),
+            return_exceptions=True
+        )
+        for (device_id, worker), result in zip(workers, results):
+            if isinstance(result, BaseException):
+                self.logger.warning(f"Closing device {device_id}: {result!r}")
+                worker.shutdown()
+        if self.initialized:
+            try:
+                await asyncio.wait_for(self.sdk_thread.call(self.backend.terminate), DEVICE_CLOSE_TIMEOUT)
+            except Exception as e:
+                self.logger.warning(f"Terminating the SDK: {e!r}")
+            self.initialized = False
+        self.sdk_thread.shutdown()
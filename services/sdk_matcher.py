@@ -0,0 +1,128 @@
+"""
+SDK 1:N Fingerprint Matcher
+
+Identifies probes with the scanner SDK's own matcher: the ZKFinger SDK keeps
+an in-memory database of registration templates (DBAdd/DBDel) and matches a
+probe's minutiae against all of them in one DBIdentify call. This is the
+identification the bridges use unless a feature extractor is configured for
+the NumPy index (see template_index.py).
+
+The SDK database is SDK-wide, so every call runs on the device pool's
+SdkThread. The methods block until the SDK thread has run them, so call them
+off the event loop (handle_index_action does).
+
+DBIdentify returns only the best match, so identify() returns at most one
+entry whatever topK asks for. Scores are the SDK's own (0-100).
+
+SdkMatcher has the same add/remove/identify/load_json/stats interface as
+TemplateIndex. Enrolled templates come from the template arena when one is
+configured (index_add and index_remove are written through to it, and
+fail with PermissionError when it is opened read-only) or else from the
+FINGERPRINT_TEMPLATE_INDEX JSON file, and are loaded into the SDK database
+once the SDK is initialized.
+"""
+
+import base64
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from template_index import DEFAULT_TOP_K, TemplateKey
+
+
+class SdkMatcher:
+    """The SDK's 1:N database, keyed by (pin, fingerIndex)"""
+
+    def __init__(self, backend, sdk_thread, store=None):
+        self.logger = logging.getLogger(__name__)
+        self.backend = backend
+        self.sdk_thread = sdk_thread
+        # A TemplateArena to write index_add/index_remove through to
+        self.store = store
+        self.fids: Dict[TemplateKey, int] = {}
+        self.keys: Dict[int, TemplateKey] = {}
+        self.next_fid = 1
+        self.lock = threading.Lock()
+        self.identified = 0
+        self.unmatched = 0
+
+    def __len__(self) -> int:
+        return len(self.fids)
+
+    def _call(self, fn: Callable, *args) -> Any:
+        """Run an SDK call on the SDK thread and wait for it"""
+        return self.sdk_thread.executor.submit(fn, *args).result()
+
+    def _add(self, key: TemplateKey, template: bytes) -> None:
+        with self.lock:
+            previous = self.fids.get(key)
+            fid = self.next_fid
+            self.next_fid += 1
+        if previous is not None:
+            self._call(self.backend.db_remove, previous)
+        self._call(self.backend.db_add, fid, bytes(template))
+        with self.lock:
+            self.keys.pop(previous, None)
+            self.fids[key] = fid
+            self.keys[fid] = key
+
+    def add(self, pin: str, finger_index: int, template: bytes) -> None:
+        """Add or replace one template; PermissionError if the arena is read-only"""
+        if self.store is not None:
+            # Raises on a read-only arena, before the SDK database diverges from it
+            self.store.add(pin, finger_index, template)
+        self._add((str(pin), int(finger_index)), template)
+
+    def add_many(self, entries: Iterable[Tuple[str, int, bytes]]) -> int:
+        """Load (pin, fingerIndex, template) entries into the SDK database; returns the count"""
+        count = 0
+        for pin, finger_index, template in entries:
+            self._add((str(pin), int(finger_index)), template)
+            count += 1
+        return count
+
+    def remove(self, pin: str, finger_index: Optional[int] = None) -> int:
+        """Remove one finger, or every finger of a PIN; returns the count"""
+        pin = str(pin)
+        if self.store is not None:
+            self.store.remove(pin, finger_index)
+        with self.lock:
+            keys = [key for key in self.fids
+                    if key[0] == pin and (finger_index is None or key[1] == int(finger_index))]
+            fids = [self.fids.pop(key) for key in keys]
+            for fid in fids:
+                self.keys.pop(fid, None)
+        for fid in fids:
+            self._call(self.backend.db_remove, fid)
+        return len(fids)
+
+    def identify(self, template: bytes, top_k: int = DEFAULT_TOP_K,
+                 min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """The best matching PIN for a probe, if the SDK finds one (top-1 only)"""
+        result = self._call(self.backend.db_identify, template)
+        key = self.keys.get(result[0]) if result else None
+        if key is None or result[1] < min_score or top_k < 1:
+            self.unmatched += 1
+            return []
+        self.identified += 1
+        return [{"pin": key[0], "fingerIndex": key[1], "score": float(result[1])}]
+
+    def load_json(self, path: str) -> int:
+        """Load [{"pin", "fingerIndex", "template": base64}] entries from a file"""
+        with open(path) as f:
+            entries = json.load(f)
+        return self.add_many(
+            (entry["pin"], entry.get("fingerIndex", 0), base64.b64decode(entry["template"]))
+            for entry in entries
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self.fids),
+            "backend": "sdk",
+            "sdk": self.backend.name,
+            "identified": self.identified,
+            "unmatched": self.unmatched,
+            "store": self.store.stats() if self.store is not None else None,
+        }
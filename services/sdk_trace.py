@@ -0,0 +1,377 @@
+"""
+SDK Call Traces
+
+The simulated backend answers every capture after the same fixed delay,
+which says nothing about how the real SDK behaves under load. These two
+backends capture and reproduce the real thing:
+
+    RecordingBackend - wraps any backend and writes every blocking SDK call
+                       it serves, with its timing and result, to a trace file
+    ReplayBackend    - serves a recorded trace back: each device's calls
+                       return the recorded results (or raise the recorded
+                       errors) after the recorded durations, optionally
+                       time-scaled
+
+Record on a machine with a scanner by setting FINGERPRINT_SDK_RECORD to a
+trace path (gzipped when it ends in .gz) next to the usual backend. Replay
+anywhere with FINGERPRINT_BRIDGE_BACKEND=replay and FINGERPRINT_SDK_TRACE
+set to that path; FINGERPRINT_TRACE_SCALE multiplies every recorded
+duration (0.5 runs twice as fast, 0 as fast as possible). A device's
+captures start over from its first one when they run out, unless
+FINGERPRINT_TRACE_LOOP=0, in which case further captures fail. Relative
+trace paths are taken from the project root, not the working directory.
+
+Templates and sensor images are biometric data, so by default a trace only
+holds their sizes and replay serves synthetic bytes of those sizes (the
+same bytes for the same record, so replays stay comparable). Replayed
+captures carry no image, so the quality gate passes them through.
+FINGERPRINT_SDK_RECORD_PAYLOADS=1 records the real templates and images
+instead; such a trace must be handled like the enrolment data it holds.
+Trace files are created readable by their owner only.
+
+A trace is JSON lines: a header, then one line per call in the order the
+calls finished.
+
+    {"trace": 1, "backend": "pyzkfp", "recordedAt": 1700000000.0, "payloads": false}
+    {"call": "initialize", "at": 0.0, "duration": 0.412}
+    {"call": "get_device_list", "at": 0.413, "duration": 0.001, "result": ["0"]}
+    {"call": "open_device", "device": "0", "at": 0.414, "duration": 0.231, "result": true}
+    {"call": "capture", "device": "0", "finger": 1, "at": 3.02, "duration": 2.174,
+     "result": {"templateSize": 1024, "imageSize": 92160, "quality": 92}}
+    {"call": "capture", "device": "0", "finger": 1, "at": 5.3, "duration": 30.0,
+     "error": {"type": "CaptureTimeoutError", "message": "No finger detected before timeout"}}
+    {"call": "merge_templates", "device": "0", "at": 9.8, "duration": 0.012, "result": {"templateSize": 1024}}
+
+With payloads recorded, a capture's result is {"template": "base64...",
+"image": "base64...", "quality": 92} and a merge's result is "base64...".
+
+"at" is when the call started, in seconds since the backend was created;
+scripts/bench_trace_replay.py replays a trace's captures at those offsets
+to reproduce the recorded workload against a bridge.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import itertools
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from scanner_device import CaptureAbortedError, CaptureTimeoutError, DeviceLostError, ScannerBackend
+
+# Configuration
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACE_VERSION = 1
+RECORD_PAYLOADS = os.environ.get('FINGERPRINT_SDK_RECORD_PAYLOADS') == '1'
+TRACE_ERRORS = {error.__name__: error for error in (CaptureTimeoutError, DeviceLostError)}
+
+
+def trace_path(path: str) -> str:
+    """A trace path, relative ones taken from the project root"""
+    return os.path.join(ROOT, os.path.expanduser(path))
+
+
+def open_trace(path: str):
+    """A trace file to record to, gzipped by extension, readable by its owner only"""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600))
+    # An existing file keeps its mode through O_CREAT
+    os.chmod(path, 0o600)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def encode_bytes(value: Optional[bytes]) -> Optional[str]:
+    return base64.b64encode(value).decode('ascii') if value is not None else None
+
+
+def decode_bytes(value: Optional[str]) -> Optional[bytes]:
+    return base64.b64decode(value) if value is not None else None
+
+
+def byte_size(value: Optional[bytes]) -> Optional[int]:
+    return len(value) if value is not None else None
+
+
+def synthetic_bytes(size: Optional[int], seed: str) -> Optional[bytes]:
+    """Stand-in for a payload that was not recorded: `size` bytes derived from `seed`"""
+    if size is None:
+        return None
+    data = bytearray()
+    for block in itertools.count():
+        if len(data) >= size:
+            break
+        data += hashlib.sha256(f"{seed}:{block}".encode()).digest()
+    return bytes(data[:size])
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """The call records of a trace; the header is checked and dropped"""
+    if path.endswith('.gz'):
+        # Not gzip.open: a trace whose recording bridge was killed has no
+        # gzip trailer, and gzip.open drops the whole last block over that
+        with open(path, 'rb') as f:
+            text = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(f.read()).decode('utf-8')
+    else:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        raise ValueError(f"Empty SDK trace: {path}")
+    header = json.loads(lines[0])
+    if header.get("trace") != TRACE_VERSION:
+        raise ValueError(f"Unsupported SDK trace version in {path}: {header.get('trace')}")
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # The recording bridge was killed mid-line
+            break
+    return records
+
+
+class RecordingBackend(ScannerBackend):
+    """Passes every call through to `inner` and records it"""
+
+    def __init__(self, inner: ScannerBackend, path: str, payloads: bool = RECORD_PAYLOADS):
+        self.logger = logging.getLogger(__name__)
+        self.inner = inner
+        self.path = trace_path(path)
+        self.payloads = payloads
+        self.name = inner.name
+        self.mock = inner.mock
+        self.matcher = inner.matcher
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.file = open_trace(self.path)
+        self._write({"trace": TRACE_VERSION, "backend": inner.name, "recordedAt": round(time.time(), 3),
+                     "payloads": payloads})
+        if payloads:
+            self.logger.warning(f"Recording SDK calls to {self.path}, with fingerprint templates and images")
+        else:
+            self.logger.info(f"Recording SDK calls to {self.path}")
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            # Every call is kept even if the bridge is killed
+            self.file.flush()
+
+    def _record(self, call: str, fn: Callable, *args, encode: Callable = lambda value: value,
+                **fields) -> Any:
+        started = time.monotonic()
+        record: Dict[str, Any] = {"call": call, **fields, "at": round(started - self.started, 4)}
+        try:
+            result = fn(*args)
+        except CaptureAbortedError:
+            # The client cancelled; nothing the SDK did is worth replaying
+            raise
+        except Exception as e:
+            record["duration"] = round(time.monotonic() - started, 4)
+            record["error"] = {"type": type(e).__name__, "message": str(e)}
+            self._write(record)
+            self.calls += 1
+            raise
+        record["duration"] = round(time.monotonic() - started, 4)
+        record["result"] = encode(result)
+        self._write(record)
+        self.calls += 1
+        return result
+
+    def initialize(self) -> None:
+        self._record("initialize", self.inner.initialize, encode=lambda result: None)
+
+    def get_device_list(self) -> List[Any]:
+        return self._record("get_device_list", self.inner.get_device_list,
+                            encode=lambda devices: [str(device) for device in devices])
+
+    def open_device(self, device: Any) -> Any:
+        return self._record("open_device", self.inner.open_device, device,
+                            encode=lambda handle: handle is not None, device=str(device))
+
+    def capture(self, handle: Any, finger_index: int, timeout: float,
+                cancel_event: threading.Event) -> Dict[str, Any]:
+        return self._record("capture", self.inner.capture, handle, finger_index, timeout, cancel_event,
+                            encode=self._encode_capture, device=str(handle), finger=finger_index)
+
+    def _encode_capture(self, capture: Dict[str, Any]) -> Dict[str, Any]:
+        if self.payloads:
+            return {
+                "template": encode_bytes(capture.get("template")),
+                "image": encode_bytes(capture.get("image")),
+                "quality": capture.get("quality"),
+            }
+        return {
+            "templateSize": byte_size(capture.get("template")),
+            "imageSize": byte_size(capture.get("image")),
+            "quality": capture.get("quality"),
+        }
+
+    def merge_templates(self, handle: Any, templates: List[bytes]) -> bytes:
+        return self._record("merge_templates", self.inner.merge_templates, handle, templates,
+                            encode=encode_bytes if self.payloads else lambda template: {
+                                "templateSize": byte_size(template)
+                            }, device=str(handle))
+
+    def close_device(self, handle: Any) -> None:
+        self._record("close_device", self.inner.close_device, handle,
+                     encode=lambda result: None, device=str(handle))
+
+    # The 1:N database calls pass through unrecorded: they carry every
+    # enrolled template, and a replay has no database to serve them from
+
+    def db_add(self, fid: int, template: bytes) -> None:
+        self.inner.db_add(fid, template)
+
+    def db_remove(self, fid: int) -> None:
+        self.inner.db_remove(fid)
+
+    def db_identify(self, template: bytes) -> Optional[Tuple[int, int]]:
+        return self.inner.db_identify(template)
+
+    def db_clear(self) -> None:
+        self.inner.db_clear()
+
+    def terminate(self) -> None:
+        try:
+            self.inner.terminate()
+        finally:
+            with self.lock:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+
+
+class ReplayBackend(ScannerBackend):
+    """Serves a recorded trace: same results, same errors, (scaled) same timing"""
+
+    name = "replay"
+    mock = True
+
+    def __init__(self, records: List[Dict[str, Any]], time_scale: float = 1.0, loop: bool = True):
+        self.logger = logging.getLogger(__name__)
+        self.time_scale = max(0.0, time_scale)
+        self.loop = loop
+        self.calls: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for record in records:
+            self.calls[(record["call"], record.get("device"))].append(record)
+        # Per (call, device): what is left of this pass over the recorded calls
+        self.pending: Dict[tuple, Deque[Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+        self.replayed = 0
+
+    @classmethod
+    def from_file(cls, path: str, time_scale: float = 1.0, loop: bool = True) -> "ReplayBackend":
+        return cls(load_trace(path), time_scale, loop)
+
+    def _next(self, call: str, device: Optional[str] = None,
+              repeat: bool = True) -> Optional[Dict[str, Any]]:
+        """The next recorded `call` on `device`, or None if there never was one"""
+        key = (call, device)
+        recorded = self.calls.get(key)
+        if not recorded:
+            return None
+        with self.lock:
+            pending = self.pending.get(key)
+            if not pending:
+                if pending is not None and not repeat:
+                    raise RuntimeError(f"SDK trace has no more {call} calls for device {device}")
+                pending = self.pending[key] = deque(recorded)
+            self.replayed += 1
+            return pending.popleft()
+
+    def _delay(self, record: Optional[Dict[str, Any]]) -> float:
+        return record.get("duration", 0.0) * self.time_scale if record else 0.0
+
+    @staticmethod
+    def _seed(record: Dict[str, Any]) -> str:
+        return f"{record['call']}:{record.get('device')}:{record.get('finger')}:{record.get('at')}"
+
+    def _finish(self, record: Dict[str, Any]) -> Any:
+        """The recorded result, or the recorded error raised"""
+        error = record.get("error")
+        if error:
+            raise TRACE_ERRORS.get(error.get("type"), RuntimeError)(error.get("message", "Replayed SDK error"))
+        return record.get("result")
+
+    def initialize(self) -> None:
+        record = self._next("initialize")
+        time.sleep(self._delay(record))
+        if record:
+            self._finish(record)
+
+    def get_device_list(self) -> List[Any]:
+        record = self._next("get_device_list")
+        time.sleep(self._delay(record))
+        if record:
+            return list(self._finish(record) or [])
+        # A trace cut before the scan: every device that was captured on
+        return sorted({device for call, device in self.calls if device is not None})
+
+    def open_device(self, device: Any) -> Any:
+        record = self._next("open_device", str(device))
+        time.sleep(self._delay(record))
+        if record and not self._finish(record):
+            return None
+        return str(device)
+
+    def capture(self, handle: Any, finger_index: int, timeout: float,
+                cancel_event: threading.Event) -> Dict[str, Any]:
+        record = self._next("capture", str(handle), repeat=self.loop)
+        if record is None:
+            raise DeviceLostError(f"SDK trace has no captures for device {handle}")
+        delay = self._delay(record)
+        if cancel_event.wait(min(delay, timeout)):
+            raise CaptureAbortedError("Capture cancelled")
+        if delay > timeout:
+            raise CaptureTimeoutError("No finger detected before timeout")
+        capture = self._finish(record)
+        if "templateSize" in capture:
+            # Recorded without payloads
+            return {
+                "template": synthetic_bytes(capture["templateSize"], self._seed(record)),
+                "image": None,
+                "quality": capture.get("quality"),
+            }
+        return {
+            "template": decode_bytes(capture.get("template")),
+            "image": decode_bytes(capture.get("image")),
+            "quality": capture.get("quality"),
+        }
+
+    def merge_templates(self, handle: Any, templates: List[bytes]) -> bytes:
+        record = self._next("merge_templates", str(handle))
+        if record is None:
+            # Not recorded on this device: keep the last press, like the simulator
+            return templates[-1]
+        time.sleep(self._delay(record))
+        merged = self._finish(record)
+        if isinstance(merged, dict):
+            return synthetic_bytes(merged.get("templateSize"), self._seed(record))
+        return decode_bytes(merged)
+
+    def close_device(self, handle: Any) -> None:
+        record = self._next("close_device", str(handle))
+        time.sleep(self._delay(record))
+
+
+def replay_from_env() -> ReplayBackend:
+    """The replay backend configured by FINGERPRINT_SDK_TRACE and friends"""
+    path = os.environ.get('FINGERPRINT_SDK_TRACE')
+    if not path:
+        raise RuntimeError("The replay backend needs FINGERPRINT_SDK_TRACE set to a recorded trace")
+    return ReplayBackend.from_file(
+        trace_path(path),
+        time_scale=float(os.environ.get('FINGERPRINT_TRACE_SCALE', 1.0)),
+        loop=os.environ.get('FINGERPRINT_TRACE_LOOP', '1') != '0'
+    )
@@ -0,0 +1,450 @@
+"""
+Memory-Mapped Template Arena
+
+An on-disk store for enrolled templates that the bridge maps with mmap and
+reads in place, instead of building millions of Python str/dict objects from
+JSON on every start. Loading only maps the files and wraps them in NumPy
+views, so it takes milliseconds regardless of size, and several bridge
+processes mapping the same arena share its pages through the page cache.
+
+An arena is three files that share one row numbering:
+
+    <path>.idx   64-byte header + compact 32-byte index records
+                     flags u8 (bit 0 = live), finger_index u8,
+                     version u16 (template version * 10), length u16,
+                     reserved u16, pin 24s (NUL padded)
+    <path>.feat  float32[feature_dim] identification features per row
+                 (zeros when no feature extractor is configured)
+    <path>.tpl   fixed-size template slots (slot_size bytes per row)
+
+Header: magic b"ZKTA", version u16, slot_size u16, feature_dim u16,
+reserved u16, record_count u64.
+
+Appending writes the slot, features and index record first and then bumps
+record_count, so readers never see a half-written row. Deleting clears the
+live flag in place (a tombstone); compact() rewrites the files without
+tombstones, and readers reopen them on their next refresh(). Files grow in
+chunks, so appends don't remap every time.
+
+Only one process writes: opening an arena writable takes an exclusive lock
+on <path>.lock (flock, or msvcrt.locking on Windows) and raises
+ArenaLockedError while another process holds it. The bridges open it
+read-only unless FINGERPRINT_TEMPLATE_ARENA_WRITABLE=1. Mappings are closed
+before a file is resized or replaced, which Windows refuses for mapped files
+(and which on POSIX would leave the old inode mapped). On Windows,
+compact() also fails while another process still maps the arena.
+
+The arena implements the same identify/add/remove/stats interface as
+TemplateIndex, and scores probes directly against the mapped features.
+Without a feature extractor it only stores templates: identify() raises
+NoExtractorError, and entries() feeds them to the SDK matcher instead
+(see sdk_matcher.py).
+"""
+
+import base64
+import functools
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lazy_imports import lazy_module
+from template_index import (DEFAULT_TOP_K, FEATURE_DIM, NUMPY_AVAILABLE, Featurizer, NoExtractorError,
+                            configured_extractor)
+
+np = lazy_module('numpy')
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+ARENA_MAGIC = b"ZKTA"
+ARENA_VERSION = 1
+HEADER_SIZE = 64
+SLOT_SIZE = 2048
+PIN_SIZE = 24
+FLAG_LIVE = 0x01
+GROWTH_RECORDS = 4096
+
+HEADER = struct.Struct("<4sHHHHQ")
+COUNT_OFFSET = HEADER.size - 8
+
+INDEX_FIELDS = [
+    ("flags", "u1"),
+    ("finger_index", "u1"),
+    ("version", "<u2"),
+    ("length", "<u2"),
+    ("reserved", "<u2"),
+    ("pin", f"S{PIN_SIZE}"),
+]
+
+
+class ArenaLockedError(RuntimeError):
+    """Another process has the arena open for writing"""
+
+
+@functools.lru_cache(maxsize=None)
+def index_dtype() -> "np.dtype":
+    """Index record layout; built on first use so numpy is only loaded then"""
+    return np.dtype(INDEX_FIELDS)
+
+
+class TemplateArena:
+    """Append-only, tombstoned, fixed-stride template store read through mmap"""
+
+    def __init__(self, path: str, slot_size: int = SLOT_SIZE, feature_dim: int = FEATURE_DIM,
+                 writable: bool = True, featurizer: Optional[Featurizer] = None):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy not available - install with: pip install numpy")
+        self.path = path
+        self.writable = writable
+        self.featurizer = featurizer or configured_extractor()
+        # identify() runs on executor threads while appends run on the loop
+        self.lock = threading.Lock()
+        self.lock_file = None
+        self.maps: List[mmap.mmap] = []
+
+        if writable:
+            self._lock_writer()
+        if not os.path.exists(self._file('idx')):
+            if not writable:
+                raise FileNotFoundError(self._file('idx'))
+            self._create(slot_size, feature_dim)
+
+        self.capacity = 0
+        try:
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+        magic, version, self.slot_size, self.feature_dim, _, _ = HEADER.unpack_from(self.idx_map)
+        if magic != ARENA_MAGIC or version != ARENA_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a template arena (version {ARENA_VERSION})")
+        self._map()
+
+    def _file(self, kind: str) -> str:
+        return f"{self.path}.{kind}"
+
+    def _lock_writer(self) -> None:
+        """Take the arena's writer lock, without waiting for another writer"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock_file = open(self._file('lock'), "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError as e:
+            self.lock_file.close()
+            self.lock_file = None
+            raise ArenaLockedError(f"Template arena {self.path} is open for writing by another process") from e
+
+    def _open(self) -> None:
+        mode = "r+b" if self.writable else "rb"
+        self.files = {}
+        for kind in ('idx', 'feat', 'tpl'):
+            self.files[kind] = open(self._file(kind), mode)
+        # Only the header, so the magic can be checked; _map() maps the rest
+        self.idx_map = mmap.mmap(self.files['idx'].fileno(), HEADER_SIZE, access=mmap.ACCESS_READ)
+        self.maps = [self.idx_map]
+
+    def _create(self, slot_size: int, feature_dim: int) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self._file('idx'), "wb") as f:
+            f.write(HEADER.pack(ARENA_MAGIC, ARENA_VERSION, slot_size, feature_dim, 0, 0)
+                    .ljust(HEADER_SIZE, b"\0"))
+        for kind in ('feat', 'tpl'):
+            open(self._file(kind), "wb").close()
+
+    def _map(self) -> None:
+        """Map all three files and rebuild the zero-copy column views"""
+        self._unmap()
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        sizes = {kind: os.fstat(f.fileno()).st_size for kind, f in self.files.items()}
+        # A writer's _grow() resizes idx, feat and tpl one after the other: map
+        # only the rows all three already cover
+        self.capacity = max(0, min((sizes['idx'] - HEADER_SIZE) // index_dtype().itemsize,
+                                   sizes['feat'] // (self.feature_dim * 4),
+                                   sizes['tpl'] // self.slot_size))
+
+        self.idx_map = mmap.mmap(self.files['idx'].fileno(), 0, access=access)
+        self.maps = [self.idx_map]
+        self.index = np.frombuffer(self.idx_map, dtype=index_dtype(), count=self.capacity, offset=HEADER_SIZE)
+        self.features = np.zeros((0, self.feature_dim), dtype=np.float32)
+        self.templates = np.zeros((0, self.slot_size), dtype=np.uint8)
+        if self.capacity:
+            feat_map = mmap.mmap(self.files['feat'].fileno(), 0, access=access)
+            tpl_map = mmap.mmap(self.files['tpl'].fileno(), 0, access=access)
+            self.maps += [feat_map, tpl_map]
+            self.features = np.frombuffer(feat_map, dtype=np.float32,
+                                          count=self.capacity * self.feature_dim).reshape(-1, self.feature_dim)
+            self.templates = np.frombuffer(tpl_map, dtype=np.uint8,
+                                           count=self.capacity * self.slot_size).reshape(-1, self.slot_size)
+
+    def _unmap(self) -> None:
+        """Drop the views and close every mapping, so the files can be resized or replaced"""
+        self.index = self.features = self.templates = None
+        for mapping in self.maps:
+            mapping.close()
+        self.maps = []
+
+    def _grow(self, rows: int) -> None:
+        capacity = max(rows, self.capacity + GROWTH_RECORDS)
+        self._unmap()
+        self.files['idx'].truncate(HEADER_SIZE + capacity * index_dtype().itemsize)
+        self.files['feat'].truncate(capacity * self.feature_dim * 4)
+        self.files['tpl'].truncate(capacity * self.slot_size)
+        self._map()
+
+    @property
+    def record_count(self) -> int:
+        return struct.unpack_from("<Q", self.idx_map, COUNT_OFFSET)[0]
+
+    def refresh(self) -> None:
+        """Pick up rows appended, or a compaction done, by another process"""
+        if self.writable:
+            # The only writer already sees everything
+            return
+        with self.lock:
+            if self._replaced():
+                for f in self.files.values():
+                    f.close()
+                self._unmap()
+                self._open()
+                self._map()
+            elif self.record_count > self.capacity:
+                self._map()
+
+    def _replaced(self) -> bool:
+        """True once compact() has swapped a new index file in under us"""
+        try:
+            return os.stat(self._file('idx')).st_ino != os.fstat(self.files['idx'].fileno()).st_ino
+        except OSError:
+            return False
+
+    def _live_rows(self) -> "np.ndarray":
+        count = self.record_count
+        return np.flatnonzero(self.index["flags"][:count] & FLAG_LIVE)
+
+    def _find(self, pin: str, finger_index: Optional[int] = None) -> "np.ndarray":
+        """Rows holding a live template for a PIN (and finger), vectorised"""
+        count = self.record_count
+        index = self.index[:count]
+        mask = (index["pin"] == str(pin).encode()) & ((index["flags"] & FLAG_LIVE) != 0)
+        if finger_index is not None:
+            mask &= index["finger_index"] == int(finger_index)
+        return np.flatnonzero(mask)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.index["flags"][:self.record_count] & FLAG_LIVE))
+
+    def _features(self, template: bytes) -> "np.ndarray":
+        """Features to store for a template; zeros when only storing templates"""
+        if self.featurizer is None:
+            return np.zeros(self.feature_dim, dtype=np.float32)
+        return self.featurizer(template, self.feature_dim)
+
+    def add(self, pin: str, finger_index: int, template: bytes, version: str = "10.0",
+            features: Optional["np.ndarray"] = None) -> int:
+        """Append a template, tombstoning any previous one for the same finger"""
+        if not self.writable:
+            raise PermissionError("Template arena opened read-only")
+        if len(template) > self.slot_size:
+            raise ValueError(f"Template of {len(template)} bytes exceeds slot size {self.slot_size}")
+        pin_bytes = str(pin).encode()
+        if len(pin_bytes) > PIN_SIZE:
+            raise ValueError(f"PIN longer than {PIN_SIZE} bytes: {pin}")
+        if features is None:
+            features = self._features(template)
+
+        with self.lock:
+            row = self.record_count
+            if row >= self.capacity:
+                self._grow(row + 1)
+
+            self.templates[row, :len(template)] = np.frombuffer(template, dtype=np.uint8)
+            self.templates[row, len(template):] = 0
+            self.features[row] = features
+            self.index[row] = (FLAG_LIVE, finger_index, int(round(float(version) * 10)),
+                               len(template), 0, pin_bytes)
+
+            previous = self._find(pin, finger_index)
+            self.index["flags"][previous[previous != row]] &= ~FLAG_LIVE & 0xFF
+
+            # Publish the row only once its bytes are in place
+            struct.pack_into("<Q", self.idx_map, COUNT_OFFSET, row + 1)
+        return row
+
+    def add_many(self, entries: Iterable[Tuple[str, int, bytes]], version: str = "10.0") -> int:
+        """Bulk append (pin, fingerIndex, template) entries with one grow and one dedupe pass"""
+        if not self.writable:
+            raise PermissionError("Template arena opened read-only")
+        entries = list(entries)
+        # Checked up front, so a bad entry leaves nothing half written
+        for pin, _, template in entries:
+            if len(template) > self.slot_size:
+                raise ValueError(f"Template of {len(template)} bytes exceeds slot size {self.slot_size}")
+            if len(str(pin).encode()) > PIN_SIZE:
+                raise ValueError(f"PIN longer than {PIN_SIZE} bytes: {pin}")
+        with self.lock:
+            start = self.record_count
+            end = start + len(entries)
+            if end > self.capacity:
+                self._grow(end)
+
+            for row, (pin, finger_index, template) in enumerate(entries, start):
+                self.templates[row, :len(template)] = np.frombuffer(template, dtype=np.uint8)
+                self.templates[row, len(template):] = 0
+                self.features[row] = self._features(template)
+                self.index[row] = (FLAG_LIVE, finger_index, int(round(float(version) * 10)),
+                                   len(template), 0, str(pin).encode())
+
+            # Keep only the newest row of each (pin, finger) among live rows
+            live = np.flatnonzero(self.index["flags"][:end] & FLAG_LIVE)[::-1]
+            keys = self.index[live][["pin", "finger_index"]].astype(
+                np.dtype([("pin", f"S{PIN_SIZE}"), ("finger_index", "u1")]))
+            _, newest = np.unique(keys, return_index=True)
+            stale = np.setdiff1d(live, live[newest])
+            self.index["flags"][stale] &= ~FLAG_LIVE & 0xFF
+
+            struct.pack_into("<Q", self.idx_map, COUNT_OFFSET, end)
+        return len(entries)
+
+    def remove(self, pin: str, finger_index: Optional[int] = None) -> int:
+        """Tombstone one finger, or every finger of a PIN, in place"""
+        if not self.writable:
+            raise PermissionError("Template arena opened read-only")
+        with self.lock:
+            rows = self._find(pin, finger_index)
+            self.index["flags"][rows] &= ~FLAG_LIVE & 0xFF
+        return len(rows)
+
+    def get(self, pin: str, finger_index: int) -> Optional[bytes]:
+        """Template bytes for a finger (a copy: the mapping can be closed to grow)"""
+        with self.lock:
+            rows = self._find(pin, finger_index)
+            if not len(rows):
+                return None
+            row = int(rows[-1])
+            return self.templates[row, :int(self.index["length"][row])].tobytes()
+
+    def entries(self, chunk: int = 1024) -> Iterator[Tuple[str, int, bytes]]:
+        """Every live (pin, fingerIndex, template), oldest first
+
+        Rows are copied out a chunk at a time, so no view of the mapping is
+        held between yields.
+        """
+        self.refresh()
+        with self.lock:
+            live = self._live_rows()
+        for start in range(0, len(live), chunk):
+            with self.lock:
+                rows = live[start:start + chunk]
+                records = self.index[rows]
+                templates = self.templates[rows]
+            for record, template in zip(records, templates):
+                yield (record["pin"].decode(), int(record["finger_index"]),
+                       template[:int(record["length"])].tobytes())
+
+    def identify(self, template: bytes, top_k: int = DEFAULT_TOP_K,
+                 min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """Top-k PINs for a probe, scored against the mapped feature rows"""
+        if self.featurizer is None:
+            raise NoExtractorError()
+        return self.identify_features(self.featurizer(template, self.feature_dim), top_k, min_score)
+
+    def identify_features(self, probe: "np.ndarray", top_k: int = DEFAULT_TOP_K,
+                          min_score: float = 0.0) -> List[Dict[str, Any]]:
+        self.refresh()
+        with self.lock:
+            count = self.record_count
+            if count == 0:
+                return []
+            scores = self.features[:count] @ probe
+            scores[(self.index["flags"][:count] & FLAG_LIVE) == 0] = -np.inf
+
+            candidates = min(count, top_k * 4)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+            # Only the winners' PINs are ever decoded into Python strings
+            keys = [(self.index["pin"][row].decode(), int(self.index["finger_index"][row])) for row in top]
+
+        matches = []
+        seen = set()
+        for row, (pin, finger_index) in zip(top, keys):
+            score = float(scores[row])
+            if not np.isfinite(score):
+                break
+            score = round(score * 100, 2)
+            if pin in seen or score < min_score:
+                continue
+            seen.add(pin)
+            matches.append({"pin": pin, "fingerIndex": finger_index, "score": score})
+            if len(matches) >= top_k:
+                break
+        return matches
+
+    def load_json(self, path: str) -> int:
+        """Append [{"pin", "fingerIndex", "template": base64}] entries from a file"""
+        with open(path) as f:
+            entries = json.load(f)
+        return self.add_many(
+            (entry["pin"], entry.get("fingerIndex", 0), base64.b64decode(entry["template"]))
+            for entry in entries
+        )
+
+    def compact(self) -> None:
+        """Rewrite the arena without tombstoned rows"""
+        if not self.writable:
+            raise PermissionError("Template arena opened read-only")
+        with self.lock:
+            live = self._live_rows()
+            for kind, data in (('feat', self.features[live]), ('tpl', self.templates[live])):
+                with open(f"{self._file(kind)}.compact", "wb") as f:
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(f"{self._file('idx')}.compact", "wb") as f:
+                f.write(HEADER.pack(ARENA_MAGIC, ARENA_VERSION, self.slot_size, self.feature_dim, 0, len(live))
+                        .ljust(HEADER_SIZE, b"\0"))
+                f.write(self.index[live].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._unmap()
+            for f in self.files.values():
+                f.close()
+            # Replace the index last: it carries the record count
+            for kind in ('feat', 'tpl', 'idx'):
+                os.replace(f"{self._file(kind)}.compact", self._file(kind))
+            self._open()
+            self._map()
+
+    def stats(self) -> Dict[str, Any]:
+        count = self.record_count
+        live = len(self)
+        return {
+            "templates": live,
+            "records": count,
+            "tombstones": count - live,
+            "dim": self.feature_dim,
+            "file_bytes": HEADER_SIZE + self.capacity * (index_dtype().itemsize + self.feature_dim * 4 + self.slot_size),
+            "backend": "arena",
+        }
+
+    def close(self) -> None:
+        self._unmap()
+        for f in getattr(self, 'files', {}).values():
+            f.close()
+        if self.lock_file is not None:
+            # Closing the file releases the writer lock
+            self.lock_file.close()
+            self.lock_file = None
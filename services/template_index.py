@@ -0,0 +1,258 @@
+"""
+Local 1:N Fingerprint Identification Index
+
+Holds enrolled templates as fixed-length feature vectors in one contiguous
+NumPy matrix, so identifying a probe is a single matrix-vector product over
+every enrolled template followed by a top-k selection, instead of one ZKBio
+`getFgListByPin` round trip per PIN.
+
+Templates are reduced to FEATURE_DIM float32 features by a minutiae feature
+extractor, configured as FINGERPRINT_FEATURE_EXTRACTOR=module:function (a
+callable taking the template bytes and the dimension and returning an
+L2-normalised vector); scores are cosine similarities scaled to 0-100. Raw
+template bytes are not comparable features, so without an extractor the
+index refuses templates (NoExtractorError) and the bridges identify with
+the scanner SDK's own 1:N matcher instead (see sdk_matcher.py).
+
+Spouse records use their own PIN (`{pin}s1`), so they are indexed and
+returned like any other PIN.
+
+WebSocket actions (see handle_index_action):
+    -> {"action": "identify", "template": "base64...", "topK": 5}
+    <- {"status": "success", "matches": [{"pin": "1001", "fingerIndex": 0, "score": 97.4}]}
+    -> {"action": "index_add", "pin": "1001", "fingerIndex": 0, "template": "base64..."}
+    -> {"action": "index_remove", "pin": "1001"}   (optional fingerIndex)
+"""
+
+import asyncio
+import base64
+import functools
+import importlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from lazy_imports import lazy_module
+
+# Loaded on first use, so importing the bridge doesn't wait for numpy
+np = lazy_module('numpy')
+NUMPY_AVAILABLE = np is not None
+
+# Configuration
+FEATURE_DIM = 128
+DEFAULT_TOP_K = 5
+INITIAL_CAPACITY = 1024
+FEATURE_EXTRACTOR = os.environ.get('FINGERPRINT_FEATURE_EXTRACTOR')
+
+TemplateKey = Tuple[str, int]
+Featurizer = Callable[[bytes, int], "np.ndarray"]
+
+
+class NoExtractorError(RuntimeError):
+    """Templates can't be indexed or identified without a feature extractor"""
+
+    def __init__(self):
+        super().__init__("No fingerprint feature extractor configured (set FINGERPRINT_FEATURE_EXTRACTOR)")
+
+
+def load_extractor(spec: str) -> Featurizer:
+    """Import a "module:function" feature extractor"""
+    module_name, _, function = spec.partition(':')
+    if not module_name or not function:
+        raise ValueError(f"Feature extractor must be module:function, got {spec!r}")
+    return getattr(importlib.import_module(module_name), function)
+
+
+@functools.lru_cache(maxsize=None)
+def configured_extractor() -> Optional[Featurizer]:
+    """The FINGERPRINT_FEATURE_EXTRACTOR callable, or None when not set"""
+    return load_extractor(FEATURE_EXTRACTOR) if FEATURE_EXTRACTOR else None
+
+
+class TemplateIndex:
+    """In-memory matrix of enrolled template features with incremental updates"""
+
+    def __init__(self, dim: int = FEATURE_DIM, featurizer: Optional[Featurizer] = None,
+                 capacity: int = INITIAL_CAPACITY):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy not available - install with: pip install numpy")
+        self.logger = logging.getLogger(__name__)
+        self.dim = dim
+        self.featurizer = featurizer or configured_extractor()
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.keys: List[TemplateKey] = []
+        self.positions: Dict[TemplateKey, int] = {}
+        # identify() runs on executor threads while updates run on the loop
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _ensure_capacity(self, size: int) -> None:
+        if size <= len(self.matrix):
+            return
+        capacity = max(size, len(self.matrix) * 2)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:len(self.keys)] = self.matrix[:len(self.keys)]
+        self.matrix = grown
+
+    def features(self, template: bytes) -> "np.ndarray":
+        if self.featurizer is None:
+            raise NoExtractorError()
+        return self.featurizer(template, self.dim)
+
+    def add(self, pin: str, finger_index: int, template: bytes) -> None:
+        """Add or replace one template"""
+        self.add_features(pin, finger_index, self.features(template))
+
+    def add_features(self, pin: str, finger_index: int, features: "np.ndarray") -> None:
+        key = (str(pin), int(finger_index))
+        with self.lock:
+            row = self.positions.get(key)
+            if row is None:
+                row = len(self.keys)
+                self._ensure_capacity(row + 1)
+                self.keys.append(key)
+                self.positions[key] = row
+            self.matrix[row] = features
+
+    def add_many(self, entries: Iterable[Tuple[str, int, bytes]]) -> int:
+        """Bulk add (pin, fingerIndex, template) entries; returns the count"""
+        count = 0
+        for pin, finger_index, template in entries:
+            self.add(pin, finger_index, template)
+            count += 1
+        return count
+
+    def remove(self, pin: str, finger_index: Optional[int] = None) -> int:
+        """Remove one finger, or every finger of a PIN; returns the count"""
+        pin = str(pin)
+        if finger_index is None:
+            keys = [(pin, finger) for finger in range(10) if (pin, finger) in self.positions]
+        else:
+            keys = [(pin, int(finger_index))] if (pin, int(finger_index)) in self.positions else []
+
+        with self.lock:
+            for key in keys:
+                # Swap-remove keeps the live rows contiguous
+                row = self.positions.pop(key)
+                last = len(self.keys) - 1
+                if row != last:
+                    last_key = self.keys[last]
+                    self.matrix[row] = self.matrix[last]
+                    self.keys[row] = last_key
+                    self.positions[last_key] = row
+                self.keys.pop()
+        return len(keys)
+
+    def identify(self, template: bytes, top_k: int = DEFAULT_TOP_K,
+                 min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """Return the top-k PINs for a probe, best first (one entry per PIN)"""
+        return self.identify_features(self.features(template), top_k, min_score)
+
+    def identify_features(self, probe: "np.ndarray", top_k: int = DEFAULT_TOP_K,
+                          min_score: float = 0.0) -> List[Dict[str, Any]]:
+        with self.lock:
+            size = len(self.keys)
+            if size == 0:
+                return []
+
+            scores = self.matrix[:size] @ probe
+            # Over-fetch so several fingers of one PIN don't crowd out other PINs
+            candidates = min(size, top_k * 4)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+            keys = [self.keys[row] for row in top]
+
+        matches = []
+        seen = set()
+        for row, (pin, finger_index) in zip(top, keys):
+            score = round(float(scores[row]) * 100, 2)
+            if pin in seen or score < min_score:
+                continue
+            seen.add(pin)
+            matches.append({"pin": pin, "fingerIndex": finger_index, "score": score})
+            if len(matches) >= top_k:
+                break
+        return matches
+
+    def load_json(self, path: str) -> int:
+        """Load [{"pin", "fingerIndex", "template": base64}] entries from a file"""
+        with open(path) as f:
+            entries = json.load(f)
+        return self.add_many(
+            (entry["pin"], entry.get("fingerIndex", 0), base64.b64decode(entry["template"]))
+            for entry in entries
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self.keys),
+            "dim": self.dim,
+            "memory_bytes": int(self.matrix.nbytes),
+        }
+
+
+def optional_int(data: Dict[str, Any], field: str) -> Optional[int]:
+    """An optional integer request field; ValueError naming the field if it isn't one"""
+    value = data.get(field)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer")
+
+
+async def handle_index_action(index: Optional[TemplateIndex], action: str,
+                              data: Dict[str, Any]) -> Dict[str, Any]:
+    """Run an identify/index_add/index_remove request against the index
+
+    The index can also be a TemplateArena or an SdkMatcher, which have the
+    same interface. Every call runs off the event loop: scoring a large
+    index takes milliseconds (NumPy releases the GIL), and the SDK matcher
+    waits for the SDK thread.
+    """
+    if index is None:
+        return {
+            "status": "error",
+            "message": "Identification not available: set FINGERPRINT_FEATURE_EXTRACTOR "
+                       "or use a scanner SDK with a 1:N matcher"
+        }
+
+    loop = asyncio.get_running_loop()
+    try:
+        if action in ('index_add', 'index_remove') and data.get('pin') in (None, ''):
+            raise ValueError("pin is required")
+        finger_index = optional_int(data, 'fingerIndex')
+
+        if action == 'index_remove':
+            removed = await loop.run_in_executor(None, index.remove, data['pin'], finger_index)
+            return {"status": "ok", "removed": removed, "templates": len(index)}
+
+        try:
+            template = base64.b64decode(data.get('template') or '', validate=True)
+        except (TypeError, ValueError):
+            raise ValueError("invalid template: expected base64")
+        if not template:
+            raise ValueError("template is required")
+
+        if action == 'index_add':
+            await loop.run_in_executor(None, index.add, data['pin'], finger_index or 0, template)
+            return {"status": "ok", "templates": len(index)}
+
+        top_k = optional_int(data, 'topK')
+        try:
+            min_score = float(data.get('minScore', 0.0))
+        except (TypeError, ValueError):
+            raise ValueError("minScore must be a number")
+        matches = await loop.run_in_executor(
+            None, index.identify, template, DEFAULT_TOP_K if top_k is None else top_k, min_score)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except PermissionError as e:
+        # A read-only template arena (FINGERPRINT_TEMPLATE_ARENA_WRITABLE unset)
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", "matches": matches, "searched": len(index)}
@@ -0,0 +1,425 @@
+"""
+Offline Template Spool
+
+An enrolment used to be lost when ZKBio was slow or down: the upload threw
+and the customer had to come back. With the spool, a template the bridge is
+asked to upload is first appended to a local journal,
+FINGERPRINT_TEMPLATE_SPOOL (default template_spool.jsonl in the project
+root, git-ignored; empty disables it), and the client is acknowledged as
+soon as it is on disk. The journal holds raw templates, so it is created
+readable by its owner only. SpoolReplayer
+uploads it to ZKBio in the background (see zkbio_uploader.py), so enrolment
+latency no longer depends on ZKBio at all.
+
+The journal is append-only JSON lines:
+
+    {"op": "put", "seq": 7, "pin": "1001", "templateNo": 0, "template": "base64...",
+     "key": "1001:0:5d41402abc4b2a76", "version": "10.0", "at": 1700000000.0}
+    {"op": "ack", "seq": 7}
+    {"op": "reject", "seq": 8, "error": "ZKBio rejected the request: ..."}
+
+Appends are group-committed: writes arriving within
+FINGERPRINT_SPOOL_FSYNC_MS (default 5) share one write and one fsync, and
+a put returns once its fsync is done. Only then is the entry pending, so
+the replayer never uploads a template that could still be lost. A put whose
+idempotency key is still pending (or still being written) returns that
+entry instead of spooling it twice. Acks are
+not waited for: an ack lost in a crash only means the template is uploaded
+again, which ZKBio treats as a replacement.
+
+On start the journal is read back (a torn last line from a crash is cut
+off) and every put without an ack or reject is pending again. Once
+SPOOL_COMPACT_MIN settled records have built up and outnumber the pending
+ones, the journal is rewritten with only the pending puts.
+
+The replayer drains pending entries oldest first, FINGERPRINT_SPOOL_BATCH
+at a time, with at most one upload in flight per PIN so each person's
+templates reach ZKBio in the order they were captured. While ZKBio is
+unreachable (the uploader's own retries exhausted), it backs off with
+jitter up to a minute and resumes where it stopped. Entries ZKBio rejects
+outright (e.g. unknown person) are settled as rejected and listed in the
+spool status.
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from panel_pool import backoff_delay
+from zkbio_uploader import TEMPLATE_VERSION, ZKBioUploader
+
+# Configuration
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPOOL_PATH = os.environ.get('FINGERPRINT_TEMPLATE_SPOOL', os.path.join(ROOT, 'template_spool.jsonl'))
+SPOOL_FSYNC_INTERVAL = float(os.environ.get('FINGERPRINT_SPOOL_FSYNC_MS', 5)) / 1000
+SPOOL_REPLAY_BATCH = int(os.environ.get('FINGERPRINT_SPOOL_BATCH', 32))
+SPOOL_COMPACT_MIN = 1000
+SPOOL_RETRY_MAX = 60.0
+REJECTED_KEPT = 50
+
+
+def open_private(path: str, mode: str):
+    """Open a journal file, readable by its owner only: it holds fingerprint templates"""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    # An existing file keeps its mode through O_CREAT
+    os.chmod(path, 0o600)
+    return open(path, mode)
+
+
+def spool_key(pin: str, template_no: int, template: str) -> str:
+    """Default idempotency key: the same template for the same finger"""
+    digest = hashlib.sha1(template.encode('ascii')).hexdigest()[:16]
+    return f"{pin}:{template_no}:{digest}"
+
+
+class SpoolEntry:
+    """One spooled template, pending until ZKBio acknowledges it"""
+
+    def __init__(self, seq: int, pin: str, template_no: int, template: str, key: str,
+                 version: str = TEMPLATE_VERSION, spooled_at: Optional[float] = None):
+        self.seq = seq
+        self.pin = pin
+        self.template_no = template_no
+        self.template = template
+        self.key = key
+        self.version = version
+        self.spooled_at = spooled_at or time.time()
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "SpoolEntry":
+        return cls(int(record["seq"]), str(record["pin"]), int(record.get("templateNo", 0)),
+                   record["template"], record.get("key") or "", record.get("version", TEMPLATE_VERSION),
+                   record.get("at"))
+
+    def record(self) -> Dict[str, Any]:
+        return {
+            "op": "put",
+            "seq": self.seq,
+            "pin": self.pin,
+            "templateNo": self.template_no,
+            "template": self.template,
+            "key": self.key,
+            "version": self.version,
+            "at": round(self.spooled_at, 3),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "seq": self.seq,
+            "pin": self.pin,
+            "templateNo": self.template_no,
+            "key": self.key,
+            "age": round(time.time() - self.spooled_at, 1),
+            "attempts": self.attempts,
+        }
+        if self.last_error:
+            stats["error"] = self.last_error
+        return stats
+
+
+class TemplateSpool:
+    """The append-only, group-committed journal of templates to upload"""
+
+    def __init__(self, path: str = SPOOL_PATH, fsync_interval: float = SPOOL_FSYNC_INTERVAL,
+                 compact_min: int = SPOOL_COMPACT_MIN):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_min = compact_min
+        self.entries: Dict[int, SpoolEntry] = {}   # pending, in seq order
+        self.keys: Dict[str, int] = {}
+        self.writing: Dict[str, asyncio.Future] = {}   # key -> its entry, once on disk
+        self.next_seq = 1
+        self.settled = 0        # records in the file that compaction would drop
+        self.file = None
+        self.opened = asyncio.Event()
+        self.arrived = asyncio.Event()
+        self.buffer: List[bytes] = []
+        self.waiters: List[Tuple[asyncio.Future, Optional[SpoolEntry]]] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.rejected: Deque[Dict[str, Any]] = collections.deque(maxlen=REJECTED_KEPT)
+        self.counts = {"spooled": 0, "duplicates": 0, "acked": 0, "rejected": 0,
+                       "fsyncs": 0, "compactions": 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def open(self) -> int:
+        """Read the journal back; returns how many entries are pending"""
+        await asyncio.to_thread(self._load)
+        self.opened.set()
+        if self.entries:
+            self.arrived.set()
+        return len(self.entries)
+
+    def _load(self) -> None:
+        good_bytes = 0
+        records = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn by a crash mid-write; cut off below
+                        break
+                    try:
+                        record = json.loads(line)
+                        op = record["op"]
+                    except (ValueError, KeyError, TypeError):
+                        self.logger.warning(f"Skipping unreadable spool record in {self.path}")
+                        good_bytes += len(line)
+                        continue
+                    good_bytes += len(line)
+                    records += 1
+                    self._replay_record(op, record)
+        except FileNotFoundError:
+            pass
+
+        self.file = open_private(self.path, 'ab')
+        if self.file.tell() != good_bytes:
+            self.file.truncate(good_bytes)
+        self.settled = records - len(self.entries)
+        if self.entries:
+            self.logger.info(f"Template spool {self.path}: {len(self.entries)} upload(s) pending")
+        if self._should_compact():
+            self._compact([entry.record() for entry in self.entries.values()])
+
+    def _replay_record(self, op: str, record: Dict[str, Any]) -> None:
+        seq = int(record.get("seq", 0))
+        self.next_seq = max(self.next_seq, seq + 1)
+        if op == "put":
+            entry = SpoolEntry.from_record(record)
+            self.entries[entry.seq] = entry
+            self.keys[entry.key] = entry.seq
+        elif op in ("ack", "reject"):
+            entry = self.entries.pop(seq, None)
+            if entry:
+                self.keys.pop(entry.key, None)
+
+    async def put(self, pin: Any, template_no: int, template: Union[bytes, str],
+                  key: Optional[str] = None, version: str = TEMPLATE_VERSION) -> SpoolEntry:
+        """Spool a template; returns once it is on disk"""
+        if not pin:
+            raise ValueError("pin is required")
+        if isinstance(template, (bytes, bytearray)):
+            template = base64.b64encode(template).decode('ascii')
+        if not template:
+            raise ValueError("template is required")
+        await self.opened.wait()
+        if self.file is None:
+            raise OSError(f"Template spool {self.path} is not open")
+
+        pin, template_no = str(pin), int(template_no)
+        key = key or spool_key(pin, template_no, template)
+        seq = self.keys.get(key)
+        if seq is not None:
+            self.counts["duplicates"] += 1
+            return self.entries[seq]
+        writing = self.writing.get(key)
+        if writing is not None:
+            # Answered (or failed) along with the put already being written
+            self.counts["duplicates"] += 1
+            return await asyncio.shield(writing)
+
+        entry = SpoolEntry(self.next_seq, pin, template_no, template, key, version)
+        self.next_seq += 1
+        written = self._append(entry.record(), entry)
+        self.writing[key] = written
+        # The entry is pending (see _flush) once this returns
+        return await asyncio.shield(written)
+
+    def ack(self, entry: SpoolEntry, error: Optional[str] = None) -> None:
+        """Settle an entry: uploaded, or rejected by ZKBio with `error`"""
+        if self.entries.pop(entry.seq, None) is None:
+            return
+        self.keys.pop(entry.key, None)
+        self.settled += 2       # the put and this record
+        if error is None:
+            self.counts["acked"] += 1
+            record = {"op": "ack", "seq": entry.seq}
+        else:
+            self.counts["rejected"] += 1
+            record = {"op": "reject", "seq": entry.seq, "error": error}
+            self.rejected.append({**entry.stats(), "error": error})
+        self._append_nowait(record)
+
+    def pending(self) -> List[SpoolEntry]:
+        return list(self.entries.values())
+
+    def _append_nowait(self, record: Dict[str, Any]) -> None:
+        self.buffer.append(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush())
+
+    def _append(self, record: Dict[str, Any], entry: Optional[SpoolEntry] = None) -> asyncio.Future:
+        """Append a record; the future resolves (to `entry`) once it is on disk"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((future, entry))
+        self._append_nowait(record)
+        return future
+
+    async def _flush(self) -> None:
+        """Write and fsync everything appended since the last flush, as one batch"""
+        while self.buffer:
+            # Let concurrent puts join this fsync
+            await asyncio.sleep(self.fsync_interval)
+            lines, self.buffer = self.buffer, []
+            waiters, self.waiters = self.waiters, []
+            try:
+                await asyncio.to_thread(self._write, lines)
+                self.counts["fsyncs"] += 1
+            except OSError as e:
+                self.logger.error(f"Template spool write failed: {e}")
+                for future, entry in waiters:
+                    if entry:
+                        self.writing.pop(entry.key, None)
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future, entry in waiters:
+                if entry:
+                    # Durable now: the replayer may upload it
+                    self.writing.pop(entry.key, None)
+                    self.entries[entry.seq] = entry
+                    self.keys[entry.key] = entry.seq
+                    self.counts["spooled"] += 1
+                    self.arrived.set()
+                if not future.done():
+                    future.set_result(entry)
+            if self._should_compact():
+                records = [entry.record() for entry in self.entries.values()]
+                self.settled = 0
+                await asyncio.to_thread(self._compact, records)
+
+    def _write(self, lines: List[bytes]) -> None:
+        self.file.write(b''.join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _should_compact(self) -> bool:
+        return self.settled >= self.compact_min and self.settled > len(self.entries)
+
+    def _compact(self, records: List[Dict[str, Any]]) -> None:
+        """Rewrite the journal with only the pending puts"""
+        tmp_path = f"{self.path}.tmp"
+        with open_private(tmp_path, 'wb') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open_private(self.path, 'ab')
+        self.counts["compactions"] += 1
+        self.logger.info(f"Compacted template spool to {len(records)} pending upload(s)")
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = next(iter(self.entries.values()), None)
+        return {
+            **self.counts,
+            "path": self.path,
+            "pending": len(self.entries),
+            "oldestAge": round(time.time() - oldest.spooled_at, 1) if oldest else None,
+        }
+
+    async def close(self) -> None:
+        if self.flush_task:
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class SpoolReplayer:
+    """Drains the spool to ZKBio, in order per PIN, backing off while ZKBio is down"""
+
+    def __init__(self, spool: TemplateSpool, uploader: ZKBioUploader,
+                 batch_size: int = SPOOL_REPLAY_BATCH, retry_max: float = SPOOL_RETRY_MAX,
+                 seed: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.spool = spool
+        self.uploader = uploader
+        self.batch_size = max(1, batch_size)
+        self.retry_max = retry_max
+        self.rng = random.Random(seed)
+        self.failures = 0
+        self.retry_at = 0.0
+        self.batches = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self) -> None:
+        await self.spool.opened.wait()
+        while True:
+            if not len(self.spool):
+                self.spool.arrived.clear()
+                await self.spool.arrived.wait()
+                continue
+            wait = self.retry_at - time.monotonic()
+            if wait > 0:
+                # New entries don't cut a backoff short
+                await asyncio.sleep(wait)
+                continue
+            await self.drain()
+
+    async def drain(self) -> None:
+        """Upload pending entries until none are left or ZKBio stops answering"""
+        while True:
+            # The oldest pending entry of each PIN; later ones wait their turn
+            heads: Dict[str, SpoolEntry] = {}
+            for entry in self.spool.pending():
+                if entry.pin not in heads:
+                    heads[entry.pin] = entry
+                    if len(heads) >= self.batch_size:
+                        break
+            if not heads:
+                return
+            self.batches += 1
+            results = await asyncio.gather(*(self.replay(entry) for entry in heads.values()))
+            if not all(results):
+                self.failures += 1
+                delay = backoff_delay(self.failures, self.rng, cap=self.retry_max)
+                self.retry_at = time.monotonic() + delay
+                self.logger.warning(f"ZKBio unreachable; {len(self.spool)} spooled upload(s) "
+                                    f"retry in {delay:.1f}s")
+                return
+            self.failures = 0
+
+    async def replay(self, entry: SpoolEntry) -> bool:
+        """Upload one entry; False when ZKBio could not be reached"""
+        entry.attempts += 1
+        ack = await self.uploader.upload(entry.pin, entry.template, entry.template_no,
+                                         version=entry.version)
+        if ack["status"] == "uploaded":
+            self.spool.ack(entry)
+            return True
+        entry.last_error = ack.get("message")
+        if ack.get("retryable"):
+            return False
+        self.logger.warning(f"ZKBio rejected spooled template {entry.pin}/{entry.template_no}: "
+                            f"{entry.last_error}")
+        self.spool.ack(entry, error=entry.last_error)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "failures": self.failures,
+            "retryIn": round(max(0.0, self.retry_at - time.monotonic()), 1) if self.failures else None,
+        }
@@ -78,4 +78,43 @@ export const getFirstInLastOut = async (
 
   const response = await apiClient.get(`/api/v2/transaction/firstInAndLastOut?${params}`);
   return response.data.data || [];
-};
\ No newline at end of file
+};
+
+// Local reads from ims.db (ingested by services/attendance_ingest.py), for
+// reports that would otherwise page ZKBio 50 rows at a time
+const localTransactionParams = (pageNo: number, pageSize: number, filters?: TransactionFilters & { deviceSn?: string }) =>
+  new URLSearchParams({
+    pageNo: pageNo.toString(),
+    pageSize: pageSize.toString(),
+    ...(filters?.personPin && { personPin: filters.personPin }),
+    ...(filters?.deviceSn && { deviceSn: filters.deviceSn }),
+    ...(filters?.startDate && { startDate: filters.startDate }),
+    ...(filters?.endDate && { endDate: filters.endDate })
+  });
+
+export const getLocalTransactions = async (
+  pageNo = 1,
+  pageSize = 50,
+  filters?: TransactionFilters & { deviceSn?: string }
+): Promise<{ data: Transaction[]; total: number }> => {
+  const response = await fetch(`/api/transactions?${localTransactionParams(pageNo, pageSize, filters)}`);
+  if (!response.ok) {
+    throw new Error(`Failed to fetch transactions: ${response.status}`);
+  }
+  const body = await response.json();
+  return { data: body.data || [], total: body.total || 0 };
+};
+
+export const getLocalFirstInLastOut = async (
+  pageNo = 1,
+  pageSize = 50,
+  filters?: TransactionFilters & { deviceSn?: string }
+): Promise<any> => {
+  const params = localTransactionParams(pageNo, pageSize, filters);
+  params.set('view', 'firstInLastOut');
+  const response = await fetch(`/api/transactions?${params}`);
+  if (!response.ok) {
+    throw new Error(`Failed to fetch first-in/last-out: ${response.status}`);
+  }
+  return (await response.json()).data || [];
+};
@@ -0,0 +1,326 @@
+"""
+ZKBio Template Uploader
+
+A captured template used to travel bridge -> browser -> /api/biometric ->
+ZKBio bioTemplate/add, one HTTP request (and, behind the Next.js route, one
+fresh connection) per finger. With ZKBIO_API_URL set, the bridge uploads it
+itself:
+
+    ZKBioConnections - keep-alive HTTP connections to ZKBio, reused across
+                       uploads (a new one only when none is idle)
+    ZKBioUploader    - micro-batches the templates submitted within
+                       ZKBIO_UPLOAD_BATCH_WINDOW seconds and uploads them over
+                       at most ZKBIO_UPLOAD_CONCURRENCY connections at once
+
+ZKBio's API has no bulk template call, so a batch is not one request: it is
+the unit in which repeated submissions of the same (pin, templateNo) are
+coalesced into one upload (the newest template wins and every submitter gets
+its acknowledgement) before being spread over the connections.
+
+Network errors, HTTP 429 and 5xx are retried up to ZKBIO_UPLOAD_RETRIES
+times with jittered exponential backoff; a ZKBio error reply (a non-zero
+"code", e.g. unknown person) is not. Each submission resolves to an ack:
+
+    {"status": "uploaded", "pin": "1001", "templateNo": 0, "attempts": 1, "uploadMs": 212.4}
+    {"status": "upload_failed", "pin": "1001", "templateNo": 0, "attempts": 4, "message": "...",
+     "retryable": true}
+
+scripts/fake_zkbio.py serves bioTemplate/add locally, with injected latency
+and failures, for testing.
+"""
+
+import asyncio
+import base64
+import http.client
+import json
+import logging
+import os
+import random
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urlparse
+
+from bridge_metrics import STAGE_SECONDS, ZKBIO_UPLOADS
+from panel_pool import backoff_delay
+
+# Configuration
+ZKBIO_API_URL = os.environ.get('ZKBIO_API_URL')
+ZKBIO_API_TOKEN = os.environ.get('ZKBIO_API_TOKEN')
+ZKBIO_TIMEOUT = 10.0
+UPLOAD_CONCURRENCY = int(os.environ.get('ZKBIO_UPLOAD_CONCURRENCY', 4))
+UPLOAD_RETRIES = int(os.environ.get('ZKBIO_UPLOAD_RETRIES', 3))
+UPLOAD_BATCH_WINDOW = float(os.environ.get('ZKBIO_UPLOAD_BATCH_WINDOW', 0.01))
+UPLOAD_MAX_BATCH = 64
+RETRY_BASE = 0.25
+RETRY_MAX = 5.0
+TEMPLATE_PATH = "/api/bioTemplate/add"
+TEMPLATE_VERSION = "10.0"
+
+# A kept-alive connection the server closed while idle fails like this
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           ConnectionResetError, BrokenPipeError)
+
+
+class ZKBioError(Exception):
+    """A ZKBio call failed; `status` is None for network errors"""
+
+    def __init__(self, message: str, status: Optional[int] = None, code: Any = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class ZKBioConnections:
+    """Keep-alive connections to ZKBio, shared by the uploader's threads"""
+
+    def __init__(self, base_url: str, token: Optional[str] = None, timeout: float = ZKBIO_TIMEOUT):
+        self.url = urlparse(base_url)
+        self.token = token
+        self.timeout = timeout
+        self.idle: List[http.client.HTTPConnection] = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def connect(self) -> http.client.HTTPConnection:
+        self.opened += 1
+        if self.url.scheme == 'https':
+            # ZKBio commonly runs with a self-signed certificate
+            return http.client.HTTPSConnection(self.url.hostname, self.url.port, timeout=self.timeout,
+                                               context=ssl._create_unverified_context())
+        return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """An idle connection (reused=True) or a new one"""
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self.connect(), False
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self.lock:
+            self.idle.append(conn)
+
+    def post(self, path: str, body: Optional[Dict[str, Any]] = None,
+             params: Optional[Dict[str, Any]] = None) -> Any:
+        """POST JSON and return ZKBio's "data" (blocking)"""
+        return self.request("POST", path, body, params)
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET and return ZKBio's "data" (blocking)"""
+        return self.request("GET", path, None, params)
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None,
+                params: Optional[Dict[str, Any]] = None) -> Any:
+        """Call ZKBio and return its "data" (blocking)
+
+        A reused connection that turns out to be closed is replaced once
+        without counting as a failed attempt.
+        """
+        params = dict(params or {})
+        if self.token:
+            params["access_token"] = self.token
+        query = f"?{urlencode(params)}" if params else ""
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        while True:
+            conn, reused = self.acquire()
+            try:
+                conn.request(method, f"{self.url.path.rstrip('/')}{path}{query}", payload, headers)
+                response = conn.getresponse()
+                raw = response.read()
+            except STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if reused:
+                    continue
+                raise ZKBioError(f"ZKBio connection failed: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise ZKBioError(f"ZKBio connection failed: {e}")
+            if response.will_close:
+                conn.close()
+            else:
+                self.release(conn)
+
+            try:
+                reply = json.loads(raw or b'{}')
+            except ValueError:
+                reply = {}
+            if response.status != 200:
+                raise ZKBioError(f"ZKBio returned HTTP {response.status}: {reply.get('message', '')}".rstrip(': '),
+                                 status=response.status, code=reply.get("code"))
+            if reply.get("code") != 0:
+                raise ZKBioError(f"ZKBio rejected the request: {reply.get('message') or reply.get('code')}",
+                                 status=response.status, code=reply.get("code"))
+            return reply.get("data")
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+class TemplateUpload:
+    """One template waiting to be uploaded, and everyone waiting on it"""
+
+    def __init__(self, pin: str, template: str, template_no: int, valid_type: str, version: str):
+        self.pin = pin
+        self.template = template
+        self.template_no = template_no
+        self.valid_type = valid_type
+        self.version = version
+        self.submitted_at = time.perf_counter()
+        self.futures: List[asyncio.Future] = []
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.pin, self.template_no
+
+    def body(self) -> Dict[str, Any]:
+        return {"apiBioTemplate": {
+            "pin": self.pin,
+            "template": self.template,
+            "templateNo": self.template_no,
+            "validType": self.valid_type,
+            "version": self.version,
+        }}
+
+
+class ZKBioUploader:
+    """Uploads templates to ZKBio in micro-batches over pooled connections"""
+
+    def __init__(self, base_url: str, token: Optional[str] = None,
+                 concurrency: int = UPLOAD_CONCURRENCY, retries: int = UPLOAD_RETRIES,
+                 batch_window: float = UPLOAD_BATCH_WINDOW, seed: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.connections = ZKBioConnections(base_url, token)
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.batch_window = batch_window
+        self.rng = random.Random(seed)
+        # One thread per concurrent upload: the executor is the concurrency bound
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="zkbio")
+        self.pending: Dict[Tuple[str, int], TemplateUpload] = {}
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.uploads: set = set()
+        self.counts = {"submitted": 0, "uploaded": 0, "failed": 0, "retries": 0,
+                       "coalesced": 0, "batches": 0}
+
+    async def upload(self, pin: Any, template: Union[bytes, str], template_no: int = 0,
+                     valid_type: str = "1", version: str = TEMPLATE_VERSION) -> Dict[str, Any]:
+        """Queue a template for the next batch and wait for its ack"""
+        if not pin:
+            raise ValueError("pin is required")
+        if isinstance(template, (bytes, bytearray)):
+            template = base64.b64encode(template).decode('ascii')
+        if not template:
+            raise ValueError("template is required")
+
+        upload = TemplateUpload(str(pin), template, int(template_no), str(valid_type), str(version))
+        future = asyncio.get_running_loop().create_future()
+        self.counts["submitted"] += 1
+        queued = self.pending.get(upload.key)
+        if queued:
+            # Not sent yet: send the newer template once and ack both
+            self.counts["coalesced"] += 1
+            upload.futures = queued.futures
+        upload.futures.append(future)
+        self.pending[upload.key] = upload
+
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        self.wakeup.set()
+        return await future
+
+    async def run(self) -> None:
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            # Let concurrent enrolments join the batch
+            if self.batch_window > 0 and len(self.pending) < UPLOAD_MAX_BATCH:
+                await asyncio.sleep(self.batch_window)
+            batch, self.pending = list(self.pending.values()), {}
+            if not batch:
+                continue
+            self.counts["batches"] += 1
+            for upload in batch:
+                task = asyncio.create_task(self.send(upload))
+                self.uploads.add(task)
+                task.add_done_callback(self.uploads.discard)
+
+    async def send(self, upload: TemplateUpload) -> None:
+        loop = asyncio.get_running_loop()
+        attempts = 0
+        error: Optional[ZKBioError] = None
+        while True:
+            attempts += 1
+            try:
+                with STAGE_SECONDS.time("zkbio_upload"):
+                    await loop.run_in_executor(self.executor, self.connections.post,
+                                               TEMPLATE_PATH, upload.body())
+                error = None
+                break
+            except ZKBioError as e:
+                error = e
+            if not error.retryable or attempts > self.retries:
+                break
+            self.counts["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempts, self.rng, base=RETRY_BASE, cap=RETRY_MAX))
+
+        ack: Dict[str, Any] = {
+            "status": "uploaded" if error is None else "upload_failed",
+            "pin": upload.pin,
+            "templateNo": upload.template_no,
+            "attempts": attempts,
+            "uploadMs": round((time.perf_counter() - upload.submitted_at) * 1000, 1),
+        }
+        if error is not None:
+            ack["message"] = str(error)
+            ack["retryable"] = error.retryable
+            self.counts["failed"] += 1
+            ZKBIO_UPLOADS.inc("failed")
+            self.logger.warning(f"Template upload for {upload.pin}/{upload.template_no} failed "
+                                f"after {attempts} attempt(s): {error}")
+        else:
+            self.counts["uploaded"] += 1
+            ZKBIO_UPLOADS.inc("uploaded")
+        for future in upload.futures:
+            if not future.done():
+                future.set_result(ack)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counts,
+            "pending": len(self.pending),
+            "inFlight": len(self.uploads),
+            "concurrency": self.concurrency,
+            "connectionsOpened": self.connections.opened,
+            "connectionsIdle": len(self.connections.idle),
+        }
+
+    async def close(self) -> None:
+        """Stop batching; uploads already sent are waited for"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.uploads:
+            await asyncio.gather(*self.uploads, return_exceptions=True)
+        for upload in self.pending.values():
+            for future in upload.futures:
+                if not future.done():
+                    future.set_result({"status": "upload_failed", "pin": upload.pin,
+                                       "templateNo": upload.template_no, "attempts": 0,
+                                       "message": "Bridge shutting down", "retryable": True})
+        self.pending = {}
+        self.executor.shutdown(wait=False)
+        self.connections.close()
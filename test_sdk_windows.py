@@ -2,50 +2,54 @@
 Windows ZKFinger SDK Test Script
 
 This script tests if the ZKFinger SDK is properly installed and can detect devices.
-Run this before starting the bridge service to verify your setup.
+Run this before starting the bridge service to verify your setup. The
+pyzkfp check is the bridge's own capability probe (services/capability_probe.py),
+and its result is saved to the capability cache the bridge boots from.
 
 Usage:
     python test_sdk_windows.py
 """
 
+import os
 import sys
 import platform
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services'))
+
+from capability_probe import CapabilityCache, module_versions, probe  # noqa: E402
+from scanner_device import create_backend  # noqa: E402
+
 print("🔍 Windows ZKFinger SDK Test")
 print("=" * 35)
 print(f"Platform: {platform.system()}")
 print(f"Python: {sys.version.split()[0]}")
 print()
 
-# Test available ZKTeco libraries
-PYZK_AVAILABLE = False
-PYZKFP_AVAILABLE = False
+# Test available ZKTeco libraries (from package metadata, without importing them)
+versions = module_versions()
+PYZK_AVAILABLE = versions["zk"] is not None
+PYZKFP_AVAILABLE = versions["pyzkfp"] is not None
 
-try:
-    from zk import ZK
-    print("✅ pyzk library imported successfully")
-    PYZK_AVAILABLE = True
-except ImportError:
+if PYZK_AVAILABLE:
+    print(f"✅ pyzk library found ({versions['zk']})")
+else:
     print("⚠ pyzk library not found")
 
-try:
-    import pyzkfp
-    print("✅ pyzkfp library imported successfully")
-    print(f"   Available attributes: {dir(pyzkfp)}")
-    PYZKFP_AVAILABLE = True
-except ImportError as e:
-    print(f"⚠ pyzkfp library not found: {e}")
-    PYZKFP_AVAILABLE = False
+if PYZKFP_AVAILABLE:
+    print(f"✅ pyzkfp library found ({versions['pyzkfp']})")
+else:
+    print("⚠ pyzkfp library not found")
 
 if not PYZK_AVAILABLE and not PYZKFP_AVAILABLE:
     print("❌ No ZKTeco SDK libraries found")
-    print("   Install with: pip install pyzk")
-    print("   Or:           pip install pyzkfp")
+    print("   Install with: pip install pyzk==0.9")
+    print("   Or:           pip install pyzkfp==0.1.5")
     print("   And install ZKFinger SDK from ZKTeco")
 
 if PYZK_AVAILABLE:
     try:
         print("\n🔧 Testing pyzk library...")
+        from zk import ZK
 
         # Try to create ZK instance (for network-attached devices)
         zk = ZK('127.0.0.1', port=4370, timeout=5)
@@ -75,59 +79,65 @@ if PYZK_AVAILABLE:
         print(f"❌ pyzk test error: {e}")
 
 if PYZKFP_AVAILABLE:
-    try:
-        print("\n🔧 Testing pyzkfp library...")
-
-        # Initialize scanner
-        scanner = pyzkfp.ZKFP()
-
-        init_result = scanner.init()
-        if init_result == 0:
-            print("✅ ZKFinger SDK initialized successfully")
-
-            # Get device count
-            device_count = scanner.get_device_count()
-            print(f"📱 Found {device_count} fingerprint device(s)")
-
-            if device_count > 0:
-                print("\n🔌 Testing device connection...")
-
-                # Try to open first device
-                open_result = scanner.open_device(0)
-                if open_result == 0:
+    print("\n🔧 Testing pyzkfp library...")
+
+    # ZKFP2.Init() (an SDK error fails the probe), device enumeration, ZKFP2.Terminate()
+    capabilities = probe(["pyzkfp"])
+    result = capabilities["backends"]["pyzkfp"]
+    if result["available"]:
+        print(f"✅ ZKFinger SDK initialized successfully ({result['probeMs']:.0f} ms)")
+        print(f"📱 Found {len(result['devices'])} fingerprint device(s): {result['devices']}")
+        if result["devices"]:
+            print("\n🔌 Testing device connection...")
+            backend = create_backend("pyzkfp", record=False)
+            try:
+                # ZKFP2.Init(): raises unless the SDK returns 0
+                backend.initialize()
+                print("✅ ZKFinger SDK initialized for the device test")
+                device = backend.get_device_list()[0]
+
+                # Try to open first device, the way the bridge does
+                handle = backend.open_device(device)
+                if handle is not None:
                     print("✅ Fingerprint device opened successfully")
                     print("🎯 Device is ready for fingerprint capture!")
 
                     # Close device
-                    scanner.close_device()
+                    backend.close_device(handle)
                     print("✅ Device closed")
 
                 else:
-                    print(f"❌ Failed to open device (error code: {open_result})")
+                    print(f"❌ Failed to open device {device}")
                     print("   - Check USB connection")
                     print("   - Verify device drivers")
                     print("   - Ensure device has power")
 
-            else:
-                print("❌ No fingerprint devices detected")
-                print("   - Check USB connection")
-                print("   - Try different USB port")
-                print("   - Verify device is powered on")
-
-            # Clean up
-            scanner.terminate()
-            print("✅ SDK terminated")
-
+            except Exception as e:
+                print(f"❌ Device test error: {e}")
+                print("   - Check SDK installation")
+                print("   - Verify device compatibility")
+            finally:
+                # Clean up: ZKFP2.Terminate() releases the SDK for the bridge
+                try:
+                    backend.terminate()
+                    print("✅ SDK terminated")
+                except Exception as e:
+                    print(f"❌ SDK terminate failed: {e}")
         else:
-            print(f"❌ SDK initialization failed (error code: {init_result})")
-            print("   - Verify ZKFinger SDK is installed")
-            print("   - Check SDK installation path")
-            print("   - Ensure proper permissions")
-
-    except Exception as e:
-        print(f"❌ pyzkfp test error: {e}")
-        print("   - Check SDK installation")
-        print("   - Verify device compatibility")
+            print("❌ No fingerprint devices detected")
+            print("   - Check USB connection")
+            print("   - Try different USB port")
+            print("   - Verify device is powered on")
+    else:
+        print(f"❌ SDK initialization failed: {result['error']}")
+        print("   - Verify ZKFinger SDK is installed")
+        print("   - Check SDK installation path")
+        print("   - Ensure proper permissions")
+
+    # The bridge starts from this instead of probing again
+    cache = CapabilityCache()
+    cache.save(capabilities)
+    print(f"✅ Capability cache written to {cache.path}")
 
 else:
     print("❌ Cannot test SDK - pyzkfp not available")
@@ -138,7 +148,7 @@ if PYZKFP_AVAILABLE:
     print("2. Open browser to: http://localhost:3000")
     print("3. Check scanner status indicator")
 else:
-    print("1. Install pyzkfp: pip install pyzkfp")
+    print("1. Install pyzkfp: pip install pyzkfp==0.1.5")
     print("2. Install ZKFinger SDK from ZKTeco")
     print("3. Run this test again")
 